@@ -0,0 +1,259 @@
+"""
+Vectorized bond analytics.
+
+Every function takes array-likes (one entry per bond or position) and works
+on the whole batch at once with NumPy, so pricing a 100k-position portfolio
+is a handful of array operations rather than a Python loop per position.
+
+Conventions:
+- Coupons are paid ``frequency`` times a year (a divisor of 12) on dates
+  stepped back whole months from the maturity date; coupon_rate is a
+  percentage of face value. Coupons dated on or before the issue date are
+  not paid.
+- Time is counted in coupon periods: the wait for the next coupon is the
+  share of its period still to run (actual days over actual days), and the
+  rest follow a whole period apart. Years are periods / ``frequency``.
+- Prices are full (dirty) prices in currency per bond, like
+  Investment.purchase_price, so a bond's price is the present value of its
+  remaining cash flows.
+- Yields are annual rates compounded ``frequency`` times a year, returned as
+  percentages.
+
+A bond's remaining flows are ``periods`` equal coupons, the first one
+``first`` periods after settlement (0 < first <= 1) and the rest a period
+apart, plus face value with the last coupon. Price, duration and convexity
+are sums over that geometric series, so they are evaluated in closed form
+per bond instead of per cash flow.
+"""
+import numpy as np
+
+DAYS_PER_YEAR = 365.25
+DEFAULT_FREQUENCY = 2
+
+# Below this |1 - v| the annuity sums use their v = 1 limits
+_FLAT = 1e-7
+
+
+def _days(dates):
+    """Dates (date objects, ISO strings or datetime64) as integer day numbers"""
+    return np.asarray(dates, dtype='datetime64[D]').astype(np.int64)
+
+
+def json_floats(values, digits=6):
+    """Round an array for JSON as a list; NaN (no remaining cash flows) becomes None"""
+    values = np.asarray(values, dtype=float)
+    rounded = np.round(values, digits).astype(object)
+    rounded[np.isnan(values)] = None
+    return rounded.tolist()
+
+
+def _coupon_dates(maturity_month, maturity_day, k, months):
+    """Day numbers of the coupons k periods before maturity
+
+    Steps whole months back from the maturity date, keeping its day of the
+    month where the month has it and the month's last day otherwise.
+    """
+    month = (maturity_month - k * months).astype('datetime64[M]')
+    start = month.astype('datetime64[D]').astype(np.int64)
+    end = (month + 1).astype('datetime64[D]').astype(np.int64) - 1
+    return np.minimum(start + maturity_day, end)
+
+
+def _schedule(face_value, coupon_rate, issue_date, maturity_date, settlement_date, frequency):
+    """Compact schedule: (face, coupon per period, periods left, first flow in periods)"""
+    if 12 % frequency:
+        raise ValueError('frequency must divide 12')
+    months = 12 // frequency
+    face, rate, issue, maturity, settlement = (
+        np.atleast_1d(value) for value in np.broadcast_arrays(
+            np.asarray(face_value, dtype=float), np.asarray(coupon_rate, dtype=float),
+            _days(issue_date), _days(maturity_date), _days(settlement_date)
+        )
+    )
+    maturity_month = maturity.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    maturity_day = maturity - maturity_month.astype('datetime64[M]').astype('datetime64[D]').astype(np.int64)
+
+    # Coupons still due are those dated after both settlement and issue. The
+    # earliest is in the cutoff's month or a later one, whole periods back
+    cutoff = np.maximum(settlement, issue)
+    cutoff_month = cutoff.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    last = np.floor_divide(maturity_month - cutoff_month, months)
+    last = np.where(_coupon_dates(maturity_month, maturity_day, last, months) > cutoff, last, last - 1)
+    periods = np.clip(last + 1, 0, None).astype(float)
+
+    # Time to the next coupon as a fraction of its period (actual days over
+    # actual days), later flows whole periods after it
+    k = np.maximum(periods - 1, 0).astype(np.int64)
+    following = _coupon_dates(maturity_month, maturity_day, k, months)
+    previous = _coupon_dates(maturity_month, maturity_day, k + 1, months)
+    first = np.where(periods > 0, (following - settlement) / (following - previous), 1.0)
+    return face, face * rate / 100 / frequency, periods, first
+
+
+def cash_flow_schedule(face_value, coupon_rate, issue_date, maturity_date, settlement_date,
+                       frequency=DEFAULT_FREQUENCY):
+    """Remaining cash flows for many bonds as padded (bonds, periods) arrays
+
+    Returns ``(times, flows)``: times in years from settlement and flow
+    amounts per bond. Rows are padded with zero flows up to the longest
+    schedule in the batch. Bonds that have matured by settlement have no
+    flows; coupons dated before the issue date are dropped.
+    """
+    face, coupon, periods, first = _schedule(face_value, coupon_rate, issue_date, maturity_date,
+                                             settlement_date, frequency)
+    width = int(periods.max()) if periods.size else 0
+    k = np.arange(width)
+    mask = k[None, :] < periods[:, None]
+    times = np.where(mask, (first[:, None] + k[None, :]) / frequency, 0.0)
+    flows = np.where(mask, coupon[:, None], 0.0)
+    alive = periods > 0
+    flows[np.nonzero(alive)[0], periods[alive].astype(np.int64) - 1] += face[alive]
+    return times, flows
+
+
+def _annuity_sums(v, n):
+    """Sums of v^k, k v^k and k^2 v^k for k = 0 .. n-1"""
+    vn = v ** n
+    one_minus_v = 1 - v
+    flat = np.abs(one_minus_v) < _FLAT
+    d = np.where(flat, 1.0, one_minus_v)
+    # (1 - v) S0 = 1 - v^n, (1 - v) S1 = S0 - 1 - (n - 1) v^n and
+    # (1 - v) S2 = 2 S1 - S0 + 1 - (n - 1)^2 v^n
+    s0 = np.where(flat, n, (1 - vn) / d)
+    s1 = np.where(flat, n * (n - 1) / 2, (s0 - 1 - (n - 1) * vn) / d)
+    s2 = np.where(flat, (n - 1) * n * (2 * n - 1) / 6, (2 * s1 - s0 + 1 - (n - 1) ** 2 * vn) / d)
+    return s0, s1, s2
+
+
+def _moments(y, face, coupon, periods, first, frequency):
+    """Present value plus its first and second moments in periods, at yield y (decimal)
+
+    Returns ``(pv, m1, m2)`` with m1 = sum e w and m2 = sum e^2 w over the
+    discounted flows w at e periods from settlement.
+    """
+    v = 1 / (1 + y / frequency)
+    s0, s1, s2 = _annuity_sums(v, periods)
+    lead = v ** first
+    last = first + periods - 1
+    redemption = face * v ** (periods - 1)
+    pv = lead * (coupon * s0 + redemption)
+    m1 = lead * (coupon * (first * s0 + s1) + last * redemption)
+    m2 = lead * (coupon * (first ** 2 * s0 + 2 * first * s1 + s2) + last ** 2 * redemption)
+    return pv, m1, m2
+
+
+def price_from_yield(yield_pct, face_value, coupon_rate, issue_date, maturity_date, settlement_date,
+                     frequency=DEFAULT_FREQUENCY):
+    """Full price per bond at each yield (percent)"""
+    face, coupon, periods, first = _schedule(face_value, coupon_rate, issue_date, maturity_date,
+                                             settlement_date, frequency)
+    y = np.broadcast_to(np.asarray(yield_pct, dtype=float), face.shape) / 100
+    pv, _, _ = _moments(y, face, coupon, periods, first, frequency)
+    return np.where(periods > 0, pv, 0.0)
+
+
+def _solve_yield(price, face, coupon, periods, first, frequency, tol=1e-10, max_iter=50):
+    price = np.broadcast_to(np.asarray(price, dtype=float), face.shape)
+    valid = (periods > 0) & (price > 0)
+    y = np.full(face.shape, np.nan)
+    rows = np.nonzero(valid)[0]
+    if not rows.size:
+        return y
+    price, face, coupon, periods, first = (a[rows] for a in (price, face, coupon, periods, first))
+
+    # Start from the usual approximation, income plus gain per year over the
+    # average of price and redemption, which leaves Newton a few steps
+    years = (first + periods - 1) / frequency
+    income = coupon * frequency + (face - price) / years
+    solved = np.maximum(income / ((face + price) / 2), -frequency / 2)
+
+    active = np.arange(rows.size)
+    for _ in range(max_iter):
+        current = solved[active]
+        pv, m1, _ = _moments(current, face[active], coupon[active], periods[active],
+                             first[active], frequency)
+        # d/dy of (1 + y/f)^(-e) is -(e/f) (1 + y/f)^(-e - 1)
+        slope = -m1 / (frequency + current)
+        step = np.divide(pv - price[active], slope, out=np.zeros_like(pv), where=slope != 0)
+        solved[active] = np.maximum(current - step, -frequency + 1e-9)
+        active = active[np.abs(step) >= tol]
+        if not active.size:
+            break
+
+    y[rows] = solved * 100
+    return y
+
+
+def yield_to_maturity(price, face_value, coupon_rate, issue_date, maturity_date, settlement_date,
+                      frequency=DEFAULT_FREQUENCY):
+    """Yield (percent) at which each bond's remaining flows are worth price
+
+    Bonds without remaining flows or with a non-positive price get NaN.
+    """
+    schedule = _schedule(face_value, coupon_rate, issue_date, maturity_date, settlement_date, frequency)
+    return _solve_yield(price, *schedule, frequency)
+
+
+def bond_analytics(price, face_value, coupon_rate, issue_date, maturity_date, settlement_date,
+                   frequency=DEFAULT_FREQUENCY):
+    """Yield, Macaulay/modified duration (years) and convexity for many bonds at the given prices"""
+    face, coupon, periods, first = _schedule(face_value, coupon_rate, issue_date, maturity_date,
+                                             settlement_date, frequency)
+    ytm = _solve_yield(price, face, coupon, periods, first, frequency)
+    y = ytm / 100
+    pv, m1, m2 = _moments(y, face, coupon, periods, first, frequency)
+    pv = np.where(pv > 0, pv, np.nan)
+    growth = 1 + y / frequency
+    macaulay = m1 / pv / frequency
+    return {
+        'yieldToMaturity': ytm,
+        'macaulayDuration': macaulay,
+        'modifiedDuration': macaulay / growth,
+        # sum t (t + 1/f) w / (pv (1 + y/f)^2) with t = e / f
+        'convexity': (m2 + m1) / pv / (frequency * growth) ** 2,
+    }
+
+
+def position_projections(investment_amount, purchase_price, face_value, coupon_rate, issue_date,
+                         maturity_date, purchase_date, frequency=DEFAULT_FREQUENCY):
+    """Server-side expected_return and maturity_value for many investments
+
+    A position holds investment_amount / purchase_price bonds. Its
+    maturity_value is the face value repaid at maturity and its
+    expected_return is every cash flow still due after the purchase date
+    (coupons plus principal).
+    """
+    amount = np.atleast_1d(np.asarray(investment_amount, dtype=float))
+    price = np.broadcast_to(np.asarray(purchase_price, dtype=float), amount.shape)
+    units = np.divide(amount, price, out=np.zeros_like(amount), where=price > 0)
+    face, coupon, periods, _ = _schedule(face_value, coupon_rate, issue_date, maturity_date,
+                                         purchase_date, frequency)
+    alive = periods > 0
+    expected_return = units * (coupon * periods + np.where(alive, face, 0.0))
+    maturity_value = units * face
+    return expected_return, maturity_value
+
+
+def portfolio_analytics(units, price, face_value, coupon_rate, issue_date, maturity_date,
+                        settlement_date, frequency=DEFAULT_FREQUENCY):
+    """Per-position analytics plus market-value weighted portfolio totals"""
+    result = bond_analytics(price, face_value, coupon_rate, issue_date, maturity_date,
+                            settlement_date, frequency)
+    market_value = np.asarray(units, dtype=float) * np.asarray(price, dtype=float)
+    market_value = np.broadcast_to(market_value, result['yieldToMaturity'].shape)
+    valid = ~np.isnan(result['yieldToMaturity'])
+    weights = np.where(valid, market_value, 0.0)
+    total = weights.sum()
+
+    def weighted(values):
+        return float(np.where(valid, values, 0.0) @ weights / total) if total else None
+
+    result['marketValue'] = market_value
+    result['portfolio'] = {
+        'marketValue': float(market_value.sum()),
+        'yieldToMaturity': weighted(result['yieldToMaturity']),
+        'macaulayDuration': weighted(result['macaulayDuration']),
+        'modifiedDuration': weighted(result['modifiedDuration']),
+        'convexity': weighted(result['convexity']),
+    }
+    return result
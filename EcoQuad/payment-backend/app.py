@@ -1,129 +1,272 @@
-from flask import Flask, request, jsonify, abort
+"""
+GreenBond payment backend.
+
+create_app() builds the Flask app: it loads the configuration from the
+environment, applies any overrides passed in, attaches the shared
+extensions (extensions.py) and registers the blueprints. Nothing it does
+opens a connection or a pool: the engine connects on the first query, and
+the Razorpay client, its HTTP session and the worker pools are built on
+first use in each process. Heavy optional imports (Razorpay and requests,
+NumPy for analytics, the PostgreSQL dialect) are deferred the same way, so
+a worker forked by a pre-fork server is ready to serve as soon as it starts.
+
+The module-level ``app`` is the default application used by
+``python app.py``, wsgi.py, the scripts and the tests.
+"""
+from flask import Blueprint, Flask, current_app, jsonify
 from flask_cors import CORS
-from flask_sqlalchemy import SQLAlchemy
-from flask_bcrypt import Bcrypt
-from flask_jwt_extended import JWTManager
 import os
-import razorpay
 from dotenv import load_dotenv
 import logging
-import traceback
 
-load_dotenv()
+from cache import TTLCache
+from engines import configure_engine, engine_options
+from extensions import (bcrypt, db, job_queue, jwt, order_idempotency, password_hasher, payment_gateway,
+                        read_replicas)
+from fulfillment import FULFILL_PAYMENT, fulfill_payment
+from guid import configure as configure_ids
+from migrations import check_id_storage, create_missing_indexes, migrate_money_columns
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('payment-backend')
 
-app = Flask(__name__)
+core_bp = Blueprint('core', __name__)
+
+
+def load_config(app):
+    """Read the app's settings from the environment"""
+    # Database configuration
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///greenbonds.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
+    app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'jwt-secret-string')
+    app.config['JWT_ACCESS_TOKEN_EXPIRES'] = False  # Tokens don't expire by default
+
+    # Engine profile (engines.py): WAL, busy timeout and a per-process writer
+    # queue for SQLite, a pre-pinged recycling pool for PostgreSQL
+    app.config['DB_ENGINE_PROFILE'] = os.getenv('DB_ENGINE_PROFILE', 'tuned')
+    app.config['SQLITE_JOURNAL_MODE'] = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+    app.config['SQLITE_SYNCHRONOUS'] = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    app.config['SQLITE_BUSY_TIMEOUT'] = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))
+    app.config['SQLITE_MMAP_SIZE'] = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 2 ** 20))
+    app.config['SQLITE_SINGLE_WRITER'] = os.getenv('SQLITE_SINGLE_WRITER', 'true').lower() == 'true'
+    app.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', 10))
+    app.config['DB_MAX_OVERFLOW'] = int(os.getenv('DB_MAX_OVERFLOW', 20))
+    app.config['DB_POOL_TIMEOUT'] = float(os.getenv('DB_POOL_TIMEOUT', 30))
+    app.config['DB_POOL_RECYCLE'] = int(os.getenv('DB_POOL_RECYCLE', 1800))
+    app.config['DB_POOL_PRE_PING'] = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+
+    # Ids (guid.py): stored as VARCHAR(36) text or 16-byte binary (new databases
+    # only), generated as random uuid4 or time-ordered uuid7
+    app.config['ID_STORAGE'] = os.getenv('ID_STORAGE', 'text')
+    app.config['ID_FORMAT'] = os.getenv('ID_FORMAT', 'uuid4')
+
+    # Read replicas (replicas.py): @read_only views read from one of these, and
+    # a client that has just written reads from the primary for a while
+    app.config['DATABASE_REPLICA_URLS'] = os.getenv('DATABASE_REPLICA_URLS', '')
+    app.config['REPLICA_STICKY_SECONDS'] = float(os.getenv('REPLICA_STICKY_SECONDS', 5))
 
-# Database configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///greenbonds.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
-app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'jwt-secret-string')
-app.config['JWT_ACCESS_TOKEN_EXPIRES'] = False  # Tokens don't expire by default
+    # bcrypt work factor: keep it low for local test scripts and load tests and
+    # high in production; stored hashes migrate to it on the next login
+    app.config['BCRYPT_LOG_ROUNDS'] = int(os.getenv('BCRYPT_LOG_ROUNDS', 12))
+    app.config['BCRYPT_REHASH_ON_LOGIN'] = os.getenv('BCRYPT_REHASH_ON_LOGIN', 'true').lower() == 'true'
 
-# Initialize extensions
-db = SQLAlchemy()
-bcrypt = Bcrypt()
-jwt = JWTManager(app)
+    # User snapshot cache for /profile and /verify-token, and optionally embed the
+    # user's profile in the JWT so verify-token needs no lookup at all
+    app.config['USER_CACHE_TTL'] = float(os.getenv('USER_CACHE_TTL', 60))
+    app.config['USER_CACHE_SIZE'] = int(os.getenv('USER_CACHE_SIZE', 10000))
+    app.config['JWT_EMBED_USER_CLAIMS'] = os.getenv('JWT_EMBED_USER_CLAIMS', 'false').lower() == 'true'
 
-# Initialize extensions with app
-db.init_app(app)
-bcrypt.init_app(app)
+    # Password hashing pool: bcrypt runs off the request thread and excess load
+    # is shed with a 503 once PASSWORD_HASH_QUEUE_DEPTH jobs are waiting
+    app.config['PASSWORD_HASH_EXECUTOR'] = os.getenv('PASSWORD_HASH_EXECUTOR', 'process')
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+    app.config['PASSWORD_HASH_QUEUE_DEPTH'] = int(os.getenv('PASSWORD_HASH_QUEUE_DEPTH', 32))
+    app.config['PASSWORD_HASH_TIMEOUT'] = float(os.getenv('PASSWORD_HASH_TIMEOUT', 10))
 
-# allow all origins during development; tighten in production
-CORS(app, resources={r"/*": {"origins": "*"}})
+    # Razorpay gateway: pooled keep-alive session, explicit timeouts and bounded
+    # retries. RAZORPAY_ORDER_MODE=async (or a "Prefer: respond-async" header)
+    # hands order creation to a thread pool and answers 202 with a job to poll
+    app.config['RAZORPAY_KEY_ID'] = os.getenv('RAZORPAY_KEY_ID') or 'rzp_test_key'
+    app.config['RAZORPAY_KEY_SECRET'] = os.getenv('RAZORPAY_KEY_SECRET') or 'rzp_test_secret'
+    app.config['RAZORPAY_BASE_URL'] = os.getenv('RAZORPAY_BASE_URL')
+    app.config['RAZORPAY_CONNECT_TIMEOUT'] = float(os.getenv('RAZORPAY_CONNECT_TIMEOUT', 3.05))
+    app.config['RAZORPAY_READ_TIMEOUT'] = float(os.getenv('RAZORPAY_READ_TIMEOUT', 10))
+    app.config['RAZORPAY_MAX_RETRIES'] = int(os.getenv('RAZORPAY_MAX_RETRIES', 2))
+    app.config['RAZORPAY_RETRY_BACKOFF'] = float(os.getenv('RAZORPAY_RETRY_BACKOFF', 0.2))
+    app.config['RAZORPAY_POOL_SIZE'] = int(os.getenv('RAZORPAY_POOL_SIZE', 20))
+    app.config['RAZORPAY_ORDER_MODE'] = os.getenv('RAZORPAY_ORDER_MODE', 'sync')
+    app.config['RAZORPAY_ORDER_WORKERS'] = int(os.getenv('RAZORPAY_ORDER_WORKERS', 32))
+    app.config['RAZORPAY_ORDER_QUEUE_DEPTH'] = int(os.getenv('RAZORPAY_ORDER_QUEUE_DEPTH', 256))
+    app.config['RAZORPAY_ORDER_RESULT_TTL'] = float(os.getenv('RAZORPAY_ORDER_RESULT_TTL', 600))
 
-RAZORPAY_KEY_ID = os.getenv('RAZORPAY_KEY_ID') or 'rzp_test_key'
-RAZORPAY_KEY_SECRET = os.getenv('RAZORPAY_KEY_SECRET') or 'rzp_test_secret'
+    # Order idempotency: requests with an Idempotency-Key header or a receipt
+    # replay the order created for it for IDEMPOTENCY_TTL seconds
+    app.config['IDEMPOTENCY_TTL'] = float(os.getenv('IDEMPOTENCY_TTL', 86400))
+    app.config['IDEMPOTENCY_CACHE_SIZE'] = int(os.getenv('IDEMPOTENCY_CACHE_SIZE', 10000))
+    app.config['IDEMPOTENCY_PENDING_TIMEOUT'] = float(os.getenv('IDEMPOTENCY_PENDING_TIMEOUT', 30))
 
-logger.info('Using Razorpay Key ID: %s', RAZORPAY_KEY_ID)
+    # Webhooks: deliveries are signed with RAZORPAY_WEBHOOK_SECRET; recently seen
+    # event ids are kept in memory (on top of the webhook_events table) to drop
+    # redeliveries without a query
+    app.config['RAZORPAY_WEBHOOK_SECRET'] = os.getenv('RAZORPAY_WEBHOOK_SECRET')
+    app.config['WEBHOOK_MAX_EVENTS'] = int(os.getenv('WEBHOOK_MAX_EVENTS', 5000))
+    app.config['WEBHOOK_SEEN_SIZE'] = int(os.getenv('WEBHOOK_SEEN_SIZE', 100000))
+    app.config['WEBHOOK_SEEN_TTL'] = float(os.getenv('WEBHOOK_SEEN_TTL', 86400))
 
-client = razorpay.Client(auth=(RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET))
+    # Impact metrics: readings accepted per POST /api/impact/readings batch, and
+    # rows written per transaction by the streaming bulk upload (ingest.py)
+    app.config['IMPACT_MAX_READINGS'] = int(os.getenv('IMPACT_MAX_READINGS', 10000))
+    app.config['IMPACT_BULK_CHUNK'] = int(os.getenv('IMPACT_BULK_CHUNK', 10000))
+
+    # Background jobs (payment fulfillment): run on a worker thread per process,
+    # inline in the request, or off to leave them to `python jobs.py`
+    app.config['JOB_QUEUE_MODE'] = os.getenv('JOB_QUEUE_MODE', 'thread')
+    app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', 4))
+    app.config['JOB_POLL_INTERVAL'] = float(os.getenv('JOB_POLL_INTERVAL', 1.0))
+    app.config['JOB_MAX_ATTEMPTS'] = int(os.getenv('JOB_MAX_ATTEMPTS', 5))
+    app.config['JOB_RETRY_BACKOFF'] = float(os.getenv('JOB_RETRY_BACKOFF', 1.0))
+    app.config['JOB_LEASE'] = float(os.getenv('JOB_LEASE', 60))
+
+
+def create_app(config=None):
+    """Build the application; ``config`` overrides settings from the environment"""
+    load_dotenv()
+    app = Flask(__name__)
+    load_config(app)
+    app.config.update(config or {})
+
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+    # Before any model is defined: the id columns' storage follows it
+    configure_ids(app.config)
+
+    # Extensions are shared by the process: an app created later rebinds them
+    db.init_app(app)
+    with app.app_context():
+        app.extensions['writer_queue'] = configure_engine(db.engine, app.config)
+    read_replicas.init_app(app, db)
+    bcrypt.init_app(app)
+    jwt.init_app(app)
+    password_hasher.init_app(app, bcrypt)
+    payment_gateway.init_app(app)
+    order_idempotency.init_app(app, db)
+    job_queue.init_app(app, db)
+    job_queue.register(FULFILL_PAYMENT, fulfill_payment)
+    app.extensions['user_cache'] = TTLCache(
+        maxsize=app.config['USER_CACHE_SIZE'], ttl=app.config['USER_CACHE_TTL']
+    )
 
-# Import models and create them
-from models import create_models
-User, GreenBond, Project, Investment = create_models(db)
+    # allow all origins during development; tighten in production
+    CORS(app, resources={r"/*": {"origins": "*"}})
 
-# Import and register blueprints after app is created
-from auth import auth_bp
-app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    # Blueprints bind the models and extensions of the app they're registered on
+    from auth import auth_bp
+    from bonds import bonds_bp
+    from impact import impact_bp
+    from issuer import issuer_bp
+    from ingest import ingest_bp
+    from payments import payments_bp
+    from portfolio import portfolio_bp
+    from search import search_bp
+    from webhooks import webhooks_bp
+    app.register_blueprint(core_bp)
+    app.register_blueprint(payments_bp)
+    app.register_blueprint(auth_bp, url_prefix='/api/auth')
+    app.register_blueprint(bonds_bp, url_prefix='/api/bonds')
+    app.register_blueprint(portfolio_bp, url_prefix='/api/portfolio')
+    app.register_blueprint(issuer_bp, url_prefix='/api/issuer')
+    app.register_blueprint(impact_bp, url_prefix='/api/impact')
+    app.register_blueprint(ingest_bp, url_prefix='/api/projects')
+    app.register_blueprint(search_bp, url_prefix='/api/search')
+    app.register_blueprint(webhooks_bp, url_prefix='/webhooks')
+    return app
 
 
-@app.route('/health')
+@core_bp.route('/health')
 def health():
     return jsonify({'status': 'ok'})
 
 
-@app.route('/config')
+@core_bp.route('/metrics/password-hashing')
+def password_hashing_metrics():
+    # Queue wait vs. hash time percentiles, for tuning BCRYPT_LOG_ROUNDS
+    return jsonify(password_hasher.metrics())
+
+
+@core_bp.route('/metrics/payment-gateway')
+def payment_gateway_metrics():
+    # Razorpay call latency percentiles, failures and offload pool sizing
+    metrics = payment_gateway.metrics()
+    metrics['idempotency'] = order_idempotency.metrics()
+    return jsonify(metrics)
+
+
+@core_bp.route('/metrics/jobs')
+def job_metrics():
+    # Background job backlog by status and this process's retry counters
+    return jsonify(job_queue.metrics())
+
+
+@core_bp.route('/metrics/database')
+def database_metrics():
+    # Connection pool occupancy, for SQLite how long writers queue, and how
+    # reads split between the replicas and the primary
+    pool = db.engine.pool
+    metrics = {'dialect': db.engine.dialect.name, 'pool': type(pool).__name__, 'status': pool.status()}
+    writers = current_app.extensions.get('writer_queue')
+    if writers is not None:
+        metrics['writerQueue'] = writers.metrics()
+    metrics['readReplicas'] = read_replicas.metrics()
+    return jsonify(metrics)
+
+
+@core_bp.route('/config')
 def config():
     # Expose non-secret config for local debugging only
     return jsonify({
-        'razorpay_key_id': RAZORPAY_KEY_ID,
+        'razorpay_key_id': current_app.config['RAZORPAY_KEY_ID'],
         'port': int(os.getenv('PORT', 5000))
     })
 
 
-@app.route('/create-order', methods=['POST'])
-def create_order():
-    data = request.json or {}
-    amount = data.get('amount')
-    currency = data.get('currency', 'INR')
-    receipt = data.get('receipt', f'receipt_{os.urandom(6).hex()}')
-    if amount is None:
-        return jsonify({'error': 'amount is required'}), 400
-
-    try:
-        # Razorpay expects amount in paise (i.e., INR * 100)
-        amount_in_paise = int(float(amount) * 100)
-        logger.info('Creating order for %s paise (currency=%s, receipt=%s)', amount_in_paise, currency, receipt)
-        order = client.order.create({'amount': amount_in_paise, 'currency': currency, 'receipt': receipt, 'payment_capture': 1})
-        logger.info('Order created: %s', order.get('id') if isinstance(order, dict) else str(order))
-        return jsonify({'order': order, 'key': RAZORPAY_KEY_ID})
-    except Exception as e:
-        tb = traceback.format_exc()
-        logger.error('Failed to create order: %s\n%s', str(e), tb)
-        # detect authentication errors from Razorpay
-        msg = str(e)
-        if 'authentication' in msg.lower() or 'invalid key' in msg.lower() or '401' in msg:
-            # auth problem - return 401 with helpful message
-            return jsonify({'error': 'authentication_failed', 'message': 'Razorpay authentication failed. Check RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET in your .env and restart the server.'}), 401
-        return jsonify({'error': 'failed_to_create_order', 'message': msg}), 500
-
-
-@app.route('/verify-payment', methods=['POST'])
-def verify_payment():
-    # This endpoint verifies the signature from the frontend after payment
-    data = request.json or {}
-    try:
-        razorpay_payment_id = data['razorpay_payment_id']
-        razorpay_order_id = data['razorpay_order_id']
-        razorpay_signature = data['razorpay_signature']
-    except KeyError:
-        return jsonify({'error': 'missing payment data'}), 400
-
-    # Verify signature
-    try:
-        params_dict = {
-            'razorpay_order_id': razorpay_order_id,
-            'razorpay_payment_id': razorpay_payment_id,
-            'razorpay_signature': razorpay_signature
-        }
-        client.utility.verify_payment_signature(params_dict)
-        # At this point you would record payment in your DB and fulfill the order
-        return jsonify({'status': 'verified'})
-    except Exception as e:
-        return jsonify({'error': 'verification failed', 'details': str(e)}), 400
-
-
 # Create database tables
-def create_tables():
-    with app.app_context():
+def create_tables(flask_app=None):
+    with (flask_app or app).app_context():
+        # Portfolio and issuer summaries and the search index are maintained
+        # incrementally from here on, so seed them from existing rows the
+        # first time they're created
+        needs_portfolio_backfill = not db.inspect(db.engine).has_table('portfolio_summaries')
+        needs_issuer_backfill = not db.inspect(db.engine).has_table('issuer_summaries')
+        needs_search_backfill = not db.inspect(db.engine).has_table('search_documents')
+        check_id_storage(db)
+        # Databases created before amounts were stored as paise. First, as
+        # it rebuilds tables on SQLite, dropping their triggers, which
+        # create_all() then restores along with the search index
+        migrate_money_columns(db)
         db.create_all()
+        # Indexes declared since the database was first created
+        create_missing_indexes(db)
+        if needs_portfolio_backfill:
+            from portfolio import rebuild_portfolios
+            rebuild_portfolios()
+        if needs_issuer_backfill:
+            from issuer import rebuild_issuers
+            rebuild_issuers()
+        if needs_search_backfill:
+            from search import rebuild_search_index
+            rebuild_search_index()
         logger.info('Database tables created')
 
+
+app = create_app()
+
 if __name__ == '__main__':
+    # Development server; serve production traffic with
+    # `gunicorn -c gunicorn.conf.py wsgi:application`
     create_tables()
+    if app.config['JOB_QUEUE_MODE'] == 'thread':
+        # Pick up jobs left queued by a previous run
+        job_queue.start()
     port = int(os.getenv('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=True)
+    debug = os.getenv('FLASK_DEBUG', 'false').lower() in ('1', 'true')
+    app.run(host=os.getenv('HOST', '0.0.0.0'), port=port, debug=debug)
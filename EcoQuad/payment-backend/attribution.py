@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Investors' share of the impact of the projects they fund.
+
+Each investor is credited with a bond's impact pro rata: their
+investment_amount over the bond's amount_raised. Only investments in
+FUNDED_STATUSES count, the ones whose money amount_raised holds, so the
+shares of a bond sum to at most 100%. A bond's impact is the sum
+over its projects of each metric's current value as GET /api/impact/metrics
+reports it (the total for flows, the latest reading for levels), read from
+the monthly rollups. The results are kept per investor and metric in
+``impact_attributions``, which GET /api/portfolio/impact reads.
+
+Nothing is computed per investor in Python. Bond impacts are written to
+``bond_impacts``, then a single INSERT ... SELECT joins investments with them
+and sums per investor and metric. However many investors there are, the work
+is one join and GROUP BY in the database.
+
+Updates are incremental. New readings (impact.record_readings) and
+investment changes (the listeners in portfolio.py) queue their bond in
+``attribution_queue``, an append-only log: writers never update a shared
+row, so concurrent payments for one bond don't wait on each other.
+refresh_attributions() takes the queued bonds off the log, then recomputes
+their impacts and every investor holding one of them. Nothing else is
+touched. Run it on a schedule:
+
+    python attribution.py              # refresh the queued bonds once
+    python attribution.py --every 60   # ... every minute until interrupted
+    python attribution.py --rebuild    # recompute everything
+
+Loads that bypass the ORM and the impact endpoints, and deleted investments,
+need --rebuild.
+"""
+import argparse
+import logging
+import time
+
+from sqlalchemy import func, select
+
+from impact import _merge, metric_value
+from models import get_models
+
+logger = logging.getLogger('payment-backend')
+
+# Investments whose money is in GreenBond.amount_raised: fulfillment.py
+# creates them confirmed, and they settle from there
+FUNDED_STATUSES = ('confirmed', 'settled')
+
+# Bonds refreshed per transaction; also keeps IN (...) lists well under
+# SQLite's bound parameter limit
+BOND_CHUNK = 500
+
+
+def update_bond_impacts(db, bond_ids):
+    """Recompute bond_impacts for bond_ids from the monthly rollups and amount_raised"""
+    models = get_models(db)
+    GreenBond, Project, ImpactRollup = models['GreenBond'], models['Project'], models['ImpactRollup']
+    table = models['BondImpact'].__table__
+
+    rows = db.session.execute(
+        select(Project.bond_id, ImpactRollup.project_id, ImpactRollup.metric_type, ImpactRollup.reading_count,
+               ImpactRollup.total, ImpactRollup.minimum, ImpactRollup.maximum,
+               ImpactRollup.last_value, ImpactRollup.last_at)
+        .join(Project, Project.id == ImpactRollup.project_id)
+        .where(Project.bond_id.in_(bond_ids), ImpactRollup.period == 'month')
+    ).all()
+    totals = {}
+    for bond_id, project_id, metric_type, *aggregate in rows:
+        key = (bond_id, project_id, metric_type)
+        if key in totals:
+            _merge(totals[key], aggregate)
+        else:
+            totals[key] = list(aggregate)
+    impacts = {}
+    for (bond_id, _, metric_type), (_, total, _, _, last, _) in totals.items():
+        key = (bond_id, metric_type)
+        impacts[key] = impacts.get(key, 0.0) + metric_value(metric_type, total, last)
+
+    raised = dict(db.session.execute(
+        select(GreenBond.id, GreenBond.amount_raised).where(GreenBond.id.in_(bond_ids))
+    ).all())
+    db.session.execute(table.delete().where(table.c.bond_id.in_(bond_ids)))
+    if impacts:
+        db.session.execute(table.insert(), [
+            {'bond_id': bond_id, 'metric_type': metric_type, 'value': value,
+             'amount_raised': raised.get(bond_id) or 0}
+            for (bond_id, metric_type), value in impacts.items()
+        ])
+
+
+def attribute(db, bond_ids=None):
+    """Recompute impact_attributions for every investor in bond_ids, or every investor
+
+    An investor is recomputed across all their bonds, from bond_impacts,
+    whatever the status of their position in bond_ids: one that is no
+    longer funded (cancelled, say) is dropped from their totals.
+    """
+    models = get_models(db)
+    Investment, BondImpact = models['Investment'], models['BondImpact']
+    table = models['ImpactAttribution'].__table__
+
+    scope = [Investment.status.in_(FUNDED_STATUSES), BondImpact.amount_raised > 0]
+    if bond_ids is not None:
+        investors = select(Investment.investor_id).where(Investment.bond_id.in_(bond_ids))
+        scope.append(Investment.investor_id.in_(investors))
+        db.session.execute(table.delete().where(table.c.investor_id.in_(investors)))
+    else:
+        db.session.execute(table.delete())
+
+    # Amounts are integer paise on both sides, so the ratio is the share
+    db.session.execute(table.insert().from_select(
+        ['investor_id', 'metric_type', 'value'],
+        select(
+            Investment.investor_id,
+            BondImpact.metric_type,
+            func.sum(Investment.investment_amount * BondImpact.value / BondImpact.amount_raised)
+        ).join(BondImpact, BondImpact.bond_id == Investment.bond_id)
+        .where(*scope).group_by(Investment.investor_id, BondImpact.metric_type)
+    ))
+
+
+def refresh_attributions(db):
+    """Attribute the impact of the queued bonds, BOND_CHUNK per transaction; returns how many
+
+    A chunk's queue entries are deleted before its bonds are recomputed, so
+    a change committed after the delete is queued again rather than lost.
+    Entries added after the refresh started wait for the next one.
+    """
+    queue = get_models(db)['AttributionQueue'].__table__
+    last = db.session.execute(select(func.max(queue.c.id))).scalar()
+    refreshed = 0
+    while last is not None:
+        bond_ids = db.session.execute(
+            select(queue.c.bond_id).where(queue.c.id <= last)
+            .group_by(queue.c.bond_id).order_by(func.min(queue.c.id)).limit(BOND_CHUNK)
+        ).scalars().all()
+        if not bond_ids:
+            break
+        db.session.execute(queue.delete().where(queue.c.bond_id.in_(bond_ids), queue.c.id <= last))
+        update_bond_impacts(db, bond_ids)
+        attribute(db, bond_ids)
+        db.session.commit()
+        refreshed += len(bond_ids)
+    return refreshed
+
+
+def rebuild_attributions(db):
+    """Recompute every bond's impact and every investor's share, and empty the queue"""
+    models = get_models(db)
+    queue = models['AttributionQueue'].__table__
+    db.session.execute(queue.delete())
+    db.session.execute(models['BondImpact'].__table__.delete())
+    bond_ids = db.session.execute(select(models['GreenBond'].id)).scalars().all()
+    for start in range(0, len(bond_ids), BOND_CHUNK):
+        update_bond_impacts(db, bond_ids[start:start + BOND_CHUNK])
+    attribute(db)
+    db.session.commit()
+    return len(bond_ids)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Attribute project impact to investors")
+    parser.add_argument('--rebuild', action='store_true', help='recompute every bond and investor')
+    parser.add_argument('--every', type=float, metavar='SECONDS', help='refresh repeatedly until interrupted')
+    args = parser.parse_args()
+
+    from app import app, db
+
+    with app.app_context():
+        if args.rebuild:
+            print(f'Rebuilt attribution for {rebuild_attributions(db)} bonds')
+            return
+        if args.every is None:
+            print(f'Refreshed {refresh_attributions(db)} bonds')
+            return
+        logger.info('Refreshing impact attribution every %ss', args.every)
+        try:
+            while True:
+                refreshed = refresh_attributions(db)
+                if refreshed:
+                    logger.info('Refreshed impact attribution for %s bonds', refreshed)
+                time.sleep(args.every)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
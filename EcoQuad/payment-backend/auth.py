@@ -6,8 +6,26 @@ from flask_jwt_extended import (
 from datetime import datetime, timedelta
 import re
 
+from hashing import HashingUnavailable
+from models import create_models
+from replicas import read_only
+
 auth_bp = Blueprint('auth', __name__)
 
+# Bound once when the blueprint is registered, so handlers don't resolve the
+# db extension or the models on every request
+db = None
+User = None
+user_cache = None
+
+@auth_bp.record_once
+def bind_models(state):
+    """Resolve the db instance, models and user cache for the app the blueprint is registered on"""
+    global db, User, user_cache
+    db = state.app.extensions['sqlalchemy']
+    User, _, _, _ = create_models(db)
+    user_cache = state.app.extensions['user_cache']
+
 def init_jwt(app):
     """Initialize JWT with the Flask app"""
     jwt = JWTManager(app)
@@ -26,6 +44,48 @@ def init_jwt(app):
     
     return jwt
 
+def hashing_unavailable():
+    """Response for requests shed because the password hashing pool is saturated"""
+    response = jsonify({'error': 'Server is busy, please try again shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+def issue_access_token(user):
+    """Create a 24h access token, embedding the user's profile if configured"""
+    additional_claims = None
+    if current_app.config.get('JWT_EMBED_USER_CLAIMS'):
+        additional_claims = {'user': user.to_dict()}
+    return create_access_token(
+        identity=user.id,
+        expires_delta=timedelta(hours=24),
+        additional_claims=additional_claims
+    )
+
+def get_user_snapshot(user_id):
+    """Return the user's to_dict() from the snapshot cache, loading it on a miss"""
+    snapshot = user_cache.get(user_id)
+    if snapshot is None:
+        user = User.query.get(user_id)
+        if not user:
+            return None
+        snapshot = user.to_dict()
+        user_cache.set(user_id, snapshot)
+    return snapshot
+
+def rehash_password_if_needed(user, password):
+    """Re-hash a just-verified password when BCRYPT_LOG_ROUNDS has changed"""
+    if not current_app.config.get('BCRYPT_REHASH_ON_LOGIN', True) or not user.password_needs_rehash():
+        return
+    try:
+        user.set_password(password)
+        db.session.commit()
+    except HashingUnavailable:
+        # Not worth failing the login over; the next login will try again
+        db.session.rollback()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.warning(f'Password rehash failed for user {user.id}: {str(e)}')
+
 def validate_email(email):
     """Validate email format"""
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
@@ -41,14 +101,6 @@ def validate_password(password):
 def register():
     """Register a new user"""
     try:
-        from flask import current_app
-        from models import create_models
-        from flask_sqlalchemy import SQLAlchemy
-        
-        # Get the database instance from the current app
-        db = current_app.extensions['sqlalchemy']
-        User, _, _, _ = create_models(db)
-        
         data = request.get_json()
         
         # Validate required fields
@@ -88,10 +140,7 @@ def register():
         db.session.commit()
         
         # Create access token
-        access_token = create_access_token(
-            identity=user.id,
-            expires_delta=timedelta(hours=24)
-        )
+        access_token = issue_access_token(user)
         
         return jsonify({
             'message': 'User registered successfully',
@@ -99,6 +148,8 @@ def register():
             'user': user.to_dict()
         }), 201
         
+    except HashingUnavailable:
+        return hashing_unavailable()
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f'Registration error: {str(e)}')
@@ -108,13 +159,6 @@ def register():
 def login():
     """Login user and return JWT token"""
     try:
-        from flask import current_app
-        from models import create_models
-        
-        # Get the database instance from the current app
-        db = current_app.extensions['sqlalchemy']
-        User, _, _, _ = create_models(db)
-        
         data = request.get_json()
         
         if not data.get('email') or not data.get('password'):
@@ -129,11 +173,11 @@ def login():
         if not user.is_active:
             return jsonify({'error': 'Account is deactivated'}), 401
         
+        # Migrate the stored hash to the configured work factor
+        rehash_password_if_needed(user, data['password'])
+        
         # Create access token
-        access_token = create_access_token(
-            identity=user.id,
-            expires_delta=timedelta(hours=24)
-        )
+        access_token = issue_access_token(user)
         
         return jsonify({
             'message': 'Login successful',
@@ -141,6 +185,8 @@ def login():
             'user': user.to_dict()
         }), 200
         
+    except HashingUnavailable:
+        return hashing_unavailable()
     except Exception as e:
         current_app.logger.error(f'Login error: {str(e)}')
         return jsonify({'error': 'Login failed'}), 500
@@ -159,23 +205,17 @@ def logout():
 
 @auth_bp.route('/profile', methods=['GET'])
 @jwt_required()
+@read_only
 def get_profile():
     """Get current user profile"""
     try:
-        from flask import current_app
-        from models import create_models
-        
-        # Get the database instance from the current app
-        db = current_app.extensions['sqlalchemy']
-        User, _, _, _ = create_models(db)
-        
         current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
+        snapshot = get_user_snapshot(current_user_id)
         
-        if not user:
+        if not snapshot:
             return jsonify({'error': 'User not found'}), 404
         
-        return jsonify({'user': user.to_dict()}), 200
+        return jsonify({'user': snapshot}), 200
         
     except Exception as e:
         current_app.logger.error(f'Profile error: {str(e)}')
@@ -186,13 +226,6 @@ def get_profile():
 def update_profile():
     """Update user profile"""
     try:
-        from flask import current_app
-        from models import create_models
-        
-        # Get the database instance from the current app
-        db = current_app.extensions['sqlalchemy']
-        User, _, _, _ = create_models(db)
-        
         current_user_id = get_jwt_identity()
         user = User.query.get(current_user_id)
         
@@ -212,11 +245,17 @@ def update_profile():
         user.updated_at = datetime.utcnow()
         
         db.session.commit()
+        user_cache.invalidate(user.id)
         
-        return jsonify({
+        response = {
             'message': 'Profile updated successfully',
             'user': user.to_dict()
-        }), 200
+        }
+        # Tokens carrying the old profile are stale now, hand out a fresh one
+        if current_app.config.get('JWT_EMBED_USER_CLAIMS'):
+            response['access_token'] = issue_access_token(user)
+        
+        return jsonify(response), 200
         
     except Exception as e:
         db.session.rollback()
@@ -228,13 +267,6 @@ def update_profile():
 def change_password():
     """Change user password"""
     try:
-        from flask import current_app
-        from models import create_models
-        
-        # Get the database instance from the current app
-        db = current_app.extensions['sqlalchemy']
-        User, _, _, _ = create_models(db)
-        
         current_user_id = get_jwt_identity()
         user = User.query.get(current_user_id)
         
@@ -260,9 +292,13 @@ def change_password():
         user.updated_at = datetime.utcnow()
         
         db.session.commit()
+        user_cache.invalidate(user.id)
         
         return jsonify({'message': 'Password changed successfully'}), 200
         
+    except HashingUnavailable:
+        db.session.rollback()
+        return hashing_unavailable()
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f'Password change error: {str(e)}')
@@ -270,25 +306,23 @@ def change_password():
 
 @auth_bp.route('/verify-token', methods=['POST'])
 @jwt_required()
+@read_only
 def verify_token():
     """Verify if token is valid"""
     try:
-        from flask import current_app
-        from models import create_models
-        
-        # Get the database instance from the current app
-        db = current_app.extensions['sqlalchemy']
-        User, _, _, _ = create_models(db)
-        
-        current_user_id = get_jwt_identity()
-        user = User.query.get(current_user_id)
-        
-        if not user:
+        # Tokens issued with JWT_EMBED_USER_CLAIMS already carry the profile
+        snapshot = None
+        if current_app.config.get('JWT_EMBED_USER_CLAIMS'):
+            snapshot = get_jwt().get('user')
+        if snapshot is None:
+            snapshot = get_user_snapshot(get_jwt_identity())
+        
+        if not snapshot:
             return jsonify({'error': 'User not found'}), 404
         
         return jsonify({
             'valid': True,
-            'user': user.to_dict()
+            'user': snapshot
         }), 200
         
     except Exception as e:
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Benchmark: pricing a large portfolio with the vectorized analytics
+
+Builds N positions (default 100,000) over 1,000 bonds with random coupons
+and maturities up to 30 years, then times:
+
+- portfolio_analytics over every position (yield, durations, convexity and
+  market-value weighted totals), the whole batch in NumPy
+- the same per-position yield/duration computed with a scalar Python
+  Newton loop, on a sample and extrapolated to N
+- GET /api/portfolio/analytics end to end for an investor holding all N
+  positions (query, analytics over every position, JSON for the largest
+  100)
+
+    python bench_analytics.py [positions]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+import warnings
+from datetime import date, timedelta
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+os.environ.setdefault('PASSWORD_HASH_EXECUTOR', 'inline')
+warnings.simplefilter('ignore')
+
+import numpy as np
+
+from analytics import portfolio_analytics
+from app import app, db
+from models import create_models
+from portfolio import rebuild_portfolios
+
+User, GreenBond, Project, Investment = create_models(db)
+
+BONDS = 1000
+SETTLEMENT = date(2025, 1, 15)
+
+
+def coupon_date(maturity, k, months):
+    """The coupon k periods before maturity, its day clamped to the month's end"""
+    year, month = divmod(maturity.year * 12 + maturity.month - 1 - k * months, 12)
+    following = date(year + (month + 1) // 12, (month + 1) % 12 + 1, 1)
+    return min(date(year, month + 1, 1) + timedelta(days=maturity.day - 1), following - timedelta(days=1))
+
+
+def scalar_position(price, face, rate, issue, maturity, settlement, frequency=2):
+    """Yield and Macaulay duration for one position with plain Python"""
+    months = 12 // frequency
+    cutoff = max(issue, settlement)
+    periods = 0
+    while coupon_date(maturity, periods, months) > cutoff:
+        periods += 1
+    if periods <= 0:
+        return None, None
+    following = coupon_date(maturity, periods - 1, months)
+    previous = coupon_date(maturity, periods, months)
+    first = (following - settlement).days / (following - previous).days
+    times = [(first + k) / frequency for k in range(periods)]
+    flows = [face * rate / 100 / frequency] * periods
+    flows[-1] += face
+    y = 0.05
+    for _ in range(100):
+        pv = sum(f / (1 + y / frequency) ** (frequency * t) for f, t in zip(flows, times))
+        slope = -sum(t * f / (1 + y / frequency) ** (frequency * t + 1) for f, t in zip(flows, times))
+        step = (pv - price) / slope
+        y -= step
+        if abs(step) < 1e-10:
+            break
+    pv_flows = [f / (1 + y / frequency) ** (frequency * t) for f, t in zip(flows, times)]
+    return y * 100, sum(t * p for t, p in zip(times, pv_flows)) / sum(pv_flows)
+
+
+def make_bonds(rng):
+    bonds = []
+    for i in range(BONDS):
+        issue = date(2015, 1, 1) + timedelta(days=rng.randrange(3650))
+        bonds.append({
+            'id': str(uuid.uuid4()),
+            'face_value': rng.choice((100.0, 1000.0, 10000.0)),
+            'coupon_rate': round(rng.uniform(0, 12), 2),
+            'issue_date': issue,
+            'maturity_date': SETTLEMENT + timedelta(days=rng.randrange(30, 30 * 365)),
+            'index': i,
+        })
+    return bonds
+
+
+def make_positions(rng, bonds, n):
+    positions = []
+    for _ in range(n):
+        bond = bonds[rng.randrange(BONDS)]
+        price = round(bond['face_value'] * rng.uniform(0.85, 1.15), 2)
+        positions.append((bond, price, rng.randint(1, 50)))
+    return positions
+
+
+def time_vectorized(positions, repeat=5):
+    units = np.array([units for _, _, units in positions], dtype=float)
+    price = np.array([price for _, price, _ in positions])
+    face = np.array([bond['face_value'] for bond, _, _ in positions])
+    rate = np.array([bond['coupon_rate'] for bond, _, _ in positions])
+    issue = np.array([bond['issue_date'] for bond, _, _ in positions], dtype='datetime64[D]')
+    maturity = np.array([bond['maturity_date'] for bond, _, _ in positions], dtype='datetime64[D]')
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = portfolio_analytics(units, price, face, rate, issue, maturity, SETTLEMENT)
+        timings.append(time.perf_counter() - started)
+    return timings, result
+
+
+def time_scalar(positions, sample=2000):
+    subset = positions[:sample]
+    started = time.perf_counter()
+    for bond, price, _ in subset:
+        scalar_position(price, bond['face_value'], bond['coupon_rate'], bond['issue_date'],
+                        bond['maturity_date'], SETTLEMENT)
+    return (time.perf_counter() - started) / len(subset) * len(positions)
+
+
+def seed_api(bonds, positions):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    client = app.test_client()
+    response = client.post('/api/auth/register', json={
+        'email': 'institution@example.com',
+        'password': 'benchpassword',
+        'firstName': 'Big',
+        'lastName': 'Fund',
+        'userType': 'institutional_investor'
+    }).get_json()
+    investor_id = response['user']['id']
+    headers = {'Authorization': f"Bearer {response['access_token']}"}
+
+    with app.app_context():
+        issuer = User(email='issuer@example.com', first_name='Bench', last_name='Issuer',
+                      user_type='bond_issuer', password_hash='x')
+        db.session.add(issuer)
+        db.session.flush()
+        db.session.execute(GreenBond.__table__.insert(), [{
+            'id': bond['id'], 'issuer_id': issuer.id, 'bond_name': f"Bond {bond['index']}",
+            'isin': f"IN{bond['index']:010d}", 'bond_type': 'corporate',
+            'face_value': bond['face_value'], 'coupon_rate': bond['coupon_rate'],
+            'maturity_date': bond['maturity_date'], 'issue_date': bond['issue_date'],
+            'currency': 'INR', 'minimum_investment': bond['face_value'], 'total_amount': 1e9,
+            'amount_raised': 0, 'risk_rating': 'AA', 'status': 'active',
+            'description': 'Benchmark bond', 'created_at': SETTLEMENT,
+        } for bond in bonds])
+        # Bulk load through Core (bypassing the ORM hooks) and backfill summaries
+        db.session.execute(Investment.__table__.insert(), [{
+            'id': str(uuid.uuid4()), 'investor_id': investor_id, 'bond_id': bond['id'],
+            'investment_amount': price * units, 'purchase_price': price,
+            'purchase_date': SETTLEMENT, 'status': 'settled', 'fees': 0,
+            'expected_return': 0, 'maturity_value': bond['face_value'] * units,
+        } for bond, price, units in positions])
+        db.session.commit()
+        rebuild_portfolios([investor_id])
+    return client, headers
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    rng = random.Random(7)
+    bonds = make_bonds(rng)
+    positions = make_positions(rng, bonds, n)
+
+    timings, result = time_vectorized(positions)
+    scalar = time_scalar(positions)
+    print(f'{n:,} positions over {BONDS:,} bonds, settlement {SETTLEMENT}')
+    print(f"{'method':<32}{'median ms':>12}{'best ms':>12}")
+    print(f"{'vectorized (NumPy)':<32}{statistics.median(timings) * 1000:>12.1f}{min(timings) * 1000:>12.1f}")
+    print(f"{'scalar loop (extrapolated)':<32}{scalar * 1000:>12.1f}{'':>12}")
+    portfolio = result['portfolio']
+    print(f"portfolio: value {portfolio['marketValue']:,.0f}, ytm {portfolio['yieldToMaturity']:.3f}%, "
+          f"modified duration {portfolio['modifiedDuration']:.3f}")
+
+    client, headers = seed_api(bonds, positions)
+    timings = []
+    for _ in range(5):
+        started = time.perf_counter()
+        response = client.get('/api/portfolio/analytics', headers=headers)
+        timings.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.get_json()
+    print(f"{'GET /api/portfolio/analytics':<32}{statistics.median(timings) * 1000:>12.1f}"
+          f"{min(timings) * 1000:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
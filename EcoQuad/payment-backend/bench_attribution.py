@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Benchmark: attributing project impact to a million investors
+
+Seeds a throwaway SQLite database with N investors (default 1,000,000)
+holding one to three of 1,000 bonds each, two projects per bond and a year
+of monthly rollups for four metrics per project, then times:
+
+- rebuild_attributions: every bond's impact and every investor's share
+- refresh_attributions after new readings for one bond, which recomputes
+  only that bond's investors
+- GET /api/portfolio/impact for one investor
+- the per-investor queries the batch replaces, measured over 1,000
+  investors and extrapolated to N
+
+    python bench_attribution.py [investors]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from datetime import date
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('JOB_QUEUE_MODE', 'off')
+warnings.simplefilter('ignore')
+
+import calendar
+import random
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import func, select
+
+import impact
+from app import app, db
+from attribution import rebuild_attributions, refresh_attributions
+from models import get_models
+
+models = get_models(db)
+User, GreenBond, Project, Investment, ImpactRollup, ImpactAttribution = (models[name] for name in (
+    'User', 'GreenBond', 'Project', 'Investment', 'ImpactRollup', 'ImpactAttribution'))
+
+BONDS = 1000
+PROJECTS_PER_BOND = 2
+METRICS = ('co2_reduction', 'energy_generated', 'water_saved', 'hectares_restored')
+MONTHS = [calendar.timegm((2024, month, 1, 0, 0, 0)) for month in range(1, 13)]
+ISSUER_ID = '00000000-0000-4000-8000-000000000000'
+BATCH = 50000
+
+
+def bond_id(i):
+    return f'00000000-0000-4000-a000-{i:012d}'
+
+
+def investor_id(i):
+    return f'00000000-0000-4000-9000-{i:012d}'
+
+
+def seed(investors):
+    rng = random.Random(23)
+    started = time.perf_counter()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(User.__table__.insert(), [{
+            'id': ISSUER_ID, 'email': 'issuer@example.com', 'password_hash': 'x', 'first_name': 'Bench',
+            'last_name': 'Issuer', 'user_type': 'bond_issuer'}])
+        db.session.execute(GreenBond.__table__.insert(), [{
+            'id': bond_id(i), 'issuer_id': ISSUER_ID, 'bond_name': f'Bond {i}', 'isin': f'IN{i:010d}',
+            'bond_type': 'corporate', 'face_value': 1000, 'coupon_rate': 5.0, 'maturity_date': date(2030, 1, 1),
+            'issue_date': date(2024, 1, 1), 'minimum_investment': 1000, 'total_amount': 10 ** 12,
+            'amount_raised': 0, 'risk_rating': 'AA', 'status': 'active', 'description': 'Green bond'}
+            for i in range(BONDS)])
+        projects = [(f'00000000-0000-4000-b000-{i:012d}', bond_id(i // PROJECTS_PER_BOND))
+                    for i in range(BONDS * PROJECTS_PER_BOND)]
+        db.session.execute(Project.__table__.insert(), [{
+            'id': project_id, 'bond_id': bond, 'project_name': 'Project', 'project_type': 'renewable_energy',
+            'description': 'Project', 'country': 'India', 'region': 'South', 'project_manager': 'PM',
+            'start_date': date(2024, 1, 1), 'expected_completion_date': date(2026, 1, 1),
+            'total_budget': 100_000} for project_id, bond in projects])
+        db.session.execute(ImpactRollup.__table__.insert(), [{
+            'project_id': project_id, 'metric_type': metric, 'period': 'month', 'bucket': month,
+            'reading_count': 720, 'total': rng.random() * 1000, 'minimum': 0, 'maximum': 10,
+            'last_value': rng.random() * 100, 'last_at': month + 86400}
+            for project_id, _ in projects for metric in METRICS for month in MONTHS])
+
+        raised = [0] * BONDS
+        positions = 0
+        for offset in range(0, investors, BATCH):
+            users, investments = [], []
+            for i in range(offset, min(investors, offset + BATCH)):
+                users.append({'id': investor_id(i), 'email': f'investor{i}@example.com', 'password_hash': 'x',
+                              'first_name': 'Bench', 'last_name': 'Investor', 'user_type': 'individual_investor'})
+                for bond in rng.sample(range(BONDS), rng.randint(1, 3)):
+                    amount = rng.randrange(1000, 100000)
+                    raised[bond] += amount
+                    investments.append({
+                        'id': f'00000000-0000-4000-c000-{positions:012d}', 'investor_id': investor_id(i),
+                        'bond_id': bond_id(bond), 'investment_amount': amount, 'purchase_price': 1000,
+                        'purchase_date': date(2024, 2, 1), 'status': 'confirmed', 'fees': 0,
+                        'expected_return': amount, 'maturity_value': amount})
+                    positions += 1
+            # Core inserts bypass the ORM listeners; the rebuild below catches up
+            db.session.execute(User.__table__.insert(), users)
+            db.session.execute(Investment.__table__.insert(), investments)
+        db.session.execute(GreenBond.__table__.update().where(GreenBond.id == db.bindparam('bond')).values(
+            amount_raised=db.bindparam('raised')), [{'bond': bond_id(i), 'raised': raised[i]} for i in range(BONDS)])
+        db.session.commit()
+    print(f'seeded {investors:,} investors, {positions:,} investments in {time.perf_counter() - started:.0f} s')
+    return projects
+
+
+def per_investor(investor):
+    """What attribution costs without the batch: one query per investor"""
+    share = Investment.investment_amount * 1.0 / GreenBond.amount_raised
+    return db.session.execute(
+        select(ImpactRollup.metric_type, func.sum(ImpactRollup.total * share))
+        .join(Project, Project.id == ImpactRollup.project_id)
+        .join(GreenBond, GreenBond.id == Project.bond_id)
+        .join(Investment, Investment.bond_id == GreenBond.id)
+        .where(Investment.investor_id == investor, ImpactRollup.period == 'month')
+        .group_by(ImpactRollup.metric_type)
+    ).all()
+
+
+def main():
+    investors = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    projects = seed(investors)
+    client = app.test_client()
+    with app.app_context():
+        started = time.perf_counter()
+        rebuild_attributions(db)
+        rebuild_seconds = time.perf_counter() - started
+        rows = db.session.execute(select(func.count()).select_from(ImpactAttribution)).scalar()
+
+        project_id, bond = projects[0]
+        holders = db.session.execute(
+            select(func.count()).select_from(Investment).where(Investment.bond_id == bond)).scalar()
+        impact.record_readings([(project_id, 'co2_reduction', MONTHS[-1] + 3600, 12.5)])
+        db.session.commit()
+        started = time.perf_counter()
+        refreshed = refresh_attributions(db)
+        refresh_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        for i in range(1000):
+            per_investor(investor_id(i))
+        per_investor_seconds = (time.perf_counter() - started) / 1000 * investors
+
+        token = create_access_token(identity=investor_id(0))
+    headers = {'Authorization': f'Bearer {token}'}
+    timings = []
+    for _ in range(50):
+        started = time.perf_counter()
+        assert client.get('/api/portfolio/impact', headers=headers).status_code == 200
+        timings.append(time.perf_counter() - started)
+
+    print(f'{investors:,} investors, {BONDS:,} bonds, {rows:,} attribution rows')
+    print(f'  rebuild_attributions:                     {rebuild_seconds:10.1f} s')
+    print(f'  refresh after readings for 1 bond ({refreshed}):      {refresh_ms:10.1f} ms  ({holders:,} investors)')
+    print(f'  per-investor queries instead (est.):      {per_investor_seconds:10.1f} s')
+    print(f'  GET /api/portfolio/impact:                {statistics.median(timings) * 1000:10.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
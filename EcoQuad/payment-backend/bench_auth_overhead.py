@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark: per-request overhead of resolving models inside auth handlers
+
+Compares the current verify-token/profile handlers (db and models bound once
+at blueprint registration) against a copy of the old pattern, which did
+`from models import create_models`, looked up current_app.extensions and
+called create_models(db) on every request. Both run through the Flask test
+client against a throwaway SQLite database with a warm user cache.
+
+    python bench_auth_overhead.py [requests]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+import warnings
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+os.environ.setdefault('PASSWORD_HASH_EXECUTOR', 'inline')
+warnings.simplefilter('ignore')
+
+from flask import Blueprint, jsonify
+from flask_jwt_extended import get_jwt_identity, jwt_required
+
+from app import app, db
+import auth
+
+legacy_bp = Blueprint('legacy_auth', __name__)
+
+
+@legacy_bp.route('/verify-token', methods=['POST'])
+@jwt_required()
+def legacy_verify_token():
+    """verify-token as it was written before the registry change"""
+    from flask import current_app
+    from models import create_models
+
+    db = current_app.extensions['sqlalchemy']
+    User, _, _, _ = create_models(db)
+
+    snapshot = auth.get_user_snapshot(get_jwt_identity())
+    return jsonify({'valid': True, 'user': snapshot}), 200
+
+
+def lookup_only():
+    from flask import current_app
+    from models import create_models
+
+    db = current_app.extensions['sqlalchemy']
+    User, _, _, _ = create_models(db)
+    return User
+
+
+def time_requests(client, path, headers, n):
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        response = client.post(path, headers=headers)
+        samples.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    samples.sort()
+    return statistics.median(samples) * 1e6, samples[int(len(samples) * 0.99)] * 1e6
+
+
+def main(n=20000):
+    app.register_blueprint(legacy_bp, url_prefix='/legacy/auth')
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+    client = app.test_client()
+    response = client.post('/api/auth/register', json={
+        'email': 'bench@example.com',
+        'password': 'benchpassword',
+        'firstName': 'Bench',
+        'lastName': 'Mark',
+        'userType': 'retail_investor'
+    })
+    headers = {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+
+    # warm up both routes and the user cache
+    time_requests(client, '/legacy/auth/verify-token', headers, 200)
+    time_requests(client, '/api/auth/verify-token', headers, 200)
+
+    # interleave the two handlers in rounds so drift affects both equally
+    routes = (('before (per-request lookup)', '/legacy/auth/verify-token'),
+              ('after (bound at register)', '/api/auth/verify-token'))
+    results = {name: [] for name, _ in routes}
+    for _ in range(10):
+        for name, path in routes:
+            results[name].append(time_requests(client, path, headers, n // 10))
+
+    print(f'{n} warm verify-token requests per handler via the Flask test client')
+    print(f"{'handler':<28}{'p50 (us)':>12}{'p99 (us)':>12}")
+    for name, _ in routes:
+        p50 = statistics.median(r[0] for r in results[name])
+        p99 = statistics.median(r[1] for r in results[name])
+        print(f'{name:<28}{p50:>12.1f}{p99:>12.1f}')
+
+    with app.app_context():
+        per_call = min(timeit.repeat(lookup_only, number=100000, repeat=5)) / 100000
+    print(f'\nremoved lookup code alone: {per_call * 1e6:.2f} us per request')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Benchmark: GET /api/bonds latency against a large green_bonds table
+
+Seeds a throwaway SQLite database with N bonds (default 1,000,000), then
+times the listing endpoint through the Flask test client:
+
+- the first page for several filter/sort combinations
+- pages reached by following nextCursor deep into the result set, which
+  should cost the same as the first page
+- the bare keyset query against the equivalent LIMIT/OFFSET query at the
+  same depth
+
+    python bench_bonds.py [bonds]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from datetime import date, datetime, timedelta
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('PASSWORD_HASH_EXECUTOR', 'inline')
+warnings.simplefilter('ignore')
+
+from app import app, db
+from bonds import encode_cursor
+from sqlalchemy import tuple_
+from models import create_models
+
+User, GreenBond, _, _ = create_models(db)
+
+BATCH = 50000
+BOND_TYPES = ('corporate', 'sovereign', 'municipal', 'supranational')
+RATINGS = ('AAA', 'AA+', 'AA', 'A', 'BBB+', 'BBB')
+STATUSES = ('active',) * 7 + ('draft', 'closed', 'matured')
+
+
+def seed(count):
+    rng = random.Random(42)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        issuer = User(email='issuer@example.com', first_name='Bench', last_name='Issuer',
+                      user_type='bond_issuer', password_hash='x')
+        db.session.add(issuer)
+        db.session.commit()
+
+        start = time.perf_counter()
+        base = datetime(2020, 1, 1)
+        table = GreenBond.__table__
+        for offset in range(0, count, BATCH):
+            rows = []
+            for i in range(offset, min(count, offset + BATCH)):
+                rows.append({
+                    'id': f'{rng.getrandbits(128):032x}',
+                    'issuer_id': issuer.id,
+                    'bond_name': f'Green Bond {i}',
+                    'isin': f'IN{i:010d}',
+                    'bond_type': rng.choice(BOND_TYPES),
+                    'face_value': 1000.0,
+                    'coupon_rate': round(rng.uniform(3, 9), 2),
+                    'maturity_date': date(2026, 1, 1) + timedelta(days=rng.randrange(7300)),
+                    'issue_date': date(2024, 1, 1),
+                    'currency': 'INR',
+                    'minimum_investment': float(rng.choice((1000, 5000, 10000, 50000, 100000))),
+                    'total_amount': float(rng.randrange(1_000_000, 500_000_000)),
+                    'amount_raised': 0.0,
+                    'risk_rating': rng.choice(RATINGS),
+                    'status': rng.choice(STATUSES),
+                    'description': 'Financing renewable energy and green infrastructure projects.',
+                    'created_at': base + timedelta(seconds=i * 60),
+                })
+            db.session.execute(table.insert(), rows)
+            db.session.commit()
+        print(f'seeded {count} bonds in {time.perf_counter() - start:.1f}s')
+
+
+def timed(client, query, runs=50):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        response = client.get('/api/bonds', query_string=query)
+        samples.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.get_json()
+    return statistics.median(samples) * 1000
+
+
+def row_at_depth(column, depth):
+    """(sort value, id) of the active bond `depth` rows into -createdAt order"""
+    with app.app_context():
+        return (db.session.query(column, GreenBond.id)
+                .filter(GreenBond.status == 'active')
+                .order_by(column.desc(), GreenBond.id.desc())
+                .offset(depth).limit(1).one())
+
+
+def query_ms(column, depth, last, runs=5):
+    """Median time of the raw page query by keyset and by OFFSET at `depth`"""
+    results = {}
+    with app.app_context():
+        base = GreenBond.query.filter(GreenBond.status == 'active').order_by(column.desc(), GreenBond.id.desc())
+        for mode in ('keyset', 'offset'):
+            samples = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                if mode == 'keyset':
+                    base.filter(tuple_(column, GreenBond.id) < tuple(last)).limit(21).all()
+                else:
+                    base.offset(depth).limit(21).all()
+                samples.append(time.perf_counter() - start)
+            results[mode] = statistics.median(samples) * 1000
+    return results['keyset'], results['offset']
+
+
+def main(count=1_000_000):
+    seed(count)
+    client = app.test_client()
+
+    print('\nfirst page, limit=20 (median ms)')
+    for label, query in (
+        ('default (-createdAt)', {}),
+        ('sort=couponRate', {'sort': 'couponRate'}),
+        ('sort=-maturityDate', {'sort': '-maturityDate'}),
+        ('bondType=municipal', {'bondType': 'municipal'}),
+        ('riskRating=AAA, couponMin=6', {'riskRating': 'AAA', 'couponMin': 6}),
+        ('minimumInvestment 5k-10k', {'minimumInvestmentMin': 5000, 'minimumInvestmentMax': 10000}),
+    ):
+        print(f'  {label:<32}{timed(client, query):>8.2f}')
+
+    print('\ndeep pages, sort=-createdAt (median ms)')
+    print(f"  {'depth':>10}{'endpoint':>10}{'keyset':>10}{'offset':>10}")
+    for depth in (0, 1000, 100_000, count // 2):
+        depth = min(depth, int(count * 0.6))
+        last = row_at_depth(GreenBond.created_at, depth)
+        endpoint = timed(client, {'cursor': encode_cursor(last[0], last[1])})
+        keyset, offset = query_ms(GreenBond.created_at, depth + 1, last)
+        print(f'  {depth:>10}{endpoint:>10.2f}{keyset:>10.2f}{offset:>10.2f}')
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Load test: concurrent register + login under each engine profile
+
+Serves the app with gunicorn (``WEB_CONCURRENCY`` workers, default 2, of 4
+threads) on a fresh database per profile and drives it with closed-loop
+clients that each register a new user and log in as them, over and over:
+
+- plain: SQLAlchemy defaults, SQLite in rollback-journal mode
+- wal: WAL, synchronous=NORMAL, busy_timeout and mmap (DB_ENGINE_PROFILE=tuned)
+- wal + writer queue: the same, with SQLITE_SINGLE_WRITER queueing each
+  worker's writers on a lock
+
+and, when ``BENCH_POSTGRES_URL`` points at an empty PostgreSQL database, the
+plain and tuned (pooled, pre-pinged) profiles against it. Reports operations
+per second, latency percentiles per endpoint, failed requests and how many
+"database is locked" errors the server logged. bcrypt runs at 4 rounds so
+the database, not hashing, is what's measured.
+
+    python bench_db_profiles.py [seconds] [connections]
+"""
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+warnings.simplefilter('ignore')
+
+from bench_serving import HERE, free_port
+
+GUNICORN = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:application']
+PASSWORD = 'bench-password'
+
+
+def sqlite_url():
+    return 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+
+def profiles():
+    yield 'sqlite plain', {'DATABASE_URL': sqlite_url(), 'DB_ENGINE_PROFILE': 'plain'}
+    yield 'sqlite wal', {'DATABASE_URL': sqlite_url(), 'SQLITE_SINGLE_WRITER': 'false'}
+    yield 'sqlite wal+queue', {'DATABASE_URL': sqlite_url()}
+    postgres = os.getenv('BENCH_POSTGRES_URL')
+    if postgres:
+        yield 'postgres plain', {'DATABASE_URL': postgres, 'DB_ENGINE_PROFILE': 'plain'}
+        yield 'postgres tuned', {'DATABASE_URL': postgres}
+
+
+def serve(port, log, **env):
+    """Start gunicorn with its log going to ``log`` and wait until it answers"""
+    server = subprocess.Popen(GUNICORN, cwd=HERE, stdout=log, stderr=log, env=dict(
+        os.environ, HOST='127.0.0.1', PORT=str(port), GUNICORN_THREADS='4', BCRYPT_LOG_ROUNDS='4',
+        JOB_QUEUE_MODE='off', **env))
+    for _ in range(200):
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/health')
+            connection.getresponse().read()
+            return server
+        except OSError:
+            time.sleep(0.05)
+    server.kill()
+    raise RuntimeError('gunicorn did not start')
+
+
+def client(port, threads, seconds):
+    """One load process: each thread registers a user and logs in as them until the time is up"""
+    deadline = time.monotonic() + seconds
+    latencies = {'register': [], 'login': []}
+    errors = [0]
+
+    def call(connection, path, body):
+        connection.request('POST', path, json.dumps(body), {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        response.read()
+        return response.status
+
+    def loop():
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        while time.monotonic() < deadline:
+            email = f'{uuid.uuid4().hex}@example.com'
+            steps = (('register', '/api/auth/register', 201,
+                      {'email': email, 'password': PASSWORD, 'firstName': 'Bench', 'lastName': 'User',
+                       'userType': 'investor'}),
+                     ('login', '/api/auth/login', 200, {'email': email, 'password': PASSWORD}))
+            for name, path, expected, body in steps:
+                started = time.perf_counter()
+                try:
+                    status = call(connection, path, body)
+                except (OSError, http.client.HTTPException):
+                    errors[0] += 1
+                    connection.close()
+                    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                    break
+                latencies[name].append(time.perf_counter() - started)
+                if status != expected:
+                    errors[0] += 1
+                    break
+
+    workers = [threading.Thread(target=loop) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencies, errors[0]
+
+
+def load(port, connections, seconds):
+    processes = max(1, min(os.cpu_count() or 1, connections // 4))
+    per_process = [connections // processes + (n < connections % processes) for n in range(processes)]
+    with ProcessPoolExecutor(processes) as pool:
+        results = list(pool.map(client, [port] * processes, per_process, [seconds] * processes))
+    latencies = {name: sorted(value for result, _ in results for value in result[name])
+                 for name in ('register', 'login')}
+    return latencies, sum(errors for _, errors in results)
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] * 1000 if values else float('nan')
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    connections = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    workers = os.getenv('WEB_CONCURRENCY', '2')
+
+    print(f'{workers} workers x 4 threads, {connections} connections, {seconds:g}s per profile')
+    print(f"  {'profile':<18}{'ops/s':>8}{'reg p50':>9}{'reg p99':>9}{'login p50':>11}{'login p99':>11}"
+          f"{'failed':>8}{'locked':>8}")
+    for label, env in profiles():
+        port = free_port()
+        log = tempfile.NamedTemporaryFile('w+', suffix='.log')
+        server = serve(port, log, WEB_CONCURRENCY=workers, **env)
+        try:
+            latencies, errors = load(port, connections, seconds)
+        finally:
+            server.terminate()
+            server.wait()
+        log.seek(0)
+        locked = log.read().count('database is locked')
+        register, login = latencies['register'], latencies['login']
+        print(f'  {label:<18}{len(login) / seconds:>8,.0f}{statistics.median(register) * 1000:>9.1f}'
+              f'{percentile(register, 0.99):>9.1f}{statistics.median(login) * 1000:>11.1f}'
+              f'{percentile(login, 0.99):>11.1f}{errors:>8}{locked:>8}')
+
+
+if __name__ == '__main__':
+    main()
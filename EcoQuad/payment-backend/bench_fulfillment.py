@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark: /verify-payment with fulfillment inline vs. on the job queue
+
+Creates N orders (default 200) on the local stub gateway, then posts their
+signed payments to /verify-payment from 8 client threads. Fulfilling a
+payment fetches its order from the gateway (LATENCY seconds, default 0.2)
+and writes the Investment, so with JOB_QUEUE_MODE=inline each response waits
+for both. With the job queue the request only records the payment and the
+worker thread catches up behind it. Reports request throughput and latency,
+and how long until every payment was fulfilled.
+
+    python bench_fulfillment.py [payments] [latency]
+"""
+import hashlib
+import hmac
+import os
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+os.environ.setdefault('PASSWORD_HASH_EXECUTOR', 'inline')
+warnings.simplefilter('ignore')
+
+from app import app, db, job_queue, payment_gateway
+from models import get_models
+from stub_gateway import StubGateway
+
+SECRET = 'rzp_bench_secret'
+CLIENTS = 8
+
+models = get_models(db)
+
+
+def seed():
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    client = app.test_client()
+    body = client.post('/api/auth/register', json={
+        'email': 'payer@example.com', 'password': 'benchpassword',
+        'firstName': 'Bench', 'lastName': 'Payer', 'userType': 'retail_investor'
+    }).get_json()
+    with app.app_context():
+        issuer = models['User'](email='issuer@example.com', first_name='Bench', last_name='Issuer',
+                                user_type='bond_issuer', password_hash='x')
+        db.session.add(issuer)
+        db.session.flush()
+        bond = models['GreenBond'](issuer_id=issuer.id, bond_name='Bench bond', isin='IN0000000001',
+                                   bond_type='corporate', face_value=1000, coupon_rate=7,
+                                   maturity_date=date(2030, 6, 30), issue_date=date(2024, 1, 1),
+                                   minimum_investment=1000, total_amount=1e12, amount_raised=0,
+                                   risk_rating='AA', status='active', description='Benchmark bond')
+        db.session.add(bond)
+        db.session.commit()
+        return {'Authorization': f"Bearer {body['access_token']}"}, bond.id
+
+
+def payments(stub, n, bond_id, prefix):
+    latency, stub.latency = stub.latency, 0
+    bodies = []
+    for i in range(n):
+        order = payment_gateway.create_order({'amount': 100000, 'currency': 'INR', 'notes': {'bondId': bond_id}})
+        payment_id = f'pay_{prefix}_{i}'
+        signature = hmac.new(SECRET.encode(), f"{order['id']}|{payment_id}".encode(),
+                             hashlib.sha256).hexdigest()
+        bodies.append({'razorpay_order_id': order['id'], 'razorpay_payment_id': payment_id,
+                       'razorpay_signature': signature, 'bondId': bond_id})
+    stub.latency = latency
+    return bodies
+
+
+def run(stub, n, mode):
+    app.config['JOB_QUEUE_MODE'] = mode
+    job_queue.init_app(app, db)
+    headers, bond_id = seed()
+    bodies = payments(stub, n, bond_id, mode)
+
+    def verify(body):
+        client = app.test_client()
+        started = time.perf_counter()
+        response = client.post('/verify-payment', json=body, headers=headers)
+        assert response.status_code == 200, response.get_json()
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(CLIENTS) as pool:
+        latencies = sorted(pool.map(verify, bodies))
+    answered = time.perf_counter() - started
+    with app.app_context():
+        while models['Payment'].query.filter_by(status='fulfilled').count() < n:
+            db.session.remove()
+            time.sleep(0.01)
+        raised = db.session.get(models['GreenBond'], bond_id).amount_raised
+    fulfilled = time.perf_counter() - started
+    job_queue.shutdown()
+    assert raised == n * 1000, raised
+    return answered, fulfilled, latencies
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+
+    with StubGateway(latency=latency) as stub:
+        app.config.update({'RAZORPAY_BASE_URL': stub.url, 'RAZORPAY_KEY_SECRET': SECRET,
+                           'JOB_POLL_INTERVAL': 0.05})
+        payment_gateway.init_app(app)
+        print(f'{n} payments from {CLIENTS} clients, order fetch latency {latency * 1000:.0f} ms')
+        print(f"{'mode':<10}{'req/s':>10}{'p50 ms':>10}{'p90 ms':>10}{'all fulfilled s':>18}")
+        for mode in ('inline', 'thread'):
+            answered, fulfilled, latencies = run(stub, n, mode)
+            print(f'{mode:<10}{n / answered:>10.1f}{statistics.median(latencies) * 1000:>10.1f}'
+                  f'{latencies[int(0.9 * (n - 1))] * 1000:>10.1f}{fulfilled:>18.2f}')
+        payment_gateway.shutdown()
+
+
+if __name__ == '__main__':
+    main()
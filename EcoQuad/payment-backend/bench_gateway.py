@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Razorpay order creation against a slow gateway
+
+Runs the stub gateway (stub_gateway.py) in-process and compares:
+
+- keep-alive under concurrency: 64 threads creating orders through the
+  stock razorpay.Client session versus the pooled PaymentGateway session,
+  counting the TCP connections the gateway accepted
+- checkout throughput with 500 ms of injected gateway latency, pushing N
+  checkouts (default 200) plus /health probes through a fixed set of 8
+  request workers (like 8 sync WSGI workers), once with /create-order
+  calling the gateway on the request thread and once offloaded with
+  "Prefer: respond-async"
+
+    python bench_gateway.py [checkouts] [latency_seconds]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+os.environ.setdefault('PASSWORD_HASH_EXECUTOR', 'inline')
+warnings.simplefilter('ignore')
+
+import logging
+
+import razorpay
+
+from app import app, payment_gateway
+from stub_gateway import StubGateway
+
+logging.getLogger('payment-backend').setLevel(logging.WARNING)
+# The stock client's undersized pool logs every discarded connection
+logging.getLogger('urllib3.connectionpool').setLevel(logging.ERROR)
+
+REQUEST_WORKERS = 8
+ORDER = {'amount': 2500, 'currency': 'INR', 'receipt': 'bench'}
+
+
+def configure(stub):
+    app.config.update({
+        'RAZORPAY_BASE_URL': stub.url,
+        'RAZORPAY_ORDER_WORKERS': 64,
+        'RAZORPAY_ORDER_QUEUE_DEPTH': 1024,
+        'RAZORPAY_POOL_SIZE': 64,
+    })
+    payment_gateway.init_app(app)
+
+
+def keep_alive(threads=64, calls=20):
+    print(f'Keep-alive: {threads} threads x {calls} orders, 20 ms gateway latency')
+    print(f"{'client':<28}{'connections':>14}{'wall s':>10}")
+    for name in ('stock razorpay.Client', 'PaymentGateway session'):
+        with StubGateway(latency=0.02) as stub:
+            if name.startswith('stock'):
+                rzp = razorpay.Client(auth=('rzp_test_key', 'rzp_test_secret'), base_url=stub.url)
+                create = rzp.order.create
+            else:
+                configure(stub)
+                create = payment_gateway.create_order
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                list(pool.map(lambda _: create(dict(ORDER)), range(threads * calls)))
+            print(f'{name:<28}{stub.connections:>14}{time.perf_counter() - started:>10.2f}')
+
+
+def checkout(mode, checkouts, latency):
+    with StubGateway(latency=latency) as stub:
+        configure(stub)
+        headers = {'Prefer': 'respond-async'} if mode == 'async' else {}
+        health = []
+
+        def order(_):
+            return app.test_client().post('/create-order', json=ORDER, headers=headers).status_code
+
+        def probe(submitted):
+            # Measured from submission, so time spent queued behind busy
+            # request workers counts
+            app.test_client().get('/health')
+            health.append(time.perf_counter() - submitted)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=REQUEST_WORKERS) as workers:
+            futures = []
+            for i in range(checkouts):
+                futures.append(workers.submit(order, i))
+                if i % 10 == 0:
+                    futures.append(workers.submit(probe, time.perf_counter()))
+            statuses = [future.result() for future in futures]
+        answered = time.perf_counter() - started
+
+        # Offloaded orders are done once the gateway has created them all
+        while len(stub.orders) < checkouts:
+            time.sleep(0.005)
+        created = time.perf_counter() - started
+
+        assert all(status in (None, 200, 202) for status in statuses), statuses
+        return answered, created, health
+
+
+def main():
+    checkouts = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.5
+    keep_alive()
+
+    print()
+    print(f'Checkout: {checkouts} orders through {REQUEST_WORKERS} request workers, '
+          f'{latency * 1000:.0f} ms gateway latency')
+    print(f"{'mode':<8}{'answered s':>12}{'created s':>12}{'orders/s':>10}"
+          f"{'health p50 ms':>15}{'health max ms':>15}")
+    for mode in ('sync', 'async'):
+        answered, created, health = checkout(mode, checkouts, latency)
+        print(f'{mode:<8}{answered:>12.2f}{created:>12.2f}{checkouts / created:>10.1f}'
+              f'{statistics.median(health) * 1000:>15.1f}{max(health) * 1000:>15.1f}')
+    payment_gateway.shutdown()
+
+
+if __name__ == '__main__':
+    main()
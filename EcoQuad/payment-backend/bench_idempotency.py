@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark: a checkout retry storm with and without idempotency keys
+
+Runs C checkouts (default 100) against the local stub gateway with LATENCY
+seconds of gateway latency (default 0.5). Every checkout is sent ATTEMPTS
+times (default 4): two immediate double-submits plus sequential retries,
+the way an impatient client or a retrying proxy would. For each mode it
+reports gateway order calls, orders created and latency of first and
+repeated attempts.
+
+    python bench_idempotency.py [checkouts] [attempts] [latency]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+os.environ.setdefault('PASSWORD_HASH_EXECUTOR', 'inline')
+warnings.simplefilter('ignore')
+
+from app import app, db, order_idempotency, payment_gateway
+from stub_gateway import StubGateway
+
+
+def checkout(n, attempts, keyed):
+    """Send one checkout attempts times; returns (first latency, repeat latencies, order ids)"""
+    client = app.test_client()
+    headers = {'Idempotency-Key': f'bench-{n}'} if keyed else {}
+    body = {'amount': 100 + n, 'currency': 'INR'}
+
+    def send():
+        started = time.perf_counter()
+        response = client.post('/create-order', json=body, headers=headers)
+        elapsed = time.perf_counter() - started
+        order = response.get_json().get('order') if response.status_code == 200 else None
+        return elapsed, order['id'] if order else None
+
+    with ThreadPoolExecutor(2) as pool:
+        first, double = pool.map(lambda _: send(), range(2))
+    results = [first, double] + [send() for _ in range(attempts - 2)]
+    return results[0][0], [elapsed for elapsed, _ in results[1:]], {order_id for _, order_id in results}
+
+
+def run(stub, checkouts, attempts, keyed):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    order_idempotency.init_app(app, db)
+    stub.reset()
+    with ThreadPoolExecutor(16) as pool:
+        results = list(pool.map(lambda n: checkout(n, attempts, keyed), range(checkouts)))
+    firsts = [first for first, _, _ in results]
+    repeats = [elapsed for _, elapsed, _ in results for elapsed in elapsed]
+    orders = sum(len(ids - {None}) for _, _, ids in results)
+    return stub.calls.count(('POST', '/v1/orders')), orders, firsts, repeats
+
+
+def main():
+    checkouts = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    attempts = max(2, int(sys.argv[2]) if len(sys.argv) > 2 else 4)
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.5
+
+    with StubGateway(latency=latency) as stub:
+        app.config.update({'RAZORPAY_BASE_URL': stub.url, 'RAZORPAY_POOL_SIZE': 32})
+        payment_gateway.init_app(app)
+        print(f'{checkouts} checkouts x {attempts} attempts, gateway latency {latency * 1000:.0f} ms')
+        print(f"{'mode':<12}{'gw calls':>10}{'orders':>10}{'first p50 ms':>14}"
+              f"{'repeat p50 ms':>15}{'repeat p90 ms':>15}")
+        for label, keyed in (('no key', False), ('keyed', True)):
+            calls, orders, firsts, repeats = run(stub, checkouts, attempts, keyed)
+            repeats.sort()
+            print(f'{label:<12}{calls:>10}{orders:>10}{statistics.median(firsts) * 1000:>14.1f}'
+                  f'{statistics.median(repeats) * 1000:>15.1f}'
+                  f'{repeats[int(0.9 * (len(repeats) - 1))] * 1000:>15.1f}')
+        payment_gateway.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark: text vs. binary UUID keys, random vs. time-ordered, on investments
+
+Seeds N investments (default 10,000,000) over 1,000 bonds and 100,000
+investors into four throwaway SQLite databases that differ only in how ids
+are stored and generated:
+
+- text uuid4: VARCHAR(36) random ids, as before
+- text uuid7: VARCHAR(36) time-ordered ids
+- binary uuid4: 16-byte random ids (ID_STORAGE=binary)
+- binary uuid7: 16-byte time-ordered ids
+
+Investments are inserted in creation order with indexes on investor_id and
+bond_id, like the app's. Reports the insert rate, the size of the table and
+of each index (from SQLite's dbstat), and the latency of the joins the
+dashboards run: one investor's positions joined to their bonds (median of
+1,000 investors) and the total invested by bond type across every
+investment.
+
+    python bench_ids.py [investments]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+import warnings
+
+warnings.simplefilter('ignore')
+
+from sqlalchemy import BigInteger, Column, ForeignKey, Index, MetaData, String, Table, create_engine, func, select, text
+
+from guid import GUID, uuid7
+
+BONDS = 1000
+INVESTORS = 100_000
+CHUNK = 50_000
+
+
+def make_tables(binary):
+    metadata = MetaData()
+    users = Table('users', metadata, Column('id', GUID(binary=binary), primary_key=True))
+    bonds = Table('green_bonds', metadata, Column('id', GUID(binary=binary), primary_key=True),
+                  Column('bond_type', String(50), nullable=False))
+    investments = Table(
+        'investments', metadata,
+        Column('id', GUID(binary=binary), primary_key=True),
+        Column('investor_id', GUID(binary=binary), ForeignKey('users.id'), nullable=False),
+        Column('bond_id', GUID(binary=binary), ForeignKey('green_bonds.id'), nullable=False),
+        Column('investment_amount', BigInteger, nullable=False),
+    )
+    Index('ix_investments_investor_id', investments.c.investor_id)
+    Index('ix_investments_bond_id', investments.c.bond_id)
+    return metadata, users, bonds, investments
+
+
+def seed(binary, make_id, n):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    engine = create_engine('sqlite:///' + path)
+    metadata, users, bonds, investments = make_tables(binary)
+    metadata.create_all(engine)
+    rng = random.Random(19)
+    investor_ids = [make_id() for _ in range(INVESTORS)]
+    bond_ids = [make_id() for _ in range(BONDS)]
+    with engine.begin() as connection:
+        connection.execute(users.insert(), [{'id': i} for i in investor_ids])
+        connection.execute(bonds.insert(), [{'id': b, 'bond_type': ('corporate', 'municipal', 'sovereign')[k % 3]}
+                                            for k, b in enumerate(bond_ids)])
+    started = time.perf_counter()
+    for start in range(0, n, CHUNK):
+        rows = [{'id': make_id(), 'investor_id': rng.choice(investor_ids), 'bond_id': rng.choice(bond_ids),
+                 'investment_amount': rng.randrange(50_000, 10_000_000)}
+                for _ in range(min(CHUNK, n - start))]
+        with engine.begin() as connection:
+            connection.execute(investments.insert(), rows)
+    insert_seconds = time.perf_counter() - started
+    return engine, (users, bonds, investments), investor_ids, insert_seconds, path
+
+
+def sizes(engine):
+    with engine.connect() as connection:
+        return dict(connection.execute(text(
+            'SELECT name, SUM(pgsize) FROM dbstat GROUP BY name')).all())
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+    variants = (('text uuid4', False, lambda: str(uuid.uuid4())), ('text uuid7', False, uuid7),
+                ('binary uuid4', True, lambda: str(uuid.uuid4())), ('binary uuid7', True, uuid7))
+
+    print(f'{n:,} investments, {INVESTORS:,} investors, {BONDS:,} bonds')
+    print(f"  {'ids':<14}{'insert/s':>10}{'file MB':>9}{'table MB':>10}{'pk MB':>8}{'investor MB':>13}"
+          f"{'bond MB':>9}{'investor ms':>13}{'by type ms':>12}")
+    for label, binary, make_id in variants:
+        engine, (users, bonds, investments), investor_ids, insert_seconds, path = seed(binary, make_id, n)
+        size = sizes(engine)
+        pk = sum(value for name, value in size.items() if name.startswith('sqlite_autoindex_investments'))
+        sample = random.Random(7).sample(investor_ids, 1000)
+        positions = (select(investments.c.id, investments.c.investment_amount, bonds.c.bond_type)
+                     .join(bonds, investments.c.bond_id == bonds.c.id))
+        by_type = (select(bonds.c.bond_type, func.sum(investments.c.investment_amount))
+                   .join(bonds, investments.c.bond_id == bonds.c.id).group_by(bonds.c.bond_type))
+        with engine.connect() as connection:
+            investor_ms = statistics.median(
+                timed(lambda: connection.execute(positions.where(investments.c.investor_id == investor)).all(), 1)
+                for investor in sample) * 1000
+            by_type_ms = timed(lambda: connection.execute(by_type).all(), 3) * 1000
+        mb = 2 ** 20
+        print(f'  {label:<14}{n / insert_seconds:>10,.0f}{os.path.getsize(path) / mb:>9.1f}'
+              f'{size["investments"] / mb:>10.1f}{pk / mb:>8.1f}{size["ix_investments_investor_id"] / mb:>13.1f}'
+              f'{size["ix_investments_bond_id"] / mb:>9.1f}{investor_ms:>13.3f}{by_type_ms:>12.1f}')
+        engine.dispose()
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Benchmark: ingesting impact readings with rollups, and reading them back
+
+Seeds N sensor readings (default 20,000,000) into a throwaway SQLite
+database through impact.record_readings, as collectors posting an hour of
+minutely CO2, energy, water and hectare readings for 40 projects per batch
+(9,600 readings, under IMPACT_MAX_READINGS). Projects default to 1,000.
+
+Reports the ingest rate with rollups maintained and the share of it spent
+folding and upserting rollups, the size of the readings and rollup tables,
+then the latency of:
+
+- a year of one project's daily CO2 from impact_rollups, against the same
+  GROUP BY over impact_readings
+- one project's hourly energy for the last week, from the rollups
+- GET /api/impact/metrics for 100 projects
+
+    python bench_impact.py [readings] [projects]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from datetime import date
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('JOB_QUEUE_MODE', 'off')
+warnings.simplefilter('ignore')
+
+import random
+
+from sqlalchemy import func, select, text
+
+import impact
+from app import app, db
+from models import get_models
+
+models = get_models(db)
+User, GreenBond, Project, ImpactReading, ImpactRollup = (
+    models[name] for name in ('User', 'GreenBond', 'Project', 'ImpactReading', 'ImpactRollup'))
+
+METRICS = ('co2_reduction', 'energy_generated', 'water_saved', 'hectares_restored')
+PROJECTS_PER_BATCH = 40
+START = 1704067200  # 2024-01-01T00:00:00Z
+
+
+def seed_projects(count):
+    issuer_id = '00000000-0000-4000-8000-000000000000'
+    projects = [f'00000000-0000-4000-b000-{i:012d}' for i in range(count)]
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(User.__table__.insert(), [{
+            'id': issuer_id, 'email': 'issuer@example.com', 'password_hash': 'x', 'first_name': 'Bench',
+            'last_name': 'Issuer', 'user_type': 'bond_issuer'}])
+        db.session.execute(GreenBond.__table__.insert(), [{
+            'id': '00000000-0000-4000-a000-000000000000', 'issuer_id': issuer_id, 'bond_name': 'Bond',
+            'isin': 'IN0000000000', 'bond_type': 'corporate', 'face_value': 1000, 'coupon_rate': 5.0,
+            'maturity_date': date(2030, 1, 1), 'issue_date': date(2024, 1, 1), 'minimum_investment': 1000,
+            'total_amount': 10 ** 9, 'risk_rating': 'AA', 'status': 'active', 'description': 'Green bond'}])
+        db.session.execute(Project.__table__.insert(), [{
+            'id': project_id, 'bond_id': '00000000-0000-4000-a000-000000000000', 'project_name': f'Project {i}',
+            'project_type': 'renewable_energy', 'description': 'Project', 'country': 'India', 'region': 'South',
+            'project_manager': 'PM', 'start_date': date(2024, 1, 1), 'expected_completion_date': date(2026, 1, 1),
+            'total_budget': 100_000} for i, project_id in enumerate(projects)])
+        db.session.commit()
+    return projects
+
+
+def batches(projects, n):
+    """Hourly batches of minutely readings, PROJECTS_PER_BATCH projects at a time, until n readings"""
+    rng = random.Random(21)
+    produced, hour = 0, START
+    while True:
+        for start in range(0, len(projects), PROJECTS_PER_BATCH):
+            batch = [(project_id, metric, hour + minute * 60, rng.random() * 10)
+                     for project_id in projects[start:start + PROJECTS_PER_BATCH]
+                     for metric in METRICS for minute in range(60)]
+            batch = batch[:n - produced]
+            produced += len(batch)
+            yield batch
+            if produced >= n:
+                return
+        hour += 3600
+
+
+def ingest(projects, n):
+    fold_seconds = 0.0
+    fold, upsert = impact.fold, impact.upsert_rollups
+
+    def timed_upsert(rollups):
+        nonlocal fold_seconds
+        started = time.perf_counter()
+        upsert(rollups)
+        fold_seconds += time.perf_counter() - started
+
+    def timed_fold(readings):
+        nonlocal fold_seconds
+        started = time.perf_counter()
+        result = fold(readings)
+        fold_seconds += time.perf_counter() - started
+        return result
+
+    impact.fold, impact.upsert_rollups = timed_fold, timed_upsert
+    started = time.perf_counter()
+    try:
+        with app.app_context():
+            for batch in batches(projects, n):
+                impact.record_readings(batch)
+                db.session.commit()
+    finally:
+        impact.fold, impact.upsert_rollups = fold, upsert
+    return time.perf_counter() - started, fold_seconds
+
+
+def timed(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000_000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    projects = seed_projects(count)
+    seconds, rollup_seconds = ingest(projects, n)
+    client = app.test_client()
+    with app.app_context():
+        sizes = dict(db.session.execute(text('SELECT name, SUM(pgsize) FROM dbstat GROUP BY name')).all())
+        rollups = db.session.execute(select(func.count()).select_from(ImpactRollup)).scalar()
+        last_hour = db.session.execute(select(func.max(ImpactReading.recorded_at))).scalar()
+        last_hour -= last_hour % 3600
+        project_id = projects[0]
+        daily_raw = (select((ImpactReading.recorded_at - ImpactReading.recorded_at % 86400).label('day'),
+                            func.sum(ImpactReading.value))
+                     .where(ImpactReading.project_id == project_id, ImpactReading.metric_type == 'co2_reduction')
+                     .group_by(text('day')))
+        daily = select(ImpactRollup.bucket, ImpactRollup.total).where(
+            ImpactRollup.project_id == project_id, ImpactRollup.metric_type == 'co2_reduction',
+            ImpactRollup.period == 'day', ImpactRollup.bucket >= last_hour - 365 * 86400)
+        rollup_ms = timed(lambda: db.session.execute(daily).all())
+        raw_ms = timed(lambda: db.session.execute(daily_raw).all(), repeat=1)
+    week_ms = timed(lambda: client.get(f'/api/impact/projects/{project_id}/series', query_string={
+        'metricType': 'energy_generated', 'period': 'hour', 'from': last_hour - 7 * 86400}))
+    metrics_ms = timed(lambda: client.get('/api/impact/metrics', query_string={'projectId': projects[:100]}))
+
+    mb = 2 ** 20
+    print(f'{n:,} readings, {count:,} projects, {rollups:,} rollup rows')
+    print(f'  ingest: {n / seconds:,.0f} readings/s, {rollup_seconds / seconds:.0%} of it in rollups')
+    print(f'  impact_readings {sizes["impact_readings"] / mb:,.1f} MB, '
+          f'impact_rollups {sizes["impact_rollups"] / mb:,.1f} MB')
+    print(f'  year of daily CO2, one project:   rollups {rollup_ms:8.2f} ms   raw GROUP BY {raw_ms:10.1f} ms')
+    print(f'  week of hourly energy (GET series):       {week_ms:8.2f} ms')
+    print(f'  GET /api/impact/metrics, 100 projects:     {metrics_ms:8.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Benchmark: dashboard queries with and without the foreign key indexes
+
+Seeds N investments (default 1,000,000) by 20,000 investors over 2,000
+bonds from 200 issuers, with 3 projects per bond, then times the queries
+behind the dashboards twice: with the investments, projects and issuer
+indexes dropped (as databases were created before them), and again after
+migrations.create_missing_indexes has put them back.
+
+- investor positions: one investor's counted investments (portfolio
+  analytics, rebuild_portfolios), median of 200 investors
+- bond investors: investor and investment counts for a page of 20 bonds
+- bond projects: project types for a page of 20 bonds
+  (GreenBond.project_categories, run by every bond listing)
+- issuer bonds: one issuer's active bonds, median of 200 issuers
+
+    python bench_indexes.py [investments]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from datetime import date
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('JOB_QUEUE_MODE', 'off')
+warnings.simplefilter('ignore')
+
+from sqlalchemy import func, select
+
+from app import app, db
+from migrations import create_missing_indexes
+from models import get_models
+from query_plans import capture_queries, explain
+
+models = get_models(db)
+User, GreenBond, Project, Investment = (models[name] for name in ('User', 'GreenBond', 'Project', 'Investment'))
+
+ISSUERS = 200
+BONDS = 2000
+INVESTORS = 20_000
+CHUNK = 50_000
+INDEXES = ('ix_investments_investor_id_status', 'ix_investments_bond_id_status_investor_id',
+           'ix_projects_bond_id_project_type', 'ix_green_bonds_issuer_id_status')
+
+
+def seed(n):
+    rng = random.Random(20)
+    user = {'password_hash': 'x', 'first_name': 'Bench', 'last_name': 'User'}
+    issuers = [f'00000000-0000-4000-8000-{i:012d}' for i in range(ISSUERS)]
+    investors = [f'00000000-0000-4000-9000-{i:012d}' for i in range(INVESTORS)]
+    bonds = [f'00000000-0000-4000-a000-{i:012d}' for i in range(BONDS)]
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(User.__table__.insert(), [
+            dict(user, id=user_id, email=f'{user_id}@example.com', user_type=user_type)
+            for ids, user_type in ((issuers, 'bond_issuer'), (investors, 'retail_investor')) for user_id in ids])
+        db.session.execute(GreenBond.__table__.insert(), [{
+            'id': bond_id, 'issuer_id': issuers[i % ISSUERS], 'bond_name': f'Bond {i}', 'isin': f'IN{i:010d}',
+            'bond_type': 'corporate', 'face_value': 1000, 'coupon_rate': 5.0, 'maturity_date': date(2030, 1, 1),
+            'issue_date': date(2024, 1, 1), 'minimum_investment': 1000, 'total_amount': 10 ** 9,
+            'risk_rating': 'AA', 'status': rng.choice(('active', 'active', 'draft', 'matured')),
+            'description': 'Green bond'} for i, bond_id in enumerate(bonds)])
+        db.session.execute(Project.__table__.insert(), [{
+            'id': f'00000000-0000-4000-b000-{i * 3 + k:012d}', 'bond_id': bond_id, 'project_name': f'Project {i}',
+            'project_type': ('renewable_energy', 'clean_transport', 'water')[k], 'description': 'Project',
+            'country': 'India', 'region': 'South', 'project_manager': 'PM', 'start_date': date(2024, 1, 1),
+            'expected_completion_date': date(2026, 1, 1), 'total_budget': 100_000}
+            for i, bond_id in enumerate(bonds) for k in range(3)])
+        for start in range(0, n, CHUNK):
+            db.session.execute(Investment.__table__.insert(), [{
+                'id': f'00000000-0000-4000-c000-{i:012d}', 'investor_id': rng.choice(investors),
+                'bond_id': rng.choice(bonds), 'investment_amount': 5000, 'purchase_price': 1000,
+                'purchase_date': date(2024, 2, 1), 'status': rng.choice(('confirmed', 'settled', 'cancelled')),
+                'fees': 0, 'expected_return': 5250, 'maturity_value': 6250}
+                for i in range(start, min(n, start + CHUNK))])
+        db.session.commit()
+    return issuers, investors, bonds
+
+
+def timed(fn, args):
+    timings = []
+    for arg in args:
+        started = time.perf_counter()
+        fn(arg)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def queries(issuers, investors, bonds):
+    rng = random.Random(7)
+    pages = [rng.sample(bonds, 20) for _ in range(20)]
+
+    def positions(investor_id):
+        return db.session.execute(
+            select(Investment.id, Investment.bond_id, Investment.investment_amount, Investment.purchase_price)
+            .where(Investment.investor_id == investor_id, Investment.status.notin_(('cancelled',)))).all()
+
+    def bond_investors(page):
+        return db.session.execute(
+            select(Investment.bond_id, func.count(func.distinct(Investment.investor_id)), func.count())
+            .where(Investment.bond_id.in_(page), Investment.status != 'cancelled')
+            .group_by(Investment.bond_id)).all()
+
+    def issuer_bonds(issuer_id):
+        return db.session.execute(
+            select(GreenBond.id).where(GreenBond.issuer_id == issuer_id, GreenBond.status == 'active')).all()
+
+    return (('investor positions', positions, rng.sample(investors, 200)),
+            ('bond investors', bond_investors, pages),
+            ('bond projects', GreenBond.project_categories, pages),
+            ('issuer bonds', issuer_bonds, rng.sample(issuers, 200)))
+
+
+def plan(fn, arg):
+    """The plan of the last query fn runs"""
+    with capture_queries(db.engine) as statements:
+        fn(arg)
+    with db.engine.connect() as connection:
+        return ' / '.join(explain(connection, *statements[-1]))
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    issuers, investors, bonds = seed(n)
+    print(f'{n:,} investments, {INVESTORS:,} investors, {BONDS:,} bonds, {ISSUERS} issuers')
+    results = {}
+    with app.app_context():
+        for index in INDEXES:
+            db.session.execute(db.text(f'DROP INDEX {index}'))
+        db.session.commit()
+        for label in ('without', 'with'):
+            if label == 'with':
+                create_missing_indexes(db)
+            for name, fn, args in queries(issuers, investors, bonds):
+                results[name, label] = (timed(fn, args), plan(fn, args[0]))
+            db.session.rollback()
+
+    print(f"  {'query':<20}{'without ms':>12}{'with ms':>10}  plan with indexes")
+    for name, _, _ in queries(issuers, investors, bonds):
+        (without, _), (with_, detail) = results[name, 'without'], results[name, 'with']
+        print(f'  {name:<20}{without:>12.2f}{with_:>10.3f}  {detail}')
+
+
+if __name__ == '__main__':
+    main()
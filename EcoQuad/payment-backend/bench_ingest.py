@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Benchmark: streaming a large bulk upload through POST /api/projects/<id>/metrics:bulk
+
+Writes a file of minutely readings for one project (default 1 GB) in the
+given format, then posts it through the test client as the request body,
+read from disk as the view consumes it. Reports the rows/s recorded,
+rollups included, and the process's peak RSS during the upload against
+its RSS before it, which stays flat however large the file.
+
+    python bench_ingest.py [megabytes] [ndjson|csv]
+
+Peak RSS is read from /proc (Linux), reset before the upload where the
+kernel allows it; elsewhere it is the process's lifetime peak.
+"""
+import os
+import sys
+import tempfile
+import time
+import warnings
+from datetime import date
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('JOB_QUEUE_MODE', 'off')
+warnings.simplefilter('ignore')
+
+import json
+import random
+import resource
+
+from flask_jwt_extended import create_access_token
+
+from app import app, db
+from models import get_models
+
+models = get_models(db)
+User, GreenBond, Project = models['User'], models['GreenBond'], models['Project']
+
+METRICS = ('co2_reduction', 'energy_generated', 'water_saved', 'hectares_restored')
+START = 1704067200  # 2024-01-01T00:00:00Z
+ISSUER_ID = '00000000-0000-4000-8000-000000000000'
+PROJECT_ID = '00000000-0000-4000-b000-000000000000'
+CONTENT_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+def seed_project():
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(User.__table__.insert(), [{
+            'id': ISSUER_ID, 'email': 'issuer@example.com', 'password_hash': 'x', 'first_name': 'Bench',
+            'last_name': 'Issuer', 'user_type': 'bond_issuer'}])
+        db.session.execute(GreenBond.__table__.insert(), [{
+            'id': '00000000-0000-4000-a000-000000000000', 'issuer_id': ISSUER_ID, 'bond_name': 'Bond',
+            'isin': 'IN0000000000', 'bond_type': 'corporate', 'face_value': 1000, 'coupon_rate': 5.0,
+            'maturity_date': date(2030, 1, 1), 'issue_date': date(2024, 1, 1), 'minimum_investment': 1000,
+            'total_amount': 10 ** 9, 'risk_rating': 'AA', 'status': 'active', 'description': 'Green bond'}])
+        db.session.execute(Project.__table__.insert(), [{
+            'id': PROJECT_ID, 'bond_id': '00000000-0000-4000-a000-000000000000', 'project_name': 'Project',
+            'project_type': 'renewable_energy', 'description': 'Project', 'country': 'India', 'region': 'South',
+            'project_manager': 'PM', 'start_date': date(2024, 1, 1), 'expected_completion_date': date(2026, 1, 1),
+            'total_budget': 100_000}])
+        db.session.commit()
+        return create_access_token(identity=ISSUER_ID)
+
+
+def write_upload(path, size, fmt):
+    """Minutely readings of each metric until the file reaches size bytes; returns the row count"""
+    rng = random.Random(22)
+    rows, written, minute = 0, 0, 0
+    with open(path, 'w', encoding='utf-8', newline='') as out:
+        if fmt == 'csv':
+            written += out.write('recordedAt,metricType,value\r\n')
+        while written < size:
+            block = []
+            for _ in range(1000):
+                at = START + minute * 60
+                for metric in METRICS:
+                    value = round(rng.random() * 10, 4)
+                    if fmt == 'csv':
+                        block.append(f'{at},{metric},{value}\r\n')
+                    else:
+                        block.append(json.dumps({'metricType': metric, 'value': value, 'recordedAt': at}) + '\n')
+                minute += 1
+            written += out.write(''.join(block))
+            rows += len(block)
+    return rows
+
+
+def rss_mb(field):
+    """VmRSS or VmHWM (peak) of this process in MB"""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        pass
+
+
+def main():
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+    fmt = sys.argv[2] if len(sys.argv) > 2 else 'ndjson'
+    token = seed_project()
+    client = app.test_client()
+    path = os.path.join(tempfile.mkdtemp(), 'upload.' + fmt)
+    try:
+        rows = write_upload(path, megabytes * 2 ** 20, fmt)
+        size = os.path.getsize(path)
+        before = rss_mb('VmRSS')
+        reset_peak_rss()
+        started = time.perf_counter()
+        with open(path, 'rb') as body:
+            response = client.post(f'/api/projects/{PROJECT_ID}/metrics:bulk', input_stream=body, headers={
+                'Authorization': f'Bearer {token}', 'Content-Type': CONTENT_TYPES[fmt],
+                'Content-Length': str(size)})
+        seconds = time.perf_counter() - started
+        peak = rss_mb('VmHWM')
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+    result = response.get_json()
+    print(f'{fmt}: {size / 2 ** 20:,.0f} MB, {rows:,} rows, '
+          f'chunks of {app.config["IMPACT_BULK_CHUNK"]:,} (HTTP {response.status_code})')
+    print(f'  recorded {result["recorded"]:,}, rejected {result["rejectedCount"]:,} in {seconds:,.1f} s')
+    print(f'  {result["recorded"] / seconds:,.0f} rows/s, {size / 2 ** 20 / seconds:,.1f} MB/s')
+    print(f'  RSS before upload {before:,.1f} MB, peak during upload {peak:,.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark: issuer summary for an issuer with many bonds
+
+Seeds one issuer with N bonds (default 10,000) in four statuses and three
+projects per bond, then compares:
+
+- GET /api/issuer/summary, which reads the precomputed summary rows
+- the same totals computed on the fly with SQL aggregates over green_bonds
+  and projects (what the endpoint would cost without the summary tables)
+- fulfilling a payment (GreenBond.add_raised) and updating a project's
+  spend, which update the summary incrementally
+
+    python bench_issuer.py [bonds]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from datetime import date
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('JOB_QUEUE_MODE', 'off')
+warnings.simplefilter('ignore')
+
+from flask_jwt_extended import create_access_token
+from sqlalchemy import func
+
+from app import app, db
+from issuer import rebuild_issuers
+from models import create_models
+
+User, GreenBond, Project, Investment = create_models(db)
+
+ISSUER_ID = '00000000-0000-4000-8000-000000000000'
+STATUSES = ('draft', 'active', 'funded', 'matured')
+
+
+def seed(bonds):
+    rng = random.Random(24)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(User.__table__.insert(), [{
+            'id': ISSUER_ID, 'email': 'issuer@example.com', 'password_hash': 'x', 'first_name': 'Bench',
+            'last_name': 'Issuer', 'user_type': 'bond_issuer'}])
+        bond_rows, project_rows = [], []
+        for i in range(bonds):
+            total = rng.randrange(1_000_000, 100_000_000)
+            bond_rows.append({
+                'id': f'00000000-0000-4000-a000-{i:012d}', 'issuer_id': ISSUER_ID, 'bond_name': f'Bond {i}',
+                'isin': f'IN{i:010d}', 'bond_type': 'corporate', 'face_value': 1000, 'coupon_rate': 5.0,
+                'maturity_date': date(2030, 1, 1), 'issue_date': date(2024, 1, 1), 'minimum_investment': 1000,
+                'total_amount': total, 'amount_raised': rng.randrange(total), 'risk_rating': 'AA',
+                'status': rng.choice(STATUSES), 'description': 'Green bond'})
+            for j in range(3):
+                budget = rng.randrange(100_000, 1_000_000)
+                project_rows.append({
+                    'id': f'00000000-0000-4000-b000-{i * 3 + j:012d}', 'bond_id': bond_rows[-1]['id'],
+                    'project_name': 'Project', 'project_type': 'renewable_energy', 'description': 'Project',
+                    'country': 'India', 'region': 'South', 'project_manager': 'PM',
+                    'start_date': date(2024, 1, 1), 'expected_completion_date': date(2026, 1, 1),
+                    'total_budget': budget, 'allocated_funds': budget, 'spent_funds': rng.randrange(budget)})
+        # Core inserts bypass the ORM hooks; the rebuild below catches up
+        db.session.execute(GreenBond.__table__.insert(), bond_rows)
+        db.session.execute(Project.__table__.insert(), project_rows)
+        db.session.commit()
+        started = time.perf_counter()
+        rebuild_issuers([ISSUER_ID])
+        print(f'rebuild_issuers for the issuer: {(time.perf_counter() - started) * 1000:.1f} ms')
+        return create_access_token(identity=ISSUER_ID)
+
+
+def on_the_fly():
+    db.session.query(func.count(GreenBond.id), func.sum(GreenBond.total_amount),
+                     func.sum(GreenBond.amount_raised)).filter(GreenBond.issuer_id == ISSUER_ID).one()
+    (db.session.query(GreenBond.status, func.count(GreenBond.id), func.sum(GreenBond.total_amount),
+                      func.sum(GreenBond.amount_raised))
+     .filter(GreenBond.issuer_id == ISSUER_ID).group_by(GreenBond.status).all())
+    (db.session.query(func.count(Project.id), func.sum(Project.total_budget), func.sum(Project.allocated_funds),
+                      func.sum(Project.spent_funds))
+     .join(GreenBond, GreenBond.id == Project.bond_id).filter(GreenBond.issuer_id == ISSUER_ID).one())
+
+
+def median_ms(fn, runs=30):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def main(bonds=10_000):
+    token = seed(bonds)
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+
+    def summary():
+        assert client.get('/api/issuer/summary', headers=headers).status_code == 200
+
+    print(f'\n{bonds:,} bonds, {bonds * 3:,} projects (median ms)')
+    print(f"  {'GET /api/issuer/summary':<40}{median_ms(summary):>8.2f}")
+    with app.app_context():
+        print(f"  {'on-the-fly SQL aggregates':<40}{median_ms(on_the_fly, runs=5):>8.2f}")
+
+        def add_raised():
+            assert GreenBond.add_raised('00000000-0000-4000-a000-000000000000', 1)
+            db.session.commit()
+
+        project = db.session.get(Project, '00000000-0000-4000-b000-000000000000')
+
+        def spend():
+            project.spent_funds = project.spent_funds + 1
+            db.session.commit()
+
+        print(f"  {'add_raised (with upkeep)':<40}{median_ms(add_raised):>8.2f}")
+        print(f"  {'update project spend (with upkeep)':<40}{median_ms(spend):>8.2f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark: aggregating money stored as FLOAT rupees, NUMERIC and BIGINT paise
+
+Seeds N investments (default 1,000,000) over 1,000 bonds and 20,000
+investors into three throwaway SQLite databases that differ only in the type
+of the amount column:
+
+- float: db.Float rupees, as before
+- numeric: Numeric(14, 2), read back as Decimal
+- paise: money.Money, integer paise read back as float rupees
+
+and times the dashboard-style aggregates over each: the grand total, SUM
+GROUP BY bond and SUM GROUP BY investor (query plus converting the rows,
+both over covering indexes), and a Python loop totalling every amount. It
+also reports the database size and counts the bonds whose total differs
+from the exact sum of their amounts.
+
+    python bench_money.py [investments]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+
+warnings.simplefilter('ignore')
+
+from sqlalchemy import Column, Float, Index, Integer, MetaData, Numeric, String, Table, create_engine, func, select
+
+from money import Money, to_paise, to_rupees
+
+BONDS = 1000
+INVESTORS = 20000
+
+
+def make_table(money_type):
+    table = Table(
+        'investments', MetaData(),
+        Column('id', Integer, primary_key=True),
+        Column('bond_id', String(36), nullable=False),
+        Column('investor_id', String(36), nullable=False),
+        Column('investment_amount', money_type, nullable=False),
+    )
+    Index('ix_investments_bond_amount', table.c.bond_id, table.c.investment_amount)
+    Index('ix_investments_investor_amount', table.c.investor_id, table.c.investment_amount)
+    return table
+
+
+def make_rows(n):
+    rng = random.Random(14)
+    # Amounts in whole paise, as a customer would pay them
+    return [{'id': i, 'bond_id': f'bond-{rng.randrange(BONDS):04d}',
+             'investor_id': f'investor-{rng.randrange(INVESTORS):05d}',
+             'investment_amount': rng.randrange(50_000, 10_000_000) / 100} for i in range(n)]
+
+
+def seed(money_type, rows):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    engine = create_engine('sqlite:///' + path)
+    table = make_table(money_type)
+    table.metadata.create_all(engine)
+    with engine.begin() as connection:
+        for start in range(0, len(rows), 50_000):
+            connection.execute(table.insert(), rows[start:start + 50_000])
+    return engine, table, os.path.getsize(path)
+
+
+def timed(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), result
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rows = make_rows(n)
+    exact = {}
+    for row in rows:
+        exact[row['bond_id']] = exact.get(row['bond_id'], 0) + to_paise(row['investment_amount'])
+
+    print(f'{n:,} investments')
+    print(f"{'column':<10}{'size MB':>9}{'total ms':>10}{'by bond ms':>12}{'by investor ms':>16}"
+          f"{'python loop ms':>16}{'bonds off':>11}")
+    for label, money_type in (('float', Float), ('numeric', Numeric(14, 2)), ('paise', Money)):
+        engine, table, size = seed(money_type, rows)
+        amount = table.c.investment_amount
+        with engine.connect() as connection:
+            total_ms, _ = timed(lambda: connection.execute(select(func.sum(amount))).scalar())
+            bond_ms, by_bond = timed(lambda: dict(connection.execute(
+                select(table.c.bond_id, func.sum(amount)).group_by(table.c.bond_id)).all()))
+            investor_ms, _ = timed(lambda: dict(connection.execute(
+                select(table.c.investor_id, func.sum(amount)).group_by(table.c.investor_id)).all()))
+            amounts = connection.execute(select(amount)).scalars().all()
+            loop_ms, _ = timed(lambda: sum(amounts))
+        off = sum(1 for bond_id, total in by_bond.items() if float(total) != to_rupees(exact[bond_id]))
+        print(f'{label:<10}{size / 2 ** 20:>9.1f}{total_ms * 1000:>10.1f}{bond_ms * 1000:>12.1f}'
+              f'{investor_ms * 1000:>16.1f}{loop_ms * 1000:>16.1f}{off:>11,}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Benchmark: portfolio summary for an investor with many positions
+
+Seeds one institutional investor with N investments (default 100,000)
+spread over 1,000 bonds, then compares:
+
+- GET /api/portfolio/summary, which reads the precomputed summary rows
+- computing the same totals and allocations on the fly with SQL aggregates
+  over investments JOIN green_bonds (what the endpoint would cost without
+  the summary tables)
+- inserting one more investment, which updates the summary incrementally
+
+    python bench_portfolio.py [positions]
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from datetime import date, timedelta
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+os.environ.setdefault('PASSWORD_HASH_EXECUTOR', 'inline')
+warnings.simplefilter('ignore')
+
+from sqlalchemy import func
+
+from app import app, db
+from models import create_models
+from portfolio import rebuild_portfolios
+
+User, GreenBond, Project, Investment = create_models(db)
+
+BONDS = 1000
+
+
+def seed(positions):
+    rng = random.Random(7)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    client = app.test_client()
+    response = client.post('/api/auth/register', json={
+        'email': 'institution@example.com',
+        'password': 'benchpassword',
+        'firstName': 'Big',
+        'lastName': 'Fund',
+        'userType': 'institutional_investor'
+    }).get_json()
+    investor_id = response['user']['id']
+    headers = {'Authorization': f"Bearer {response['access_token']}"}
+
+    with app.app_context():
+        issuer = User(email='issuer@example.com', first_name='Bench', last_name='Issuer',
+                      user_type='bond_issuer', password_hash='x')
+        db.session.add(issuer)
+        db.session.flush()
+        bond_rows = [{
+            'id': f'bond-{i:05d}', 'issuer_id': issuer.id, 'bond_name': f'Bond {i}',
+            'isin': f'IN{i:010d}', 'bond_type': rng.choice(('corporate', 'municipal', 'sovereign')),
+            'face_value': 1000.0, 'coupon_rate': round(rng.uniform(3, 9), 2),
+            'maturity_date': date(2026, 1, 1) + timedelta(days=rng.randrange(7300)),
+            'issue_date': date(2024, 1, 1), 'currency': 'INR', 'minimum_investment': 1000.0,
+            'total_amount': 1e9, 'amount_raised': 0.0, 'risk_rating': rng.choice(('AAA', 'AA', 'A', 'BBB')),
+            'status': 'active', 'description': 'Green bond'
+        } for i in range(BONDS)]
+        db.session.execute(GreenBond.__table__.insert(), bond_rows)
+
+        start = time.perf_counter()
+        for offset in range(0, positions, 50000):
+            rows = []
+            for i in range(offset, min(positions, offset + 50000)):
+                amount = float(rng.randrange(1000, 100000))
+                rows.append({
+                    'id': f'inv-{i:08d}', 'investor_id': investor_id,
+                    'bond_id': f'bond-{rng.randrange(BONDS):05d}', 'investment_amount': amount,
+                    'purchase_price': 1000.0, 'purchase_date': date(2024, 2, 1), 'status': 'settled',
+                    'fees': 10.0, 'expected_return': amount * 1.05, 'maturity_value': amount * 1.3
+                })
+            # bulk core inserts bypass the ORM hooks; the rebuild below catches up
+            db.session.execute(Investment.__table__.insert(), rows)
+        db.session.commit()
+        print(f'seeded {positions} positions in {time.perf_counter() - start:.1f}s')
+
+        start = time.perf_counter()
+        rebuild_portfolios([investor_id])
+        print(f'rebuild_portfolios for the investor: {(time.perf_counter() - start) * 1000:.1f} ms')
+    return client, investor_id, headers
+
+
+def median_ms(fn, runs=30):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def on_the_fly(investor_id):
+    counted = (Investment.investor_id == investor_id, Investment.status != 'cancelled')
+    db.session.query(func.count(Investment.id), func.sum(Investment.investment_amount),
+                     func.sum(Investment.expected_return), func.sum(Investment.maturity_value),
+                     func.sum(Investment.fees)).filter(*counted).one()
+    for column in (GreenBond.bond_type, GreenBond.risk_rating, func.strftime('%Y', GreenBond.maturity_date)):
+        (db.session.query(column, func.count(Investment.id), func.sum(Investment.investment_amount))
+         .join(GreenBond, GreenBond.id == Investment.bond_id)
+         .filter(*counted).group_by(column).all())
+
+
+def main(positions=100_000):
+    client, investor_id, headers = seed(positions)
+
+    def summary():
+        assert client.get('/api/portfolio/summary', headers=headers).status_code == 200
+
+    print(f'\n{positions} positions (median ms)')
+    print(f"  {'GET /api/portfolio/summary':<40}{median_ms(summary):>8.2f}")
+    with app.app_context():
+        print(f"  {'on-the-fly SQL aggregates':<40}{median_ms(lambda: on_the_fly(investor_id), runs=5):>8.2f}")
+
+        def insert_one():
+            db.session.add(Investment(investor_id=investor_id, bond_id='bond-00001', investment_amount=5000,
+                                      purchase_price=1000, purchase_date=date(2024, 3, 1), status='settled',
+                                      fees=10, expected_return=5250, maturity_value=6500))
+            db.session.commit()
+
+        print(f"  {'insert one investment (with upkeep)':<40}{median_ms(insert_one):>8.2f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
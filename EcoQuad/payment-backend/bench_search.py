@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Benchmark: GET /api/search over many project descriptions
+
+Seeds N projects (default 1,000,000) with 20-40 word descriptions drawn from
+a 20,000-word vocabulary with a Zipf-like frequency, loaded with Core
+inserts so the triggers index them as they would any bulk load. Then times
+the search for queries of increasing breadth:
+
+- a rare word, and two words that each occur in thousands of rows
+- three-letter prefixes, answered from the index's prefix entries
+- a word in about a third of all rows, every match of which is ranked
+
+    python bench_search.py [projects]
+"""
+import itertools
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from datetime import date
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('JOB_QUEUE_MODE', 'off')
+warnings.simplefilter('ignore')
+
+from app import app, db
+from models import create_models
+
+User, GreenBond, Project, Investment = create_models(db)
+
+ISSUER_ID = '00000000-0000-4000-8000-000000000000'
+BOND_ID = '00000000-0000-4000-a000-000000000000'
+REGIONS = ('Assam', 'Bihar', 'Goa', 'Gujarat', 'Kerala', 'Ladakh', 'Odisha', 'Punjab', 'Sikkim', 'Tripura')
+CHUNK = 10_000
+
+
+def vocabulary(rng, size=20_000):
+    """Pronounceable made-up words, most frequent first"""
+    consonants, vowels = 'bdfghklmnprstvz', 'aeiou'
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(consonants) + rng.choice(vowels) for _ in range(rng.randint(2, 4))))
+    return sorted(sorted(words), key=lambda word: rng.random())
+
+
+def seed(projects):
+    rng = random.Random(25)
+    words = vocabulary(rng)
+    weights = list(itertools.accumulate(1 / (rank + 10) for rank in range(len(words))))
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(User.__table__.insert(), [{
+            'id': ISSUER_ID, 'email': 'issuer@example.com', 'password_hash': 'x', 'first_name': 'Bench',
+            'last_name': 'Issuer', 'user_type': 'bond_issuer'}])
+        db.session.execute(GreenBond.__table__.insert(), [{
+            'id': BOND_ID, 'issuer_id': ISSUER_ID, 'bond_name': 'Bench Bond', 'isin': 'IN0000000000',
+            'bond_type': 'corporate', 'face_value': 1000, 'coupon_rate': 5.0, 'maturity_date': date(2030, 1, 1),
+            'issue_date': date(2024, 1, 1), 'minimum_investment': 1000, 'total_amount': 1_000_000,
+            'risk_rating': 'AA', 'status': 'active', 'description': 'Green bond'}])
+        started = time.perf_counter()
+        for offset in range(0, projects, CHUNK):
+            db.session.execute(Project.__table__.insert(), [{
+                'id': f'00000000-0000-4000-b000-{i:012d}', 'bond_id': BOND_ID,
+                'project_name': ' '.join(rng.choices(words, cum_weights=weights, k=3)).title(),
+                'project_type': 'renewable_energy',
+                'description': ' '.join(rng.choices(words, cum_weights=weights, k=rng.randint(20, 40))),
+                'country': 'India', 'region': rng.choice(REGIONS), 'project_manager': 'PM',
+                'start_date': date(2024, 1, 1), 'expected_completion_date': date(2026, 1, 1),
+                'total_budget': 100_000} for i in range(offset, min(offset + CHUNK, projects))])
+        db.session.commit()
+        elapsed = time.perf_counter() - started
+        print(f'loaded and indexed {projects:,} projects in {elapsed:.1f} s ({projects / elapsed:,.0f} rows/s)')
+    return words
+
+
+def median_ms(fn, runs=20):
+    fn()
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def matches(query):
+    words = query.split()
+    return db.session.execute(db.text('SELECT count(*) FROM search_index WHERE search_index MATCH :query'),
+                              {'query': ' '.join(f'"{word}"*' for word in words)}).scalar()
+
+
+def main(projects=1_000_000):
+    words = seed(projects)
+    client = app.test_client()
+    queries = [
+        ('rare word', words[15_000]),
+        ('two mid-frequency words', f'{words[300]} {words[400]}'),
+        ('3-letter prefix', words[5_000][:3]),
+        ('word + region prefix', f'{words[100]} ker'),
+        ('common word', words[0]),
+    ]
+    print(f'\n{projects:,} projects (median ms, limit 20)')
+    print(f"  {'query':<38}{'matches':>10}{'GET':>10}")
+    with app.app_context():
+        for label, query in queries:
+            def search():
+                assert client.get('/api/search', query_string={'q': query}).status_code == 200
+            print(f"  {f'{label} ({query})':<38}{matches(query):>10,}{median_ms(search):>10.2f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Load test: requests per second from the dev server and gunicorn by worker count
+
+Seeds a throwaway SQLite database with bonds, then serves it with
+``python app.py`` (Werkzeug's threaded dev server) and with
+``gunicorn -c gunicorn.conf.py wsgi:application`` at 1, 2, 4, ... worker
+processes up to twice the number of cores. Each server gets the same
+closed-loop load for a fixed time: client processes, each running keep-alive
+connections on threads, alternating GET /health and GET /api/bonds?limit=20.
+Reports requests per second, latency percentiles and errors.
+
+Everything runs on this machine and the load generator takes CPU from the
+server, so compare rows with each other rather than against production; run
+it on a machine with several cores to see workers scale.
+
+    python bench_serving.py [seconds] [connections]
+"""
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+os.environ.setdefault('PASSWORD_HASH_EXECUTOR', 'inline')
+os.environ.setdefault('JOB_QUEUE_MODE', 'off')
+warnings.simplefilter('ignore')
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PATHS = ('/health', '/api/bonds?limit=20')
+BONDS = 500
+
+
+def seed():
+    from app import app, create_tables, db
+    from models import create_models
+
+    create_tables()
+    User, GreenBond, _, _ = create_models(db)
+    with app.app_context():
+        issuer = User(email='issuer@example.com', first_name='Eco', last_name='Issuer',
+                      user_type='bond_issuer', password_hash='x')
+        db.session.add(issuer)
+        db.session.flush()
+        db.session.add_all(GreenBond(
+            issuer_id=issuer.id, bond_name=f'Bond {i}', isin=f'IN{i:010d}', bond_type='corporate',
+            face_value=1000, coupon_rate=5 + i % 4, maturity_date=date(2030 + i % 5, 6, 30),
+            issue_date=date(2024, 1, 1), minimum_investment=1000, total_amount=1_000_000,
+            risk_rating='AA', status='active', description='Green bond') for i in range(BONDS))
+        db.session.commit()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start(command, port, **env):
+    server = subprocess.Popen(command, cwd=HERE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                              env=dict(os.environ, HOST='127.0.0.1', PORT=str(port), **env))
+    for _ in range(200):
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/health')
+            connection.getresponse().read()
+            return server
+        except OSError:
+            time.sleep(0.05)
+    server.kill()
+    raise RuntimeError(f'{" ".join(command)} did not start')
+
+
+def client(port, threads, seconds):
+    """One load process: keep-alive connections on threads until the time is up"""
+    deadline = time.monotonic() + seconds
+    latencies, errors = [], [0]
+
+    def loop(offset):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        i = offset
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                connection.request('GET', PATHS[i % len(PATHS)])
+                response = connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    errors[0] += 1
+            except (OSError, http.client.HTTPException):
+                errors[0] += 1
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+                continue
+            latencies.append(time.perf_counter() - started)
+            i += 1
+
+    workers = [threading.Thread(target=loop, args=(n,)) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencies, errors[0]
+
+
+def load(port, connections, seconds):
+    processes = max(1, min(os.cpu_count() or 1, connections // 4))
+    per_process = [connections // processes + (n < connections % processes) for n in range(processes)]
+    with ProcessPoolExecutor(processes) as pool:
+        results = list(pool.map(client, [port] * processes, per_process, [seconds] * processes))
+    latencies = sorted(latency for result, _ in results for latency in result)
+    errors = sum(errors for _, errors in results)
+    return len(latencies) / seconds, latencies, errors
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    connections = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    seed()
+
+    cores = os.cpu_count() or 1
+    counts, workers = [], 1
+    while workers <= 2 * cores:
+        counts.append(workers)
+        workers *= 2
+    servers = [('python app.py', '-', [sys.executable, 'app.py'], {})]
+    servers += [('gunicorn', str(count), [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+                                          'wsgi:application'], {'WEB_CONCURRENCY': str(count)})
+                for count in counts]
+
+    print(f'{cores} cores, {connections} connections, {seconds:g}s per server')
+    print(f"  {'server':<16}{'workers':>8}{'req/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for label, count, command, env in servers:
+        port = free_port()
+        server = start(command, port, **env)
+        try:
+            rate, latencies, errors = load(port, connections, seconds)
+        finally:
+            server.terminate()
+            server.wait()
+        p50 = statistics.median(latencies) * 1000 if latencies else float('nan')
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else float('nan')
+        print(f'  {label:<16}{count:>8}{rate:>10,.0f}{p50:>9.1f}{p99:>9.1f}{errors:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Benchmark: cold start of the app and of a pre-fork worker
+
+Every measurement runs in a fresh interpreter against a throwaway SQLite
+database, repeated and reported as the median:
+
+- interpreter: ``python -c pass``, the floor everything else includes
+- import app: importing app.py, which builds the default app
+- create_app: building a second app once the modules are loaded
+- first request: GET /health then GET /api/bonds straight after the import
+- worker spawn: a process that has imported wsgi (as gunicorn's master does
+  with preload_app) forks, and the child runs init_worker() and serves GET
+  /health; measured with and without import_deferred() in the parent
+- first checkout: POST /create-order to a local stub gateway in a fresh
+  worker, which builds the Razorpay client
+
+It then totals the self time of every module ``python -X importtime -c
+'import app'`` reports by top-level package and lists the slowest. Pass
+another checkout of the backend (say, an earlier commit unpacked with
+``git archive``) to measure that one instead.
+
+    python bench_startup.py [runs] [app_dir]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import warnings
+
+warnings.simplefilter('ignore')
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SETUP = '''
+import os, sys, time, warnings
+warnings.simplefilter('ignore')
+import logging
+logging.disable(logging.CRITICAL)
+'''
+
+IMPORT_APP = SETUP + '''
+started = time.perf_counter()
+import app
+print(time.perf_counter() - started)
+'''
+
+CREATE_APP = SETUP + '''
+import app
+started = time.perf_counter()
+app.create_app()
+print(time.perf_counter() - started)
+'''
+
+FIRST_REQUEST = SETUP + '''
+started = time.perf_counter()
+from app import app, create_tables
+create_tables()
+client = app.test_client()
+assert client.get('/health').status_code == 200
+assert client.get('/api/bonds').status_code == 200
+print(time.perf_counter() - started)
+'''
+
+WORKER_SPAWN = SETUP + '''
+import wsgi
+if sys.argv[1] == 'deferred' and hasattr(wsgi, 'import_deferred'):
+    wsgi.import_deferred()
+read, write = os.pipe()
+started = time.perf_counter()
+pid = os.fork()
+if pid == 0:
+    wsgi.init_worker()
+    assert wsgi.application.test_client().get('/health').status_code == 200
+    os.write(write, str(time.perf_counter() - started).encode())
+    os._exit(0)
+os.waitpid(pid, 0)
+print(os.read(read, 64).decode())
+'''
+
+FIRST_CHECKOUT = SETUP + '''
+from stub_gateway import StubGateway
+with StubGateway(key_id='rzp_test_key', key_secret='rzp_test_secret') as stub:
+    os.environ['RAZORPAY_BASE_URL'] = stub.url
+    from app import app, create_tables
+    create_tables()
+    client = app.test_client()
+    started = time.perf_counter()
+    assert client.post('/create-order', json={'amount': 500}).status_code == 200
+    print(time.perf_counter() - started)
+'''
+
+
+def run(script, app_dir, *args):
+    env = dict(os.environ, JOB_QUEUE_MODE='off',
+               PASSWORD_HASH_EXECUTOR='inline', RAZORPAY_KEY_ID='rzp_test_key',
+               RAZORPAY_KEY_SECRET='rzp_test_secret',
+               DATABASE_URL='sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+    result = subprocess.run([sys.executable, '-c', script, *args], cwd=app_dir, env=env,
+                            capture_output=True, text=True, check=True)
+    return float(result.stdout.split()[-1])
+
+
+def interpreter(app_dir):
+    import time
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'pass'], cwd=app_dir, check=True)
+    return time.perf_counter() - started
+
+
+def median_ms(fn, runs):
+    return statistics.median(fn() for _ in range(runs)) * 1000
+
+
+def importtime(app_dir, top=12):
+    """(self us, package) for the packages `import app` spends longest in"""
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=app_dir,
+                            env=env, capture_output=True, text=True, check=True)
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        own, _, name = line[len('import time:'):].split('|')
+        package = name.strip().split('.')[0]
+        packages[package] = packages.get(package, 0) + int(own)
+    return sorted(((us, package) for package, us in packages.items()), reverse=True)[:top]
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 7
+    app_dir = os.path.abspath(sys.argv[2]) if len(sys.argv) > 2 else HERE
+
+    print(f'{app_dir}, median of {runs} fresh interpreters')
+    rows = [
+        ('interpreter', lambda: interpreter(app_dir)),
+        ('import app', lambda: run(IMPORT_APP, app_dir)),
+        ('create_app', lambda: run(CREATE_APP, app_dir)),
+        ('first request', lambda: run(FIRST_REQUEST, app_dir)),
+        ('worker spawn', lambda: run(WORKER_SPAWN, app_dir, 'lazy')),
+        ('  + import_deferred', lambda: run(WORKER_SPAWN, app_dir, 'deferred')),
+        ('first checkout', lambda: run(FIRST_CHECKOUT, app_dir)),
+    ]
+    for label, fn in rows:
+        try:
+            print(f'  {label:<22}{median_ms(fn, runs):>9.1f} ms')
+        except (subprocess.CalledProcessError, ValueError):
+            print(f'  {label:<22}{"n/a":>9}')
+
+    print('\nslowest packages under `import app` (self ms, one run)')
+    for us, package in importtime(app_dir):
+        print(f'  {package:<22}{us / 1000:>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark: absorbing a settlement burst of Razorpay webhook events
+
+- signature checks: hmac.new per message (what razorpay.Utility does) vs.
+  SignatureVerifier.verify_many, which copies one pre-keyed HMAC state
+- POST /webhooks/razorpay with N captured-payment events (default 5,000),
+  one event per request vs. relayed batches of 500, with 5% of events
+  redelivered. Reports events per second and SQL statements per event.
+
+    python bench_webhooks.py [events]
+"""
+import hashlib
+import hmac
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+os.environ.setdefault('PASSWORD_HASH_EXECUTOR', 'inline')
+os.environ.setdefault('RAZORPAY_WEBHOOK_SECRET', 'whsec_bench')
+os.environ.setdefault('JOB_QUEUE_MODE', 'off')
+warnings.simplefilter('ignore')
+
+from app import app, db
+from gateway import SignatureVerifier
+from query_counter import count_queries
+
+SECRET = os.environ['RAZORPAY_WEBHOOK_SECRET']
+BATCH = 500
+
+
+def make_events(n):
+    """(event_id, body) for n captured payments, with 5% sent twice"""
+    events = []
+    for i in range(n):
+        body = json.dumps({
+            'entity': 'event', 'event': 'payment.captured', 'created_at': 1735689600 + i,
+            'payload': {'payment': {'entity': {
+                'id': f'pay_{i:014d}', 'entity': 'payment', 'amount': 100000, 'currency': 'INR',
+                'order_id': f'order_{i:014d}', 'status': 'captured', 'method': 'upi',
+                'notes': {'bondId': 'bond-bench', 'investorId': 'investor-bench'},
+            }}},
+        })
+        events.append((f'evt_{i:014d}', body))
+    rng = random.Random(3)
+    return events + rng.sample(events, n // 20)
+
+
+def time_signatures(events, repeat=5):
+    verifier = SignatureVerifier(SECRET)
+    secret = SECRET.encode()
+    bodies = [body.encode() for _, body in events]
+    signatures = [verifier.sign(body) for body in bodies]
+    pairs = list(zip(bodies, signatures))
+    results = {}
+    for label, check in (
+        ('hmac.new per message', lambda: [
+            hmac.compare_digest(hmac.new(secret, body, hashlib.sha256).hexdigest(), sig)
+            for body, sig in pairs]),
+        ('verify_many', lambda: verifier.verify_many(pairs)),
+    ):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            assert all(check())
+            timings.append(time.perf_counter() - started)
+        results[label] = statistics.median(timings)
+    return results
+
+
+def reset():
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    app.extensions['webhook_seen'].clear()
+
+
+def deliver_single(client, events):
+    verifier = SignatureVerifier(SECRET)
+    for event_id, body in events:
+        response = client.post('/webhooks/razorpay', data=body, content_type='application/json', headers={
+            'X-Razorpay-Signature': verifier.sign(body), 'X-Razorpay-Event-Id': event_id,
+        })
+        assert response.status_code == 200, response.get_json()
+
+
+def deliver_batches(client, events):
+    verifier = SignatureVerifier(SECRET)
+    items = [{'eventId': event_id, 'body': body, 'signature': verifier.sign(body)}
+             for event_id, body in events]
+    for start in range(0, len(items), BATCH):
+        response = client.post('/webhooks/razorpay', json={'events': items[start:start + BATCH]})
+        assert response.status_code == 200, response.get_json()
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    events = make_events(n)
+
+    print(f'{len(events):,} signatures')
+    for label, seconds in time_signatures(events).items():
+        print(f'  {label:<24}{seconds * 1000:>10.1f} ms{len(events) / seconds:>14,.0f} /s')
+
+    client = app.test_client()
+    print(f'{len(events):,} webhook events ({n:,} unique)')
+    print(f"  {'delivery':<24}{'seconds':>10}{'events/s':>14}{'statements/event':>18}")
+    for label, deliver in (('one per request', deliver_single), (f'batches of {BATCH}', deliver_batches)):
+        reset()
+        with app.app_context(), count_queries(db.engine) as statements:
+            started = time.perf_counter()
+            deliver(client, events)
+            elapsed = time.perf_counter() - started
+        print(f'  {label:<24}{elapsed:>10.2f}{len(events) / elapsed:>14,.0f}'
+              f'{len(statements) / len(events):>18.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+from flask import Blueprint, request, jsonify, current_app
+from sqlalchemy import tuple_
+from datetime import date, datetime
+import base64
+import json
+
+from models import create_models
+from replicas import read_only
+
+bonds_bp = Blueprint('bonds', __name__)
+
+# Bound once when the blueprint is registered (see auth.py)
+db = None
+GreenBond = None
+
+@bonds_bp.record_once
+def bind_models(state):
+    """Resolve the db instance and models for the app the blueprint is registered on"""
+    global db, GreenBond
+    db = state.app.extensions['sqlalchemy']
+    _, GreenBond, _, _ = create_models(db)
+
+# ?sort= keys and the GreenBond columns they order by. Every key has a
+# composite (status, column, id) index on green_bonds, so a page is a range
+# scan of that index no matter how deep the cursor is.
+SORT_KEYS = {
+    'createdAt': 'created_at',
+    'bondName': 'bond_name',
+    'couponRate': 'coupon_rate',
+    'maturityDate': 'maturity_date',
+    'minimumInvestment': 'minimum_investment',
+    'totalAmount': 'total_amount',
+}
+DEFAULT_SORT = '-createdAt'
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+MAX_ANALYTICS_BONDS = 10000
+
+class InvalidQuery(ValueError):
+    """Raised for query parameters the listing can't serve"""
+
+def encode_cursor(value, bond_id):
+    """Opaque cursor holding the sort value and id of the last bond on a page"""
+    if isinstance(value, (date, datetime)):
+        value = value.isoformat()
+    raw = json.dumps([value, bond_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, column):
+    """Inverse of encode_cursor, restoring dates for date/datetime columns"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, bond_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        python_type = column.type.python_type
+        if python_type is datetime:
+            value = datetime.fromisoformat(value)
+        elif python_type is date:
+            value = date.fromisoformat(value)
+        return value, bond_id
+    except (ValueError, TypeError, json.JSONDecodeError):
+        raise InvalidQuery('Invalid cursor')
+
+def parse_float(name):
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise InvalidQuery(f'{name} must be a number')
+
+def parse_limit():
+    try:
+        limit = int(request.args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise InvalidQuery('limit must be an integer')
+    if limit < 1:
+        raise InvalidQuery('limit must be positive')
+    return min(limit, MAX_LIMIT)
+
+def apply_filters(query, sort_column):
+    """Apply the listing filters from the query string"""
+    # Only active bonds are listed unless the caller asks for other statuses
+    statuses = request.args.getlist('status') or ['active']
+    if statuses != ['all']:
+        query = query.filter(GreenBond.status.in_(statuses))
+
+    for param, column in (('bondType', GreenBond.bond_type),
+                          ('riskRating', GreenBond.risk_rating),
+                          ('currency', GreenBond.currency)):
+        values = request.args.getlist(param)
+        if values:
+            query = query.filter(column.in_(values))
+
+    for prefix, column in (('coupon', GreenBond.coupon_rate),
+                           ('minimumInvestment', GreenBond.minimum_investment)):
+        # Range filters on a column we're not sorting by are written as
+        # column + 0 so the planner keeps walking the sort index instead of
+        # range-scanning this column's index and sorting every match
+        if column is not sort_column:
+            column = column + 0
+        low = parse_float(f'{prefix}Min')
+        if low is not None:
+            query = query.filter(column >= low)
+        high = parse_float(f'{prefix}Max')
+        if high is not None:
+            query = query.filter(column <= high)
+
+    return query
+
+@bonds_bp.route('', methods=['GET'])
+@read_only
+def list_bonds():
+    """List marketplace bonds with filters, sorting and cursor pagination
+
+    Query parameters:
+    - status, bondType, riskRating, currency: repeatable exact-match filters
+      (status defaults to active; status=all lists every status)
+    - couponMin/couponMax, minimumInvestmentMin/minimumInvestmentMax: ranges
+    - sort: one of SORT_KEYS, prefixed with '-' for descending
+    - limit: page size (max 100)
+    - cursor: nextCursor from the previous page
+    """
+    try:
+        sort = request.args.get('sort', DEFAULT_SORT)
+        descending = sort.startswith('-')
+        sort_key = sort.lstrip('-')
+        if sort_key not in SORT_KEYS:
+            raise InvalidQuery(f'sort must be one of {", ".join(SORT_KEYS)}')
+        column = getattr(GreenBond, SORT_KEYS[sort_key])
+        limit = parse_limit()
+
+        query = apply_filters(GreenBond.query.options(*GreenBond.list_loader_options()), column)
+
+        cursor = request.args.get('cursor')
+        if cursor:
+            value, last_id = decode_cursor(cursor, column)
+            position = tuple_(column, GreenBond.id)
+            query = query.filter(position < (value, last_id) if descending else position > (value, last_id))
+
+        if descending:
+            query = query.order_by(column.desc(), GreenBond.id.desc())
+        else:
+            query = query.order_by(column.asc(), GreenBond.id.asc())
+
+        # One extra row tells us whether there is a next page
+        bonds = query.limit(limit + 1).all()
+        next_cursor = None
+        if len(bonds) > limit:
+            bonds = bonds[:limit]
+            last = bonds[-1]
+            next_cursor = encode_cursor(getattr(last, SORT_KEYS[sort_key]), last.id)
+
+        categories = GreenBond.project_categories([bond.id for bond in bonds])
+        return jsonify({
+            'bonds': [bond.to_dict(categories[bond.id]) for bond in bonds],
+            'nextCursor': next_cursor,
+            'limit': limit
+        }), 200
+
+    except InvalidQuery as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f'Bond listing error: {str(e)}')
+        return jsonify({'error': 'Failed to list bonds'}), 500
+
+def parse_date(value, name):
+    if value is None:
+        return date.today()
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise InvalidQuery(f'{name} must be an ISO date')
+
+def analytics_rows(bonds, prices, settlement, include_cash_flows=False):
+    """Run bond_analytics over bonds in one batch and serialize per bond"""
+    # Imported on first use: NumPy is the slowest import in the app
+    from analytics import bond_analytics, cash_flow_schedule, json_floats
+
+    terms = (
+        [bond.face_value for bond in bonds],
+        [bond.coupon_rate for bond in bonds],
+        [bond.issue_date for bond in bonds],
+        [bond.maturity_date for bond in bonds],
+        settlement
+    )
+    result = bond_analytics(prices, *terms)
+    if include_cash_flows:
+        times, flows = cash_flow_schedule(*terms)
+    columns = {name: json_floats(result[name]) for name in
+               ('yieldToMaturity', 'macaulayDuration', 'modifiedDuration', 'convexity')}
+    rows = []
+    for i, bond in enumerate(bonds):
+        row = {'bondId': bond.id, 'price': float(prices[i])}
+        row.update((name, values[i]) for name, values in columns.items())
+        if include_cash_flows:
+            row['cashFlows'] = [
+                {'years': round(float(t), 6), 'amount': round(float(amount), 6)}
+                for t, amount in zip(times[i], flows[i]) if amount
+            ]
+        rows.append(row)
+    return rows
+
+@bonds_bp.route('/analytics', methods=['POST'])
+@read_only
+def batch_analytics():
+    """Yield, duration and convexity for many bonds in one call
+
+    Body: {"bonds": [{"bondId": "...", "price": 1012.5}, ...],
+           "settlementDate": "YYYY-MM-DD", "includeCashFlows": false}
+    price is the full price per bond and defaults to face value.
+    """
+    try:
+        data = request.get_json() or {}
+        requested = data.get('bonds') or []
+        if not isinstance(requested, list) or not requested:
+            raise InvalidQuery('bonds must be a non-empty list')
+        if len(requested) > MAX_ANALYTICS_BONDS:
+            raise InvalidQuery(f'at most {MAX_ANALYTICS_BONDS} bonds per request')
+        settlement = parse_date(data.get('settlementDate'), 'settlementDate')
+
+        ids = [item.get('bondId') for item in requested if isinstance(item, dict)]
+        if len(ids) != len(requested):
+            raise InvalidQuery('every entry needs a bondId')
+        found = {bond.id: bond for bond in GreenBond.query.filter(GreenBond.id.in_(set(ids))).all()}
+        missing = [bond_id for bond_id in ids if bond_id not in found]
+        if missing:
+            return jsonify({'error': 'Bond not found', 'bondIds': missing[:20]}), 404
+
+        bonds = [found[bond_id] for bond_id in ids]
+        prices = []
+        for item, bond in zip(requested, bonds):
+            try:
+                prices.append(float(item.get('price', bond.face_value)))
+            except (TypeError, ValueError):
+                raise InvalidQuery('price must be a number')
+
+        rows = analytics_rows(bonds, prices, settlement, bool(data.get('includeCashFlows')))
+        return jsonify({'settlementDate': settlement.isoformat(), 'analytics': rows}), 200
+
+    except InvalidQuery as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f'Bond analytics error: {str(e)}')
+        return jsonify({'error': 'Failed to compute bond analytics'}), 500
+
+@bonds_bp.route('/<bond_id>/analytics', methods=['GET'])
+@read_only
+def get_bond_analytics(bond_id):
+    """Cash-flow schedule, yield, duration and convexity for one bond
+
+    Query parameters: price (full price per bond, default face value),
+    settlementDate (default today).
+    """
+    try:
+        bond = GreenBond.query.get(bond_id)
+        if not bond:
+            return jsonify({'error': 'Bond not found'}), 404
+        settlement = parse_date(request.args.get('settlementDate'), 'settlementDate')
+        price = parse_float('price')
+        rows = analytics_rows([bond], [bond.face_value if price is None else price], settlement, True)
+        return jsonify({'settlementDate': settlement.isoformat(), 'analytics': rows[0]}), 200
+
+    except InvalidQuery as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        current_app.logger.error(f'Bond analytics error: {str(e)}')
+        return jsonify({'error': 'Failed to compute bond analytics'}), 500
+
+@bonds_bp.route('/<bond_id>', methods=['GET'])
+@read_only
+def get_bond(bond_id):
+    """Get a single bond"""
+    try:
+        bond = GreenBond.query.options(*GreenBond.list_loader_options()).filter_by(id=bond_id).first()
+        if not bond:
+            return jsonify({'error': 'Bond not found'}), 404
+        return jsonify({'bond': bond.to_dict(GreenBond.project_categories([bond.id])[bond.id])}), 200
+
+    except Exception as e:
+        current_app.logger.error(f'Bond lookup error: {str(e)}')
+        return jsonify({'error': 'Failed to get bond'}), 500
@@ -0,0 +1,31 @@
+"""
+Pytest setup: point the app at a throwaway SQLite file and hash passwords on
+threads so the suite runs without touching instance/greenbonds.db.
+"""
+import os
+import tempfile
+
+import pytest
+
+os.environ.setdefault(
+    'DATABASE_URL',
+    'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='greenbonds-test-'), 'test.db')
+)
+os.environ.setdefault('PASSWORD_HASH_EXECUTOR', 'thread')
+os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+
+
+@pytest.fixture
+def app():
+    """The application with freshly created tables"""
+    from app import app, db
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
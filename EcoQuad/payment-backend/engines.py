@@ -0,0 +1,155 @@
+"""
+Engine profiles for SQLite and PostgreSQL.
+
+``DB_ENGINE_PROFILE=tuned`` (the default) configures the engine for
+concurrent web traffic; ``plain`` leaves SQLAlchemy's defaults, for
+comparison (see bench_db_profiles.py).
+
+SQLite, tuned: every connection is switched to WAL so readers no longer
+block the writer (and the writer no longer blocks readers), with
+``synchronous=NORMAL`` (durable at each checkpoint rather than each commit,
+which is safe in WAL), a busy timeout so a writer waits for the lock instead
+of failing with "database is locked", and memory-mapped reads. SQLite only
+ever has one writer; with ``SQLITE_SINGLE_WRITER`` the threads of a process
+also queue for it on a lock (WriterQueue) rather than in SQLite's busy
+handler, which polls with sleeps of up to 100ms. Processes still contend
+through the busy timeout.
+
+PostgreSQL, tuned: a bounded pool with overflow, a liveness check on
+checkout (pre-ping) so connections dropped by the server or a proxy are
+replaced rather than failing a request, and recycling of old connections.
+
+Configuration:
+
+- ``DB_ENGINE_PROFILE``: ``tuned`` (default) or ``plain``
+- ``SQLITE_JOURNAL_MODE``: default ``WAL``
+- ``SQLITE_SYNCHRONOUS``: default ``NORMAL``
+- ``SQLITE_BUSY_TIMEOUT``: milliseconds a writer waits for the lock (5000)
+- ``SQLITE_MMAP_SIZE``: bytes of the file to memory-map (256 MiB)
+- ``SQLITE_SINGLE_WRITER``: queue a process's writers on a lock (true)
+- ``DB_POOL_SIZE`` / ``DB_MAX_OVERFLOW``: connections kept open and extra
+  ones allowed under load (10 / 20)
+- ``DB_POOL_TIMEOUT``: seconds to wait for a connection from a full pool
+- ``DB_POOL_RECYCLE``: seconds after which a connection is replaced (1800)
+- ``DB_POOL_PRE_PING``: test connections on checkout (true)
+"""
+import threading
+import time
+
+from sqlalchemy import event
+
+# Statements that leave the database as it was; anything else takes the writer lock
+READ_PREFIXES = ('SELECT', 'PRAGMA')
+
+
+def dialect_name(uri):
+    return uri.split(':', 1)[0].split('+', 1)[0]
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database and profile"""
+    if config.get('DB_ENGINE_PROFILE', 'tuned') != 'tuned':
+        return {}
+    dialect = dialect_name(config['SQLALCHEMY_DATABASE_URI'])
+    if dialect == 'sqlite':
+        # pysqlite's own lock timeout, in seconds; the PRAGMA below sets the same
+        return {'connect_args': {'timeout': int(config.get('SQLITE_BUSY_TIMEOUT', 5000)) / 1000}}
+    if dialect == 'postgresql':
+        return {
+            'pool_size': int(config.get('DB_POOL_SIZE', 10)),
+            'max_overflow': int(config.get('DB_MAX_OVERFLOW', 20)),
+            'pool_timeout': float(config.get('DB_POOL_TIMEOUT', 30)),
+            'pool_recycle': int(config.get('DB_POOL_RECYCLE', 1800)),
+            'pool_pre_ping': str(config.get('DB_POOL_PRE_PING', 'true')).lower() == 'true',
+        }
+    return {}
+
+
+class WriterQueue:
+    """Process-wide lock that a connection holds from its first write to commit or rollback
+
+    A connection that can't get the lock within ``timeout`` seconds goes
+    ahead anyway and leaves it to SQLite's busy timeout, so a writer stuck
+    in an open transaction delays the others rather than wedging them.
+    """
+
+    def __init__(self, timeout=5.0):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.acquired = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+
+    def acquire(self, info):
+        if info.get('writer_queue'):
+            return
+        started = time.perf_counter()
+        acquired = self._lock.acquire(timeout=self.timeout)
+        waited = time.perf_counter() - started
+        with self._stats_lock:
+            self.wait_seconds += waited
+            if acquired:
+                self.acquired += 1
+            else:
+                self.timeouts += 1
+        info['writer_queue'] = acquired
+
+    def release(self, info):
+        if info.pop('writer_queue', False):
+            self._lock.release()
+
+    def metrics(self):
+        with self._stats_lock:
+            return {
+                'acquired': self.acquired,
+                'timeouts': self.timeouts,
+                'meanWaitMs': round(self.wait_seconds * 1000 / self.acquired, 3) if self.acquired else 0.0,
+            }
+
+
+def configure_engine(engine, config):
+    """Attach the profile's per-connection settings to an engine
+
+    Returns the engine's WriterQueue, or None when writers aren't queued.
+    """
+    if config.get('DB_ENGINE_PROFILE', 'tuned') != 'tuned' or engine.dialect.name != 'sqlite':
+        return None
+    journal_mode = config.get('SQLITE_JOURNAL_MODE', 'WAL')
+    synchronous = config.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    busy_timeout = int(config.get('SQLITE_BUSY_TIMEOUT', 5000))
+    mmap_size = int(config.get('SQLITE_MMAP_SIZE', 256 * 2 ** 20))
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f'PRAGMA journal_mode={journal_mode}')
+            cursor.execute(f'PRAGMA synchronous={synchronous}')
+            cursor.execute(f'PRAGMA busy_timeout={busy_timeout}')
+            cursor.execute(f'PRAGMA mmap_size={mmap_size}')
+        finally:
+            cursor.close()
+
+    if str(config.get('SQLITE_SINGLE_WRITER', 'true')).lower() != 'true':
+        return None
+    writers = WriterQueue(timeout=busy_timeout / 1000)
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def queue_writer(conn, cursor, statement, parameters, context, executemany):
+        if not statement.lstrip()[:6].upper().startswith(READ_PREFIXES):
+            writers.acquire(conn.info)
+
+    @event.listens_for(engine, 'commit')
+    @event.listens_for(engine, 'rollback')
+    def release_writer(conn):
+        # Fired just before the COMMIT/ROLLBACK; the next writer's busy
+        # timeout covers the moment until it lands
+        writers.release(conn.info)
+
+    @event.listens_for(engine, 'checkin')
+    def release_on_checkin(dbapi_connection, connection_record):
+        # Connections returned without an explicit commit or rollback
+        writers.release(connection_record.info)
+
+    return writers
@@ -0,0 +1,27 @@
+"""
+Extension instances shared by the app and its blueprints.
+
+They are created unbound and attached to an app by create_app() (app.py)
+through their init_app methods, so importing this module costs nothing
+beyond the Flask extensions themselves: the Razorpay client, its HTTP
+session and the worker pools are only built on first use in each process.
+"""
+from flask_bcrypt import Bcrypt
+from flask_jwt_extended import JWTManager
+from flask_sqlalchemy import SQLAlchemy
+
+from gateway import PaymentGateway
+from hashing import PasswordHasher
+from idempotency import OrderIdempotency
+from jobs import JobQueue
+from replicas import ReadReplicas, RoutingSession
+
+# Sessions read from a replica in @read_only views (replicas.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+bcrypt = Bcrypt()
+jwt = JWTManager()
+password_hasher = PasswordHasher()
+payment_gateway = PaymentGateway()
+order_idempotency = OrderIdempotency()
+job_queue = JobQueue()
+read_replicas = ReadReplicas()
@@ -0,0 +1,155 @@
+"""
+Turning verified Razorpay payments into Investment rows.
+
+/verify-payment only checks the signature and calls record_verified_payment,
+which stores the payment and queues a ``fulfill_payment`` job in one
+transaction, then answers. The job (see jobs.py) does the slow part:
+
+- takes the amount, the bond and (if the payer wasn't signed in) the
+  investor from the order, from ``payment_orders`` when this server created
+  it and from the Razorpay API otherwise. The bond is the ``bondId`` note
+  /create-order put on the order: the signature covers only the order and
+  payment ids, so a bond named by the client is never trusted,
+- creates the Investment and adds the amount to ``GreenBond.amount_raised``
+  with GreenBond.add_raised: a single UPDATE that only applies while the
+  total stays within ``total_amount``. Concurrent fulfillments can't lose an
+  increment or oversubscribe the bond, and the bond row is locked only for
+  the end of the transaction,
+- moves the payment from ``verified`` to ``fulfilled`` with a conditional
+  UPDATE in that same transaction. A retried or duplicated job finds the
+  payment already fulfilled and does nothing.
+
+Payments that don't name a bond and an investor are marked ``unmatched``, and
+payments the bond no longer has room for ``oversubscribed`` (to be
+refunded), for manual reconciliation.
+"""
+import json
+import logging
+from datetime import date, datetime
+
+from flask import current_app
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from gateway import get_gateway
+from models import get_models
+from money import to_rupees
+
+logger = logging.getLogger('payment-backend')
+
+FULFILL_PAYMENT = 'fulfill_payment'
+
+# Payments in these statuses are never fulfilled again
+FINAL_STATUSES = ('fulfilled', 'unmatched', 'oversubscribed')
+
+
+def record_verified_payment(db, job_queue, razorpay_order_id, razorpay_payment_id, investor_id=None):
+    """Store a verified payment and queue its fulfillment; returns (payment, job_id)
+
+    A payment already recorded is returned as is, with job_id None. The job
+    takes the bond from the order's notes.
+    """
+    Payment = get_models(db)['Payment']
+    payment = Payment(razorpay_payment_id=razorpay_payment_id, razorpay_order_id=razorpay_order_id,
+                      investor_id=investor_id, status='verified')
+    db.session.add(payment)
+    try:
+        db.session.flush()
+        job = job_queue.enqueue(FULFILL_PAYMENT, {'paymentId': payment.id})
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return Payment.query.filter_by(razorpay_payment_id=razorpay_payment_id).one(), None
+    return payment, job.id
+
+
+def stored_order(db, razorpay_order_id):
+    """The gateway's response for an order this server created, or None"""
+    PaymentOrder = get_models(db)['PaymentOrder']
+    row = PaymentOrder.query.filter_by(razorpay_order_id=razorpay_order_id).first()
+    return json.loads(row.order_data) if row is not None and row.order_data else None
+
+
+def order_notes(order):
+    # Razorpay sends notes as [] when there are none
+    notes = order.get('notes')
+    return notes if isinstance(notes, dict) else {}
+
+
+def fetch_order(db, razorpay_order_id):
+    """An order's amount (paise), currency and notes, asking Razorpay if it wasn't created here"""
+    order = stored_order(db, razorpay_order_id)
+    if order is None:
+        # Raises on gateway errors, which retries the job
+        order = get_gateway(current_app).client.order.fetch(razorpay_order_id)
+    return int(order['amount']), order.get('currency', 'INR'), order_notes(order)
+
+
+def fulfill_payment(payload):
+    """Job handler: create the Investment for a verified payment, at most once"""
+    db = current_app.extensions['sqlalchemy']
+    models = get_models(db)
+    Payment, GreenBond, Investment = models['Payment'], models['GreenBond'], models['Investment']
+
+    payment = db.session.get(Payment, payload['paymentId'])
+    if payment is None or payment.status in FINAL_STATUSES:
+        return
+    if payment.amount is None or payment.bond_id is None:
+        amount, currency, notes = fetch_order(db, payment.razorpay_order_id)
+        if payment.amount is None:
+            payment.amount, payment.currency = amount, currency
+        payment.bond_id = payment.bond_id or notes.get('bondId')
+        payment.investor_id = payment.investor_id or notes.get('investorId')
+        db.session.commit()
+
+    bond = db.session.get(GreenBond, payment.bond_id) if payment.bond_id else None
+    if bond is None or payment.investor_id is None:
+        payment.status = 'unmatched'
+        db.session.commit()
+        logger.warning('Payment %s has no bond or investor to fulfill', payment.razorpay_payment_id)
+        return
+
+    now = datetime.utcnow()
+    claimed = db.session.execute(
+        update(Payment)
+        .where(Payment.id == payment.id, Payment.status == 'verified')
+        .values(status='fulfilled', updated_at=now)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not claimed:
+        db.session.rollback()
+        return
+
+    amount = to_rupees(payment.amount)
+    investment = Investment(
+        investor_id=payment.investor_id,
+        bond_id=bond.id,
+        investment_amount=amount,
+        purchase_price=bond.face_value,
+        purchase_date=date.today(),
+        status='confirmed',
+        transaction_id=payment.razorpay_payment_id,
+        fees=0,
+    )
+    db.session.add(investment)
+    db.session.flush()
+    db.session.execute(
+        update(Payment)
+        .where(Payment.id == payment.id)
+        .values(investment_id=investment.id)
+        .execution_options(synchronize_session=False)
+    )
+    # Last, so the hot bond row stays locked only until the commit below
+    if not GreenBond.add_raised(bond.id, amount):
+        db.session.rollback()
+        db.session.execute(
+            update(Payment)
+            .where(Payment.id == payment.id, Payment.status == 'verified')
+            .values(status='oversubscribed', updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        logger.warning('Payment %s oversubscribes bond %s', payload['paymentId'], payment.bond_id)
+        return
+    db.session.commit()
+    logger.info('Payment %s fulfilled as investment %s', payment.razorpay_payment_id, investment.id)
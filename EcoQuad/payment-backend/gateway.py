@@ -0,0 +1,292 @@
+"""
+Razorpay calls over a pooled, time-bounded HTTP session.
+
+The stock ``razorpay.Client`` opens its own ``requests.Session`` with no
+timeout, so a slow gateway holds a WSGI worker for as long as it likes.
+PaymentGateway hands the client a session that:
+
+- keeps connections alive in a pool sized for concurrent checkouts,
+- applies explicit connect/read timeouts to every call,
+- retries connection failures (the request never reached Razorpay) for
+  every method, and 502/503/504 responses only for idempotent methods, with
+  exponential backoff plus jitter. Order creation is a POST, so a read
+  timeout or 5xx on it is never replayed and can't create a second order.
+
+Order creation can also be offloaded: ``submit_order`` queues the call on a
+bounded thread pool and returns a job id straight away, so the request
+thread is free while the gateway responds. At most ``workers + queue_depth``
+orders are admitted at once; beyond that GatewayBusy is raised so the caller
+can answer 503.
+
+Signatures (checkout callbacks and webhooks) are checked with
+SignatureVerifier, which hashes the secret into the HMAC state once and
+copies that state per message instead of re-keying for every signature.
+
+razorpay and requests are imported when a process first calls the gateway,
+not when the app is imported, so processes that never do start faster.
+"""
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import TTLCache
+
+logger = logging.getLogger('payment-backend')
+
+# razorpay.constants.url.URL.BASE_URL, without importing razorpay
+RAZORPAY_BASE_URL = 'https://api.razorpay.com'
+
+
+class GatewayBusy(Exception):
+    """Raised when the order offload pool is saturated"""
+
+
+class SignatureVerifier:
+    """HMAC-SHA256 signatures under one secret, keyed once and copied per message"""
+
+    def __init__(self, secret):
+        self.configured = bool(secret)
+        self._keyed = hmac.new((secret or '').encode('utf-8'), digestmod=hashlib.sha256)
+
+    def sign(self, message):
+        if isinstance(message, str):
+            message = message.encode('utf-8')
+        mac = self._keyed.copy()
+        mac.update(message)
+        return mac.hexdigest()
+
+    def verify(self, message, signature):
+        if not self.configured or not isinstance(signature, str):
+            return False
+        return hmac.compare_digest(self.sign(message), signature)
+
+    def verify_many(self, items):
+        """[verify(message, signature) for each (message, signature) pair]"""
+        if not self.configured:
+            return [False for _ in items]
+        keyed, compare = self._keyed, hmac.compare_digest
+        results = []
+        for message, signature in items:
+            if not isinstance(signature, str):
+                results.append(False)
+                continue
+            mac = keyed.copy()
+            mac.update(message.encode('utf-8') if isinstance(message, str) else message)
+            results.append(compare(mac.hexdigest(), signature))
+        return results
+
+
+class GatewayStats:
+    """Call counters and a rolling sample of gateway latencies"""
+
+    def __init__(self, size=2048):
+        self._lock = threading.Lock()
+        self._latency = deque(maxlen=size)
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.rejected = 0
+
+    def record(self, latency, failed=False, timed_out=False):
+        with self._lock:
+            self.calls += 1
+            self.failures += failed
+            self.timeouts += timed_out
+            self._latency.append(latency)
+
+    def reject(self):
+        with self._lock:
+            self.rejected += 1
+
+    def snapshot(self):
+        with self._lock:
+            ordered = sorted(self._latency)
+            counters = {
+                'calls': self.calls,
+                'failures': self.failures,
+                'timeouts': self.timeouts,
+                'rejected': self.rejected,
+            }
+        if ordered:
+            last = len(ordered) - 1
+            counters['latencyMs'] = {
+                name: round(ordered[min(last, int(q * len(ordered)))] * 1000, 3)
+                for name, q in (('p50', 0.50), ('p90', 0.90), ('p99', 0.99))
+            }
+        else:
+            counters['latencyMs'] = {'p50': None, 'p90': None, 'p99': None}
+        return counters
+
+
+class PaymentGateway:
+    """Razorpay client with a pooled session and an order offload pool
+
+    Configuration (read in ``init_app``):
+
+    - ``RAZORPAY_KEY_ID`` / ``RAZORPAY_KEY_SECRET``: API credentials
+    - ``RAZORPAY_WEBHOOK_SECRET``: secret webhook deliveries are signed with
+    - ``RAZORPAY_BASE_URL``: API root, e.g. a local stub gateway in tests
+    - ``RAZORPAY_CONNECT_TIMEOUT`` / ``RAZORPAY_READ_TIMEOUT``: seconds
+    - ``RAZORPAY_MAX_RETRIES`` / ``RAZORPAY_RETRY_BACKOFF``: retry budget
+    - ``RAZORPAY_POOL_SIZE``: keep-alive connections kept per process
+    - ``RAZORPAY_ORDER_WORKERS`` / ``RAZORPAY_ORDER_QUEUE_DEPTH``: offload pool
+    - ``RAZORPAY_ORDER_RESULT_TTL``: seconds an offloaded result is kept
+    """
+
+    def __init__(self, app=None):
+        self.key_id = None
+        self.key_secret = None
+        self.payment_signatures = SignatureVerifier(None)
+        self.webhook_signatures = SignatureVerifier(None)
+        self.base_url = RAZORPAY_BASE_URL
+        self.session_options = {}
+        self.workers = 32
+        self.queue_depth = 256
+        self.stats = GatewayStats()
+        self.jobs = TTLCache(maxsize=10000, ttl=600)
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_depth)
+        self._client = None
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.key_id = app.config.get('RAZORPAY_KEY_ID')
+        self.key_secret = app.config.get('RAZORPAY_KEY_SECRET')
+        self.payment_signatures = SignatureVerifier(self.key_secret)
+        self.webhook_signatures = SignatureVerifier(app.config.get('RAZORPAY_WEBHOOK_SECRET'))
+        self.base_url = app.config.get('RAZORPAY_BASE_URL') or self.base_url
+        self.session_options = {
+            'pool_size': int(app.config.get('RAZORPAY_POOL_SIZE', 20)),
+            'connect_timeout': float(app.config.get('RAZORPAY_CONNECT_TIMEOUT', 3.05)),
+            'read_timeout': float(app.config.get('RAZORPAY_READ_TIMEOUT', 10)),
+            'max_retries': int(app.config.get('RAZORPAY_MAX_RETRIES', 2)),
+            'backoff': float(app.config.get('RAZORPAY_RETRY_BACKOFF', 0.2)),
+        }
+        self.workers = int(app.config.get('RAZORPAY_ORDER_WORKERS', 32))
+        self.queue_depth = int(app.config.get('RAZORPAY_ORDER_QUEUE_DEPTH', 256))
+        self.jobs = TTLCache(maxsize=self.workers + self.queue_depth + 10000,
+                             ttl=float(app.config.get('RAZORPAY_ORDER_RESULT_TTL', 600)))
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_depth)
+        self.shutdown(wait=False)
+        app.extensions['payment_gateway'] = self
+
+    def _ensure_process(self):
+        # Sessions and pools inherited across fork() share sockets and have
+        # no live threads, so each process builds its own on first use
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    import razorpay
+                    from http_session import build_session
+
+                    session = build_session(**self.session_options)
+                    self._client = razorpay.Client(session=session, auth=(self.key_id, self.key_secret),
+                                                   base_url=self.base_url)
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                        thread_name_prefix='razorpay-order')
+                    self._pid = pid
+
+    @property
+    def client(self):
+        """The process's razorpay.Client, sharing the pooled session"""
+        self._ensure_process()
+        return self._client
+
+    def create_order(self, payload):
+        """Create a Razorpay order on the calling thread"""
+        client = self.client
+        import requests
+
+        started = time.monotonic()
+        try:
+            order = client.order.create(payload)
+        except requests.exceptions.Timeout:
+            self.stats.record(time.monotonic() - started, failed=True, timed_out=True)
+            raise
+        except Exception:
+            self.stats.record(time.monotonic() - started, failed=True)
+            raise
+        self.stats.record(time.monotonic() - started)
+        return order
+
+    def verify_payment_signature(self, order_id, payment_id, signature):
+        """Check a checkout callback's signature; raises SignatureVerificationError"""
+        if not self.payment_signatures.verify(f'{order_id}|{payment_id}', signature):
+            from razorpay.errors import SignatureVerificationError
+            raise SignatureVerificationError('Razorpay Signature Verification Failed')
+
+    def submit_order(self, payload, on_done=None):
+        """Queue order creation on the offload pool and return its job id
+
+        on_done(order, error) runs on the pool thread once the call finishes,
+        before pollers can see the result.
+        """
+        if not self._slots.acquire(blocking=False):
+            self.stats.reject()
+            raise GatewayBusy('order queue is full')
+        job_id = secrets.token_urlsafe(16)
+        self.jobs.set(job_id, {'status': 'pending'})
+        try:
+            self._ensure_process()
+            future = self._executor.submit(self._run_order, job_id, payload, on_done)
+        except Exception:
+            self._slots.release()
+            self.jobs.invalidate(job_id)
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return job_id
+
+    def _run_order(self, job_id, payload, on_done=None):
+        order, error = None, None
+        try:
+            order = self.create_order(payload)
+        except Exception as e:
+            logger.error('Offloaded order %s failed: %s', job_id, str(e))
+            error = e
+        if on_done is not None:
+            try:
+                on_done(order, error)
+            except Exception as e:
+                logger.error('Offloaded order %s callback failed: %s', job_id, str(e))
+        if error is None:
+            self.jobs.set(job_id, {'status': 'created', 'order': order})
+        else:
+            self.jobs.set(job_id, {'status': 'failed', 'error': error})
+
+    def job(self, job_id):
+        """Offloaded order state: pending, created (with order) or failed (with error)"""
+        return self.jobs.get(job_id)
+
+    def metrics(self):
+        snapshot = self.stats.snapshot()
+        snapshot.update({
+            'baseUrl': self.base_url,
+            'poolSize': self.session_options.get('pool_size'),
+            'orderWorkers': self.workers,
+            'orderQueueDepth': self.queue_depth,
+        })
+        return snapshot
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=wait)
+                self._client.session.close()
+            self._client = None
+            self._executor = None
+            self._pid = None
+
+
+def get_gateway(app):
+    """Return the app's PaymentGateway"""
+    return app.extensions['payment_gateway']
@@ -0,0 +1,58 @@
+"""
+Gunicorn settings for the payment backend.
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+Every setting can be overridden from the environment:
+
+- ``HOST`` / ``PORT``: address to bind (default 0.0.0.0:5000)
+- ``WEB_CONCURRENCY``: worker processes (default 2 per core + 1)
+- ``GUNICORN_THREADS``: request threads per worker (default 4; 1 uses the
+  sync worker). Threads help while requests wait on Razorpay or bcrypt,
+  processes are what scale CPU-bound work across cores
+- ``GUNICORN_PRELOAD``: import the app once in the master (default true)
+- ``GUNICORN_TIMEOUT``: seconds a silent worker gets before it is restarted
+- ``GUNICORN_GRACEFUL_TIMEOUT``: seconds in-flight requests get to finish on
+  SIGTERM or a reload before the worker is killed
+- ``GUNICORN_KEEPALIVE``: seconds an idle keep-alive connection stays open
+- ``GUNICORN_MAX_REQUESTS`` / ``GUNICORN_MAX_REQUESTS_JITTER``: recycle
+  workers after this many requests (0, the default, never does)
+- ``GUNICORN_ACCESS_LOG``: path or ``-`` for stdout (off by default)
+"""
+import os
+
+# Worker processes already spread bcrypt over the cores, so hash on threads
+# (bcrypt releases the GIL) rather than give every worker its own process pool
+os.environ.setdefault('PASSWORD_HASH_EXECUTOR', 'thread')
+os.environ.setdefault('PASSWORD_HASH_WORKERS', '2')
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', (os.cpu_count() or 1) * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+worker_class = 'gthread' if threads > 1 else 'sync'
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 0))
+accesslog = os.getenv('GUNICORN_ACCESS_LOG')
+errorlog = '-'
+
+
+def when_ready(server):
+    # Runs in the master before the first fork: with the app preloaded, import
+    # what it defers too so every worker inherits it
+    if server.cfg.preload_app:
+        from wsgi import import_deferred
+        import_deferred()
+
+
+def post_fork(server, worker):
+    from wsgi import init_worker
+    init_worker()
+
+
+def worker_exit(server, worker):
+    from wsgi import shutdown_worker
+    shutdown_worker()
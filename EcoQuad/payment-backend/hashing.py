@@ -0,0 +1,237 @@
+"""
+Password hashing off the request thread.
+
+bcrypt is deliberately CPU-bound, so a burst of logins running it inline pins
+every WSGI worker and cheap endpoints such as /health queue behind them.
+PasswordHasher runs hashes on a dedicated pool (processes by default, sized to
+the number of cores) and admits at most ``workers + queue_depth`` jobs at once;
+anything beyond that is rejected straight away with HashingUnavailable so the
+caller can answer 503 instead of letting latency grow without bound.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError
+
+from flask_bcrypt import Bcrypt
+
+logger = logging.getLogger('payment-backend')
+
+
+class HashingUnavailable(Exception):
+    """Raised when the hashing pool is saturated or a hash timed out"""
+
+
+def _generate(bcrypt, password, rounds):
+    return bcrypt.generate_password_hash(password, rounds).decode('utf-8')
+
+
+def _check(bcrypt, pw_hash, password):
+    return bcrypt.check_password_hash(pw_hash, password)
+
+
+def hash_rounds(pw_hash):
+    """Return the cost factor a bcrypt hash was created with, or None if unparseable"""
+    try:
+        return int(pw_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def _timed(fn, args):
+    """Run fn in the worker and report when it actually started and finished"""
+    started = time.monotonic()
+    result = fn(*args)
+    return result, started, time.monotonic()
+
+
+class HashingStats:
+    """Rolling queue-wait and hash-time samples for tuning the bcrypt cost"""
+
+    def __init__(self, size=2048):
+        self._lock = threading.Lock()
+        self._queue_wait = deque(maxlen=size)
+        self._hash_time = deque(maxlen=size)
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def record(self, queue_wait, hash_time):
+        with self._lock:
+            self._queue_wait.append(queue_wait)
+            self._hash_time.append(hash_time)
+            self.completed += 1
+
+    def reject(self, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timed_out += 1
+            else:
+                self.rejected += 1
+
+    @staticmethod
+    def _summary(samples):
+        if not samples:
+            return {'p50': None, 'p90': None, 'p99': None, 'max': None}
+        ordered = sorted(samples)
+        last = len(ordered) - 1
+
+        def pick(q):
+            return round(ordered[min(last, int(q * len(ordered)))] * 1000, 3)
+
+        return {
+            'p50': pick(0.50),
+            'p90': pick(0.90),
+            'p99': pick(0.99),
+            'max': round(ordered[last] * 1000, 3),
+        }
+
+    def snapshot(self):
+        with self._lock:
+            queue_wait = list(self._queue_wait)
+            hash_time = list(self._hash_time)
+            counters = {
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timedOut': self.timed_out,
+            }
+        counters['queueWaitMs'] = self._summary(queue_wait)
+        counters['hashTimeMs'] = self._summary(hash_time)
+        return counters
+
+
+class PasswordHasher:
+    """Bounded bcrypt executor with admission control
+
+    Hashing is delegated to the app's Flask-Bcrypt instance (its prefix and
+    long-password handling travel with it to the pool workers).
+
+    Configuration (read in ``init_app``):
+
+    - ``PASSWORD_HASH_EXECUTOR``: ``process`` (default), ``thread`` or ``inline``
+    - ``PASSWORD_HASH_WORKERS``: pool size, defaults to the number of cores
+    - ``PASSWORD_HASH_QUEUE_DEPTH``: jobs allowed to wait behind busy workers
+    - ``PASSWORD_HASH_TIMEOUT``: seconds a request waits for its hash
+    - ``BCRYPT_LOG_ROUNDS``: bcrypt cost factor for new hashes
+    """
+
+    def __init__(self, app=None, bcrypt=None):
+        self.mode = 'process'
+        self.workers = os.cpu_count() or 1
+        self.queue_depth = self.workers * 4
+        self.timeout = 10.0
+        self.rounds = 12
+        self.bcrypt = bcrypt or Bcrypt()
+        self.stats = HashingStats()
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_depth)
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, bcrypt)
+
+    def init_app(self, app, bcrypt=None):
+        self.mode = app.config.get('PASSWORD_HASH_EXECUTOR', 'process')
+        self.workers = int(app.config.get('PASSWORD_HASH_WORKERS') or os.cpu_count() or 1)
+        self.queue_depth = int(app.config.get('PASSWORD_HASH_QUEUE_DEPTH', self.workers * 4))
+        self.timeout = float(app.config.get('PASSWORD_HASH_TIMEOUT', 10))
+        self.rounds = int(app.config.get('BCRYPT_LOG_ROUNDS', 12))
+        if bcrypt is None:
+            bcrypt = Bcrypt(app)
+        self.bcrypt = bcrypt
+        if self.mode not in ('process', 'thread', 'inline'):
+            raise ValueError(f'Unknown PASSWORD_HASH_EXECUTOR: {self.mode}')
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_depth)
+        app.extensions['password_hasher'] = self
+
+    def _get_executor(self):
+        # A pool inherited across fork() has no live workers, so rebuild it
+        # in every process that uses it (e.g. pre-fork server workers).
+        pid = os.getpid()
+        if self._executor is None or self._executor_pid != pid:
+            with self._lock:
+                if self._executor is None or self._executor_pid != pid:
+                    if self.mode == 'process':
+                        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                    else:
+                        self._executor = ThreadPoolExecutor(
+                            max_workers=self.workers, thread_name_prefix='password-hash'
+                        )
+                    self._executor_pid = pid
+        return self._executor
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self.stats.reject()
+            raise HashingUnavailable('password hashing queue is full')
+
+        enqueued = time.monotonic()
+        if self.mode == 'inline':
+            try:
+                result, started, finished = _timed(fn, args)
+            finally:
+                self._slots.release()
+        else:
+            try:
+                future = self._get_executor().submit(_timed, fn, args)
+            except Exception:
+                self._slots.release()
+                raise
+            # The slot is held until the job really finishes, even if this
+            # request gives up waiting, so the pool can never be oversubscribed.
+            future.add_done_callback(lambda _: self._slots.release())
+            try:
+                result, started, finished = future.result(timeout=self.timeout)
+            except TimeoutError:
+                self.stats.reject(timed_out=True)
+                raise HashingUnavailable('password hashing timed out')
+
+        self.stats.record(max(0.0, started - enqueued), finished - started)
+        return result
+
+    def hash(self, password):
+        """Return a bcrypt hash of password"""
+        return self._submit(_generate, self.bcrypt, password, self.rounds)
+
+    def check(self, pw_hash, password):
+        """Return True if password matches pw_hash"""
+        return self._submit(_check, self.bcrypt, pw_hash, password)
+
+    def needs_rehash(self, pw_hash):
+        """True if pw_hash was made with a different cost than BCRYPT_LOG_ROUNDS"""
+        return hash_rounds(pw_hash) != self.rounds
+
+    def metrics(self):
+        """Current pool configuration plus queue-wait/hash-time percentiles"""
+        snapshot = self.stats.snapshot()
+        snapshot.update({
+            'executor': self.mode,
+            'workers': self.workers,
+            'queueDepth': self.queue_depth,
+            'rounds': self.rounds,
+        })
+        return snapshot
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None and self._executor_pid == os.getpid():
+                self._executor.shutdown(wait=wait)
+            self._executor = None
+            self._executor_pid = None
+
+
+_inline_hasher = None
+
+
+def get_hasher(app):
+    """Return the app's PasswordHasher, or an inline one if it never registered one"""
+    global _inline_hasher
+    hasher = app.extensions.get('password_hasher')
+    if hasher is None:
+        if _inline_hasher is None:
+            _inline_hasher = PasswordHasher()
+            _inline_hasher.mode = 'inline'
+        hasher = _inline_hasher
+    return hasher
@@ -0,0 +1,57 @@
+"""
+HTTP sessions for Razorpay calls.
+
+build_session returns a requests.Session for razorpay.Client that:
+
+- keeps connections alive in a pool sized for concurrent checkouts,
+- applies explicit connect/read timeouts to every call,
+- retries connection failures (the request never reached Razorpay) for
+  every method, and 502/503/504 responses only for idempotent methods, with
+  exponential backoff plus jitter.
+
+gateway.py imports this module when it first builds a client; keep it out
+of import-time code paths, since it pulls in requests.
+"""
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+RETRY_STATUSES = frozenset({502, 503, 504})
+
+
+class TimeoutSession(requests.Session):
+    """requests.Session that applies a default (connect, read) timeout"""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+def build_session(pool_size=20, connect_timeout=3.05, read_timeout=10.0, max_retries=2,
+                  backoff=0.2, backoff_jitter=0.1):
+    """Keep-alive session with timeouts and bounded, jittered retries"""
+    retry = Retry(
+        total=max_retries,
+        connect=max_retries,
+        read=max_retries,
+        status=max_retries,
+        other=0,
+        allowed_methods=IDEMPOTENT_METHODS,
+        status_forcelist=RETRY_STATUSES,
+        backoff_factor=backoff,
+        backoff_jitter=backoff_jitter,
+        respect_retry_after_header=True,
+        # Hand the last 5xx back to the caller instead of raising RetryError
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry,
+                          pool_block=False)
+    session = TimeoutSession((connect_timeout, read_timeout))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
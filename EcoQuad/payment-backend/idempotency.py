@@ -0,0 +1,253 @@
+"""
+Idempotent Razorpay order creation.
+
+A /create-order request carrying an ``Idempotency-Key`` header (or, failing
+that, a client-chosen ``receipt``) creates at most one gateway order per key.
+Repeats within IDEMPOTENCY_TTL get the stored order back without calling the
+gateway:
+
+- a per-process TTLCache answers repeats without touching the database,
+- the ``payment_orders`` row, claimed with a unique insert before the gateway
+  call, makes the key stick across processes and restarts,
+- concurrent duplicates in the same process wait for the first request's
+  gateway call (single flight) instead of queueing their own. A duplicate
+  arriving at another process while the call is in flight gets
+  IdempotencyInProgress, answered 409 with Retry-After.
+
+A key reused with a different amount, currency or receipt is refused with
+IdempotencyMismatch rather than replaying an order for the wrong payment.
+Failed gateway calls release the key so the client can retry.
+"""
+import hashlib
+import json
+import logging
+import threading
+from concurrent.futures import Future, TimeoutError
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from cache import TTLCache
+from models import get_models
+
+logger = logging.getLogger('payment-backend')
+
+
+class IdempotencyMismatch(Exception):
+    """Raised when a key is reused for a different payment"""
+
+
+class IdempotencyInProgress(Exception):
+    """Raised when another process is still creating the order for a key"""
+
+
+def fingerprint(payload):
+    """Hash of the parts of an order request a key must always carry"""
+    parts = {name: payload.get(name) for name in ('amount', 'currency', 'receipt')}
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class OrderIdempotency:
+    """Order store and single-flight guard behind /create-order
+
+    Configuration (read in ``init_app``):
+
+    - ``IDEMPOTENCY_TTL``: seconds a key keeps replaying its order
+    - ``IDEMPOTENCY_CACHE_SIZE``: keys cached per process
+    - ``IDEMPOTENCY_PENDING_TIMEOUT``: seconds after which a claim whose
+      gateway call never finished (e.g. the process died) can be taken over
+    """
+
+    def __init__(self, app=None, db=None):
+        self.app = None
+        self.db = None
+        self.PaymentOrder = None
+        self.ttl = 86400.0
+        self.pending_timeout = 30.0
+        self.cache = TTLCache()
+        self.replayed = 0
+        self.created = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        self.PaymentOrder = get_models(db)['PaymentOrder']
+        self.ttl = float(app.config.get('IDEMPOTENCY_TTL', 86400))
+        self.pending_timeout = float(app.config.get('IDEMPOTENCY_PENDING_TIMEOUT', 30))
+        self.cache = TTLCache(maxsize=int(app.config.get('IDEMPOTENCY_CACHE_SIZE', 10000)),
+                              ttl=self.ttl)
+        app.extensions['order_idempotency'] = self
+
+    def _record(self, row):
+        return {
+            'status': row.status,
+            'fingerprint': row.fingerprint,
+            'order': json.loads(row.order_data) if row.order_data else None,
+            'jobId': None,
+            'createdAt': row.created_at,
+        }
+
+    def lookup(self, key):
+        """The stored record for key ({status, fingerprint, order, jobId}), or None"""
+        record = self.cache.get(key)
+        if record is not None:
+            return record
+        row = self.PaymentOrder.query.filter_by(idempotency_key=key).first()
+        if row is None or row.created_at < datetime.utcnow() - timedelta(seconds=self.ttl):
+            return None
+        record = self._record(row)
+        if record['status'] == 'created':
+            self.cache.set(key, record)
+        return record
+
+    def _claim(self, key, fp, payload):
+        """Insert the pending row for key; returns the existing record if someone else holds it"""
+        session = self.db.session
+        now = datetime.utcnow()
+        existing = self.PaymentOrder.query.filter_by(idempotency_key=key).first()
+        if existing is not None:
+            expired = existing.created_at < now - timedelta(seconds=self.ttl)
+            abandoned = existing.status == 'pending' and \
+                existing.updated_at < now - timedelta(seconds=self.pending_timeout)
+            if not (expired or abandoned):
+                return self._record(existing)
+            session.delete(existing)
+            session.flush()
+        session.add(self.PaymentOrder(
+            idempotency_key=key, fingerprint=fp, receipt=payload['receipt'],
+            amount=payload['amount'], currency=payload['currency'], status='pending'
+        ))
+        try:
+            session.commit()
+        except IntegrityError:
+            session.rollback()
+            existing = self.PaymentOrder.query.filter_by(idempotency_key=key).first()
+            return self._record(existing) if existing else {'status': 'pending', 'fingerprint': fp,
+                                                            'order': None, 'jobId': None}
+        return None
+
+    def _complete(self, key, order):
+        row = self.PaymentOrder.query.filter_by(idempotency_key=key).first()
+        row.status = 'created'
+        row.razorpay_order_id = order.get('id') if isinstance(order, dict) else None
+        row.order_data = json.dumps(order)
+        self.db.session.commit()
+        self.cache.set(key, self._record(row))
+        self.created += 1
+
+    def _release(self, key):
+        self.db.session.rollback()
+        self.PaymentOrder.query.filter_by(idempotency_key=key, status='pending').delete()
+        self.db.session.commit()
+        self.cache.invalidate(key)
+
+    def _replay(self, record, fp):
+        if record['fingerprint'] != fp:
+            raise IdempotencyMismatch('Idempotency key was used for a different payment')
+        self.replayed += 1
+        return record
+
+    def create(self, key, payload, create):
+        """Create the order for key once; returns (order, replayed)
+
+        create(payload) performs the gateway call. Must run in an app context.
+        """
+        fp = fingerprint(payload)
+        record = self.lookup(key)
+        if record is not None and record['status'] == 'created':
+            return self._replay(record, fp)['order'], True
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = Future()
+        if not leader:
+            # Hand the lookup's pooled connection back while waiting, or a
+            # burst of duplicates can starve the leader of one
+            self.db.session.rollback()
+            try:
+                order, leader_fp = flight.result(timeout=self.pending_timeout)
+            except TimeoutError:
+                raise IdempotencyInProgress('Order for this key is still being created')
+            self._replay({'fingerprint': leader_fp}, fp)
+            return order, True
+
+        try:
+            existing = self._claim(key, fp, payload)
+            if existing is not None:
+                self._replay(existing, fp)
+                if existing['status'] != 'created':
+                    raise IdempotencyInProgress('Order for this key is still being created')
+                flight.set_result((existing['order'], existing['fingerprint']))
+                return existing['order'], True
+            try:
+                order = create(payload)
+            except Exception:
+                self._release(key)
+                raise
+            self._complete(key, order)
+            flight.set_result((order, fp))
+            return order, False
+        except BaseException as e:
+            if not flight.done():
+                flight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def submit(self, key, payload, submit):
+        """Queue the order for key once; returns ('created', order) or ('pending', job_id)
+
+        submit(payload, on_done) queues the gateway call and returns a job id
+        (PaymentGateway.submit_order). Must run in an app context.
+        """
+        fp = fingerprint(payload)
+        record = self.lookup(key)
+        if record is None or (record['status'] == 'pending' and record['jobId'] is None):
+            record = self._claim(key, fp, payload)
+        if record is not None:
+            self._replay(record, fp)
+            if record['status'] == 'created':
+                return 'created', record['order']
+            if record['jobId'] is None:
+                raise IdempotencyInProgress('Order for this key is still being created')
+            return 'pending', record['jobId']
+
+        # The work can finish before submit() returns; whichever of the two
+        # runs second leaves the cache as on_done left it
+        claim = threading.Lock()
+        finished = []
+
+        def on_done(order, error):
+            with claim, self.app.app_context():
+                if error is None:
+                    self._complete(key, order)
+                else:
+                    self._release(key)
+                finished.append(True)
+
+        try:
+            job_id = submit(payload, on_done)
+        except Exception:
+            self._release(key)
+            raise
+        # Lets duplicates in this process answer with the same job to poll
+        with claim:
+            if not finished:
+                self.cache.set(key, {'status': 'pending', 'fingerprint': fp, 'order': None,
+                                     'jobId': job_id, 'createdAt': datetime.utcnow()})
+        return 'pending', job_id
+
+    def metrics(self):
+        return {
+            'created': self.created,
+            'replayed': self.replayed,
+            'cacheHits': self.cache.hits,
+            'cacheMisses': self.cache.misses,
+        }
@@ -0,0 +1,439 @@
+"""
+Project impact metrics: sensor readings and their hourly, daily and monthly
+rollups.
+
+POST /api/impact/readings appends a batch of readings for projects whose
+bond the caller issued:
+
+    {"readings": [{"projectId": "...", "metricType": "co2_reduction",
+                   "value": 12.5, "recordedAt": "2024-09-01T10:15:00"}, ...]}
+
+``recordedAt`` is ISO 8601 (UTC unless it carries an offset) or Unix
+seconds. Readings that don't validate are reported and skipped. The rest go
+into ``impact_readings`` as they are, and the same transaction folds them
+into ``impact_rollups``: the batch is aggregated in Python first, hours into
+days and days into months, so it costs one upsert per bucket it touches
+rather than three per reading. Rollups keep the count, sum, minimum, maximum
+and latest value of a bucket, all of which merge by addition or comparison.
+
+The GET endpoints read rollups only, never raw readings. A metric's value is
+the sum of its readings for flows (CO2 avoided, energy generated, water
+saved) and the latest reading for levels (hectares restored).
+rebuild_rollups() recomputes the rollups from the readings after loads that
+bypass the endpoint.
+
+Every batch also queues its projects' bonds, whose investors are credited
+with a share of the new totals by attribution.py.
+"""
+import calendar
+import csv
+import io
+import math
+from datetime import datetime, timezone
+
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import case, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import get_models
+from replicas import read_only
+
+impact_bp = Blueprint('impact', __name__)
+
+# Bound once when the blueprint is registered (see auth.py)
+db = None
+GreenBond = None
+Project = None
+ImpactReading = None
+ImpactRollup = None
+AttributionQueue = None
+
+# Metric types (the frontend's ImpactMetricType), their unit and how readings
+# combine: 'sum' for flows measured per reading, 'last' for levels
+METRICS = {
+    'co2_reduction': ('tCO2e', 'sum'),
+    'energy_generated': ('MWh', 'sum'),
+    'water_saved': ('m3', 'sum'),
+    'hectares_restored': ('ha', 'last'),
+    'jobs_created': ('jobs', 'last'),
+    'people_served': ('people', 'last'),
+}
+PERIODS = ('hour', 'day', 'month')
+
+DEFAULT_POINTS = 1000
+MAX_POINTS = 10000
+MAX_PROJECTS = 100
+
+# Values per IN (...) lookup, well under SQLite's bound parameter limit
+IN_CHUNK = 500
+
+# Readings folded per pass by rebuild_rollups
+REBUILD_CHUNK = 100000
+
+class InvalidQuery(ValueError):
+    """Raised for query parameters the impact endpoints can't serve"""
+
+@impact_bp.record_once
+def bind_models(state):
+    """Resolve the db instance and models for the app the blueprint is registered on"""
+    global db, GreenBond, Project, ImpactReading, ImpactRollup, AttributionQueue
+    db = state.app.extensions['sqlalchemy']
+    models = get_models(db)
+    GreenBond = models['GreenBond']
+    Project = models['Project']
+    ImpactReading = models['ImpactReading']
+    ImpactRollup = models['ImpactRollup']
+    AttributionQueue = models['AttributionQueue']
+
+def parse_time(value):
+    """Unix seconds for an ISO 8601 string or a number; naive times are UTC"""
+    if isinstance(value, bool):
+        raise ValueError('not a time')
+    if isinstance(value, (int, float)):
+        if not math.isfinite(value):
+            raise ValueError('not a time')
+        return int(value)
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
+
+def isoformat(seconds):
+    return datetime.utcfromtimestamp(seconds).isoformat()
+
+def day_start(seconds):
+    return seconds - seconds % 86400
+
+def month_start(seconds):
+    moment = datetime.utcfromtimestamp(seconds)
+    return calendar.timegm((moment.year, moment.month, 1, 0, 0, 0))
+
+def _merge(into, other):
+    """Combine aggregate other into into; both are [count, total, min, max, last, last_at]"""
+    into[0] += other[0]
+    into[1] += other[1]
+    if other[2] < into[2]:
+        into[2] = other[2]
+    if other[3] > into[3]:
+        into[3] = other[3]
+    if other[5] >= into[5]:
+        into[4] = other[4]
+        into[5] = other[5]
+
+def fold(readings):
+    """Rollup aggregates for (project_id, metric_type, recorded_at, value) readings
+
+    Returns {(project_id, metric_type, period, bucket): [count, total, min,
+    max, last, last_at]} with an entry per hour, day and month the readings
+    fall in.
+    """
+    hours = {}
+    for project_id, metric_type, recorded_at, value in readings:
+        key = (project_id, metric_type, 'hour', recorded_at - recorded_at % 3600)
+        aggregate = hours.get(key)
+        if aggregate is None:
+            hours[key] = [1, value, value, value, value, recorded_at]
+            continue
+        aggregate[0] += 1
+        aggregate[1] += value
+        if value < aggregate[2]:
+            aggregate[2] = value
+        if value > aggregate[3]:
+            aggregate[3] = value
+        if recorded_at >= aggregate[5]:
+            aggregate[4] = value
+            aggregate[5] = recorded_at
+    rollups = dict(hours)
+    finer = hours
+    for period, start in (('day', day_start), ('month', month_start)):
+        coarser = {}
+        for (project_id, metric_type, _, bucket), aggregate in finer.items():
+            key = (project_id, metric_type, period, start(bucket))
+            if key in coarser:
+                _merge(coarser[key], aggregate)
+            else:
+                coarser[key] = list(aggregate)
+        rollups.update(coarser)
+        finer = coarser
+    return rollups
+
+def upsert_rollups(rollups):
+    """Add fold() aggregates to impact_rollups, one upsert per bucket"""
+    if not rollups:
+        return
+    table = ImpactRollup.__table__
+    if db.session.get_bind().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        insert = sqlite_insert
+    stmt = insert(table)
+    new = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['project_id', 'metric_type', 'period', 'bucket'],
+        set_={
+            'reading_count': table.c.reading_count + new.reading_count,
+            'total': table.c.total + new.total,
+            'minimum': case((new.minimum < table.c.minimum, new.minimum), else_=table.c.minimum),
+            'maximum': case((new.maximum > table.c.maximum, new.maximum), else_=table.c.maximum),
+            'last_value': case((new.last_at >= table.c.last_at, new.last_value), else_=table.c.last_value),
+            'last_at': case((new.last_at >= table.c.last_at, new.last_at), else_=table.c.last_at),
+        }
+    )
+    db.session.execute(stmt, [{
+        'project_id': project_id, 'metric_type': metric_type, 'period': period, 'bucket': bucket,
+        'reading_count': count, 'total': total, 'minimum': low, 'maximum': high,
+        'last_value': last, 'last_at': last_at,
+    } for (project_id, metric_type, period, bucket), (count, total, low, high, last, last_at) in rollups.items()])
+
+def insert_readings(readings):
+    """Append readings to impact_readings: COPY on PostgreSQL with psycopg2, executemany elsewhere"""
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        cursor = connection.connection.dbapi_connection.cursor()
+        if hasattr(cursor, 'copy_expert'):
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(readings)
+            buffer.seek(0)
+            cursor.copy_expert('COPY impact_readings (project_id, metric_type, recorded_at, value) '
+                               'FROM STDIN WITH (FORMAT csv)', buffer)
+            return
+    connection.execute(ImpactReading.__table__.insert(), [
+        {'project_id': project_id, 'metric_type': metric_type, 'recorded_at': recorded_at, 'value': value}
+        for project_id, metric_type, recorded_at, value in readings
+    ])
+
+def record_readings(readings):
+    """Append (project_id, metric_type, recorded_at, value) readings and update their rollups
+
+    Runs in the caller's transaction and queues the projects' bonds for
+    attribution (see attribution.py); returns the number of rollup rows touched.
+    """
+    if not readings:
+        return 0
+    insert_readings(readings)
+    rollups = fold(readings)
+    upsert_rollups(rollups)
+    AttributionQueue.add(db.session.connection(), project_ids={reading[0] for reading in readings})
+    return len(rollups)
+
+def rebuild_rollups(project_ids=None):
+    """Recompute rollups from impact_readings, for every project when project_ids is None"""
+    table = ImpactRollup.__table__
+    scope = []
+    if project_ids is not None:
+        scope.append(ImpactReading.project_id.in_(project_ids))
+        db.session.execute(table.delete().where(table.c.project_id.in_(project_ids)))
+    else:
+        db.session.execute(table.delete())
+    # Rollups merge by addition, so readings are folded a chunk at a time
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(ImpactReading.id, ImpactReading.project_id, ImpactReading.metric_type,
+                   ImpactReading.recorded_at, ImpactReading.value)
+            .where(ImpactReading.id > last_id, *scope)
+            .order_by(ImpactReading.id)
+            .limit(REBUILD_CHUNK)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        upsert_rollups(fold([row[1:] for row in rows]))
+    if project_ids is None:
+        project_ids = db.session.execute(select(Project.id)).scalars().all()
+    AttributionQueue.add(db.session.connection(), project_ids=project_ids)
+    db.session.commit()
+
+def owned_projects(project_ids, issuer_id):
+    """The subset of project_ids on bonds issued by issuer_id"""
+    project_ids = list(project_ids)
+    owned = set()
+    for start in range(0, len(project_ids), IN_CHUNK):
+        chunk = project_ids[start:start + IN_CHUNK]
+        owned.update(project_id for (project_id,) in db.session.execute(
+            select(Project.id).join(GreenBond, GreenBond.id == Project.bond_id)
+            .where(Project.id.in_(chunk), GreenBond.issuer_id == issuer_id)
+        ))
+    return owned
+
+def read_readings(items):
+    """(index, (project_id, metric_type, recorded_at, value)) for valid items, and the rejected ones"""
+    readings, rejected = [], []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            rejected.append({'index': index, 'error': 'expected an object'})
+            continue
+        project_id, metric_type, value = item.get('projectId'), item.get('metricType'), item.get('value')
+        if not isinstance(project_id, str) or not project_id:
+            rejected.append({'index': index, 'error': 'projectId is required'})
+        elif metric_type not in METRICS:
+            rejected.append({'index': index, 'error': f'unknown metricType: {metric_type}'})
+        elif isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            rejected.append({'index': index, 'error': 'value must be a number'})
+        else:
+            try:
+                recorded_at = parse_time(item.get('recordedAt'))
+            except (TypeError, ValueError, OverflowError):
+                rejected.append({'index': index, 'error': 'recordedAt must be ISO 8601 or Unix seconds'})
+                continue
+            readings.append((index, (project_id, metric_type, recorded_at, float(value))))
+    return readings, rejected
+
+def query_time(name):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        return parse_time(float(value))
+    except (ValueError, OverflowError):
+        pass
+    try:
+        return parse_time(value)
+    except ValueError:
+        raise InvalidQuery(f'{name} must be ISO 8601 or Unix seconds')
+
+def metric_value(metric_type, total, last):
+    return total if METRICS[metric_type][1] == 'sum' else last
+
+@impact_bp.route('/readings', methods=['POST'])
+@jwt_required()
+def post_readings():
+    """Append a batch of readings for the caller's projects"""
+    data = request.get_json(silent=True)
+    items = data.get('readings') if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        return jsonify({'error': 'expected {"readings": [...]}'}), 400
+    limit = current_app.config.get('IMPACT_MAX_READINGS', 10000)
+    if len(items) > limit:
+        return jsonify({'error': f'at most {limit} readings per batch'}), 413
+
+    try:
+        readings, rejected = read_readings(items)
+        owned = owned_projects({reading[0] for _, reading in readings}, get_jwt_identity())
+        accepted = [reading for _, reading in readings if reading[0] in owned]
+        if len(accepted) < len(readings):
+            rejected.extend({'index': index, 'error': 'not a project of yours'}
+                            for index, reading in readings if reading[0] not in owned)
+            rejected.sort(key=lambda item: item['index'])
+        rollups = record_readings(accepted)
+        db.session.commit()
+        return jsonify({
+            'received': len(items),
+            'recorded': len(accepted),
+            'rollupsUpdated': rollups,
+            'rejected': rejected
+        }), 200
+
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Impact readings error: {str(e)}')
+        return jsonify({'error': 'Failed to record readings'}), 500
+
+@impact_bp.route('/metrics', methods=['GET'])
+@read_only
+def get_metrics():
+    """Current value of every metric of the given projects (repeatable ?projectId=)
+
+    Totals come from the monthly rollups: a handful of rows per project and
+    metric whatever the number of readings.
+    """
+    project_ids = request.args.getlist('projectId')
+    if not project_ids:
+        return jsonify({'error': 'projectId is required'}), 400
+    if len(project_ids) > MAX_PROJECTS:
+        return jsonify({'error': f'at most {MAX_PROJECTS} projects'}), 400
+
+    try:
+        rows = db.session.execute(
+            select(ImpactRollup.project_id, ImpactRollup.metric_type, ImpactRollup.reading_count,
+                   ImpactRollup.total, ImpactRollup.minimum, ImpactRollup.maximum,
+                   ImpactRollup.last_value, ImpactRollup.last_at)
+            .where(ImpactRollup.project_id.in_(set(project_ids)), ImpactRollup.period == 'month')
+        ).all()
+        totals = {}
+        for project_id, metric_type, *aggregate in rows:
+            key = (project_id, metric_type)
+            if key in totals:
+                _merge(totals[key], aggregate)
+            else:
+                totals[key] = list(aggregate)
+
+        metrics = {project_id: [] for project_id in project_ids}
+        for (project_id, metric_type), (count, total, low, high, last, last_at) in sorted(totals.items()):
+            metrics[project_id].append({
+                'projectId': project_id,
+                'metricType': metric_type,
+                'unit': METRICS[metric_type][0],
+                'currentValue': metric_value(metric_type, total, last),
+                'total': total,
+                'readingCount': count,
+                'minimum': low,
+                'maximum': high,
+                'lastValue': last,
+                'measurementDate': isoformat(last_at)
+            })
+        return jsonify({'projects': [{'projectId': project_id, 'metrics': metrics[project_id]}
+                                     for project_id in dict.fromkeys(project_ids)]}), 200
+
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Impact metrics error: {str(e)}')
+        return jsonify({'error': 'Failed to get impact metrics'}), 500
+
+@impact_bp.route('/projects/<project_id>/series', methods=['GET'])
+@read_only
+def get_series(project_id):
+    """One metric of a project per hour, day or month
+
+    - metricType: required
+    - period: hour, day (default) or month
+    - from, to: ISO 8601 or Unix seconds, inclusive bucket starts
+    - limit: the latest points in the range, default 1000, at most 10000
+    """
+    metric_type = request.args.get('metricType')
+    period = request.args.get('period', 'day')
+    try:
+        if metric_type not in METRICS:
+            raise InvalidQuery('metricType must be one of ' + ', '.join(METRICS))
+        if period not in PERIODS:
+            raise InvalidQuery('period must be one of ' + ', '.join(PERIODS))
+        start, end = query_time('from'), query_time('to')
+        try:
+            limit = int(request.args.get('limit', DEFAULT_POINTS))
+        except ValueError:
+            raise InvalidQuery('limit must be an integer')
+        limit = max(1, min(limit, MAX_POINTS))
+    except InvalidQuery as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        query = select(ImpactRollup).where(ImpactRollup.project_id == project_id,
+                                           ImpactRollup.metric_type == metric_type,
+                                           ImpactRollup.period == period)
+        if start is not None:
+            query = query.where(ImpactRollup.bucket >= start)
+        if end is not None:
+            query = query.where(ImpactRollup.bucket <= end)
+        rows = db.session.execute(query.order_by(ImpactRollup.bucket.desc()).limit(limit)).scalars().all()
+        return jsonify({
+            'projectId': project_id,
+            'metricType': metric_type,
+            'unit': METRICS[metric_type][0],
+            'period': period,
+            'points': [{
+                'bucket': isoformat(row.bucket),
+                'value': metric_value(metric_type, row.total, row.last_value),
+                'readingCount': row.reading_count,
+                'total': row.total,
+                'average': row.total / row.reading_count,
+                'minimum': row.minimum,
+                'maximum': row.maximum,
+                'lastValue': row.last_value
+            } for row in reversed(rows)]
+        }), 200
+
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Impact series error: {str(e)}')
+        return jsonify({'error': 'Failed to get impact series'}), 500
@@ -0,0 +1,196 @@
+"""
+Bulk impact readings for one project, streamed from the request body.
+
+POST /api/projects/<project_id>/metrics:bulk takes newline-delimited JSON
+(``Content-Type: application/x-ndjson``), one reading per line:
+
+    {"metricType": "co2_reduction", "value": 12.5, "recordedAt": "2024-09-01T10:15:00"}
+
+or CSV (``Content-Type: text/csv``) with a header row naming metricType,
+value and recordedAt. Fields are as for POST /api/impact/readings (see
+impact.py); ``projectId`` may be left out, and rows naming another project
+are rejected.
+
+The body is never held in memory: it is read through a 1 MB buffer and
+parsed a line at a time. Rows are validated and written IMPACT_BULK_CHUNK
+(default 10,000) at a time, each chunk in its own transaction with its
+rollups (impact.record_readings), so memory and lock time stay bounded
+however large the upload. Rows that don't validate are counted and the
+first hundred reported by line. If a chunk fails, the upload stops there:
+the chunks before it stay committed, and ``committedThroughLine`` in the
+response says where to resume.
+"""
+import csv
+import io
+import json
+
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+from impact import owned_projects, read_readings, record_readings
+
+ingest_bp = Blueprint('ingest', __name__)
+
+# Bound once when the blueprint is registered (see auth.py)
+db = None
+
+BUFFER_SIZE = 1 << 20
+CSV_FIELDS = ('metricType', 'value', 'recordedAt')
+
+# Rejected rows listed in the response; the rest are only counted
+MAX_REPORTED = 100
+
+class InvalidUpload(ValueError):
+    """Raised for a body that can't be read as the declared format"""
+
+@ingest_bp.record_once
+def bind_models(state):
+    """Resolve the db instance for the app the blueprint is registered on"""
+    global db
+    db = state.app.extensions['sqlalchemy']
+
+class _RawStream(io.RawIOBase):
+    """readinto() over a stream that only has read(), for io.BufferedReader
+
+    request.stream is the server's input stream as is when the body is
+    chunked rather than sized, and not every server's has readinto().
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+def text_stream(stream):
+    """Buffered UTF-8 text over a binary stream, lines ending as sent"""
+    return io.TextIOWrapper(io.BufferedReader(_RawStream(stream), BUFFER_SIZE), encoding='utf-8', newline='')
+
+def ndjson_rows(text):
+    """(line, item, error) for each non-blank line"""
+    for line, content in enumerate(text, 1):
+        if not content.strip():
+            continue
+        try:
+            yield line, json.loads(content), None
+        except ValueError:
+            yield line, None, 'line is not JSON'
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value
+
+def csv_rows(text):
+    """(line, item, error) for each record after the header"""
+    reader = csv.DictReader(text)
+    if reader.fieldnames is None:
+        return
+    missing = [name for name in CSV_FIELDS if name not in reader.fieldnames]
+    if missing:
+        raise InvalidUpload('CSV header is missing ' + ', '.join(missing))
+    for row in reader:
+        yield reader.line_num, {
+            'projectId': row.get('projectId') or None,
+            'metricType': row['metricType'],
+            'value': _number(row['value']),
+            'recordedAt': _number(row['recordedAt']),
+        }, None
+
+PARSERS = {
+    'application/x-ndjson': ndjson_rows,
+    'application/jsonl': ndjson_rows,
+    'text/csv': csv_rows,
+}
+
+class Upload:
+    """Counters for one bulk upload, written a chunk at a time"""
+
+    def __init__(self, project_id):
+        self.project_id = project_id
+        self.received = 0
+        self.recorded = 0
+        self.rejected_count = 0
+        self.rejected = []
+        self.committed_line = 0
+        self.chunk = []
+
+    def reject(self, line, error):
+        self.rejected_count += 1
+        if len(self.rejected) < MAX_REPORTED:
+            self.rejected.append({'line': line, 'error': error})
+
+    def add(self, line, item, error):
+        self.received += 1
+        if error is None and isinstance(item, dict):
+            project_id = item.get('projectId')
+            if project_id is None:
+                item['projectId'] = self.project_id
+            elif project_id != self.project_id:
+                error = 'projectId does not match the URL'
+        if error is not None:
+            self.reject(line, error)
+        else:
+            self.chunk.append((line, item))
+
+    def flush(self, last_line):
+        """Validate and commit the pending rows; everything through last_line is then done"""
+        readings, rejected = read_readings([item for _, item in self.chunk])
+        for entry in rejected:
+            self.reject(self.chunk[entry['index']][0], entry['error'])
+        record_readings([reading for _, reading in readings])
+        db.session.commit()
+        self.recorded += len(readings)
+        self.committed_line = last_line
+        self.chunk = []
+
+    def to_dict(self):
+        return {
+            'received': self.received,
+            'recorded': self.recorded,
+            'rejectedCount': self.rejected_count,
+            'rejected': sorted(self.rejected, key=lambda entry: entry['line']),
+            'committedThroughLine': self.committed_line
+        }
+
+@ingest_bp.route('/<project_id>/metrics:bulk', methods=['POST'])
+@jwt_required()
+def bulk_readings(project_id):
+    """Stream NDJSON or CSV readings for one of the caller's projects"""
+    parse = PARSERS.get(request.mimetype)
+    if parse is None:
+        return jsonify({'error': 'Content-Type must be one of ' + ', '.join(PARSERS)}), 415
+    try:
+        if not owned_projects([project_id], get_jwt_identity()):
+            return jsonify({'error': 'Project not found'}), 404
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Bulk readings error: {str(e)}')
+        return jsonify({'error': 'Failed to record readings'}), 500
+    # Release the connection while the body streams in
+    db.session.rollback()
+
+    chunk_size = current_app.config.get('IMPACT_BULK_CHUNK', 10000)
+    upload = Upload(project_id)
+    line = 0
+    try:
+        for line, item, error in parse(text_stream(request.stream)):
+            upload.add(line, item, error)
+            if len(upload.chunk) >= chunk_size:
+                upload.flush(line)
+        upload.flush(line)
+        return jsonify(upload.to_dict()), 200
+
+    except (InvalidUpload, UnicodeDecodeError, csv.Error) as e:
+        db.session.rollback()
+        return jsonify(dict(upload.to_dict(), error=f'Invalid upload after line {line}: {e}')), 400
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Bulk readings error: {str(e)}')
+        return jsonify(dict(upload.to_dict(), error='Failed to record readings')), 500
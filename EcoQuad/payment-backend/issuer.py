@@ -0,0 +1,215 @@
+"""
+Issuer dashboard totals, kept current as bonds and projects change.
+
+GET /api/issuer/summary serves the issuer's bond count, target and raised
+amounts, funding progress by bond status, and project budget against
+allocated and spent funds. These come from ``issuer_summaries`` (one row
+per issuer) and ``issuer_bond_statuses`` (one per issuer and status), so the
+read is a primary-key lookup and a range read of the same key however many
+bonds the issuer has.
+
+The rows are maintained like the portfolio summaries (see portfolio.py).
+ORM hooks on GreenBond and Project apply each insert, change and delete as a
+delta with a single upsert. GreenBond.add_raised adds fulfilled payments to
+them in its own UPDATE. rebuild_issuers() recomputes from green_bonds and
+projects with SQL aggregates, for issuers whose bonds predate the tables and
+after loads that bypass the ORM.
+"""
+from datetime import datetime
+
+from flask import Blueprint, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import event, func, inspect, literal, select
+
+from models import get_models
+from portfolio import upsert_add
+from replicas import read_only
+
+issuer_bp = Blueprint('issuer', __name__)
+
+# Bound once when the blueprint is registered (see auth.py)
+db = None
+GreenBond = None
+Project = None
+IssuerSummary = None
+IssuerBondStatus = None
+
+# Columns whose changes move the summary
+BOND_COLUMNS = ('issuer_id', 'status', 'total_amount', 'amount_raised')
+PROJECT_COLUMNS = ('bond_id', 'total_budget', 'allocated_funds', 'spent_funds')
+
+@issuer_bp.record_once
+def bind_models(state):
+    """Resolve models and start maintaining summaries for the app's db instance"""
+    global db, GreenBond, Project, IssuerSummary, IssuerBondStatus
+    db = state.app.extensions['sqlalchemy']
+    models = get_models(db)
+    GreenBond = models['GreenBond']
+    Project = models['Project']
+    IssuerSummary = models['IssuerSummary']
+    IssuerBondStatus = models['IssuerBondStatus']
+    for model, name, listener in ((GreenBond, 'after_insert', _bond_after_insert),
+                                  (GreenBond, 'before_update', _bond_before_update),
+                                  (GreenBond, 'before_delete', _bond_before_delete),
+                                  (Project, 'after_insert', _project_after_insert),
+                                  (Project, 'before_update', _project_before_update),
+                                  (Project, 'before_delete', _project_before_delete)):
+        if not event.contains(model, name, listener):
+            event.listen(model, name, listener)
+
+def apply_bond(connection, bond, sign):
+    """Add (sign=1) or remove (sign=-1) one bond's contribution"""
+    issuer = {'issuer_id': bond['issuer_id']}
+    deltas = {
+        'bond_count': sign,
+        'total_amount': sign * (bond['total_amount'] or 0),
+        'amount_raised': sign * (bond['amount_raised'] or 0),
+    }
+    upsert_add(connection, IssuerSummary.__table__, issuer, deltas, touch={'updated_at': datetime.utcnow()})
+    upsert_add(connection, IssuerBondStatus.__table__, dict(issuer, status=bond['status']), deltas)
+
+def apply_project(connection, project, sign):
+    """Add (sign=1) or remove (sign=-1) one project's budget and spend"""
+    issuer_id = connection.execute(
+        select(GreenBond.issuer_id).where(GreenBond.id == project['bond_id'])
+    ).scalar_one()
+    upsert_add(connection, IssuerSummary.__table__, {'issuer_id': issuer_id}, {
+        'project_count': sign,
+        'total_budget': sign * (project['total_budget'] or 0),
+        'allocated_funds': sign * (project['allocated_funds'] or 0),
+        'spent_funds': sign * (project['spent_funds'] or 0),
+    }, touch={'updated_at': datetime.utcnow()})
+
+def _values(target, columns):
+    return {name: getattr(target, name) for name in columns}
+
+def _reapply(connection, target, columns, apply):
+    """Swap the old contribution of an updated row for its new one"""
+    state = inspect(target)
+    if not any(state.attrs[name].history.has_changes() for name in columns):
+        return
+    # Read the old values from the row itself (see portfolio._before_update)
+    table = type(target).__table__
+    old = connection.execute(
+        select(*[table.c[name] for name in columns]).where(table.c.id == target.id)
+    ).one()
+    apply(connection, dict(old._mapping), -1)
+    apply(connection, _values(target, columns), 1)
+
+def _bond_after_insert(mapper, connection, target):
+    apply_bond(connection, _values(target, BOND_COLUMNS), 1)
+
+def _bond_before_update(mapper, connection, target):
+    _reapply(connection, target, BOND_COLUMNS, apply_bond)
+
+def _bond_before_delete(mapper, connection, target):
+    apply_bond(connection, _values(target, BOND_COLUMNS), -1)
+
+def _project_after_insert(mapper, connection, target):
+    apply_project(connection, _values(target, PROJECT_COLUMNS), 1)
+
+def _project_before_update(mapper, connection, target):
+    _reapply(connection, target, PROJECT_COLUMNS, apply_project)
+
+def _project_before_delete(mapper, connection, target):
+    apply_project(connection, _values(target, PROJECT_COLUMNS), -1)
+
+def rebuild_issuers(issuer_ids=None):
+    """Recompute summaries from green_bonds and projects with SQL aggregates
+
+    Rebuilds every issuer when issuer_ids is None.
+    """
+    summary_table = IssuerSummary.__table__
+    status_table = IssuerBondStatus.__table__
+    scope = []
+    if issuer_ids is not None:
+        scope.append(GreenBond.issuer_id.in_(issuer_ids))
+        db.session.execute(summary_table.delete().where(summary_table.c.issuer_id.in_(issuer_ids)))
+        db.session.execute(status_table.delete().where(status_table.c.issuer_id.in_(issuer_ids)))
+    else:
+        db.session.execute(summary_table.delete())
+        db.session.execute(status_table.delete())
+
+    bonds = select(
+        GreenBond.issuer_id,
+        func.count(GreenBond.id).label('bond_count'),
+        func.coalesce(func.sum(GreenBond.total_amount), 0).label('total_amount'),
+        func.coalesce(func.sum(GreenBond.amount_raised), 0).label('amount_raised')
+    ).where(*scope).group_by(GreenBond.issuer_id).subquery()
+    projects = select(
+        GreenBond.issuer_id,
+        func.count(Project.id).label('project_count'),
+        func.coalesce(func.sum(Project.total_budget), 0).label('total_budget'),
+        func.coalesce(func.sum(Project.allocated_funds), 0).label('allocated_funds'),
+        func.coalesce(func.sum(Project.spent_funds), 0).label('spent_funds')
+    ).join(GreenBond, GreenBond.id == Project.bond_id).where(*scope).group_by(GreenBond.issuer_id).subquery()
+    db.session.execute(summary_table.insert().from_select(
+        ['issuer_id', 'bond_count', 'total_amount', 'amount_raised', 'project_count',
+         'total_budget', 'allocated_funds', 'spent_funds', 'updated_at'],
+        select(
+            bonds.c.issuer_id, bonds.c.bond_count, bonds.c.total_amount, bonds.c.amount_raised,
+            func.coalesce(projects.c.project_count, 0),
+            func.coalesce(projects.c.total_budget, 0),
+            func.coalesce(projects.c.allocated_funds, 0),
+            func.coalesce(projects.c.spent_funds, 0),
+            literal(datetime.utcnow())
+        ).outerjoin(projects, projects.c.issuer_id == bonds.c.issuer_id)
+    ))
+
+    db.session.execute(status_table.insert().from_select(
+        ['issuer_id', 'status', 'bond_count', 'total_amount', 'amount_raised'],
+        select(
+            GreenBond.issuer_id,
+            GreenBond.status,
+            func.count(GreenBond.id),
+            func.coalesce(func.sum(GreenBond.total_amount), 0),
+            func.coalesce(func.sum(GreenBond.amount_raised), 0)
+        ).where(*scope).group_by(GreenBond.issuer_id, GreenBond.status)
+    ))
+
+    db.session.commit()
+
+def _progress(part, whole):
+    return round(part / whole * 100, 2) if whole else 0
+
+@issuer_bp.route('/summary', methods=['GET'])
+@jwt_required()
+@read_only
+def get_summary():
+    """Bond, funding and project totals for the current issuer"""
+    try:
+        issuer_id = get_jwt_identity()
+        summary = db.session.get(IssuerSummary, issuer_id)
+        if summary is None:
+            # No bonds yet. A read never writes (see portfolio.get_summary)
+            summary = IssuerSummary(issuer_id=issuer_id, bond_count=0, total_amount=0, amount_raised=0,
+                                    project_count=0, total_budget=0, allocated_funds=0, spent_funds=0)
+        statuses = [row for row in IssuerBondStatus.query.filter_by(issuer_id=issuer_id).all()
+                    if row.bond_count > 0]
+
+        return jsonify({
+            'summary': {
+                'bondCount': summary.bond_count,
+                'totalAmount': summary.total_amount,
+                'amountRaised': summary.amount_raised,
+                'fundingProgress': _progress(summary.amount_raised, summary.total_amount),
+                'projectCount': summary.project_count,
+                'totalBudget': summary.total_budget,
+                'allocatedFunds': summary.allocated_funds,
+                'spentFunds': summary.spent_funds,
+                'budgetSpent': _progress(summary.spent_funds, summary.total_budget),
+                'updatedAt': summary.updated_at.isoformat() if summary.updated_at else None
+            },
+            'bondsByStatus': [{
+                'status': row.status,
+                'bondCount': row.bond_count,
+                'totalAmount': row.total_amount,
+                'amountRaised': row.amount_raised,
+                'fundingProgress': _progress(row.amount_raised, row.total_amount)
+            } for row in sorted(statuses, key=lambda row: row.total_amount, reverse=True)]
+        }), 200
+
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Issuer summary error: {str(e)}')
+        return jsonify({'error': 'Failed to get issuer summary'}), 500
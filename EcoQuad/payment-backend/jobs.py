@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Durable background jobs in the application database.
+
+Work that must outlive the request that triggered it, such as fulfilling a
+verified payment, is written to the ``jobs`` table in the same transaction
+as the data it acts on, so it can't be lost between the commit and the
+response. JobQueue then runs it off the request thread:
+
+- a job is claimed with a conditional UPDATE that only one worker can win,
+  across threads and processes, and holds a lease of JOB_LEASE seconds. A
+  job whose worker died is picked up again once the lease runs out;
+- a handler that raises is retried with exponential backoff and jitter up to
+  ``max_attempts`` times, then left as ``failed`` with its last error.
+  Handlers must therefore be safe to run more than once;
+- ``JOB_QUEUE_MODE`` picks who runs jobs: ``thread`` (default) JOB_WORKERS
+  worker threads per process, woken as soon as a job is queued; ``inline`` the
+  request that queued it, before responding; ``off`` nobody in the web
+  process, leaving it to ``python jobs.py``.
+
+    python jobs.py          # work the queue until interrupted
+    python jobs.py --once   # run every due job, then exit
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, func, or_, update
+
+from guid import new_id
+from models import get_models
+
+logger = logging.getLogger('payment-backend')
+
+MODES = ('thread', 'inline', 'off')
+
+
+class JobQueue:
+    """Database-backed job queue with per-process worker threads
+
+    Configuration (read in ``init_app``):
+
+    - ``JOB_QUEUE_MODE``: thread, inline or off (see the module docstring)
+    - ``JOB_WORKERS``: worker threads per process in thread mode
+    - ``JOB_POLL_INTERVAL``: seconds an idle worker waits before polling
+    - ``JOB_MAX_ATTEMPTS``: runs before a job is marked failed
+    - ``JOB_RETRY_BACKOFF``: seconds before the first retry, doubled each time
+    - ``JOB_LEASE``: seconds a claimed job is reserved for its worker
+    """
+
+    def __init__(self, app=None, db=None):
+        self.app = None
+        self.db = None
+        self.Job = None
+        self.mode = 'thread'
+        self.workers = 4
+        self.poll_interval = 1.0
+        self.max_attempts = 5
+        self.retry_backoff = 1.0
+        self.lease = 60.0
+        self.handlers = {}
+        self.processed = 0
+        self.retried = 0
+        self.failed = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        mode = app.config.get('JOB_QUEUE_MODE', 'thread')
+        if mode not in MODES:
+            raise ValueError(f'JOB_QUEUE_MODE must be one of {", ".join(MODES)}, not {mode!r}')
+        self.shutdown()
+        self.app = app
+        self.db = db
+        self.Job = get_models(db)['Job']
+        self.mode = mode
+        self.workers = int(app.config.get('JOB_WORKERS', 4))
+        self.poll_interval = float(app.config.get('JOB_POLL_INTERVAL', 1.0))
+        self.max_attempts = int(app.config.get('JOB_MAX_ATTEMPTS', 5))
+        self.retry_backoff = float(app.config.get('JOB_RETRY_BACKOFF', 1.0))
+        self.lease = float(app.config.get('JOB_LEASE', 60))
+        app.extensions['job_queue'] = self
+
+    def register(self, kind, handler):
+        """Run handler(payload) for jobs of this kind, inside an app context"""
+        self.handlers[kind] = handler
+
+    def enqueue(self, kind, payload, max_attempts=None):
+        """Add a job to the current session; it becomes visible when the caller commits"""
+        if kind not in self.handlers:
+            raise KeyError(f'no handler registered for job kind {kind!r}')
+        job = self.Job(kind=kind, payload=json.dumps(payload), status='queued',
+                       attempts=0, max_attempts=max_attempts or self.max_attempts,
+                       run_at=datetime.utcnow())
+        self.db.session.add(job)
+        return job
+
+    def enqueue_many(self, kind, payloads):
+        """Add many jobs with one INSERT in the current transaction; returns their ids"""
+        if kind not in self.handlers:
+            raise KeyError(f'no handler registered for job kind {kind!r}')
+        now = datetime.utcnow()
+        rows = [{'id': new_id(), 'kind': kind, 'payload': json.dumps(payload),
+                 'status': 'queued', 'attempts': 0, 'max_attempts': self.max_attempts,
+                 'run_at': now, 'created_at': now, 'updated_at': now} for payload in payloads]
+        if rows:
+            self.db.session.execute(self.Job.__table__.insert(), rows)
+        return [row['id'] for row in rows]
+
+    def dispatch(self, job_id):
+        """Hand a committed job to whoever runs jobs in this mode"""
+        self.dispatch_many([job_id])
+
+    def dispatch_many(self, job_ids):
+        if not job_ids:
+            return
+        if self.mode == 'inline':
+            for job_id in job_ids:
+                self.run(job_id)
+        elif self.mode == 'thread':
+            self.start()
+            self._wake.set()
+
+    def _due(self, now):
+        Job = self.Job
+        return or_(
+            and_(Job.status == 'queued', Job.run_at <= now),
+            # Claimed by a worker that never finished it
+            and_(Job.status == 'running', Job.locked_until < now),
+        )
+
+    def run(self, job_id):
+        """Claim and run one job if it is due; returns True if it ran"""
+        Job = self.Job
+        session = self.db.session
+        now = datetime.utcnow()
+        claimed = session.execute(
+            update(Job)
+            .where(Job.id == job_id, self._due(now))
+            .values(status='running', attempts=Job.attempts + 1,
+                    locked_until=now + timedelta(seconds=self.lease), updated_at=now)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        session.commit()
+        if not claimed:
+            return False
+
+        job = session.get(Job, job_id, populate_existing=True)
+        try:
+            self.handlers[job.kind](json.loads(job.payload))
+        except Exception as e:
+            session.rollback()
+            job = session.get(Job, job_id, populate_existing=True)
+            job.last_error = f'{type(e).__name__}: {e}'[:2000]
+            job.locked_until = None
+            if job.attempts >= job.max_attempts:
+                job.status = 'failed'
+                self.failed += 1
+                logger.error('Job %s (%s) failed after %d attempts: %s',
+                             job_id, job.kind, job.attempts, str(e))
+            else:
+                delay = self.retry_backoff * 2 ** (job.attempts - 1)
+                job.status = 'queued'
+                job.run_at = datetime.utcnow() + timedelta(seconds=delay * random.uniform(1, 1.5))
+                self.retried += 1
+                logger.warning('Job %s (%s) attempt %d failed, retrying in %.1fs: %s',
+                               job_id, job.kind, job.attempts, delay, str(e))
+            session.commit()
+            return True
+
+        job = session.get(Job, job_id, populate_existing=True)
+        job.status = 'done'
+        job.locked_until = None
+        session.commit()
+        self.processed += 1
+        return True
+
+    def run_pending(self, limit=100):
+        """Run due jobs, oldest first, until none are left; returns how many ran"""
+        ran = 0
+        while True:
+            ids = [job_id for (job_id,) in self.db.session.query(self.Job.id)
+                   .filter(self._due(datetime.utcnow()))
+                   .order_by(self.Job.run_at)
+                   .limit(limit)]
+            self.db.session.commit()
+            if not ids:
+                return ran
+            ran += sum(self.run(job_id) for job_id in ids)
+
+    def start(self):
+        """Start this process's worker threads if they aren't running"""
+        # Threads don't survive fork(), so each process starts its own
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._stop.clear()
+            self._threads = [threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+                             for i in range(self.workers)]
+            self._pid = pid
+            for thread in self._threads:
+                thread.start()
+
+    def _work(self):
+        with self.app.app_context():
+            while not self._stop.is_set():
+                try:
+                    ran = self.run_pending()
+                except Exception as e:
+                    logger.error('Job worker error: %s', str(e))
+                    self.db.session.rollback()
+                    ran = 0
+                finally:
+                    self.db.session.remove()
+                if not ran:
+                    self._wake.wait(self.poll_interval)
+                    self._wake.clear()
+
+    def metrics(self):
+        """Job counts by status plus this process's run counters"""
+        counts = dict(self.db.session.query(self.Job.status, func.count(self.Job.id))
+                      .group_by(self.Job.status).all())
+        return {
+            'mode': self.mode,
+            'queued': counts.get('queued', 0),
+            'running': counts.get('running', 0),
+            'done': counts.get('done', 0),
+            'failed': counts.get('failed', 0),
+            'processed': self.processed,
+            'retried': self.retried,
+            'failedHere': self.failed,
+        }
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._threads and self._pid == os.getpid():
+                self._stop.set()
+                self._wake.set()
+                if wait:
+                    for thread in self._threads:
+                        thread.join()
+            self._threads = []
+            self._pid = None
+
+
+def get_job_queue(app):
+    """Return the app's JobQueue"""
+    return app.extensions['job_queue']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Work the background job queue')
+    parser.add_argument('--once', action='store_true', help='run every due job, then exit')
+    args = parser.parse_args()
+
+    from app import app, job_queue
+
+    with app.app_context():
+        if args.once:
+            print(f'Ran {job_queue.run_pending()} jobs')
+            return
+        logger.info('Working the job queue (poll every %ss)', job_queue.poll_interval)
+        try:
+            while True:
+                if not job_queue.run_pending():
+                    time.sleep(job_queue.poll_interval)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Schema migrations create_all can't do on an existing database.
+
+Money columns (money.py) used to be FLOAT columns holding rupees.
+migrate_money_columns converts every such column still found in the database
+to BIGINT paise, multiplying the stored values by 100:
+
+- SQLite can't change a column's type, so each affected table is rebuilt:
+  the current definition is created as ``<table>__money``, the rows are
+  copied across with the amounts converted, and the old table is dropped
+  and the new one renamed into its place in the same transaction as the
+  copy. Its indexes are then recreated.
+- PostgreSQL converts in place with ``ALTER COLUMN ... TYPE BIGINT USING``.
+
+Tables whose money columns are already integers are left alone, so this is
+safe to run on every start; ``python app.py`` does. Other dialects stop the
+start with a RuntimeError if they have columns to convert.
+
+create_all skips tables that already exist, so create_missing_indexes adds
+the indexes declared on the models since the database was created, then
+ANALYZEs those tables so the planner has statistics for them. On a large
+PostgreSQL table, create the index beforehand with ``CREATE INDEX
+CONCURRENTLY`` under the same name to avoid locking writes; it is then
+skipped here.
+
+Id columns (guid.py) are not converted: check_id_storage stops the app
+starting against a database whose ids are stored differently from
+``ID_STORAGE``, rather than let it write ids the existing rows can't match.
+
+    python migrations.py
+"""
+import logging
+
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.types import Integer, String
+
+from guid import GUID
+from money import PAISE_PER_RUPEE, Money
+
+logger = logging.getLogger('payment-backend')
+
+
+def money_columns(table):
+    return [column.name for column in table.columns if isinstance(column.type, Money)]
+
+
+def tables_to_migrate(db, connection):
+    """(table, names of its money columns still stored as rupees) for each such table"""
+    inspector = inspect(connection)
+    pending = []
+    for table in db.metadata.sorted_tables:
+        names = money_columns(table)
+        if not names or not inspector.has_table(table.name):
+            continue
+        types = {column['name']: column['type'] for column in inspector.get_columns(table.name)}
+        legacy = [name for name in names if name in types and not isinstance(types[name], Integer)]
+        if legacy:
+            pending.append((table, legacy))
+    return pending
+
+
+def _rebuild_sqlite_table(connection, table, legacy):
+    preparer = connection.dialect.identifier_preparer
+    name = preparer.quote(table.name)
+    temporary = f'{table.name}__money'
+    existing = {column['name'] for column in inspect(connection).get_columns(table.name)}
+    columns, values = [], []
+    for column in table.columns:
+        if column.name not in existing:
+            continue
+        quoted = preparer.quote(column.name)
+        columns.append(quoted)
+        values.append(f'CAST(ROUND({quoted} * {PAISE_PER_RUPEE}) AS INTEGER)'
+                      if column.name in legacy else quoted)
+
+    connection.exec_driver_sql(f'DROP TABLE IF EXISTS {preparer.quote(temporary)}')
+    create = str(CreateTable(table).compile(dialect=connection.dialect))
+    connection.exec_driver_sql(create.replace(f'CREATE TABLE {name}', f'CREATE TABLE {preparer.quote(temporary)}', 1))
+    connection.exec_driver_sql(
+        f'INSERT INTO {preparer.quote(temporary)} ({", ".join(columns)}) '
+        f'SELECT {", ".join(values)} FROM {name}'
+    )
+    # Dropping the old table drops its indexes and triggers too; the indexes
+    # are recreated below, the triggers by db.create_all()
+    connection.exec_driver_sql(f'DROP TABLE {name}')
+    # Other tables' triggers name this one; rename without checking them
+    # while it's missing
+    connection.exec_driver_sql('PRAGMA legacy_alter_table=ON')
+    connection.exec_driver_sql(f'ALTER TABLE {preparer.quote(temporary)} RENAME TO {name}')
+    connection.exec_driver_sql('PRAGMA legacy_alter_table=OFF')
+
+
+def _alter_postgresql_table(connection, table, legacy):
+    preparer = connection.dialect.identifier_preparer
+    changes = ', '.join(
+        f'ALTER COLUMN {preparer.quote(name)} TYPE BIGINT '
+        f'USING ROUND({preparer.quote(name)} * {PAISE_PER_RUPEE})::BIGINT'
+        for name in legacy
+    )
+    connection.exec_driver_sql(f'ALTER TABLE {preparer.quote(table.name)} {changes}')
+
+
+def check_id_storage(db):
+    """Raise RuntimeError if existing id columns don't match the models' GUID storage"""
+    with db.engine.connect() as connection:
+        inspector = inspect(connection)
+        for table in db.metadata.sorted_tables:
+            guids = {column.name: column.type for column in table.columns if isinstance(column.type, GUID)}
+            if not guids or not inspector.has_table(table.name):
+                continue
+            for column in inspector.get_columns(table.name):
+                if column['name'] in guids and isinstance(column['type'], String) == guids[column['name']].binary:
+                    stored = 'text' if isinstance(column['type'], String) else 'binary'
+                    raise RuntimeError(
+                        f'{table.name}.{column["name"]} stores ids as {stored}; set ID_STORAGE={stored} '
+                        f'or point DATABASE_URL at a new database')
+
+
+def create_missing_indexes(db):
+    """Create declared indexes the database doesn't have; returns their names"""
+    engine = db.engine
+    created = []
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {index['name'] for index in inspector.get_indexes(table.name)}
+            missing = [index for index in table.indexes if index.name not in existing]
+            for index in missing:
+                index.create(connection)
+                created.append(index.name)
+                logger.info('Created index %s on %s', index.name, table.name)
+            if missing:
+                connection.exec_driver_sql(f'ANALYZE {connection.dialect.identifier_preparer.quote(table.name)}')
+    return created
+
+
+# How each dialect converts a table's money columns
+MONEY_MIGRATIONS = {
+    'sqlite': _rebuild_sqlite_table,
+    'postgresql': _alter_postgresql_table,
+}
+
+
+def migrate_money_columns(db):
+    """Convert rupee FLOAT money columns to BIGINT paise; returns the tables migrated
+
+    Raises RuntimeError, before changing anything, if the database has
+    columns to convert and its dialect has no migration.
+    """
+    engine = db.engine
+    migrate = MONEY_MIGRATIONS.get(engine.dialect.name)
+    with engine.connect() as connection:
+        pending = tables_to_migrate(db, connection)
+    if not pending:
+        return []
+    if migrate is None:
+        raise RuntimeError(
+            f'unsupported dialect {engine.dialect.name} for the money column migration; convert '
+            f'{", ".join(table.name for table, _ in pending)} to integer paise by hand, or use '
+            f'{" or ".join(MONEY_MIGRATIONS)}')
+
+    with engine.begin() as connection:
+        if engine.dialect.name == 'sqlite':
+            # Keep foreign keys pointing at the rebuilt tables by name
+            connection.exec_driver_sql('PRAGMA foreign_keys=OFF')
+        for table, legacy in pending:
+            migrate(connection, table, legacy)
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+            logger.info('Stored %s.%s as integer paise', table.name, ', '.join(legacy))
+    return [table.name for table, _ in pending]
+
+
+def main():
+    from app import app, db
+
+    with app.app_context():
+        migrated = migrate_money_columns(db)
+        indexes = create_missing_indexes(db)
+    print(f'Migrated {", ".join(migrated)}' if migrated else 'Nothing to migrate')
+    if indexes:
+        print(f'Created {", ".join(indexes)}')
+
+
+if __name__ == '__main__':
+    main()
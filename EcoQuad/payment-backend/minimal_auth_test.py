@@ -16,6 +16,7 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = 'test-secret'
 app.config['JWT_SECRET_KEY'] = 'jwt-secret'
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = False
+app.config['BCRYPT_LOG_ROUNDS'] = 4  # cheap hashes for local testing
 
 db = SQLAlchemy(app)
 bcrypt = Bcrypt(app)
@@ -1,24 +1,36 @@
 from datetime import datetime
-import uuid
 
-# Global registry to store models once they're created
-_models_created = False
-_User = None
-_GreenBond = None
-_Project = None
-_Investment = None
+from flask import current_app
+from sqlalchemy import func, literal, select, update
+from sqlalchemy.orm import joinedload
+
+from guid import GUID, new_id
+from hashing import get_hasher
+from money import Money
+
+# Registry of models already created, keyed by the SQLAlchemy instance they
+# belong to (scripts such as minimal_auth_test.py build their own instance)
+_registry = {}
 
 def create_models(db):
     """Create all database models with the provided db instance"""
-    global _models_created, _User, _GreenBond, _Project, _Investment
-    
-    if _models_created:
-        return _User, _GreenBond, _Project, _Investment
+    models = get_models(db)
+    return models['User'], models['GreenBond'], models['Project'], models['Investment']
+
+def get_models(db):
+    """All models for the provided db instance, by class name"""
+    if db not in _registry:
+        _registry[db] = _define_models(db)
+    return _registry[db]
+
+def _define_models(db):
+    # Money columns store integer paise and read back as rupees (money.py);
+    # GUID columns hold ids as text or 16 bytes per ID_STORAGE (guid.py)
     
     class User(db.Model):
         __tablename__ = 'users'
         
-        id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+        id = db.Column(GUID, primary_key=True, default=new_id)
         email = db.Column(db.String(120), unique=True, nullable=False, index=True)
         password_hash = db.Column(db.String(128), nullable=False)
         first_name = db.Column(db.String(50), nullable=False)
@@ -35,16 +47,16 @@ def create_models(db):
         issued_bonds = db.relationship('GreenBond', backref='issuer', lazy=True)
         
         def set_password(self, password):
-            """Hash and set password"""
-            from flask_bcrypt import Bcrypt
-            bcrypt = Bcrypt()
-            self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+            """Hash and set password (runs on the password hashing pool)"""
+            self.password_hash = get_hasher(current_app).hash(password)
         
         def check_password(self, password):
-            """Check if provided password matches hash"""
-            from flask_bcrypt import Bcrypt
-            bcrypt = Bcrypt()
-            return bcrypt.check_password_hash(self.password_hash, password)
+            """Check if provided password matches hash (runs on the password hashing pool)"""
+            return get_hasher(current_app).check(self.password_hash, password)
+        
+        def password_needs_rehash(self):
+            """Check if the stored hash uses a different cost than BCRYPT_LOG_ROUNDS"""
+            return get_hasher(current_app).needs_rehash(self.password_hash)
         
         def to_dict(self):
             """Convert user to dictionary for JSON serialization"""
@@ -67,20 +79,32 @@ def create_models(db):
 
     class GreenBond(db.Model):
         __tablename__ = 'green_bonds'
+        # Marketplace listing (bonds.py): filter by status, keyset-paginate by
+        # (sort column, id)
+        __table_args__ = (
+            db.Index('ix_green_bonds_status_created_at', 'status', 'created_at', 'id'),
+            db.Index('ix_green_bonds_status_bond_name', 'status', 'bond_name', 'id'),
+            db.Index('ix_green_bonds_status_coupon_rate', 'status', 'coupon_rate', 'id'),
+            db.Index('ix_green_bonds_status_maturity_date', 'status', 'maturity_date', 'id'),
+            db.Index('ix_green_bonds_status_minimum_investment', 'status', 'minimum_investment', 'id'),
+            db.Index('ix_green_bonds_status_total_amount', 'status', 'total_amount', 'id'),
+            # An issuer's bonds, optionally by status
+            db.Index('ix_green_bonds_issuer_id_status', 'issuer_id', 'status'),
+        )
         
-        id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-        issuer_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
+        id = db.Column(GUID, primary_key=True, default=new_id)
+        issuer_id = db.Column(GUID, db.ForeignKey('users.id'), nullable=False)
         bond_name = db.Column(db.String(200), nullable=False)
         isin = db.Column(db.String(20), unique=True, nullable=False)
         bond_type = db.Column(db.String(50), nullable=False)
-        face_value = db.Column(db.Float, nullable=False)
+        face_value = db.Column(Money, nullable=False)
         coupon_rate = db.Column(db.Float, nullable=False)
         maturity_date = db.Column(db.Date, nullable=False)
         issue_date = db.Column(db.Date, nullable=False)
         currency = db.Column(db.String(3), default='INR')
-        minimum_investment = db.Column(db.Float, nullable=False)
-        total_amount = db.Column(db.Float, nullable=False)
-        amount_raised = db.Column(db.Float, default=0)
+        minimum_investment = db.Column(Money, nullable=False)
+        total_amount = db.Column(Money, nullable=False)
+        amount_raised = db.Column(Money, default=0)
         risk_rating = db.Column(db.String(10), nullable=False)
         status = db.Column(db.String(20), default='draft')
         description = db.Column(db.Text, nullable=False)
@@ -90,8 +114,67 @@ def create_models(db):
         investments = db.relationship('Investment', backref='bond', lazy=True)
         projects = db.relationship('Project', backref='bond', lazy=True)
         
-        def to_dict(self):
-            """Convert bond to dictionary for JSON serialization"""
+        @staticmethod
+        def list_loader_options():
+            """Loader options for serializing many bonds with to_dict()
+            
+            Issuer names come in through a join, so a page of bonds costs a
+            fixed number of queries instead of one per bond.
+            """
+            return (joinedload(GreenBond.issuer).load_only(User.first_name, User.last_name),)
+        
+        @staticmethod
+        def add_raised(bond_id, amount):
+            """Add amount (rupees) to amount_raised in one UPDATE unless it would pass total_amount
+            
+            Returns False, changing nothing, if the bond can't take the amount.
+            The row is locked only from this statement to the caller's commit,
+            so run it last in the transaction. The issuer's summary rows (see
+            issuer.py) are updated with it, since this bypasses the ORM hooks.
+            """
+            raised = func.coalesce(GreenBond.amount_raised, 0) + amount
+            result = db.session.execute(
+                update(GreenBond)
+                .where(GreenBond.id == bond_id, raised <= GreenBond.total_amount)
+                .values(amount_raised=raised)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount != 1:
+                return False
+            issuer_id = select(GreenBond.issuer_id).where(GreenBond.id == bond_id).scalar_subquery()
+            status = select(GreenBond.status).where(GreenBond.id == bond_id).scalar_subquery()
+            for model, scope in ((IssuerSummary, ()), (IssuerBondStatus, (IssuerBondStatus.status == status,))):
+                db.session.execute(
+                    update(model)
+                    .where(model.issuer_id == issuer_id, *scope)
+                    .values(amount_raised=model.amount_raised + amount)
+                    .execution_options(synchronize_session=False)
+                )
+            return True
+        
+        @staticmethod
+        def project_categories(bond_ids):
+            """Sorted project types of many bonds in one query"""
+            categories = {bond_id: [] for bond_id in bond_ids}
+            if not categories:
+                return categories
+            rows = (
+                db.session.query(Project.bond_id, Project.project_type)
+                .filter(Project.bond_id.in_(list(categories)))
+                .distinct()
+                .order_by(Project.bond_id, Project.project_type)
+                .all()
+            )
+            for bond_id, project_type in rows:
+                categories[bond_id].append(project_type)
+            return categories
+        
+        def to_dict(self, project_categories=()):
+            """Convert bond to dictionary for JSON serialization
+            
+            Runs no queries of its own: load bonds with list_loader_options()
+            and pass each bond's entry from project_categories().
+            """
             return {
                 'id': self.id,
                 'issuerId': self.issuer_id,
@@ -113,16 +196,20 @@ def create_models(db):
                 'createdAt': self.created_at.isoformat(),
                 'greenCertification': [],
                 'useOfProceeds': [],
-                'projectCategories': [],
+                'projectCategories': list(project_categories),
                 'impactTargets': [],
                 'documents': []
             }
 
     class Project(db.Model):
         __tablename__ = 'projects'
+        # A bond's projects; covers the project types the bond listing loads
+        __table_args__ = (
+            db.Index('ix_projects_bond_id_project_type', 'bond_id', 'project_type'),
+        )
         
-        id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-        bond_id = db.Column(db.String(36), db.ForeignKey('green_bonds.id'), nullable=False)
+        id = db.Column(GUID, primary_key=True, default=new_id)
+        bond_id = db.Column(GUID, db.ForeignKey('green_bonds.id'), nullable=False)
         project_name = db.Column(db.String(200), nullable=False)
         project_type = db.Column(db.String(50), nullable=False)
         description = db.Column(db.Text, nullable=False)
@@ -132,9 +219,9 @@ def create_models(db):
         start_date = db.Column(db.Date, nullable=False)
         expected_completion_date = db.Column(db.Date, nullable=False)
         actual_completion_date = db.Column(db.Date, nullable=True)
-        total_budget = db.Column(db.Float, nullable=False)
-        allocated_funds = db.Column(db.Float, default=0)
-        spent_funds = db.Column(db.Float, default=0)
+        total_budget = db.Column(Money, nullable=False)
+        allocated_funds = db.Column(Money, default=0)
+        spent_funds = db.Column(Money, default=0)
         status = db.Column(db.String(20), default='planning')
         created_at = db.Column(db.DateTime, default=datetime.utcnow)
         
@@ -166,18 +253,25 @@ def create_models(db):
 
     class Investment(db.Model):
         __tablename__ = 'investments'
+        # An investor's positions (portfolio analytics and rebuilds) and a
+        # bond's investors (counted without reading rows), both filtered on
+        # status
+        __table_args__ = (
+            db.Index('ix_investments_investor_id_status', 'investor_id', 'status'),
+            db.Index('ix_investments_bond_id_status_investor_id', 'bond_id', 'status', 'investor_id'),
+        )
         
-        id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-        investor_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False)
-        bond_id = db.Column(db.String(36), db.ForeignKey('green_bonds.id'), nullable=False)
-        investment_amount = db.Column(db.Float, nullable=False)
-        purchase_price = db.Column(db.Float, nullable=False)
+        id = db.Column(GUID, primary_key=True, default=new_id)
+        investor_id = db.Column(GUID, db.ForeignKey('users.id'), nullable=False)
+        bond_id = db.Column(GUID, db.ForeignKey('green_bonds.id'), nullable=False)
+        investment_amount = db.Column(Money, nullable=False)
+        purchase_price = db.Column(Money, nullable=False)
         purchase_date = db.Column(db.Date, nullable=False)
         status = db.Column(db.String(20), default='pending')
         transaction_id = db.Column(db.String(100), nullable=True)
-        fees = db.Column(db.Float, default=0)
-        expected_return = db.Column(db.Float, nullable=False)
-        maturity_value = db.Column(db.Float, nullable=False)
+        fees = db.Column(Money, default=0)
+        expected_return = db.Column(Money, nullable=False)
+        maturity_value = db.Column(Money, nullable=False)
         created_at = db.Column(db.DateTime, default=datetime.utcnow)
         
         def to_dict(self):
@@ -197,11 +291,255 @@ def create_models(db):
                 'createdAt': self.created_at.isoformat()
             }
     
-    # Store the models globally
-    _User = User
-    _GreenBond = GreenBond
-    _Project = Project
-    _Investment = Investment
-    _models_created = True
+    class PortfolioSummary(db.Model):
+        """Per-investor portfolio totals, maintained incrementally by portfolio.py"""
+        __tablename__ = 'portfolio_summaries'
+        
+        investor_id = db.Column(GUID, db.ForeignKey('users.id'), primary_key=True)
+        position_count = db.Column(db.Integer, nullable=False, default=0)
+        total_invested = db.Column(Money, nullable=False, default=0)
+        total_fees = db.Column(Money, nullable=False, default=0)
+        expected_return = db.Column(Money, nullable=False, default=0)
+        maturity_value = db.Column(Money, nullable=False, default=0)
+        updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    class PortfolioAllocation(db.Model):
+        """Per-investor totals by bond type, risk rating and maturity year"""
+        __tablename__ = 'portfolio_allocations'
+        
+        investor_id = db.Column(GUID, db.ForeignKey('users.id'), primary_key=True)
+        dimension = db.Column(db.String(20), primary_key=True)
+        bucket = db.Column(db.String(50), primary_key=True)
+        position_count = db.Column(db.Integer, nullable=False, default=0)
+        amount = db.Column(Money, nullable=False, default=0)
+        maturity_value = db.Column(Money, nullable=False, default=0)
+    
+    class IssuerSummary(db.Model):
+        """Per-issuer bond and project totals, maintained incrementally by issuer.py"""
+        __tablename__ = 'issuer_summaries'
+        
+        issuer_id = db.Column(GUID, db.ForeignKey('users.id'), primary_key=True)
+        bond_count = db.Column(db.Integer, nullable=False, default=0)
+        total_amount = db.Column(Money, nullable=False, default=0)
+        amount_raised = db.Column(Money, nullable=False, default=0)
+        project_count = db.Column(db.Integer, nullable=False, default=0)
+        total_budget = db.Column(Money, nullable=False, default=0)
+        allocated_funds = db.Column(Money, nullable=False, default=0)
+        spent_funds = db.Column(Money, nullable=False, default=0)
+        updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    class IssuerBondStatus(db.Model):
+        """Per-issuer bond totals by bond status"""
+        __tablename__ = 'issuer_bond_statuses'
+        
+        issuer_id = db.Column(GUID, db.ForeignKey('users.id'), primary_key=True)
+        status = db.Column(db.String(20), primary_key=True)
+        bond_count = db.Column(db.Integer, nullable=False, default=0)
+        total_amount = db.Column(Money, nullable=False, default=0)
+        amount_raised = db.Column(Money, nullable=False, default=0)
+    
+    class ImpactReading(db.Model):
+        """One sensor reading for a project, appended by impact.py and never updated"""
+        __tablename__ = 'impact_readings'
+        
+        # Integer rowid keys and Unix-second timestamps keep the table append-only
+        # and each row small; the API reads impact_rollups, so there are no
+        # secondary indexes to maintain on ingest
+        id = db.Column(db.Integer, primary_key=True)
+        project_id = db.Column(GUID, db.ForeignKey('projects.id'), nullable=False)
+        metric_type = db.Column(db.String(30), nullable=False)
+        recorded_at = db.Column(db.BigInteger, nullable=False)  # Unix seconds, UTC
+        value = db.Column(db.Float, nullable=False)
+    
+    class ImpactRollup(db.Model):
+        """Readings of one project and metric aggregated over an hour, day or month"""
+        __tablename__ = 'impact_rollups'
+        # Clustered on the key, so a series is one range read
+        __table_args__ = {'sqlite_with_rowid': False}
+        
+        project_id = db.Column(GUID, db.ForeignKey('projects.id'), primary_key=True)
+        metric_type = db.Column(db.String(30), primary_key=True)
+        period = db.Column(db.String(5), primary_key=True)  # hour, day or month
+        bucket = db.Column(db.BigInteger, primary_key=True)  # start of the period, Unix seconds
+        reading_count = db.Column(db.Integer, nullable=False)
+        total = db.Column(db.Float, nullable=False)
+        minimum = db.Column(db.Float, nullable=False)
+        maximum = db.Column(db.Float, nullable=False)
+        last_value = db.Column(db.Float, nullable=False)
+        last_at = db.Column(db.BigInteger, nullable=False)
+    
+    class BondImpact(db.Model):
+        """Impact of a bond's projects and the amount it is shared over, as of the last attribution"""
+        __tablename__ = 'bond_impacts'
+        
+        bond_id = db.Column(GUID, db.ForeignKey('green_bonds.id'), primary_key=True)
+        metric_type = db.Column(db.String(30), primary_key=True)
+        value = db.Column(db.Float, nullable=False)
+        amount_raised = db.Column(Money, nullable=False, default=0)
+    
+    class ImpactAttribution(db.Model):
+        """An investor's pro-rata share of one metric over their bonds, maintained by attribution.py"""
+        __tablename__ = 'impact_attributions'
+        # Clustered on the key, so an investor's metrics are one range read
+        __table_args__ = {'sqlite_with_rowid': False}
+        
+        investor_id = db.Column(GUID, db.ForeignKey('users.id'), primary_key=True)
+        metric_type = db.Column(db.String(30), primary_key=True)
+        value = db.Column(db.Float, nullable=False)
+    
+    class AttributionQueue(db.Model):
+        """Bond whose impact or investments changed since attribution last ran"""
+        __tablename__ = 'attribution_queue'
+        
+        # Append-only, so concurrent writers for one bond never touch the same
+        # row; a bond queued several times is refreshed once
+        id = db.Column(db.Integer, primary_key=True)
+        bond_id = db.Column(GUID, db.ForeignKey('green_bonds.id'), nullable=False, index=True)
+        queued_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+        
+        @staticmethod
+        def add(connection, bond_ids=None, project_ids=None):
+            """Queue bonds, given by id or by their projects' ids, in the caller's transaction"""
+            table = AttributionQueue.__table__
+            now = datetime.utcnow()
+            ids = list(set(project_ids if project_ids is not None else bond_ids))
+            # A few hundred ids per statement, well under SQLite's bound parameter limit
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                if project_ids is not None:
+                    connection.execute(table.insert().from_select(['bond_id', 'queued_at'], select(
+                        Project.bond_id, literal(now, db.DateTime)
+                    ).where(Project.id.in_(chunk)).distinct()))
+                else:
+                    connection.execute(table.insert(), [{'bond_id': bond_id, 'queued_at': now} for bond_id in chunk])
+    
+    class SearchDocument(db.Model):
+        """The bond or project behind a row of the SQLite full-text index (see search.py)"""
+        __tablename__ = 'search_documents'
+        
+        # The FTS5 rowid; green_bonds and projects have no stable integer key
+        id = db.Column(db.Integer, primary_key=True)
+        kind = db.Column(db.String(10), nullable=False)  # bond or project
+        ref_id = db.Column(GUID, nullable=False, unique=True)
+    
+    class PaymentOrder(db.Model):
+        """Razorpay order created for an idempotency key, replayed to repeat requests"""
+        __tablename__ = 'payment_orders'
+        
+        id = db.Column(GUID, primary_key=True, default=new_id)
+        idempotency_key = db.Column(db.String(255), unique=True, nullable=False)
+        fingerprint = db.Column(db.String(64), nullable=False)
+        receipt = db.Column(db.String(40), nullable=False)
+        amount = db.Column(db.Integer, nullable=False)  # paise
+        currency = db.Column(db.String(3), nullable=False, default='INR')
+        status = db.Column(db.String(20), nullable=False, default='pending')
+        razorpay_order_id = db.Column(db.String(64), nullable=True, index=True)
+        order_data = db.Column(db.Text, nullable=True)  # gateway response, JSON
+        created_at = db.Column(db.DateTime, default=datetime.utcnow)
+        updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+        
+        def to_dict(self):
+            """Convert payment order to dictionary for JSON serialization"""
+            return {
+                'id': self.id,
+                'receipt': self.receipt,
+                'amount': self.amount,
+                'currency': self.currency,
+                'status': self.status,
+                'razorpayOrderId': self.razorpay_order_id,
+                'createdAt': self.created_at.isoformat()
+            }
+    
+    class Payment(db.Model):
+        """Verified Razorpay payment and the Investment it was fulfilled into"""
+        __tablename__ = 'payments'
+        
+        id = db.Column(GUID, primary_key=True, default=new_id)
+        razorpay_payment_id = db.Column(db.String(64), unique=True, nullable=False)
+        razorpay_order_id = db.Column(db.String(64), nullable=False, index=True)
+        investor_id = db.Column(GUID, db.ForeignKey('users.id'), nullable=True)
+        bond_id = db.Column(GUID, db.ForeignKey('green_bonds.id'), nullable=True)
+        amount = db.Column(db.Integer, nullable=True)  # paise, filled in from the order
+        currency = db.Column(db.String(3), nullable=True)
+        status = db.Column(db.String(20), nullable=False, default='verified')
+        investment_id = db.Column(GUID, db.ForeignKey('investments.id'), nullable=True)
+        created_at = db.Column(db.DateTime, default=datetime.utcnow)
+        updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+        
+        def to_dict(self):
+            """Convert payment to dictionary for JSON serialization"""
+            return {
+                'id': self.id,
+                'razorpayPaymentId': self.razorpay_payment_id,
+                'razorpayOrderId': self.razorpay_order_id,
+                'investorId': self.investor_id,
+                'bondId': self.bond_id,
+                'amount': self.amount,
+                'currency': self.currency,
+                'status': self.status,
+                'investmentId': self.investment_id,
+                'createdAt': self.created_at.isoformat()
+            }
+    
+    class WebhookEvent(db.Model):
+        """Razorpay webhook event already processed, for deduplicating redeliveries"""
+        __tablename__ = 'webhook_events'
+        
+        id = db.Column(db.String(64), primary_key=True)  # X-Razorpay-Event-Id
+        event = db.Column(db.String(50), nullable=False)
+        razorpay_payment_id = db.Column(db.String(64), nullable=True)
+        received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    class Job(db.Model):
+        """Background job, claimed and retried by jobs.JobQueue"""
+        __tablename__ = 'jobs'
+        # Workers poll for due jobs by (status, run_at)
+        __table_args__ = (
+            db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+        )
+        
+        id = db.Column(GUID, primary_key=True, default=new_id)
+        kind = db.Column(db.String(50), nullable=False)
+        payload = db.Column(db.Text, nullable=False)  # JSON
+        status = db.Column(db.String(20), nullable=False, default='queued')
+        attempts = db.Column(db.Integer, nullable=False, default=0)
+        max_attempts = db.Column(db.Integer, nullable=False, default=5)
+        run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+        locked_until = db.Column(db.DateTime, nullable=True)
+        last_error = db.Column(db.Text, nullable=True)
+        created_at = db.Column(db.DateTime, default=datetime.utcnow)
+        updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+        
+        def to_dict(self):
+            """Convert job to dictionary for JSON serialization"""
+            return {
+                'id': self.id,
+                'kind': self.kind,
+                'status': self.status,
+                'attempts': self.attempts,
+                'maxAttempts': self.max_attempts,
+                'runAt': self.run_at.isoformat(),
+                'lastError': self.last_error,
+                'createdAt': self.created_at.isoformat()
+            }
     
-    return User, GreenBond, Project, Investment
\ No newline at end of file
+    return {
+        'User': User,
+        'GreenBond': GreenBond,
+        'Project': Project,
+        'Investment': Investment,
+        'PortfolioSummary': PortfolioSummary,
+        'PortfolioAllocation': PortfolioAllocation,
+        'IssuerSummary': IssuerSummary,
+        'IssuerBondStatus': IssuerBondStatus,
+        'ImpactReading': ImpactReading,
+        'ImpactRollup': ImpactRollup,
+        'BondImpact': BondImpact,
+        'ImpactAttribution': ImpactAttribution,
+        'AttributionQueue': AttributionQueue,
+        'SearchDocument': SearchDocument,
+        'PaymentOrder': PaymentOrder,
+        'Payment': Payment,
+        'WebhookEvent': WebhookEvent,
+        'Job': Job,
+    }
@@ -0,0 +1,103 @@
+"""
+Money as integer paise.
+
+Amounts are stored as whole paise in BIGINT columns (see Money), so SUM and
+GROUP BY in SQL are exact integer arithmetic and totals can't drift the way
+sums of floating-point rupees do. Models and the JSON API still speak
+rupees: Money converts at the column boundary, with integer and float fast
+paths that never go through Decimal.
+
+    to_paise(1500.5)      # 150050
+    to_paise('1500.50')   # 150050
+    to_rupees(150050)     # 1500.5
+"""
+import math
+from decimal import Decimal
+
+from sqlalchemy.sql import operators
+from sqlalchemy.types import BigInteger, TypeDecorator
+
+PAISE_PER_RUPEE = 100
+
+
+def to_paise(amount):
+    """Whole paise in an amount of rupees (int, float, numeric string or Decimal)
+
+    Floats are rounded to the nearest paisa, which is exact for any amount
+    written with at most two decimals. Strings are parsed digit by digit and
+    may not carry fractions of a paisa. Raises ValueError for anything that
+    isn't a finite amount.
+    """
+    kind = type(amount)
+    if kind is int:
+        return amount * PAISE_PER_RUPEE
+    if kind is float:
+        if not math.isfinite(amount):
+            raise ValueError(f'amount must be finite, not {amount!r}')
+        return round(amount * PAISE_PER_RUPEE)
+    if isinstance(amount, str):
+        return _parse_paise(amount)
+    if isinstance(amount, Decimal):
+        if not amount.is_finite():
+            raise ValueError(f'amount must be finite, not {amount!r}')
+        return int((amount * PAISE_PER_RUPEE).to_integral_value())
+    if isinstance(amount, bool) or not isinstance(amount, (int, float)):
+        raise ValueError(f'amount must be a number, not {amount!r}')
+    return to_paise(float(amount))
+
+
+def _parse_paise(text):
+    text = text.strip()
+    sign = -1 if text[:1] == '-' else 1
+    rupees, _, fraction = text.lstrip('+-').partition('.')
+    if not (rupees or fraction) or not (rupees or '0').isdigit() or (fraction and not fraction.isdigit()):
+        raise ValueError(f'amount must be a number, not {text!r}')
+    if len(fraction) > 2 and fraction[2:].strip('0'):
+        raise ValueError(f'amount has fractions of a paisa: {text!r}')
+    return sign * (int(rupees or 0) * PAISE_PER_RUPEE + int((fraction[:2] or '0').ljust(2, '0')))
+
+
+def to_rupees(paise):
+    """Rupees in a whole number of paise, as a float for JSON"""
+    return paise / PAISE_PER_RUPEE
+
+
+class Money(TypeDecorator):
+    """Rupee amount stored as integer paise
+
+    Values bound to the column, including literals compared with, added to
+    or subtracted from it in SQL, are converted with to_paise. Values read
+    back, including sums and differences of amounts, SUM() and COALESCE(),
+    come back as float rupees; multiplying or dividing an amount in SQL
+    gives plain paise.
+    """
+
+    impl = BigInteger
+    cache_ok = True
+
+    class Comparator(TypeDecorator.Comparator, BigInteger.Comparator):
+        def _adapt_expression(self, op, other_comparator):
+            # The sum or difference of two amounts is an amount, so
+            # ``amount_raised + 0 >= :low`` still binds low as rupees
+            if op in (operators.add, operators.sub) and isinstance(other_comparator.type, Money):
+                return op, self.type
+            return super()._adapt_expression(op, other_comparator)
+
+    comparator_factory = Comparator
+
+    def coerce_compared_value(self, op, value):
+        # Factors and divisors are plain numbers, not amounts
+        if op in (operators.mul, operators.truediv, operators.floordiv, operators.mod):
+            return self.impl_instance.coerce_compared_value(op, value)
+        return self
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else to_paise(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        # SUM(bigint) comes back as a Decimal on PostgreSQL
+        if type(value) is not int:
+            value = round(value)
+        return value / PAISE_PER_RUPEE
@@ -0,0 +1,235 @@
+"""
+Checkout endpoints: create a Razorpay order, poll an order queued with
+``Prefer: respond-async``, verify the payment the checkout returns and poll
+its fulfillment.
+
+    POST /create-order
+    GET  /create-order/<job_id>
+    POST /verify-payment
+    GET  /payments/<razorpay_payment_id>
+"""
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+import hashlib
+import logging
+import os
+import traceback
+
+from fulfillment import order_notes, record_verified_payment, stored_order
+from gateway import GatewayBusy
+from idempotency import IdempotencyInProgress, IdempotencyMismatch
+from models import get_models
+from money import to_paise, to_rupees
+
+payments_bp = Blueprint('payments', __name__)
+
+logger = logging.getLogger('payment-backend')
+
+# Bound once when the blueprint is registered (see auth.py)
+db = None
+GreenBond = None
+Payment = None
+payment_gateway = None
+order_idempotency = None
+job_queue = None
+RAZORPAY_KEY_ID = None
+
+@payments_bp.record_once
+def bind_models(state):
+    """Resolve models, the gateway, idempotency store and job queue for the app"""
+    global db, GreenBond, Payment, payment_gateway, order_idempotency, job_queue, RAZORPAY_KEY_ID
+    db = state.app.extensions['sqlalchemy']
+    models = get_models(db)
+    GreenBond = models['GreenBond']
+    Payment = models['Payment']
+    payment_gateway = state.app.extensions['payment_gateway']
+    order_idempotency = state.app.extensions['order_idempotency']
+    job_queue = state.app.extensions['job_queue']
+    RAZORPAY_KEY_ID = state.app.config['RAZORPAY_KEY_ID']
+    logger.info('Using Razorpay Key ID: %s', RAZORPAY_KEY_ID)
+
+
+def order_error_response(e):
+    """Map a failed Razorpay order call to a response"""
+    # Only reached on a failed call, by which point the gateway has loaded both
+    import requests
+    from razorpay.errors import GatewayError, ServerError
+
+    msg = str(e)
+    if isinstance(e, requests.exceptions.Timeout):
+        return jsonify({'error': 'gateway_timeout', 'message': 'Razorpay did not respond in time, please retry.'}), 504
+    if isinstance(e, requests.exceptions.ConnectionError):
+        return jsonify({'error': 'gateway_unavailable', 'message': 'Could not reach Razorpay, please retry.'}), 502
+    if isinstance(e, (GatewayError, ServerError)):
+        return jsonify({'error': 'gateway_error', 'message': msg}), 502
+    # detect authentication errors from Razorpay
+    if 'authentication' in msg.lower() or 'invalid key' in msg.lower() or '401' in msg:
+        # auth problem - return 401 with helpful message
+        return jsonify({'error': 'authentication_failed', 'message': 'Razorpay authentication failed. Check RAZORPAY_KEY_ID and RAZORPAY_KEY_SECRET in your .env and restart the server.'}), 401
+    return jsonify({'error': 'failed_to_create_order', 'message': msg}), 500
+
+
+def optional_identity():
+    """The JWT identity if the request carries a valid token, else None"""
+    try:
+        verify_jwt_in_request(optional=True)
+        return get_jwt_identity()
+    except Exception:
+        return None
+
+
+def pending_order_response(job_id):
+    response = jsonify({'status': 'pending', 'jobId': job_id})
+    response.headers['Location'] = f'/create-order/{job_id}'
+    response.headers['Retry-After'] = '1'
+    return response, 202
+
+
+def retry_later_response(error, message, status):
+    response = jsonify({'error': error, 'message': message})
+    response.headers['Retry-After'] = '1'
+    return response, status
+
+
+@payments_bp.route('/create-order', methods=['POST'])
+def create_order():
+    data = request.json or {}
+    amount = data.get('amount')
+    currency = data.get('currency', 'INR')
+    receipt = data.get('receipt')
+    if amount is None:
+        return jsonify({'error': 'amount is required'}), 400
+    try:
+        # Razorpay expects amount in paise (i.e., INR * 100)
+        amount_in_paise = to_paise(amount)
+    except ValueError:
+        return jsonify({'error': 'amount must be a number'}), 400
+
+    # Repeats of a keyed request get the order created the first time
+    key = request.headers.get('Idempotency-Key')
+    if key:
+        key = f'key:{key}'
+        # Retries without a receipt must still send the same one to Razorpay
+        receipt = receipt or f'rcpt_{hashlib.sha256(key.encode()).hexdigest()[:32]}'
+    elif receipt:
+        key = f'receipt:{receipt}'
+    else:
+        receipt = f'receipt_{os.urandom(6).hex()}'
+    if key and len(key) > 255:
+        return jsonify({'error': 'Idempotency-Key is too long'}), 400
+
+    # Turn away orders the bond can't take before the customer pays. Only
+    # advisory: fulfillment enforces the limit atomically (GreenBond.add_raised)
+    if data.get('bondId'):
+        bond = db.session.get(GreenBond, data['bondId'])
+        if bond is None:
+            return jsonify({'error': 'Bond not found'}), 404
+        remaining = to_paise(bond.total_amount) - to_paise(bond.amount_raised or 0)
+        if amount_in_paise > remaining:
+            return jsonify({'error': 'oversubscribed', 'remainingAmount': to_rupees(remaining)}), 409
+
+    try:
+        payload = {'amount': amount_in_paise, 'currency': currency, 'receipt': receipt, 'payment_capture': 1}
+        # Carried on the order so a payment.captured webhook can be fulfilled
+        # even if the checkout never calls /verify-payment
+        notes = {'bondId': data.get('bondId'), 'investorId': optional_identity()}
+        notes = {name: value for name, value in notes.items() if value}
+        if notes:
+            payload['notes'] = notes
+        offload = current_app.config['RAZORPAY_ORDER_MODE'] == 'async' or \
+            'respond-async' in request.headers.get('Prefer', '')
+        if offload:
+            if key:
+                status, result = order_idempotency.submit(key, payload, payment_gateway.submit_order)
+                if status == 'created':
+                    response = jsonify({'status': 'created', 'order': result, 'key': RAZORPAY_KEY_ID})
+                    response.headers['Idempotent-Replayed'] = 'true'
+                    return response
+                job_id = result
+            else:
+                job_id = payment_gateway.submit_order(payload)
+            logger.info('Queued order %s for %s paise (currency=%s, receipt=%s)', job_id, amount_in_paise, currency, receipt)
+            return pending_order_response(job_id)
+
+        logger.info('Creating order for %s paise (currency=%s, receipt=%s)', amount_in_paise, currency, receipt)
+        replayed = False
+        if key:
+            order, replayed = order_idempotency.create(key, payload, payment_gateway.create_order)
+        else:
+            order = payment_gateway.create_order(payload)
+        logger.info('Order %s: %s', 'replayed' if replayed else 'created',
+                    order.get('id') if isinstance(order, dict) else str(order))
+        response = jsonify({'order': order, 'key': RAZORPAY_KEY_ID})
+        if replayed:
+            response.headers['Idempotent-Replayed'] = 'true'
+        return response
+    except IdempotencyMismatch as e:
+        return jsonify({'error': 'idempotency_key_reused', 'message': str(e)}), 422
+    except IdempotencyInProgress as e:
+        return retry_later_response('in_progress', str(e), 409)
+    except GatewayBusy:
+        return retry_later_response('busy', 'Too many checkouts in progress, please retry shortly.', 503)
+    except Exception as e:
+        tb = traceback.format_exc()
+        logger.error('Failed to create order: %s\n%s', str(e), tb)
+        return order_error_response(e)
+
+
+@payments_bp.route('/create-order/<job_id>', methods=['GET'])
+def get_order_job(job_id):
+    # Poll an order queued with "Prefer: respond-async"
+    job = payment_gateway.job(job_id)
+    if job is None:
+        return jsonify({'error': 'unknown or expired job'}), 404
+    if job['status'] == 'pending':
+        return pending_order_response(job_id)
+    if job['status'] == 'failed':
+        return order_error_response(job['error'])
+    return jsonify({'status': 'created', 'order': job['order'], 'key': RAZORPAY_KEY_ID})
+
+
+@payments_bp.route('/verify-payment', methods=['POST'])
+def verify_payment():
+    # This endpoint verifies the signature from the frontend after payment
+    data = request.json or {}
+    try:
+        razorpay_payment_id = data['razorpay_payment_id']
+        razorpay_order_id = data['razorpay_order_id']
+        razorpay_signature = data['razorpay_signature']
+    except KeyError:
+        return jsonify({'error': 'missing payment data'}), 400
+
+    # Verify signature
+    try:
+        payment_gateway.verify_payment_signature(razorpay_order_id, razorpay_payment_id, razorpay_signature)
+    except Exception as e:
+        return jsonify({'error': 'verification failed', 'details': str(e)}), 400
+
+    # The bond comes from the order's notes when the job runs; a bondId in
+    # the body is only checked against orders created here
+    order = stored_order(db, razorpay_order_id)
+    if data.get('bondId') and order is not None and order_notes(order).get('bondId') != data['bondId']:
+        return jsonify({'error': 'bondId does not match the order'}), 400
+
+    # Record the payment and queue its fulfillment; the Investment is created
+    # off the request thread (see fulfillment.py)
+    try:
+        payment, job_id = record_verified_payment(
+            db, job_queue, razorpay_order_id, razorpay_payment_id, investor_id=optional_identity()
+        )
+        if job_id is not None:
+            job_queue.dispatch(job_id)
+            db.session.refresh(payment)
+        return jsonify({'status': 'verified', 'payment': payment.to_dict()})
+    except Exception as e:
+        logger.error('Failed to record payment %s: %s\n%s', razorpay_payment_id, str(e), traceback.format_exc())
+        return jsonify({'error': 'failed_to_record_payment', 'message': 'Payment verified but not recorded, please retry.'}), 500
+
+
+@payments_bp.route('/payments/<razorpay_payment_id>', methods=['GET'])
+def get_payment(razorpay_payment_id):
+    # Poll fulfillment of a verified payment: verified, then fulfilled or unmatched
+    payment = Payment.query.filter_by(razorpay_payment_id=razorpay_payment_id).first()
+    if payment is None:
+        return jsonify({'error': 'unknown payment'}), 404
+    return jsonify({'payment': payment.to_dict()})
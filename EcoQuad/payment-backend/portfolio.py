@@ -0,0 +1,395 @@
+from flask import Blueprint, request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import String, cast, event, extract, func, inspect, literal, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from datetime import date, datetime
+
+from impact import METRICS
+from models import get_models
+from replicas import read_only
+
+portfolio_bp = Blueprint('portfolio', __name__)
+
+# Bound once when the blueprint is registered (see auth.py)
+db = None
+GreenBond = None
+Investment = None
+PortfolioSummary = None
+PortfolioAllocation = None
+ImpactAttribution = None
+AttributionQueue = None
+
+# Investments in these statuses don't count towards a portfolio
+EXCLUDED_STATUSES = ('cancelled',)
+
+# Positions listed by GET /api/portfolio/analytics, largest first
+DEFAULT_POSITION_LIMIT = 100
+MAX_POSITION_LIMIT = 10000
+
+# Investment columns whose changes move the summary
+TRACKED_COLUMNS = ('investor_id', 'bond_id', 'status', 'investment_amount', 'fees',
+                   'expected_return', 'maturity_value')
+
+# GreenBond columns that pick a position's allocation buckets
+BUCKET_COLUMNS = ('bond_type', 'risk_rating', 'maturity_date')
+
+# Investment columns expected_return and maturity_value are computed from
+PROJECTION_COLUMNS = ('bond_id', 'investment_amount', 'purchase_price', 'purchase_date',
+                      'expected_return', 'maturity_value')
+
+# The investor dashboard's impactSummary fields, by metric type
+IMPACT_SUMMARY_FIELDS = {
+    'co2_reduction': 'co2Reduced',
+    'energy_generated': 'energyGenerated',
+    'water_saved': 'waterSaved',
+    'hectares_restored': 'hectaresRestored',
+}
+
+@portfolio_bp.record_once
+def bind_models(state):
+    """Resolve models and start maintaining summaries for the app's db instance"""
+    global db, GreenBond, Investment, PortfolioSummary, PortfolioAllocation, ImpactAttribution, AttributionQueue
+    db = state.app.extensions['sqlalchemy']
+    models = get_models(db)
+    GreenBond = models['GreenBond']
+    Investment = models['Investment']
+    PortfolioSummary = models['PortfolioSummary']
+    PortfolioAllocation = models['PortfolioAllocation']
+    ImpactAttribution = models['ImpactAttribution']
+    AttributionQueue = models['AttributionQueue']
+    for model, name, listener in ((Investment, 'before_insert', _fill_projections),
+                                  (Investment, 'after_insert', _after_insert),
+                                  (Investment, 'before_update', _before_update),
+                                  (Investment, 'before_delete', _before_delete),
+                                  (GreenBond, 'before_update', _bond_before_update)):
+        if not event.contains(model, name, listener):
+            event.listen(model, name, listener)
+
+def upsert_add(connection, table, keys, deltas, touch=None):
+    """Insert a row or add deltas to the existing one in a single statement"""
+    if connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        insert = sqlite_insert
+    stmt = insert(table).values(**keys, **deltas, **(touch or {}))
+    updates = {name: table.c[name] + stmt.excluded[name] for name in deltas}
+    updates.update(touch or {})
+    connection.execute(stmt.on_conflict_do_update(index_elements=list(keys), set_=updates))
+
+def buckets(bond):
+    """(dimension, bucket) of each allocation a position in bond counts towards"""
+    return (('bondType', bond.bond_type),
+            ('riskRating', bond.risk_rating),
+            ('maturityYear', str(bond.maturity_date.year)))
+
+def apply_position(connection, position, sign):
+    """Add (sign=1) or remove (sign=-1) one investment's contribution
+
+    The bond is also queued for impact attribution (see attribution.py).
+    """
+    if position['status'] in EXCLUDED_STATUSES:
+        return
+    AttributionQueue.add(connection, bond_ids=[position['bond_id']])
+    bond = connection.execute(
+        select(*[GreenBond.__table__.c[name] for name in BUCKET_COLUMNS])
+        .where(GreenBond.id == position['bond_id'])
+    ).one()
+
+    investor = {'investor_id': position['investor_id']}
+    amount = sign * (position['investment_amount'] or 0)
+    maturity_value = sign * (position['maturity_value'] or 0)
+
+    upsert_add(connection, PortfolioSummary.__table__, investor, {
+        'position_count': sign,
+        'total_invested': amount,
+        'total_fees': sign * (position['fees'] or 0),
+        'expected_return': sign * (position['expected_return'] or 0),
+        'maturity_value': maturity_value,
+    }, touch={'updated_at': datetime.utcnow()})
+
+    for dimension, bucket in buckets(bond):
+        upsert_add(connection, PortfolioAllocation.__table__,
+                   dict(investor, dimension=dimension, bucket=bucket),
+                   {'position_count': sign, 'amount': amount, 'maturity_value': maturity_value})
+
+def _fill_projections(mapper, connection, target):
+    """Compute expected_return/maturity_value from the bond, replacing any the caller set"""
+    # Imported on first use (see bonds.analytics_rows)
+    from analytics import position_projections
+
+    bond = connection.execute(
+        select(GreenBond.face_value, GreenBond.coupon_rate, GreenBond.issue_date, GreenBond.maturity_date)
+        .where(GreenBond.id == target.bond_id)
+    ).one()
+    expected_return, maturity_value = position_projections(
+        target.investment_amount, target.purchase_price, bond.face_value, bond.coupon_rate,
+        bond.issue_date, bond.maturity_date, target.purchase_date or date.today()
+    )
+    target.expected_return = round(float(expected_return[0]), 2)
+    target.maturity_value = round(float(maturity_value[0]), 2)
+
+def _after_insert(mapper, connection, target):
+    apply_position(connection, {name: getattr(target, name) for name in TRACKED_COLUMNS}, 1)
+
+def _before_update(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in PROJECTION_COLUMNS):
+        _fill_projections(mapper, connection, target)
+    if not any(state.attrs[name].history.has_changes() for name in TRACKED_COLUMNS):
+        return
+    # Read the old values from the row itself: an attribute that was expired
+    # when it was set has no old value in its history
+    table = Investment.__table__
+    old = connection.execute(
+        select(*[table.c[name] for name in TRACKED_COLUMNS]).where(table.c.id == target.id)
+    ).one()
+    apply_position(connection, dict(old._mapping), -1)
+    apply_position(connection, {name: getattr(target, name) for name in TRACKED_COLUMNS}, 1)
+
+def _before_delete(mapper, connection, target):
+    apply_position(connection, {name: getattr(target, name) for name in TRACKED_COLUMNS}, -1)
+
+def move_bucket(connection, bond_id, dimension, bucket, sign):
+    """Add (sign=1) or remove (sign=-1) every counted position in a bond to or from one bucket
+
+    One INSERT ... SELECT ... ON CONFLICT for all the bond's investors.
+    """
+    if connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        insert = sqlite_insert
+    table = PortfolioAllocation.__table__
+    # Negated in SQL: a -1 bound against a money column would be read as rupees
+    signed = (lambda column: column) if sign > 0 else (lambda column: -column)
+    stmt = insert(table).from_select(
+        ['investor_id', 'dimension', 'bucket', 'position_count', 'amount', 'maturity_value'],
+        select(
+            Investment.investor_id,
+            literal(dimension),
+            literal(bucket),
+            signed(func.count(Investment.id)),
+            signed(func.coalesce(func.sum(Investment.investment_amount), 0)),
+            signed(func.coalesce(func.sum(Investment.maturity_value), 0))
+        ).where(Investment.bond_id == bond_id, Investment.status.notin_(EXCLUDED_STATUSES))
+        .group_by(Investment.investor_id)
+    )
+    connection.execute(stmt.on_conflict_do_update(
+        index_elements=['investor_id', 'dimension', 'bucket'],
+        set_={name: table.c[name] + stmt.excluded[name] for name in ('position_count', 'amount', 'maturity_value')}))
+
+def _bond_before_update(mapper, connection, target):
+    """Move the bond's positions to its new buckets when it is re-rated, retyped or its maturity moves"""
+    state = inspect(target)
+    if not any(state.attrs[name].history.has_changes() for name in BUCKET_COLUMNS):
+        return
+    # Read the old values from the row itself (see _before_update)
+    table = GreenBond.__table__
+    old = connection.execute(
+        select(*[table.c[name] for name in BUCKET_COLUMNS]).where(table.c.id == target.id)
+    ).one()
+    for (dimension, before), (_, after) in zip(buckets(old), buckets(target)):
+        if before != after:
+            move_bucket(connection, target.id, dimension, before, -1)
+            move_bucket(connection, target.id, dimension, after, 1)
+
+def rebuild_portfolios(investor_ids=None):
+    """Recompute summaries from investments JOIN green_bonds with SQL aggregates
+
+    Rebuilds every investor when investor_ids is None. Used to backfill
+    investors whose investments predate the summary tables, or after bulk
+    loads that bypass the ORM.
+    """
+    summary_table = PortfolioSummary.__table__
+    allocation_table = PortfolioAllocation.__table__
+    counted = Investment.status.notin_(EXCLUDED_STATUSES)
+    scope = [counted]
+    if investor_ids is not None:
+        scope.append(Investment.investor_id.in_(investor_ids))
+        db.session.execute(summary_table.delete().where(summary_table.c.investor_id.in_(investor_ids)))
+        db.session.execute(allocation_table.delete().where(allocation_table.c.investor_id.in_(investor_ids)))
+    else:
+        db.session.execute(summary_table.delete())
+        db.session.execute(allocation_table.delete())
+
+    db.session.execute(summary_table.insert().from_select(
+        ['investor_id', 'position_count', 'total_invested', 'total_fees',
+         'expected_return', 'maturity_value', 'updated_at'],
+        select(
+            Investment.investor_id,
+            func.count(Investment.id),
+            func.coalesce(func.sum(Investment.investment_amount), 0),
+            func.coalesce(func.sum(Investment.fees), 0),
+            func.coalesce(func.sum(Investment.expected_return), 0),
+            func.coalesce(func.sum(Investment.maturity_value), 0),
+            literal(datetime.utcnow())
+        ).where(*scope).group_by(Investment.investor_id)
+    ))
+
+    for dimension, column in (('bondType', GreenBond.bond_type),
+                              ('riskRating', GreenBond.risk_rating),
+                              ('maturityYear', cast(extract('year', GreenBond.maturity_date), String))):
+        db.session.execute(allocation_table.insert().from_select(
+            ['investor_id', 'dimension', 'bucket', 'position_count', 'amount', 'maturity_value'],
+            select(
+                Investment.investor_id,
+                literal(dimension),
+                column,
+                func.count(Investment.id),
+                func.coalesce(func.sum(Investment.investment_amount), 0),
+                func.coalesce(func.sum(Investment.maturity_value), 0)
+            ).join(GreenBond, GreenBond.id == Investment.bond_id)
+            .where(*scope).group_by(Investment.investor_id, column)
+        ))
+
+    db.session.commit()
+
+def _bucket_list(rows, total):
+    return [{
+        'bucket': row.bucket,
+        'amount': row.amount,
+        'maturityValue': row.maturity_value,
+        'positionCount': row.position_count,
+        'share': round(row.amount / total * 100, 2) if total else 0
+    } for row in sorted(rows, key=lambda row: row.amount, reverse=True)]
+
+@portfolio_bp.route('/summary', methods=['GET'])
+@jwt_required()
+@read_only
+def get_summary():
+    """Portfolio totals, allocation and maturity ladder for the current investor"""
+    try:
+        investor_id = get_jwt_identity()
+        summary = PortfolioSummary.query.get(investor_id)
+        if summary is None:
+            # No positions yet. A read never writes (it may be on a replica);
+            # summaries are backfilled by create_tables and rebuild_portfolios
+            summary = PortfolioSummary(investor_id=investor_id, position_count=0, total_invested=0,
+                                       total_fees=0, expected_return=0, maturity_value=0)
+
+        allocations = {'bondType': [], 'riskRating': [], 'maturityYear': []}
+        for row in PortfolioAllocation.query.filter_by(investor_id=investor_id).all():
+            if row.position_count > 0:
+                allocations[row.dimension].append(row)
+
+        total = summary.total_invested
+        gains = summary.expected_return - total
+        return jsonify({
+            'summary': {
+                'portfolioValue': total,
+                'expectedReturns': summary.expected_return,
+                'totalGains': gains,
+                'returnPercentage': round(gains / total * 100, 4) if total else 0,
+                'maturityValue': summary.maturity_value,
+                'fees': summary.total_fees,
+                'positionCount': summary.position_count,
+                'updatedAt': summary.updated_at.isoformat() if summary.updated_at else None
+            },
+            'allocation': {
+                'bondType': _bucket_list(allocations['bondType'], total),
+                'riskRating': _bucket_list(allocations['riskRating'], total)
+            },
+            'maturityLadder': [{
+                'year': int(row.bucket),
+                'amount': row.amount,
+                'maturityValue': row.maturity_value,
+                'positionCount': row.position_count
+            } for row in sorted(allocations['maturityYear'], key=lambda row: row.bucket)]
+        }), 200
+
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Portfolio summary error: {str(e)}')
+        return jsonify({'error': 'Failed to get portfolio summary'}), 500
+
+@portfolio_bp.route('/impact', methods=['GET'])
+@jwt_required()
+@read_only
+def get_impact():
+    """The current investor's pro-rata share of their bonds' impact
+
+    Read from impact_attributions, as of the last attribution run (see
+    attribution.py).
+    """
+    try:
+        values = dict(db.session.execute(
+            select(ImpactAttribution.metric_type, ImpactAttribution.value)
+            .where(ImpactAttribution.investor_id == get_jwt_identity())
+        ).all())
+        return jsonify({
+            'impactSummary': {field: values.get(metric_type, 0)
+                              for metric_type, field in IMPACT_SUMMARY_FIELDS.items()},
+            'metrics': [{'metricType': metric_type, 'unit': METRICS[metric_type][0], 'value': value}
+                        for metric_type, value in sorted(values.items())]
+        }), 200
+
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Portfolio impact error: {str(e)}')
+        return jsonify({'error': 'Failed to get portfolio impact'}), 500
+
+@portfolio_bp.route('/analytics', methods=['GET'])
+@jwt_required()
+@read_only
+def get_analytics():
+    """Yield, duration and convexity across every position of the current investor
+
+    Positions are valued at their purchase price as of today; the portfolio
+    figures cover every position, weighted by market value. The per-position
+    breakdown lists the largest ``limit`` positions (default 100).
+    """
+    import numpy as np
+    from analytics import json_floats, portfolio_analytics
+
+    try:
+        investor_id = get_jwt_identity()
+        try:
+            limit = int(request.args.get('limit', DEFAULT_POSITION_LIMIT))
+        except ValueError:
+            return jsonify({'error': 'limit must be an integer'}), 400
+        limit = max(0, min(limit, MAX_POSITION_LIMIT))
+
+        positions = db.session.execute(
+            select(Investment.id, Investment.bond_id, Investment.investment_amount,
+                   Investment.purchase_price)
+            .where(Investment.investor_id == investor_id,
+                   Investment.status.notin_(EXCLUDED_STATUSES))
+        ).all()
+        if not positions:
+            return jsonify({'portfolio': None, 'positionCount': 0, 'positions': []}), 200
+
+        # Bond terms are loaded and converted once per bond, then fanned out
+        # to the positions by index
+        ids, bond_ids, amounts, prices = (list(column) for column in zip(*positions))
+        bonds = db.session.execute(
+            select(GreenBond.id, GreenBond.face_value, GreenBond.coupon_rate,
+                   GreenBond.issue_date, GreenBond.maturity_date)
+            .where(GreenBond.id.in_(set(bond_ids)))
+        ).all()
+        index = {bond.id: i for i, bond in enumerate(bonds)}
+        which = np.array([index[bond_id] for bond_id in bond_ids])
+        face = np.array([bond.face_value for bond in bonds], dtype=float)[which]
+        rate = np.array([bond.coupon_rate for bond in bonds], dtype=float)[which]
+        issue = np.array([bond.issue_date for bond in bonds], dtype='datetime64[D]')[which]
+        maturity = np.array([bond.maturity_date for bond in bonds], dtype='datetime64[D]')[which]
+
+        price = np.array(prices, dtype=float)
+        units = np.divide(np.array(amounts, dtype=float), price,
+                          out=np.zeros_like(price), where=price > 0)
+        result = portfolio_analytics(units, price, face, rate, issue, maturity, date.today())
+
+        largest = np.argsort(-result['marketValue'], kind='stable')[:limit]
+        columns = {name: json_floats(result[name][largest]) for name in
+                   ('marketValue', 'yieldToMaturity', 'macaulayDuration', 'modifiedDuration', 'convexity')}
+        return jsonify({
+            'portfolio': result['portfolio'],
+            'positionCount': len(ids),
+            'positions': [
+                dict(investmentId=ids[i], bondId=bond_ids[i],
+                     **{name: values[rank] for name, values in columns.items()})
+                for rank, i in enumerate(largest.tolist())
+            ]
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error(f'Portfolio analytics error: {str(e)}')
+        return jsonify({'error': 'Failed to compute portfolio analytics'}), 500
@@ -0,0 +1,38 @@
+"""
+Count the SQL statements a block of code runs.
+
+    with assert_max_queries(db.engine, 3):
+        client.get('/api/bonds')
+
+The tests use this to catch N+1 regressions in to_dict() callers: a list
+endpoint should run the same number of queries for 1 row as for 100.
+"""
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+
+@contextmanager
+def count_queries(engine):
+    """Collect every statement executed on engine inside the block"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+@contextmanager
+def assert_max_queries(engine, limit):
+    """Fail if the block runs more than limit statements on engine"""
+    with count_queries(engine) as statements:
+        yield statements
+    if len(statements) > limit:
+        raise AssertionError(
+            f'expected at most {limit} queries, ran {len(statements)}:\n' + '\n'.join(statements)
+        )
@@ -0,0 +1,73 @@
+"""
+Check the SQLite query plans of the SQL statements a block of code runs.
+
+    with assert_no_scans(db.engine):
+        client.get('/api/portfolio/analytics', headers=headers)
+
+Every query run inside the block (SELECTs, and the SELECT or WHERE of an
+INSERT, UPDATE or DELETE) is replayed with EXPLAIN QUERY PLAN, using
+the parameters it ran with. The block fails if any of them reads a whole
+table (``SCAN investments``), even through a covering index, or has SQLite
+build a throwaway index for it (``AUTOMATIC INDEX``). The tests use this to
+catch hot queries that lose their index.
+"""
+import re
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+_SCAN = re.compile(r'^SCAN (\w+)')
+_QUERIES = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+
+def explain(connection, statement, parameters=()):
+    """The plan's detail lines for statement, as SQLite reports them"""
+    # EXPLAIN is planned against the schema the connection last read, which
+    # misses indexes created or dropped since on other connections; reading
+    # sqlite_master brings it up to date
+    connection.exec_driver_sql('SELECT count(*) FROM sqlite_master').scalar()
+    rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+    return [row[-1] for row in rows]
+
+
+def scans(detail, allow=()):
+    """The steps in a plan that read a whole table or build an automatic index"""
+    found = []
+    for line in detail:
+        match = _SCAN.match(line)
+        if match and match.group(1) not in allow and match.group(1) != 'CONSTANT':
+            found.append(line)
+        elif 'AUTOMATIC' in line:
+            found.append(line)
+    return found
+
+
+@contextmanager
+def capture_queries(engine):
+    """Collect (statement, parameters) for every query executed once on engine inside the block"""
+    queries = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(_QUERIES):
+            queries.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield queries
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+@contextmanager
+def assert_no_scans(engine, allow=()):
+    """Fail if a query run on engine inside the block scans a table not in allow"""
+    with capture_queries(engine) as queries:
+        yield queries
+    failures = []
+    with engine.connect() as connection:
+        for statement, parameters in queries:
+            found = scans(explain(connection, statement, parameters), allow)
+            if found:
+                failures.append(f'{statement}\n  ' + '\n  '.join(found))
+    if failures:
+        raise AssertionError('query plans scan tables:\n' + '\n'.join(failures))
@@ -0,0 +1,163 @@
+"""
+Read-replica routing.
+
+Views decorated with ``@read_only`` (profile, token verification, bond
+listings, portfolio reads) send their SELECTs to one of the replicas in
+``DATABASE_REPLICA_URLS``; everything else, and every write, goes to the
+primary (``DATABASE_URL``). Without replicas configured the decorator does
+nothing.
+
+Replicas lag the primary, so a client that has just written reads from the
+primary for ``REPLICA_STICKY_SECONDS`` afterwards (read-your-writes):
+
+- the response to any request that wrote sets a ``db_primary_until`` cookie,
+  which holds in every server process;
+- the JWT identity that wrote is also remembered in this process, for clients
+  that don't keep cookies. Like the other in-process caches (cache.py) that
+  only covers requests served by the same worker.
+
+Within a request, once anything has been written the remaining queries stay
+on the primary too. SQLite replicas are opened with ``PRAGMA query_only`` so
+a write routed to one fails loudly; two SQLite files stand in for a primary
+and a replica in the tests.
+
+Configuration:
+
+- ``DATABASE_REPLICA_URLS``: comma-separated replica URLs (none by default)
+- ``REPLICA_STICKY_SECONDS``: how long a client reads from the primary after
+  writing (default 5)
+"""
+import functools
+import itertools
+import threading
+import time
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.sql.dml import UpdateBase
+
+from cache import TTLCache
+from engines import configure_engine, engine_options
+
+STICKY_COOKIE = 'db_primary_until'
+
+
+class RoutingSession(Session):
+    """Session that reads from the request's replica until it writes"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            if self._flushing or isinstance(clause, UpdateBase):
+                self.info['wrote'] = True
+            elif not self.info.get('wrote'):
+                replica = g.get('read_replica')
+                if replica is not None:
+                    return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _after_commit(session):
+    if session.info.get('wrote') and has_request_context():
+        g.wrote_primary = True
+
+
+def current_identity():
+    """The JWT identity if the request carries a valid token, else None"""
+    try:
+        verify_jwt_in_request(optional=True)
+        return get_jwt_identity()
+    except Exception:
+        return None
+
+
+class ReadReplicas:
+    """Replica engines and the per-client stickiness that keeps them consistent"""
+
+    def __init__(self, app=None, db=None):
+        self.engines = []
+        self.sticky_seconds = 5.0
+        self.recent_writers = TTLCache(maxsize=0)
+        self._next = itertools.count()
+        self._stats_lock = threading.Lock()
+        self.replica_reads = 0
+        self.primary_reads = 0
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.dispose()
+        urls = [url.strip() for url in (app.config.get('DATABASE_REPLICA_URLS') or '').split(',') if url.strip()]
+        self.engines = [self._make_engine(url, app.config) for url in urls]
+        self.sticky_seconds = float(app.config.get('REPLICA_STICKY_SECONDS', 5))
+        self.recent_writers = TTLCache(maxsize=int(app.config.get('USER_CACHE_SIZE', 10000)),
+                                       ttl=self.sticky_seconds)
+        if 'read_replicas' not in app.extensions:
+            app.after_request(self._mark_writer)
+        app.extensions['read_replicas'] = self
+
+    @staticmethod
+    def _make_engine(url, config):
+        config = dict(config, SQLALCHEMY_DATABASE_URI=url, SQLITE_SINGLE_WRITER=False)
+        engine = create_engine(url, **engine_options(config))
+        configure_engine(engine, config)
+        if engine.dialect.name == 'sqlite':
+            @event.listens_for(engine, 'connect')
+            def query_only(dbapi_connection, connection_record):
+                dbapi_connection.execute('PRAGMA query_only=ON')
+        return engine
+
+    def choose(self):
+        """The replica engine for this request, or None to read from the primary"""
+        if not self.engines:
+            return None
+        if self.is_sticky():
+            with self._stats_lock:
+                self.primary_reads += 1
+            return None
+        with self._stats_lock:
+            self.replica_reads += 1
+        return self.engines[next(self._next) % len(self.engines)]
+
+    def is_sticky(self):
+        try:
+            if float(request.cookies.get(STICKY_COOKIE, 0)) > time.time():
+                return True
+        except ValueError:
+            pass
+        if len(self.recent_writers):
+            identity = current_identity()
+            return identity is not None and self.recent_writers.get(identity) is not None
+        return False
+
+    def _mark_writer(self, response):
+        if self.engines and g.get('wrote_primary'):
+            until = time.time() + self.sticky_seconds
+            response.set_cookie(STICKY_COOKIE, f'{until:.3f}', max_age=int(self.sticky_seconds) + 1,
+                                httponly=True, samesite='Lax')
+            identity = current_identity()
+            if identity is not None:
+                self.recent_writers.set(identity, until)
+        return response
+
+    def metrics(self):
+        with self._stats_lock:
+            return {'replicas': len(self.engines), 'replicaReads': self.replica_reads,
+                    'primaryReads': self.primary_reads, 'stickyWriters': len(self.recent_writers)}
+
+    def dispose(self, close=True):
+        for engine in self.engines:
+            engine.dispose(close=close)
+
+
+def read_only(view):
+    """Send the view's reads to a replica unless the client has just written"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        replicas = current_app.extensions.get('read_replicas')
+        if replicas is not None:
+            g.read_replica = replicas.choose()
+        return view(*args, **kwargs)
+    return wrapper
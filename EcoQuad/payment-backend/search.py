@@ -0,0 +1,275 @@
+"""
+Full-text search over bonds and projects.
+
+GET /api/search?q=solar+mah ranks bonds (name and description) and projects
+(name, description and region) containing every word of ``q``, each word
+matched as a prefix so results follow the search box as the user types.
+Matches come back highlighted: ``titleHighlight`` and ``snippet`` are HTML,
+the text escaped and matches wrapped in ``<mark>``. As in the marketplace
+listing, only active bonds and their projects are found.
+
+On SQLite the index is an FTS5 table, ``search_index``, with one row per
+bond and project. Triggers on green_bonds and projects keep it in sync on
+every insert, update and delete, including bulk loads that bypass the ORM.
+``search_documents`` maps its rowids back to ids, and each row carries its
+bond's status, so inactive bonds are skipped without leaving the index.
+Results are ranked by BM25, a title match counting ten times a description
+match, with FTS5's own ORDER BY rank. On PostgreSQL
+the same search runs on GIN indexes over the tables' tsvectors, which need
+no upkeep, ranked with ts_rank.
+
+The index is created with the tables (db.create_all()).
+rebuild_search_index() fills it from existing rows.
+"""
+import html
+import logging
+import re
+import unicodedata
+
+from flask import Blueprint, request, jsonify, current_app
+from sqlalchemy import String, event, text
+
+from guid import GUID
+from models import get_models
+from replicas import read_only
+
+logger = logging.getLogger('payment-backend')
+
+search_bp = Blueprint('search', __name__)
+
+# Bound once when the blueprint is registered (see auth.py)
+db = None
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+MAX_TERMS = 8
+SNIPPET_WORDS = 24
+# Bonds in this status, and their projects, are searchable (see bonds.py)
+LISTED_STATUS = 'active'
+
+# Indexed text of each kind of document: (table, title, body, region)
+SOURCES = {
+    'bond': ('green_bonds', 'bond_name', 'description', None),
+    'project': ('projects', 'project_name', 'description', 'region'),
+}
+
+WORD = re.compile(r'\w+')
+
+class InvalidQuery(ValueError):
+    """Raised for query parameters the search can't serve"""
+
+@search_bp.record_once
+def bind_models(state):
+    """Resolve the db instance and maintain the index along with its tables"""
+    global db
+    db = state.app.extensions['sqlalchemy']
+    get_models(db)
+    for name, listener in (('after_create', create_search_index), ('before_drop', drop_search_index)):
+        if not event.contains(db.metadata, name, listener):
+            event.listen(db.metadata, name, listener)
+
+def _status(kind, row):
+    """SQL for the status of the bond behind row, a bond or a project"""
+    return f'{row}.status' if kind == 'bond' else f'(SELECT status FROM green_bonds WHERE id = {row}.bond_id)'
+
+def _sqlite_triggers(kind, table, title, body, region):
+    """Statements creating the triggers that mirror table into search_index"""
+    region_value = f'NEW.{region}' if region else 'NULL'
+    columns = ', '.join(column for column in (title, body, region, 'status' if kind == 'bond' else 'bond_id')
+                        if column)
+    document = '(SELECT id FROM search_documents WHERE ref_id = OLD.id)'
+    statements = [
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_search_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO search_documents (kind, ref_id) VALUES ('{kind}', NEW.id);
+            INSERT INTO search_index (rowid, title, body, region, kind, status)
+            VALUES (last_insert_rowid(), NEW.{title}, NEW.{body}, {region_value}, '{kind}', {_status(kind, 'NEW')});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_search_update AFTER UPDATE OF {columns} ON {table} BEGIN
+            UPDATE search_index SET title = NEW.{title}, body = NEW.{body}, region = {region_value},
+                status = {_status(kind, 'NEW')}
+            WHERE rowid = {document};
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_search_delete AFTER DELETE ON {table} BEGIN
+            DELETE FROM search_index WHERE rowid = {document};
+            DELETE FROM search_documents WHERE ref_id = OLD.id;
+        END""",
+    ]
+    if kind == 'bond':
+        # A bond's projects are listed along with it
+        statements.append(f"""CREATE TRIGGER IF NOT EXISTS {table}_search_status AFTER UPDATE OF status ON {table}
+            WHEN NEW.status IS NOT OLD.status BEGIN
+            UPDATE search_index SET status = NEW.status WHERE rowid IN (
+                SELECT d.id FROM search_documents d JOIN projects p ON p.id = d.ref_id WHERE p.bond_id = NEW.id);
+        END""")
+    return statements
+
+def _pg_vector(kind):
+    """The tsvector a PostgreSQL table is indexed and searched on, titles weighted A"""
+    _, title, body, region = SOURCES[kind]
+    rest = f"coalesce({body}, '')" + (f" || ' ' || coalesce({region}, '')" if region else '')
+    return (f"setweight(to_tsvector('simple', coalesce({title}, '')), 'A') || "
+            f"setweight(to_tsvector('simple', {rest}), 'B')")
+
+def create_search_index(target, connection, **kw):
+    """Create the index and its triggers with the tables; a no-op where they exist"""
+    if connection.dialect.name == 'postgresql':
+        for kind, (table, *_) in SOURCES.items():
+            connection.exec_driver_sql(
+                f'CREATE INDEX IF NOT EXISTS ix_{table}_search ON {table} USING gin (({_pg_vector(kind)}))')
+        return
+    if connection.dialect.name != 'sqlite':
+        return
+    if not connection.exec_driver_sql("SELECT sqlite_compileoption_used('ENABLE_FTS5')").scalar():
+        logger.warning('SQLite was built without FTS5; GET /api/search is unavailable')
+        return
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'").first()
+    if not exists:
+        # Prefix indexes for two- and three-letter prefixes, the broadest ones
+        connection.exec_driver_sql(
+            "CREATE VIRTUAL TABLE search_index USING fts5("
+            "title, body, region, kind UNINDEXED, status UNINDEXED, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')")
+        connection.exec_driver_sql(
+            "INSERT INTO search_index (search_index, rank) VALUES ('rank', 'bm25(10.0, 1.0, 2.0, 0.0, 0.0)')")
+    for kind, source in SOURCES.items():
+        for statement in _sqlite_triggers(kind, *source):
+            connection.exec_driver_sql(statement)
+
+def drop_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql('DROP TABLE IF EXISTS search_index')
+
+def rebuild_search_index():
+    """Index every bond and project from scratch (SQLite; PostgreSQL's indexes need no rebuild)"""
+    if db.session.get_bind().dialect.name != 'sqlite':
+        return
+    db.session.execute(text('DELETE FROM search_index'))
+    db.session.execute(text('DELETE FROM search_documents'))
+    for kind, (table, title, body, region) in SOURCES.items():
+        db.session.execute(text(
+            f"INSERT INTO search_documents (kind, ref_id) SELECT '{kind}', id FROM {table}"))
+        db.session.execute(text(
+            f"INSERT INTO search_index (rowid, title, body, region, kind, status) "
+            f"SELECT d.id, t.{title}, t.{body}, {f't.{region}' if region else 'NULL'}, '{kind}', "
+            f"{_status(kind, 't')} "
+            f"FROM search_documents d JOIN {table} t ON t.id = d.ref_id WHERE d.kind = '{kind}'"))
+    db.session.commit()
+
+def _sqlite_search(words, kind, limit):
+    query = ' '.join(f'"{word}"*' for word in words)
+    # FTS5 sorts the matches by rank itself; the status and kind filters
+    # read only the rows it hands over until the limit is reached
+    statement = text(f"""
+        SELECT d.kind, d.ref_id, coalesce(p.bond_id, d.ref_id) AS bond_id, s.title, s.body, s.region,
+               -s.score AS score
+        FROM (
+            SELECT rowid, title, body, region, rank AS score FROM search_index
+            WHERE search_index MATCH :query AND status = :status {'AND kind = :kind' if kind else ''}
+            ORDER BY rank LIMIT :limit
+        ) AS s
+        JOIN search_documents d ON d.id = s.rowid
+        LEFT JOIN projects p ON d.kind = 'project' AND p.id = d.ref_id
+        ORDER BY s.score
+    """).columns(kind=String, ref_id=GUID(), bond_id=GUID())
+    return db.session.execute(statement, {'query': query, 'status': LISTED_STATUS, 'kind': kind,
+                                          'limit': limit}).all()
+
+def _pg_search(words, kind, limit):
+    ranked = []
+    for source_kind, (table, title, body, region) in SOURCES.items():
+        if kind and kind != source_kind:
+            continue
+        vector = _pg_vector(source_kind)
+        ranked.append(
+            f"SELECT '{source_kind}' AS kind, id AS ref_id, {'bond_id' if source_kind == 'project' else 'id'} "
+            f"AS bond_id, {title} AS title, {body} AS body, {region or 'NULL'} AS region, "
+            f"ts_rank({vector}, q) AS score FROM {table} AS t, to_tsquery('simple', :query) AS q "
+            f"WHERE {vector} @@ q AND {_status(source_kind, 't')} = :status")
+    statement = text(
+        f"{' UNION ALL '.join(ranked)} ORDER BY score DESC LIMIT :limit"
+    ).columns(kind=String, ref_id=GUID(), bond_id=GUID())
+    query = ' & '.join(f'{word}:*' for word in words)
+    return db.session.execute(statement, {'query': query, 'status': LISTED_STATUS, 'limit': limit}).all()
+
+def _fold(word):
+    """A word as the index compares it: lower case, without diacritics"""
+    return ''.join(c for c in unicodedata.normalize('NFKD', word.lower()) if not unicodedata.combining(c))
+
+def highlighted(value, words, max_words=None):
+    """Escaped HTML of value with words matching a query prefix in <mark>
+
+    With max_words, returns the window of that many words matching the most
+    query words, elided with '…' where it cuts the text.
+    """
+    if value is None:
+        return None
+    tokens = list(WORD.finditer(value))
+    hits = [next((i for i, word in enumerate(words) if _fold(token.group()).startswith(word)), None)
+            for token in tokens]
+    first, last = 0, len(tokens)
+    if max_words and len(tokens) > max_words:
+        first = max(range(len(tokens) - max_words + 1),
+                    key=lambda start: (len({hit for hit in hits[start:start + max_words] if hit is not None}),
+                                       -start))
+        last = first + max_words
+    start = tokens[first].start() if first else 0
+    end = tokens[last - 1].end() if last < len(tokens) else len(value)
+    parts = ['…'] if first else []
+    position = start
+    for token, hit in zip(tokens[first:last], hits[first:last]):
+        if hit is not None:
+            parts += [html.escape(value[position:token.start()]), f'<mark>{html.escape(token.group())}</mark>']
+            position = token.end()
+    parts.append(html.escape(value[position:end]))
+    if last < len(tokens):
+        parts.append('…')
+    return ''.join(parts)
+
+@search_bp.route('', methods=['GET'])
+@read_only
+def search():
+    """Bonds and projects matching q, best first
+
+    - q: words to match, each as a prefix (at most 8)
+    - type: bond or project (default both)
+    - limit: default 20, at most 100
+    """
+    try:
+        words = [_fold(word) for word in WORD.findall(request.args.get('q', ''))[:MAX_TERMS]]
+        if not words:
+            raise InvalidQuery('q must contain a word')
+        kind = request.args.get('type')
+        if kind is not None and kind not in SOURCES:
+            raise InvalidQuery('type must be one of ' + ', '.join(SOURCES))
+        try:
+            limit = int(request.args.get('limit', DEFAULT_LIMIT))
+        except ValueError:
+            raise InvalidQuery('limit must be an integer')
+        limit = max(1, min(limit, MAX_LIMIT))
+    except InvalidQuery as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        if db.session.get_bind().dialect.name == 'postgresql':
+            rows = _pg_search(words, kind, limit)
+        else:
+            rows = _sqlite_search(words, kind, limit)
+        return jsonify({
+            'query': ' '.join(words),
+            'results': [{
+                'type': row.kind,
+                'id': row.ref_id,
+                'bondId': row.bond_id,
+                'title': row.title,
+                'titleHighlight': highlighted(row.title, words),
+                'snippet': highlighted(row.body, words, SNIPPET_WORDS),
+                'region': row.region,
+                'score': row.score
+            } for row in rows]
+        }), 200
+
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Search error: {str(e)}')
+        return jsonify({'error': 'Failed to search'}), 500
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Razorpay orders API, with latency and error injection.
+
+Serves POST /v1/orders and GET /v1/orders/<id> over keep-alive HTTP/1.1 and
+counts accepted connections, so tests and benchmarks can check pooling,
+timeouts and retries without reaching the real gateway:
+
+    with StubGateway(latency=0.5) as stub:
+        app.config['RAZORPAY_BASE_URL'] = stub.url
+        stub.fail_next(2, status=503)   # next two calls answer 503
+        stub.drop_next(1)               # next call closes the socket unanswered
+
+Run it standalone to point a dev server at it:
+
+    python stub_gateway.py --port 9010 --latency 0.5 --error-rate 0.05
+    RAZORPAY_BASE_URL=http://127.0.0.1:9010 python app.py
+"""
+import argparse
+import base64
+import json
+import random
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ERROR_CODES = {400: 'BAD_REQUEST_ERROR', 401: 'BAD_REQUEST_ERROR', 502: 'GATEWAY_ERROR'}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body):
+        raw = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _error(self, status, description):
+        code = ERROR_CODES.get(status, 'SERVER_ERROR')
+        self._reply(status, {'error': {'code': code, 'description': description}})
+
+    def _handle(self, method):
+        stub = self.server.stub
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        fault = stub._next_fault(method, self.path)
+        if stub.latency:
+            time.sleep(stub.latency)
+        if fault == 'drop':
+            self.close_connection = True
+            self.connection.close()
+            return
+        if fault:
+            self._error(fault, f'Injected {fault}')
+            return
+        if not stub._authorized(self.headers.get('Authorization')):
+            self._error(401, 'Authentication failed')
+            return
+
+        if method == 'POST' and self.path == '/v1/orders':
+            data = json.loads(body or b'{}')
+            order = {
+                'id': f'order_{secrets.token_hex(7)}',
+                'entity': 'order',
+                'amount': data.get('amount'),
+                'amount_paid': 0,
+                'amount_due': data.get('amount'),
+                'currency': data.get('currency', 'INR'),
+                'receipt': data.get('receipt'),
+                'status': 'created',
+                'attempts': 0,
+                'notes': data.get('notes', []),
+                'created_at': int(time.time()),
+            }
+            with stub._lock:
+                stub.orders[order['id']] = order
+            self._reply(200, order)
+        elif method == 'GET' and self.path.startswith('/v1/orders/'):
+            order = stub.orders.get(self.path.rsplit('/', 1)[-1])
+            if order is None:
+                self._error(400, 'The id provided does not exist')
+            else:
+                self._reply(200, order)
+        else:
+            self._error(400, 'The requested URL was not found on the server.')
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def process_request(self, request, client_address):
+        with self.stub._lock:
+            self.stub.connections += 1
+        super().process_request(request, client_address)
+
+
+class StubGateway:
+    """Threaded stub gateway; see the module docstring"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, error_rate=0.0,
+                 key_id=None, key_secret=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.key_id = key_id
+        self.key_secret = key_secret
+        self.orders = {}
+        self.connections = 0
+        self.requests = 0
+        self.calls = []
+        self._faults = []
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), _Handler)
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def fail_next(self, count=1, status=503):
+        """Answer the next count calls with an error status"""
+        with self._lock:
+            self._faults.extend([status] * count)
+
+    def drop_next(self, count=1):
+        """Close the connection on the next count calls without answering"""
+        with self._lock:
+            self._faults.extend(['drop'] * count)
+
+    def reset(self):
+        with self._lock:
+            self._faults.clear()
+            self.calls.clear()
+            self.connections = 0
+            self.requests = 0
+
+    def _next_fault(self, method, path):
+        with self._lock:
+            self.requests += 1
+            self.calls.append((method, path))
+            if self._faults:
+                return self._faults.pop(0)
+        if self.error_rate and random.random() < self.error_rate:
+            return 503
+        return None
+
+    def _authorized(self, header):
+        if self.key_id is None:
+            return True
+        expected = base64.b64encode(f'{self.key_id}:{self.key_secret}'.encode()).decode()
+        return header == f'Basic {expected}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,),
+                                        name='stub-gateway', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9010)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every call')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of calls answering 503')
+    args = parser.parse_args()
+    stub = StubGateway(args.host, args.port, args.latency, args.error_rate)
+    print(f'Stub gateway on {stub.url} (latency {args.latency}s, error rate {args.error_rate})')
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
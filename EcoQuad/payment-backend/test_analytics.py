@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Tests for the vectorized bond analytics and the endpoints built on them
+"""
+from datetime import date
+
+import numpy as np
+import pytest
+
+from analytics import (bond_analytics, cash_flow_schedule, portfolio_analytics,
+                       position_projections, price_from_yield)
+
+
+def scalar_price(ytm, face, rate, times, frequency=2):
+    """Reference pricing with a plain loop over one bond's cash flows"""
+    price = 0.0
+    for i, t in enumerate(times):
+        flow = face * rate / 100 / frequency + (face if i == len(times) - 1 else 0)
+        price += flow / (1 + ytm / 100 / frequency) ** (frequency * t)
+    return price
+
+
+def test_par_bond_yields_its_coupon():
+    # Settling on a coupon date, a bond priced at face yields its coupon
+    result = bond_analytics([1000, 500], [1000, 500], [7.5, 4], ['2020-01-01', '2020-01-01'],
+                            ['2030-01-01', '2027-01-01'], '2025-01-01')
+    assert result['yieldToMaturity'] == pytest.approx([7.5, 4], abs=1e-9)
+
+
+def test_settling_on_the_issue_date():
+    # A 10-year bond bought at issue has 20 coupons, the first half a year out
+    terms = ([1000], [8], '2020-01-01', '2030-01-01', '2020-01-01')
+    times, flows = cash_flow_schedule(*terms)
+    assert (flows[0] > 0).sum() == 20
+    assert times[0][0] == pytest.approx(0.5)
+    assert bond_analytics([1000], *terms)['yieldToMaturity'][0] == pytest.approx(8, abs=1e-9)
+    expected_return, _ = position_projections([1000], [1000], *terms)
+    assert expected_return[0] == pytest.approx(1800)
+    expected_return, _ = position_projections([1000], [1000], [1000], [8], '2024-01-01', '2029-01-01',
+                                              '2024-01-01')
+    assert expected_return[0] == pytest.approx(1400)
+
+
+def test_coupon_dates_step_back_whole_months():
+    # Maturing on the 31st, coupons fall on the last day of shorter months
+    times, flows = cash_flow_schedule([1000], [6], '2020-01-01', '2030-08-31', '2025-03-15')
+    assert (flows[0] > 0).sum() == 11
+    following, previous = date(2025, 8, 31), date(2025, 2, 28)
+    assert times[0][0] == pytest.approx((following - date(2025, 3, 15)).days / (following - previous).days / 2)
+    assert np.diff(times[0][flows[0] > 0]) == pytest.approx([0.5] * 10)
+
+
+def test_zero_coupon_duration_equals_time_to_maturity():
+    result = bond_analytics([800], [1000], [0], ['2020-01-01'], ['2030-01-01'], '2025-01-01')
+    assert result['macaulayDuration'][0] == pytest.approx(5)
+    assert result['modifiedDuration'][0] < result['macaulayDuration'][0]
+
+
+def scalar_moments(ytm, times, flows, frequency=2):
+    """Reference Macaulay duration and convexity with a plain loop"""
+    y = ytm / 100
+    pv_flows = [f / (1 + y / frequency) ** (frequency * t) for t, f in zip(times, flows)]
+    price = sum(pv_flows)
+    macaulay = sum(t * w for t, w in zip(times, pv_flows)) / price
+    convexity = sum(t * (t + 1 / frequency) * w for t, w in zip(times, pv_flows)) / \
+        (price * (1 + y / frequency) ** 2)
+    return macaulay, convexity
+
+
+def test_batch_matches_scalar_reference():
+    rng = np.random.default_rng(7)
+    n = 200
+    face = rng.choice([100, 1000, 10000], n)
+    rate = rng.uniform(0, 12, n)
+    rate[:10] = 0
+    maturity = np.datetime64('2025-03-15') + rng.integers(30, 30 * 365, n).astype('timedelta64[D]')
+    price = face * rng.uniform(0.8, 1.2, n)
+    price[10:20] = face[10:20]  # near-zero yields exercise the flat annuity limits
+    rate[10:20] = 0
+    result = bond_analytics(price, face, rate, '2015-01-01', maturity, '2025-03-15')
+    times, flows = cash_flow_schedule(face, rate, '2015-01-01', maturity, '2025-03-15')
+
+    for i in range(n):
+        live = flows[i] > 0
+        ytm = result['yieldToMaturity'][i]
+        assert scalar_price(ytm, face[i], rate[i], times[i][live]) == pytest.approx(price[i], rel=1e-8)
+        macaulay, convexity = scalar_moments(ytm, times[i][live], flows[i][live])
+        assert result['macaulayDuration'][i] == pytest.approx(macaulay, rel=1e-6)
+        assert result['convexity'][i] == pytest.approx(convexity, rel=1e-5)
+
+
+def test_duration_and_convexity_match_finite_differences():
+    terms = ([1000], [6], '2020-06-30', '2034-06-30', '2025-02-10')
+    result = bond_analytics([950], *terms)
+    ytm = result['yieldToMaturity']
+    bump = 1e-3  # percent
+    up, mid, down = (price_from_yield(ytm + d, *terms)[0] for d in (bump, 0, -bump))
+    assert mid == pytest.approx(950)
+    h = bump / 100
+    assert result['modifiedDuration'][0] == pytest.approx(-(up - down) / (2 * h) / mid, rel=1e-5)
+    assert result['convexity'][0] == pytest.approx((up + down - 2 * mid) / h ** 2 / mid, rel=1e-3)
+
+
+def test_schedule_edge_cases():
+    times, flows = cash_flow_schedule([1000, 1000, 1000], [5, 5, 5],
+                                      ['2020-01-01', '2024-10-01', '2020-01-01'],
+                                      ['2024-12-31', '2025-04-01', '2026-01-01'], '2025-01-01')
+    # Matured bonds have no flows; coupons before issue are dropped
+    assert flows[0].sum() == 0
+    assert flows[1].sum() == pytest.approx(1025)
+    assert flows[2].sum() == pytest.approx(1050)
+    assert np.isnan(bond_analytics([1000], [1000], [5], '2020-01-01', '2024-12-31',
+                                   '2025-01-01')['yieldToMaturity'][0])
+
+
+def test_projections_and_portfolio_totals():
+    expected_return, maturity_value = position_projections(
+        [5000, 0], [1000, 1000], [1000, 1000], [8, 8], '2024-01-01', '2027-01-01', '2025-01-01')
+    assert maturity_value == pytest.approx([5000, 0])
+    assert expected_return == pytest.approx([5000 + 5 * 40 * 4, 0])
+
+    result = portfolio_analytics([1, 3], [1000, 1000], [1000, 1000], [5, 9], '2020-01-01',
+                                 ['2030-01-01', '2030-01-01'], '2025-01-01')
+    assert result['portfolio']['marketValue'] == pytest.approx(4000)
+    assert result['portfolio']['yieldToMaturity'] == pytest.approx((5 + 3 * 9) / 4, abs=5e-3)
+
+
+def seed(app, client):
+    from app import db
+    from models import create_models
+
+    User, GreenBond, _, Investment = create_models(db)
+    response = client.post('/api/auth/register', json={
+        'email': 'analyst@example.com', 'password': 'testpassword123',
+        'firstName': 'Ana', 'lastName': 'Lyst', 'userType': 'retail_investor'
+    })
+    body = response.get_json()
+    headers = {'Authorization': f"Bearer {body['access_token']}"}
+    with app.app_context():
+        issuer = User(email='issuer@example.com', first_name='Eco', last_name='Issuer',
+                      user_type='bond_issuer', password_hash='x')
+        db.session.add(issuer)
+        db.session.flush()
+        bond = GreenBond(issuer_id=issuer.id, bond_name='Solar 2030', isin='IN0000000001',
+                         bond_type='corporate', face_value=1000, coupon_rate=6,
+                         maturity_date=date(2030, 1, 1), issue_date=date(2020, 1, 1),
+                         minimum_investment=1000, total_amount=1_000_000, risk_rating='AA',
+                         status='active', description='Green bond')
+        db.session.add(bond)
+        db.session.flush()
+        # The server computes expected_return and maturity_value, whatever the caller sets
+        investment = Investment(investor_id=body['user']['id'], bond_id=bond.id,
+                                investment_amount=10000, purchase_price=1000,
+                                purchase_date=date(2025, 1, 1), status='settled', fees=0,
+                                expected_return=999_999, maturity_value=999_999)
+        db.session.add(investment)
+        db.session.commit()
+        return bond.id, investment.id, headers
+
+
+def test_investment_projections_computed_by_server(app, client):
+    from app import db
+    from models import create_models
+
+    _, _, _, Investment = create_models(db)
+    bond_id, investment_id, headers = seed(app, client)
+    with app.app_context():
+        investment = db.session.get(Investment, investment_id)
+        assert investment.maturity_value == pytest.approx(10000)
+        assert investment.expected_return == pytest.approx(10000 + 10 * 30 * 10)
+
+    summary = client.get('/api/portfolio/summary', headers=headers).get_json()['summary']
+    assert summary['expectedReturns'] == pytest.approx(13000)
+
+    # Changing the position recomputes them; setting them directly doesn't stick
+    with app.app_context():
+        investment = db.session.get(Investment, investment_id)
+        investment.investment_amount = 5000
+        investment.expected_return = 1
+        db.session.commit()
+        assert (investment.expected_return, investment.maturity_value) == (6500, 5000)
+    summary = client.get('/api/portfolio/summary', headers=headers).get_json()['summary']
+    assert summary['expectedReturns'] == pytest.approx(6500)
+
+
+def test_analytics_endpoints(app, client):
+    bond_id, _, headers = seed(app, client)
+
+    response = client.get(f'/api/bonds/{bond_id}/analytics?settlementDate=2025-01-01')
+    assert response.status_code == 200
+    analytics = response.get_json()['analytics']
+    assert analytics['yieldToMaturity'] == pytest.approx(6, abs=5e-3)
+    assert len(analytics['cashFlows']) == 10
+    assert analytics['cashFlows'][-1]['amount'] == pytest.approx(1030)
+
+    response = client.post('/api/bonds/analytics', json={
+        'bonds': [{'bondId': bond_id, 'price': 950}, {'bondId': bond_id}],
+        'settlementDate': '2025-01-01'
+    })
+    rows = response.get_json()['analytics']
+    assert rows[0]['yieldToMaturity'] > 6 > rows[1]['yieldToMaturity'] - 5e-3
+    assert 'cashFlows' not in rows[0]
+
+    assert client.post('/api/bonds/analytics', json={'bonds': [{'bondId': 'nope'}]}).status_code == 404
+    assert client.post('/api/bonds/analytics', json={'bonds': []}).status_code == 400
+    assert client.get(f'/api/bonds/{bond_id}/analytics?settlementDate=soon').status_code == 400
+
+    body = client.get('/api/portfolio/analytics', headers=headers).get_json()
+    assert body['portfolio']['marketValue'] == pytest.approx(10000)
+    assert body['positionCount'] == 1 and len(body['positions']) == 1
+    assert body['positions'][0]['modifiedDuration'] > 0
+    assert client.get('/api/portfolio/analytics?limit=0', headers=headers).get_json()['positions'] == []
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, '-q']))
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Tests for attributing project impact to investors (attribution.py)
+"""
+from datetime import date
+
+import pytest
+
+T0 = 1727737200  # 2024-09-30T23:00:00Z
+
+ISSUER = {
+    'email': 'attribution@example.com',
+    'password': 'testpassword123',
+    'firstName': 'River',
+    'lastName': 'Issuer',
+    'userType': 'bond_issuer'
+}
+
+
+def register(client, email, user_type='individual_investor'):
+    """(user_id, headers) for a new user"""
+    body = client.post('/api/auth/register', json=dict(ISSUER, email=email, userType=user_type)).get_json()
+    return body['user']['id'], {'Authorization': f"Bearer {body['access_token']}"}
+
+
+def add_bond(app, issuer_id, isin, raised, projects=1):
+    """A bond with amount_raised and its projects; returns (bond_id, project_ids)"""
+    from app import db
+    from models import create_models
+
+    _, GreenBond, Project, _ = create_models(db)
+    with app.app_context():
+        bond = GreenBond(issuer_id=issuer_id, bond_name='River', isin=isin, bond_type='corporate',
+                         face_value=1000, coupon_rate=5, maturity_date=date(2030, 1, 1),
+                         issue_date=date(2024, 1, 1), minimum_investment=1000, total_amount=1_000_000,
+                         amount_raised=raised, risk_rating='AA', status='active', description='Green bond')
+        db.session.add(bond)
+        db.session.flush()
+        project_ids = []
+        for i in range(projects):
+            project = Project(bond_id=bond.id, project_name=f'Project {i}', project_type='water_management',
+                              description='Project', country='India', region='North', project_manager='PM',
+                              start_date=date(2024, 1, 1), expected_completion_date=date(2026, 1, 1),
+                              total_budget=100_000)
+            db.session.add(project)
+            db.session.flush()
+            project_ids.append(project.id)
+        db.session.commit()
+        return bond.id, project_ids
+
+
+def invest(app, investor_id, bond_id, amount, status='confirmed'):
+    from app import db
+    from models import create_models
+
+    Investment = create_models(db)[3]
+    with app.app_context():
+        investment = Investment(investor_id=investor_id, bond_id=bond_id, investment_amount=amount,
+                                purchase_price=1000, purchase_date=date(2024, 2, 1), status=status,
+                                fees=0, expected_return=amount, maturity_value=amount)
+        db.session.add(investment)
+        db.session.commit()
+        return investment.id
+
+
+def readings(client, headers, project_id, metric_type, *values):
+    response = client.post('/api/impact/readings', headers=headers, json={'readings': [
+        {'projectId': project_id, 'metricType': metric_type, 'value': value, 'recordedAt': T0 + i * 60}
+        for i, value in enumerate(values)]})
+    assert response.status_code == 200
+
+
+def attributions(app):
+    from app import db
+
+    with app.app_context():
+        return {(investor_id, metric_type): value for investor_id, metric_type, value in db.session.execute(
+            db.text('SELECT investor_id, metric_type, value FROM impact_attributions'))}
+
+
+def refresh(app):
+    from app import db
+    from attribution import refresh_attributions
+
+    with app.app_context():
+        return refresh_attributions(db)
+
+
+@pytest.fixture
+def bond(app, client):
+    """A bond that raised 10,000 from two investors, 60/40, with two projects reporting"""
+    issuer_id, issuer = register(client, ISSUER['email'], 'bond_issuer')
+    bond_id, (first, second) = add_bond(app, issuer_id, 'IN0000000001', 10_000, projects=2)
+    alice, alice_headers = register(client, 'alice@example.com')
+    bob, _ = register(client, 'bob@example.com')
+    invest(app, alice, bond_id, 6000)
+    invest(app, bob, bond_id, 4000)
+    readings(client, issuer, first, 'co2_reduction', 10, 20)
+    readings(client, issuer, second, 'co2_reduction', 5)
+    # Levels count each project's latest reading: 7 + 2 hectares
+    readings(client, issuer, first, 'hectares_restored', 3, 7)
+    readings(client, issuer, second, 'hectares_restored', 2)
+    return {'issuer_id': issuer_id, 'issuer': issuer, 'bond_id': bond_id, 'projects': (first, second),
+            'alice': alice, 'alice_headers': alice_headers, 'bob': bob}
+
+
+def test_impact_is_shared_pro_rata(app, client, bond):
+    assert refresh(app) == 1
+    alice, bob = bond['alice'], bond['bob']
+    assert attributions(app) == pytest.approx({
+        (alice, 'co2_reduction'): 21.0, (alice, 'hectares_restored'): 5.4,
+        (bob, 'co2_reduction'): 14.0, (bob, 'hectares_restored'): 3.6,
+    })
+
+    body = client.get('/api/portfolio/impact', headers=bond['alice_headers']).get_json()
+    assert body['impactSummary'] == pytest.approx(
+        {'co2Reduced': 21.0, 'energyGenerated': 0, 'waterSaved': 0, 'hectaresRestored': 5.4})
+    assert [(metric['metricType'], metric['unit']) for metric in body['metrics']] == [
+        ('co2_reduction', 'tCO2e'), ('hectares_restored', 'ha')]
+    assert client.get('/api/portfolio/impact').status_code == 401
+
+
+def test_refresh_only_recomputes_queued_bonds(app, client, bond):
+    from app import db
+    from attribution import rebuild_attributions
+    from models import create_models
+
+    alice, bob = bond['alice'], bond['bob']
+    other_bond, (other_project,) = add_bond(app, bond['issuer_id'], 'IN0000000002', 1000)
+    invest(app, bob, other_bond, 1000)
+    readings(client, bond['issuer'], other_project, 'water_saved', 50)
+    assert refresh(app) == 2
+    assert refresh(app) == 0
+
+    # New readings queue their bond; Bob keeps his share of the other one
+    readings(client, bond['issuer'], bond['projects'][1], 'co2_reduction', 15)
+    assert refresh(app) == 1
+    assert attributions(app)[(alice, 'co2_reduction')] == pytest.approx(30.0)
+    assert attributions(app)[(bob, 'water_saved')] == pytest.approx(50.0)
+
+    # A cancelled position drops out of the investor's totals
+    Investment = create_models(db)[3]
+    with app.app_context():
+        investment = Investment.query.filter_by(investor_id=alice).one()
+        investment.status = 'cancelled'
+        db.session.commit()
+    assert refresh(app) == 1
+    incremental = attributions(app)
+    assert not any(investor_id == alice for investor_id, _ in incremental)
+
+    with app.app_context():
+        rebuild_attributions(db)
+    assert attributions(app) == pytest.approx(incremental)
+
+
+def test_only_funded_investments_get_a_share(app, client, bond):
+    from app import db
+
+    # Pending money isn't in amount_raised yet, so it gets no share
+    carol, _ = register(client, 'carol@example.com')
+    invest(app, carol, bond['bond_id'], 5000, status='pending')
+    invest(app, bond['bob'], bond['bond_id'], 1000, status='pending')
+    with app.app_context():
+        # Each change appends to the queue; the bond is refreshed once
+        assert db.session.execute(db.text('SELECT count(*) FROM attribution_queue')).scalar() > 1
+    assert refresh(app) == 1
+    shares = attributions(app)
+    assert not any(investor_id == carol for investor_id, _ in shares)
+    assert shares[(bond['bob'], 'co2_reduction')] == pytest.approx(14.0)
+    assert sum(value for (_, metric_type), value in shares.items()
+               if metric_type == 'co2_reduction') == pytest.approx(35.0)
+
+
+def test_refresh_runs_the_same_statements_for_any_number_of_investors(app, client, bond):
+    from app import db
+    from query_counter import count_queries
+
+    def refresh_statements():
+        readings(client, bond['issuer'], bond['projects'][0], 'co2_reduction', 1)
+        with app.app_context():
+            engine = db.engine
+        with count_queries(engine) as statements:
+            assert refresh(app) == 1
+        return len(statements)
+
+    few = refresh_statements()
+    for i in range(20):
+        investor_id, _ = register(client, f'investor{i}@example.com')
+        invest(app, investor_id, bond['bond_id'], 100)
+    assert refresh_statements() == few
+    assert len({investor_id for investor_id, _ in attributions(app)}) == 22
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, '-q']))
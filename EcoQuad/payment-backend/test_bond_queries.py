@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Query-count regression tests for bond serialization
+"""
+from datetime import date
+
+import pytest
+
+from query_counter import assert_max_queries, count_queries
+
+
+def seed(app, bonds=12):
+    from app import db
+    from models import create_models
+
+    User, GreenBond, Project, Investment = create_models(db)
+    with app.app_context():
+        issuers = [User(email=f'issuer{i}@example.com', first_name='Issuer', last_name=str(i),
+                        user_type='bond_issuer', password_hash='x') for i in range(3)]
+        investors = [User(email=f'investor{i}@example.com', first_name='Investor', last_name=str(i),
+                          user_type='retail_investor', password_hash='x') for i in range(2)]
+        db.session.add_all(issuers + investors)
+        db.session.flush()
+        for i in range(bonds):
+            bond = GreenBond(issuer_id=issuers[i % 3].id, bond_name=f'Bond {i}', isin=f'IN{i:010d}',
+                             bond_type='corporate', face_value=1000, coupon_rate=5,
+                             maturity_date=date(2030, 1, 1), issue_date=date(2024, 1, 1),
+                             minimum_investment=1000, total_amount=1_000_000, risk_rating='AA',
+                             status='active', description='Green bond')
+            db.session.add(bond)
+            db.session.flush()
+            for project_type in ('renewable_energy', 'clean_transport'):
+                db.session.add(Project(bond_id=bond.id, project_name=f'{project_type} {i}',
+                                       project_type=project_type, description='Project',
+                                       country='India', region='South', project_manager='PM',
+                                       start_date=date(2024, 1, 1), expected_completion_date=date(2026, 1, 1),
+                                       total_budget=100_000))
+            for investor in investors:
+                db.session.add(Investment(investor_id=investor.id, bond_id=bond.id, investment_amount=5000,
+                                          purchase_price=1000, purchase_date=date(2024, 2, 1),
+                                          status='settled', expected_return=5250, maturity_value=5250))
+        db.session.commit()
+
+
+def engine(app):
+    from app import db
+
+    with app.app_context():
+        return db.engine
+
+
+@pytest.mark.parametrize('limit', [1, 5, 12])
+def test_bond_listing_runs_constant_queries(app, client, limit):
+    seed(app)
+    # page query with the issuer join, then the page's project types
+    with assert_max_queries(engine(app), 2):
+        response = client.get('/api/bonds', query_string={'limit': limit})
+    bonds = response.get_json()['bonds']
+    assert len(bonds) == limit
+    for bond in bonds:
+        assert bond['issuerName'].startswith('Issuer ')
+        assert bond['projectCategories'] == ['clean_transport', 'renewable_energy']
+        assert 'investorCount' not in bond
+
+
+def test_to_dict_runs_no_queries(app):
+    """Serialization only reads what the caller loaded; lazy issuers are the N+1 the helper catches"""
+    from app import db
+    from models import create_models
+
+    _, GreenBond, _, _ = create_models(db)
+    seed(app)
+    with app.app_context():
+        bonds = GreenBond.query.options(*GreenBond.list_loader_options()).all()
+        with count_queries(db.engine) as statements:
+            [bond.to_dict() for bond in bonds]
+        assert statements == []
+        db.session.expunge_all()
+        with pytest.raises(AssertionError):
+            with assert_max_queries(db.engine, 1):
+                [bond.to_dict() for bond in GreenBond.query.all()]
+
+
+def test_single_bond_detail(app, client):
+    seed(app, bonds=1)
+    bond_id = client.get('/api/bonds').get_json()['bonds'][0]['id']
+    with assert_max_queries(engine(app), 2):
+        response = client.get(f'/api/bonds/{bond_id}')
+    assert response.status_code == 200
+    assert response.get_json()['bond']['projectCategories'] == ['clean_transport', 'renewable_energy']
+    assert client.get('/api/bonds/missing').status_code == 404
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, '-q']))
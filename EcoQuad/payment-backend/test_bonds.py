@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Tests for the bond marketplace listing API
+"""
+from datetime import date, datetime, timedelta
+
+import pytest
+
+
+def seed_bonds(app, count=25):
+    from app import db
+    from models import create_models
+
+    User, GreenBond, _, _ = create_models(db)
+    with app.app_context():
+        issuer = User(email='issuer@example.com', first_name='Eco', last_name='Issuer',
+                      user_type='bond_issuer', password_hash='x')
+        db.session.add(issuer)
+        db.session.flush()
+        base = datetime(2024, 1, 1)
+        for i in range(count):
+            db.session.add(GreenBond(
+                issuer_id=issuer.id,
+                bond_name=f'Bond {i:03d}',
+                isin=f'IN{i:010d}',
+                bond_type=('corporate', 'municipal', 'sovereign')[i % 3],
+                face_value=1000,
+                coupon_rate=4 + (i % 5) * 0.5,
+                maturity_date=date(2030, 1, 1) + timedelta(days=i * 30),
+                issue_date=date(2024, 1, 1),
+                minimum_investment=1000 * (1 + i % 4),
+                total_amount=1_000_000 + i,
+                risk_rating=('AAA', 'AA', 'BBB+')[i % 3],
+                status='draft' if i % 5 == 4 else 'active',
+                description=f'Green bond number {i}',
+                # identical timestamps in pairs exercise the id tie-breaker
+                created_at=base + timedelta(hours=i // 2)
+            ))
+        db.session.commit()
+
+
+def fetch_all(client, **params):
+    """Walk every page and return the bonds in order"""
+    bonds, cursor = [], None
+    while True:
+        query = dict(params, limit=7)
+        if cursor:
+            query['cursor'] = cursor
+        response = client.get('/api/bonds', query_string=query)
+        assert response.status_code == 200, response.get_json()
+        body = response.get_json()
+        bonds.extend(body['bonds'])
+        cursor = body['nextCursor']
+        if not cursor:
+            return bonds
+
+
+def test_lists_only_active_bonds_by_default(app, client):
+    seed_bonds(app)
+    bonds = fetch_all(client)
+    assert len(bonds) == 20
+    assert {bond['status'] for bond in bonds} == {'active'}
+    assert len(fetch_all(client, status='all')) == 25
+
+
+@pytest.mark.parametrize('sort, key', [
+    ('-createdAt', 'createdAt'),
+    ('couponRate', 'couponRate'),
+    ('-minimumInvestment', 'minimumInvestment'),
+    ('maturityDate', 'maturityDate'),
+    ('bondName', 'bondName'),
+])
+def test_pages_cover_every_bond_once_in_order(app, client, sort, key):
+    seed_bonds(app)
+    bonds = fetch_all(client, sort=sort, status='all')
+    assert len({bond['id'] for bond in bonds}) == 25
+    values = [bond[key] for bond in bonds]
+    assert values == sorted(values, reverse=sort.startswith('-'))
+
+
+def test_filters(app, client):
+    seed_bonds(app)
+    bonds = fetch_all(client, bondType=['corporate', 'municipal'], couponMin=5, minimumInvestmentMax=2000)
+    assert bonds
+    for bond in bonds:
+        assert bond['bondType'] in ('corporate', 'municipal')
+        assert bond['couponRate'] >= 5
+        assert bond['minimumInvestment'] <= 2000
+        assert bond['status'] == 'active'
+
+
+def test_rejects_bad_parameters(app, client):
+    assert client.get('/api/bonds?sort=issuerName').status_code == 400
+    assert client.get('/api/bonds?couponMin=abc').status_code == 400
+    assert client.get('/api/bonds?cursor=not-a-cursor').status_code == 400
+
+
+def test_listing_uses_composite_index(app):
+    from app import db
+
+    with app.app_context():
+        plan = db.session.execute(db.text(
+            "EXPLAIN QUERY PLAN SELECT * FROM green_bonds WHERE status = 'active' "
+            "AND (coupon_rate, id) > (4.5, '') ORDER BY coupon_rate, id LIMIT 21"
+        )).all()
+    detail = ' '.join(row[-1] for row in plan)
+    assert 'ix_green_bonds_status_coupon_rate' in detail
+    assert 'TEMP B-TREE' not in detail
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, '-q']))
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Tests for the engine profiles (engines.py)
+"""
+import os
+import tempfile
+import threading
+import time
+
+import pytest
+from sqlalchemy import Column, Integer, MetaData, Table, create_engine, text
+
+from engines import WriterQueue, configure_engine, engine_options
+
+TUNED = {'DB_ENGINE_PROFILE': 'tuned', 'SQLITE_BUSY_TIMEOUT': 2000}
+
+
+def sqlite_engine(config):
+    url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'engines.db')
+    engine = create_engine(url, **engine_options(dict(config, SQLALCHEMY_DATABASE_URI=url)))
+    return engine, configure_engine(engine, config)
+
+
+def test_engine_options_by_dialect():
+    assert engine_options({'SQLALCHEMY_DATABASE_URI': 'sqlite:///x.db', 'SQLITE_BUSY_TIMEOUT': 2500}) == \
+        {'connect_args': {'timeout': 2.5}}
+    options = engine_options({'SQLALCHEMY_DATABASE_URI': 'postgresql+psycopg2://db/greenbonds',
+                              'DB_POOL_SIZE': 4, 'DB_POOL_PRE_PING': True})
+    assert options['pool_size'] == 4 and options['max_overflow'] == 20 and options['pool_pre_ping'] is True
+    assert engine_options({'SQLALCHEMY_DATABASE_URI': 'sqlite:///x.db', 'DB_ENGINE_PROFILE': 'plain'}) == {}
+
+
+def test_app_engine_uses_wal(app, client):
+    from app import db
+
+    with app.app_context():
+        assert db.session.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        assert db.session.execute(text('PRAGMA busy_timeout')).scalar() == app.config['SQLITE_BUSY_TIMEOUT']
+        assert db.session.execute(text('PRAGMA synchronous')).scalar() == 1  # NORMAL
+    metrics = client.get('/metrics/database').get_json()
+    assert metrics['dialect'] == 'sqlite' and 'writerQueue' in metrics
+
+
+def test_plain_profile_leaves_sqlite_defaults():
+    engine, writers = sqlite_engine({'DB_ENGINE_PROFILE': 'plain'})
+    assert writers is None
+    with engine.connect() as connection:
+        assert connection.execute(text('PRAGMA journal_mode')).scalar() == 'delete'
+
+
+def test_concurrent_writers_take_turns():
+    engine, writers = sqlite_engine(TUNED)
+    table = Table('counters', MetaData(), Column('id', Integer, primary_key=True), Column('n', Integer))
+    table.metadata.create_all(engine)
+    failures = []
+
+    def write(n):
+        try:
+            with engine.begin() as connection:
+                connection.execute(table.insert(), {'n': n})
+                # Hold the write transaction open while the others queue
+                time.sleep(0.02)
+                connection.execute(table.update().where(table.c.n == n).values(n=n + 100))
+        except Exception as e:
+            failures.append(e)
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert failures == []
+    with engine.connect() as connection:
+        assert sorted(connection.execute(table.select().with_only_columns(table.c.n)).scalars()) == \
+            [n + 100 for n in range(8)]
+    metrics = writers.metrics()
+    assert metrics['acquired'] >= 8 and metrics['timeouts'] == 0
+
+
+def test_rollback_releases_the_writer_lock():
+    engine, writers = sqlite_engine(TUNED)
+    with engine.connect() as connection:
+        connection.execute(text('CREATE TABLE t (id INTEGER PRIMARY KEY)'))
+        connection.commit()
+        connection.execute(text('INSERT INTO t VALUES (1)'))
+        assert connection.info['writer_queue'] is True
+        connection.rollback()
+        assert 'writer_queue' not in connection.info
+    # Free for the next writer straight away
+    with engine.begin() as connection:
+        connection.execute(text('INSERT INTO t VALUES (2)'))
+    assert writers.metrics()['timeouts'] == 0
+
+
+def test_writer_queue_gives_up_after_timeout():
+    writers = WriterQueue(timeout=0.01)
+    first, second = {}, {}
+    writers.acquire(first)
+    writers.acquire(second)
+    assert first['writer_queue'] is True and second['writer_queue'] is False
+    writers.release(second)
+    writers.release(first)
+    assert writers.metrics()['timeouts'] == 1
+    writers.acquire(second)
+    assert second['writer_queue'] is True
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, '-q']))
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+Tests for recording verified payments and fulfilling them through the job queue
+"""
+import hashlib
+import hmac
+import threading
+import time
+from datetime import date
+
+import pytest
+
+from stub_gateway import StubGateway
+
+SECRET = 'rzp_test_secret'
+
+
+@pytest.fixture
+def stub():
+    with StubGateway(key_id='rzp_test_key', key_secret=SECRET) as stub:
+        yield stub
+
+
+@pytest.fixture
+def queue(app, stub):
+    """The app's job queue with no worker thread, and the gateway pointed at the stub"""
+    from app import db, job_queue, order_idempotency, payment_gateway
+
+    original = dict(app.config)
+    app.config.update({
+        'RAZORPAY_KEY_ID': 'rzp_test_key',
+        'RAZORPAY_KEY_SECRET': SECRET,
+        'RAZORPAY_BASE_URL': stub.url,
+        'RAZORPAY_RETRY_BACKOFF': 0,
+        'JOB_QUEUE_MODE': 'off',
+        'JOB_RETRY_BACKOFF': 0,
+        'JOB_POLL_INTERVAL': 0.05,
+    })
+    payment_gateway.init_app(app)
+    order_idempotency.init_app(app, db)
+    job_queue.init_app(app, db)
+    yield job_queue
+    job_queue.shutdown()
+    payment_gateway.shutdown()
+    app.config.clear()
+    app.config.update(original)
+    payment_gateway.init_app(app)
+    order_idempotency.init_app(app, db)
+    job_queue.init_app(app, db)
+
+
+def register(client):
+    response = client.post('/api/auth/register', json={
+        'email': 'payer@example.com',
+        'password': 'testpassword123',
+        'firstName': 'Pay',
+        'lastName': 'Er',
+        'userType': 'retail_investor'
+    })
+    body = response.get_json()
+    return body['user']['id'], {'Authorization': f"Bearer {body['access_token']}"}
+
+
+def seed_bond(app, total_amount=1_000_000):
+    from app import db
+    from models import create_models
+
+    User, GreenBond, _, _ = create_models(db)
+    with app.app_context():
+        issuer = User(email='issuer@example.com', first_name='Eco', last_name='Issuer',
+                      user_type='bond_issuer', password_hash='x')
+        db.session.add(issuer)
+        db.session.flush()
+        bond = GreenBond(issuer_id=issuer.id, bond_name='Solar', isin='IN0000000001',
+                         bond_type='corporate', face_value=1000, coupon_rate=7,
+                         maturity_date=date(2030, 6, 30), issue_date=date(2024, 1, 1),
+                         minimum_investment=1000, total_amount=total_amount, amount_raised=0,
+                         risk_rating='AA', status='active', description='Green bond')
+        db.session.add(bond)
+        db.session.commit()
+        return bond.id
+
+
+def signed(order_id, payment_id):
+    signature = hmac.new(SECRET.encode(), f'{order_id}|{payment_id}'.encode(), hashlib.sha256).hexdigest()
+    return {'razorpay_order_id': order_id, 'razorpay_payment_id': payment_id,
+            'razorpay_signature': signature}
+
+
+def models(app):
+    from app import db
+    from models import get_models
+
+    return db, get_models(db)
+
+
+def queue_payments(app, queue, bond_id, investor_id, amounts):
+    """Record payments with known amounts and queue their fulfillment; returns job ids"""
+    from fulfillment import FULFILL_PAYMENT
+
+    db, m = models(app)
+    with app.app_context():
+        payments = [m['Payment'](razorpay_payment_id=f'pay_q{i}', razorpay_order_id=f'order_q{i}',
+                                 bond_id=bond_id, investor_id=investor_id, amount=amount,
+                                 currency='INR', status='verified')
+                    for i, amount in enumerate(amounts)]
+        db.session.add_all(payments)
+        db.session.flush()
+        job_ids = queue.enqueue_many(FULFILL_PAYMENT, [{'paymentId': payment.id} for payment in payments])
+        db.session.commit()
+        return job_ids
+
+
+def test_verified_payment_is_fulfilled_off_the_request(app, client, queue, stub):
+    investor_id, headers = register(client)
+    bond_id = seed_bond(app)
+    order = client.post('/create-order', json={'amount': 2500, 'bondId': bond_id},
+                        headers={'Idempotency-Key': 'inv-1'}).get_json()['order']
+
+    response = client.post('/verify-payment', json=dict(signed(order['id'], 'pay_1'), bondId=bond_id),
+                           headers=headers)
+    assert response.status_code == 200
+    payment = response.get_json()['payment']
+    assert payment['status'] == 'verified' and payment['investorId'] == investor_id
+
+    with app.app_context():
+        assert queue.run_pending() == 1
+    payment = client.get('/payments/pay_1').get_json()['payment']
+    assert payment['status'] == 'fulfilled' and payment['amount'] == 250000
+
+    db, m = models(app)
+    with app.app_context():
+        investment = db.session.get(m['Investment'], payment['investmentId'])
+        assert investment.transaction_id == 'pay_1'
+        assert investment.investment_amount == 2500 and investment.investor_id == investor_id
+        assert investment.expected_return > investment.maturity_value == 2500
+        assert db.session.get(m['GreenBond'], bond_id).amount_raised == 2500
+    # The amount came from the stored order, not another gateway call
+    assert stub.calls == [('POST', '/v1/orders')]
+    summary = client.get('/api/portfolio/summary', headers=headers).get_json()['summary']
+    assert summary['portfolioValue'] == pytest.approx(2500)
+
+
+def test_duplicate_verification_fulfills_once(app, client, queue, stub):
+    from app import payment_gateway
+    from fulfillment import fulfill_payment
+
+    _, headers = register(client)
+    bond_id = seed_bond(app)
+    order = payment_gateway.create_order({'amount': 100000, 'currency': 'INR', 'notes': {'bondId': bond_id}})
+    body = dict(signed(order['id'], 'pay_2'), bondId=bond_id)
+    first = client.post('/verify-payment', json=body, headers=headers).get_json()['payment']
+    second = client.post('/verify-payment', json=body, headers=headers).get_json()['payment']
+    assert first['id'] == second['id']
+
+    db, m = models(app)
+    with app.app_context():
+        assert queue.run_pending() == 1
+        fulfill_payment({'paymentId': first['id']})
+        assert m['Investment'].query.filter_by(transaction_id='pay_2').count() == 1
+        assert db.session.get(m['GreenBond'], bond_id).amount_raised == 1000
+    # Fetched the order it didn't create once
+    assert stub.calls.count(('GET', f"/v1/orders/{order['id']}")) == 1
+
+
+def test_gateway_errors_retry_the_job(app, client, queue, stub):
+    from app import payment_gateway
+
+    _, headers = register(client)
+    bond_id = seed_bond(app)
+    order = payment_gateway.create_order({'amount': 50000, 'currency': 'INR', 'notes': {'bondId': bond_id}})
+    client.post('/verify-payment', json=dict(signed(order['id'], 'pay_3'), bondId=bond_id), headers=headers)
+    # More 503s than the session retries, so the first attempt fails
+    stub.fail_next(3, status=503)
+
+    db, m = models(app)
+    with app.app_context():
+        assert queue.run_pending() == 2
+        job = m['Job'].query.one()
+        assert (job.status, job.attempts) == ('done', 2)
+        assert job.last_error.startswith('ServerError')
+    assert client.get('/payments/pay_3').get_json()['payment']['status'] == 'fulfilled'
+
+
+def test_exhausted_job_is_marked_failed(app, client, queue, stub):
+    from app import db, payment_gateway
+
+    app.config['JOB_MAX_ATTEMPTS'] = 2
+    queue.init_app(app, db)
+    _, headers = register(client)
+    bond_id = seed_bond(app)
+    order = payment_gateway.create_order({'amount': 50000, 'currency': 'INR', 'notes': {'bondId': bond_id}})
+    client.post('/verify-payment', json=dict(signed(order['id'], 'pay_4'), bondId=bond_id), headers=headers)
+    stub.fail_next(6, status=503)
+
+    _, m = models(app)
+    with app.app_context():
+        queue.run_pending()
+        job = m['Job'].query.one()
+        assert (job.status, job.attempts) == ('failed', 2)
+        assert queue.metrics()['failed'] == 1
+    assert client.get('/payments/pay_4').get_json()['payment']['status'] == 'verified'
+
+
+def test_payment_without_bond_is_unmatched(app, client, queue):
+    from app import payment_gateway
+
+    order = payment_gateway.create_order({'amount': 50000, 'currency': 'INR'})
+    response = client.post('/verify-payment', json=signed(order['id'], 'pay_5'))
+    assert response.get_json()['payment']['investorId'] is None
+    with app.app_context():
+        queue.run_pending()
+    assert client.get('/payments/pay_5').get_json()['payment']['status'] == 'unmatched'
+
+
+def test_bond_comes_from_the_order(app, client, queue, stub):
+    from app import payment_gateway
+
+    _, headers = register(client)
+    bond_id = seed_bond(app)
+    # An order created here is checked when the payment is verified
+    order = client.post('/create-order', json={'amount': 1000, 'bondId': bond_id},
+                        headers={'Idempotency-Key': 'inv-8'}).get_json()['order']
+    response = client.post('/verify-payment', json=dict(signed(order['id'], 'pay_8'), bondId='another-bond'),
+                           headers=headers)
+    assert response.status_code == 400
+    assert client.get('/payments/pay_8').status_code == 404
+
+    # Otherwise the body's bondId is ignored in favour of the order's notes
+    order = payment_gateway.create_order({'amount': 50000, 'currency': 'INR', 'notes': {'bondId': bond_id}})
+    client.post('/verify-payment', json=dict(signed(order['id'], 'pay_9'), bondId='another-bond'),
+                headers=headers)
+    db, m = models(app)
+    with app.app_context():
+        queue.run_pending()
+        assert db.session.get(m['GreenBond'], bond_id).amount_raised == 500
+    payment = client.get('/payments/pay_9').get_json()['payment']
+    assert (payment['status'], payment['bondId']) == ('fulfilled', bond_id)
+
+
+def test_checkout_without_idempotency_key_is_fulfilled(app, client, queue, stub):
+    # As the frontend checks out: the order names the bond and the investor
+    investor_id, headers = register(client)
+    bond_id = seed_bond(app)
+    order = client.post('/create-order', json={'amount': 1500, 'currency': 'INR', 'bondId': bond_id},
+                        headers=headers).get_json()['order']
+    assert client.post('/verify-payment', json=signed(order['id'], 'pay_10')).status_code == 200
+    with app.app_context():
+        queue.run_pending()
+
+    payment = client.get('/payments/pay_10').get_json()['payment']
+    assert (payment['status'], payment['bondId'], payment['investorId']) == ('fulfilled', bond_id, investor_id)
+    db, m = models(app)
+    with app.app_context():
+        investment = db.session.get(m['Investment'], payment['investmentId'])
+        assert (investment.bond_id, investment.investor_id, investment.investment_amount) == (
+            bond_id, investor_id, 1500)
+    # Not stored here, so the job read the order back from Razorpay
+    assert stub.calls == [('POST', '/v1/orders'), ('GET', f"/v1/orders/{order['id']}")]
+
+
+def test_invalid_signature_records_nothing(app, client, queue):
+    body = dict(signed('order_x', 'pay_6'), razorpay_signature='0' * 64)
+    assert client.post('/verify-payment', json=body).status_code == 400
+    assert client.get('/payments/pay_6').status_code == 404
+    _, m = models(app)
+    with app.app_context():
+        assert m['Job'].query.count() == 0
+
+
+def test_concurrent_fulfillments_add_up(app, client, queue):
+    from app import db, payment_gateway
+    from fulfillment import record_verified_payment
+
+    _, headers = register(client)
+    bond_id = seed_bond(app)
+    job_ids = []
+    for i in range(8):
+        order = payment_gateway.create_order({'amount': 100000 * (i + 1), 'currency': 'INR',
+                                              'notes': {'bondId': bond_id}})
+        with app.app_context():
+            _, job_id = record_verified_payment(db, queue, order['id'], f'pay_c{i}', investor_id='investor-1')
+            job_ids.append(job_id)
+
+    def run(job_id):
+        with app.app_context():
+            queue.run(job_id)
+
+    threads = [threading.Thread(target=run, args=(job_id,)) for job_id in job_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    db, m = models(app)
+    with app.app_context():
+        assert db.session.get(m['GreenBond'], bond_id).amount_raised == sum(1000 * (i + 1) for i in range(8))
+        assert m['Payment'].query.filter_by(status='fulfilled').count() == 8
+
+
+def test_oversubscribing_payment_is_not_fulfilled(app, client, queue):
+    investor_id, headers = register(client)
+    bond_id = seed_bond(app, total_amount=3000)
+    queue_payments(app, queue, bond_id, investor_id, [200000, 200000, 100000])
+
+    db, m = models(app)
+    with app.app_context():
+        assert queue.run_pending() == 3
+        statuses = {p.razorpay_payment_id: p.status for p in m['Payment'].query}
+        assert statuses == {'pay_q0': 'fulfilled', 'pay_q1': 'oversubscribed', 'pay_q2': 'fulfilled'}
+        assert db.session.get(m['GreenBond'], bond_id).amount_raised == 3000
+        assert m['Investment'].query.count() == 2
+        assert m['Payment'].query.filter_by(razorpay_payment_id='pay_q1').one().investment_id is None
+    summary = client.get('/api/portfolio/summary', headers=headers).get_json()['summary']
+    assert summary['portfolioValue'] == pytest.approx(3000)
+
+
+def test_hundreds_of_parallel_investments_never_oversubscribe(app, client, queue):
+    from concurrent.futures import ThreadPoolExecutor
+
+    investor_id, headers = register(client)
+    bond_id = seed_bond(app, total_amount=200_000)
+    job_ids = queue_payments(app, queue, bond_id, investor_id, [100000] * 300)
+
+    def run(job_id):
+        with app.app_context():
+            queue.run(job_id)
+
+    with ThreadPoolExecutor(64) as pool:
+        list(pool.map(run, job_ids))
+    db, m = models(app)
+    with app.app_context():
+        # Anything that hit a busy database was requeued; finish those
+        queue.run_pending()
+        assert m['Job'].query.filter_by(status='done').count() == 300
+        assert m['Payment'].query.filter_by(status='fulfilled').count() == 200
+        assert m['Payment'].query.filter_by(status='oversubscribed').count() == 100
+        assert m['Investment'].query.count() == 200
+        assert db.session.get(m['GreenBond'], bond_id).amount_raised == 200_000
+    summary = client.get('/api/portfolio/summary', headers=headers).get_json()['summary']
+    assert summary['portfolioValue'] == pytest.approx(200_000) and summary['positionCount'] == 200
+
+
+def test_create_order_checks_remaining_capacity(app, client, queue, stub):
+    bond_id = seed_bond(app, total_amount=5000)
+    response = client.post('/create-order', json={'amount': 6000, 'bondId': bond_id})
+    assert response.status_code == 409
+    assert response.get_json() == {'error': 'oversubscribed', 'remainingAmount': 5000}
+    assert client.post('/create-order', json={'amount': 10, 'bondId': 'nope'}).status_code == 404
+    order = client.post('/create-order', json={'amount': 5000, 'bondId': bond_id}).get_json()['order']
+    assert order['notes'] == {'bondId': bond_id}
+    assert stub.requests == 1
+
+
+def test_worker_thread_fulfills(app, client, queue):
+    from app import db, payment_gateway
+
+    app.config['JOB_QUEUE_MODE'] = 'thread'
+    queue.init_app(app, db)
+    _, headers = register(client)
+    bond_id = seed_bond(app)
+    order = payment_gateway.create_order({'amount': 50000, 'currency': 'INR', 'notes': {'bondId': bond_id}})
+    client.post('/verify-payment', json=dict(signed(order['id'], 'pay_7'), bondId=bond_id), headers=headers)
+
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        payment = client.get('/payments/pay_7').get_json()['payment']
+        if payment['status'] != 'verified':
+            break
+        time.sleep(0.02)
+    assert payment['status'] == 'fulfilled'
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, '-q']))
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Tests for Razorpay order creation against the local stub gateway
+"""
+import socket
+import time
+
+import pytest
+
+from gateway import GatewayBusy
+from http_session import build_session
+from stub_gateway import StubGateway
+
+ORDER = {'amount': 1500.5, 'currency': 'INR'}
+
+
+@pytest.fixture
+def stub():
+    with StubGateway(key_id='rzp_test_key', key_secret='rzp_test_secret') as stub:
+        yield stub
+
+
+@pytest.fixture
+def gateway(app, stub):
+    """The app's PaymentGateway pointed at the stub with short timeouts"""
+    from app import payment_gateway
+
+    original = dict(app.config)
+    app.config.update({
+        'RAZORPAY_KEY_ID': 'rzp_test_key',
+        'RAZORPAY_KEY_SECRET': 'rzp_test_secret',
+        'RAZORPAY_BASE_URL': stub.url,
+        'RAZORPAY_CONNECT_TIMEOUT': 0.5,
+        'RAZORPAY_READ_TIMEOUT': 0.2,
+        'RAZORPAY_RETRY_BACKOFF': 0,
+        'RAZORPAY_ORDER_WORKERS': 4,
+        'RAZORPAY_ORDER_QUEUE_DEPTH': 4,
+    })
+    payment_gateway.init_app(app)
+    yield payment_gateway
+    payment_gateway.shutdown()
+    app.config.clear()
+    app.config.update(original)
+    payment_gateway.init_app(app)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_create_order_reuses_one_connection(client, gateway, stub):
+    for _ in range(5):
+        response = client.post('/create-order', json=ORDER)
+        assert response.status_code == 200
+        order = response.get_json()['order']
+        assert order['amount'] == 150050 and order['status'] == 'created'
+    assert stub.requests == 5
+    assert stub.connections == 1
+
+
+def test_slow_gateway_times_out_without_replaying_the_post(client, gateway, stub):
+    stub.latency = 0.5
+    started = time.monotonic()
+    response = client.post('/create-order', json=ORDER)
+    assert response.status_code == 504
+    assert time.monotonic() - started < 0.5
+    assert stub.calls == [('POST', '/v1/orders')]
+
+
+def test_order_errors_are_not_retried(client, gateway, stub):
+    stub.fail_next(1, status=503)
+    assert client.post('/create-order', json=ORDER).status_code == 502
+    stub.drop_next(1)
+    assert client.post('/create-order', json=ORDER).status_code == 502
+    assert stub.requests == 2
+
+
+def test_idempotent_calls_retry_5xx_and_dropped_connections(gateway, stub):
+    order = gateway.create_order({'amount': 100, 'currency': 'INR'})
+    stub.reset()
+    stub.fail_next(2, status=503)
+    assert gateway.client.order.fetch(order['id'])['id'] == order['id']
+    assert stub.requests == 3
+
+    stub.reset()
+    stub.drop_next(1)
+    assert gateway.client.order.fetch(order['id'])['id'] == order['id']
+    assert stub.requests == 2
+
+
+def test_unreachable_gateway_fails_fast(app, client, gateway):
+    app.config['RAZORPAY_BASE_URL'] = f'http://127.0.0.1:{free_port()}'
+    gateway.init_app(app)
+    response = client.post('/create-order', json=ORDER)
+    assert response.status_code == 502
+    assert response.get_json()['error'] == 'gateway_unavailable'
+
+
+def test_session_applies_default_timeout():
+    session = build_session(connect_timeout=1.5, read_timeout=4)
+    assert session.timeout == (1.5, 4)
+    retry = session.get_adapter('https://api.razorpay.com').max_retries
+    assert 'POST' not in retry.allowed_methods and retry.backoff_jitter > 0
+
+
+def test_offloaded_order_is_polled(client, gateway, stub):
+    stub.latency = 0.1
+    response = client.post('/create-order', json=ORDER, headers={'Prefer': 'respond-async'})
+    assert response.status_code == 202
+    location = response.headers['Location']
+    assert location == f"/create-order/{response.get_json()['jobId']}"
+
+    deadline = time.monotonic() + 2
+    while True:
+        response = client.get(location)
+        if response.status_code != 202 or time.monotonic() > deadline:
+            break
+        time.sleep(0.02)
+    assert response.status_code == 200
+    assert response.get_json()['order']['amount'] == 150050
+    assert client.get('/create-order/nope').status_code == 404
+
+
+def test_offload_pool_sheds_load(app, client, gateway, stub):
+    app.config.update({'RAZORPAY_ORDER_WORKERS': 1, 'RAZORPAY_ORDER_QUEUE_DEPTH': 0})
+    gateway.init_app(app)
+    stub.latency = 0.15
+    headers = {'Prefer': 'respond-async'}
+    assert client.post('/create-order', json=ORDER, headers=headers).status_code == 202
+    response = client.post('/create-order', json=ORDER, headers=headers)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    with pytest.raises(GatewayBusy):
+        gateway.submit_order(ORDER)
+    assert gateway.metrics()['rejected'] == 2
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, '-q']))
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Tests for UUID id columns (guid.py) and the id storage check (migrations.py)
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import Column, ForeignKey, MetaData, String, Table, create_engine, select, text
+
+from guid import GUID, new_id, settings, uuid7
+from migrations import check_id_storage
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def tables(binary):
+    metadata = MetaData()
+    Table('users', metadata, Column('id', GUID(binary=binary), primary_key=True), Column('name', String(20)))
+    Table('bonds', metadata, Column('id', GUID(binary=binary), primary_key=True),
+          Column('issuer_id', GUID(binary=binary), ForeignKey('users.id')))
+    return metadata
+
+
+def sqlite_engine():
+    return create_engine('sqlite:///' + os.path.join(tempfile.mkdtemp(), 'guid.db'))
+
+
+def test_uuid7_is_a_time_ordered_uuid():
+    first = uuid7()
+    time.sleep(0.002)
+    later = [uuid7() for _ in range(100)]
+    parsed = uuid.UUID(first)
+    assert str(parsed) == first and parsed.version == 7 and parsed.variant == uuid.RFC_4122
+    assert all(first < value for value in later)
+    assert abs((parsed.int >> 80) - time.time() * 1000) < 5000
+
+
+def test_new_id_follows_id_format():
+    original = dict(settings)
+    try:
+        settings['format'] = 'uuid7'
+        assert uuid.UUID(new_id()).version == 7
+        settings['format'] = 'uuid4'
+        assert uuid.UUID(new_id()).version == 4
+    finally:
+        settings.update(original)
+
+
+def test_binary_ids_round_trip_as_strings():
+    engine = sqlite_engine()
+    metadata = tables(binary=True)
+    metadata.create_all(engine)
+    users, bonds = metadata.tables['users'], metadata.tables['bonds']
+    user_id, bond_id = uuid7(), str(uuid.uuid4())
+    with engine.begin() as connection:
+        connection.execute(users.insert(), {'id': user_id, 'name': 'issuer'})
+        connection.execute(bonds.insert(), {'id': bond_id, 'issuer_id': user_id})
+        row = connection.execute(select(bonds.c.id, users.c.id, users.c.name)
+                                 .join(users, bonds.c.issuer_id == users.c.id)).one()
+        assert row == (bond_id, user_id, 'issuer')
+        assert connection.execute(text('SELECT typeof(id), length(id) FROM users')).one() == ('blob', 16)
+        # Ids that aren't UUIDs bind without error and match nothing
+        assert connection.execute(select(users).where(users.c.id == 'not-a-uuid')).first() is None
+        assert connection.execute(select(users).where(users.c.id == user_id.upper())).one().name == 'issuer'
+
+
+def test_text_ids_are_stored_as_before():
+    engine = sqlite_engine()
+    metadata = tables(binary=False)
+    metadata.create_all(engine)
+    user_id = new_id()
+    with engine.begin() as connection:
+        connection.execute(metadata.tables['users'].insert(), {'id': user_id})
+        assert connection.execute(text('SELECT typeof(id), id FROM users')).one() == ('text', user_id)
+
+
+def test_mismatched_id_storage_refuses_to_start():
+    engine = sqlite_engine()
+    tables(binary=False).create_all(engine)
+    check_id_storage(SimpleNamespace(engine=engine, metadata=tables(binary=False)))
+    with pytest.raises(RuntimeError, match='ID_STORAGE=text'):
+        check_id_storage(SimpleNamespace(engine=engine, metadata=tables(binary=True)))
+
+
+def test_app_with_binary_ids():
+    # Id storage is fixed when the models are defined, so in a fresh interpreter
+    script = (
+        'from app import app, create_tables, db\n'
+        'from sqlalchemy import text\n'
+        'create_tables()\n'
+        'client = app.test_client()\n'
+        "user = {'email': 'binary@example.com', 'password': 'testpassword123', 'firstName': 'B',\n"
+        "        'lastName': 'Id', 'userType': 'retail_investor'}\n"
+        "token = client.post('/api/auth/register', json=user).get_json()['access_token']\n"
+        "profile = client.get('/api/auth/profile', headers={'Authorization': f'Bearer {token}'}).get_json()\n"
+        'with app.app_context():\n'
+        "    print(db.session.execute(text('SELECT typeof(id) FROM users')).scalar(), profile['user']['id'])\n"
+    )
+    env = dict(os.environ, ID_STORAGE='binary', ID_FORMAT='uuid7', JOB_QUEUE_MODE='off',
+               DATABASE_URL='sqlite:///' + os.path.join(tempfile.mkdtemp(), 'binary.db'))
+    result = subprocess.run([sys.executable, '-c', script], cwd=HERE, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    storage, user_id = result.stdout.split()
+    assert storage == 'blob' and uuid.UUID(user_id).version == 7
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, '-q']))
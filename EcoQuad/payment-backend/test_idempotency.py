@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Tests for idempotent order creation keyed by Idempotency-Key or receipt
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from stub_gateway import StubGateway
+
+ORDER = {'amount': 1500.5, 'currency': 'INR'}
+
+
+@pytest.fixture
+def stub():
+    with StubGateway(key_id='rzp_test_key', key_secret='rzp_test_secret') as stub:
+        yield stub
+
+
+@pytest.fixture
+def gateway(app, stub):
+    """The app's PaymentGateway pointed at the stub, with a fresh idempotency cache"""
+    from app import db, order_idempotency, payment_gateway
+
+    original = dict(app.config)
+    app.config.update({
+        'RAZORPAY_KEY_ID': 'rzp_test_key',
+        'RAZORPAY_KEY_SECRET': 'rzp_test_secret',
+        'RAZORPAY_BASE_URL': stub.url,
+        'RAZORPAY_READ_TIMEOUT': 1,
+        'RAZORPAY_RETRY_BACKOFF': 0,
+    })
+    payment_gateway.init_app(app)
+    order_idempotency.init_app(app, db)
+    yield payment_gateway
+    payment_gateway.shutdown()
+    app.config.clear()
+    app.config.update(original)
+    payment_gateway.init_app(app)
+    order_idempotency.init_app(app, db)
+
+
+def order_posts(stub):
+    return stub.calls.count(('POST', '/v1/orders'))
+
+
+def test_repeated_key_replays_the_order(client, gateway, stub):
+    headers = {'Idempotency-Key': 'checkout-1'}
+    first = client.post('/create-order', json=ORDER, headers=headers)
+    second = client.post('/create-order', json=ORDER, headers=headers)
+    assert first.status_code == second.status_code == 200
+    assert 'Idempotent-Replayed' not in first.headers
+    assert second.headers['Idempotent-Replayed'] == 'true'
+    assert second.get_json()['order'] == first.get_json()['order']
+    assert order_posts(stub) == 1
+
+
+def test_receipt_is_the_key_without_a_header(client, gateway, stub):
+    body = dict(ORDER, receipt='receipt_42')
+    first = client.post('/create-order', json=body).get_json()['order']
+    assert client.post('/create-order', json=body).get_json()['order']['id'] == first['id']
+    assert first['receipt'] == 'receipt_42'
+    assert order_posts(stub) == 1
+
+
+def test_unkeyed_requests_create_separate_orders(client, gateway, stub):
+    first = client.post('/create-order', json=ORDER).get_json()['order']
+    second = client.post('/create-order', json=ORDER).get_json()['order']
+    assert first['id'] != second['id']
+    assert order_posts(stub) == 2
+
+
+def test_key_reused_for_another_amount_is_refused(client, gateway, stub):
+    headers = {'Idempotency-Key': 'checkout-2'}
+    assert client.post('/create-order', json=ORDER, headers=headers).status_code == 200
+    response = client.post('/create-order', json=dict(ORDER, amount=10), headers=headers)
+    assert response.status_code == 422
+    assert response.get_json()['error'] == 'idempotency_key_reused'
+    assert order_posts(stub) == 1
+
+
+def test_concurrent_duplicates_make_one_gateway_call(app, gateway, stub):
+    stub.latency = 0.2
+    results = []
+
+    def post():
+        with app.test_client() as client:
+            response = client.post('/create-order', json=ORDER, headers={'Idempotency-Key': 'burst'})
+            results.append((response.status_code, response.get_json()['order']['id']))
+
+    threads = [threading.Thread(target=post) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [status for status, _ in results] == [200] * 10
+    assert len({order_id for _, order_id in results}) == 1
+    assert order_posts(stub) == 1
+
+
+def test_failed_call_releases_the_key(client, gateway, stub):
+    headers = {'Idempotency-Key': 'checkout-3'}
+    stub.fail_next(1, status=503)
+    assert client.post('/create-order', json=ORDER, headers=headers).status_code == 502
+    response = client.post('/create-order', json=ORDER, headers=headers)
+    assert response.status_code == 200
+    assert 'Idempotent-Replayed' not in response.headers
+    assert order_posts(stub) == 2
+
+
+def test_replay_survives_a_cold_cache(app, client, gateway, stub):
+    from app import order_idempotency
+
+    headers = {'Idempotency-Key': 'checkout-4'}
+    order = client.post('/create-order', json=ORDER, headers=headers).get_json()['order']
+    order_idempotency.cache.clear()
+    response = client.post('/create-order', json=ORDER, headers=headers)
+    assert response.headers['Idempotent-Replayed'] == 'true'
+    assert response.get_json()['order']['id'] == order['id']
+    assert order_posts(stub) == 1
+
+
+def test_expired_key_creates_a_new_order(app, client, gateway, stub):
+    from app import db, order_idempotency
+    from models import get_models
+
+    PaymentOrder = get_models(db)['PaymentOrder']
+    headers = {'Idempotency-Key': 'checkout-5'}
+    first = client.post('/create-order', json=ORDER, headers=headers).get_json()['order']
+    with app.app_context():
+        row = PaymentOrder.query.filter_by(idempotency_key='key:checkout-5').one()
+        row.created_at = datetime.utcnow() - timedelta(seconds=order_idempotency.ttl + 1)
+        db.session.commit()
+    order_idempotency.cache.clear()
+    second = client.post('/create-order', json=ORDER, headers=headers).get_json()['order']
+    assert second['id'] != first['id']
+    assert order_posts(stub) == 2
+
+
+def test_offloaded_duplicates_share_a_job(client, gateway, stub):
+    stub.latency = 0.1
+    headers = {'Idempotency-Key': 'checkout-6', 'Prefer': 'respond-async'}
+    first = client.post('/create-order', json=ORDER, headers=headers)
+    second = client.post('/create-order', json=ORDER, headers=headers)
+    assert first.status_code == second.status_code == 202
+    assert first.get_json()['jobId'] == second.get_json()['jobId']
+
+    deadline = time.monotonic() + 2
+    while client.get(first.headers['Location']).status_code == 202 and time.monotonic() < deadline:
+        time.sleep(0.02)
+    replay = client.post('/create-order', json=ORDER, headers=headers)
+    assert replay.status_code == 200
+    assert replay.headers['Idempotent-Replayed'] == 'true'
+    assert order_posts(stub) == 1
+
+
+def test_offloaded_work_finishing_before_submit_returns(app, gateway):
+    from app import order_idempotency
+
+    payload = {'amount': 150050, 'currency': 'INR', 'receipt': 'rcpt_7'}
+    jobs = []
+
+    def instant(result, error=None):
+        def submit(payload, on_done):
+            # Done on the caller's thread, before the job id is handed back
+            on_done(result, error)
+            jobs.append(f'job-{len(jobs)}')
+            return jobs[-1]
+        return submit
+
+    with app.app_context():
+        # A failure releases the key, so a retry queues the order again
+        assert order_idempotency.submit('key:checkout-7', payload, instant(None, RuntimeError('declined'))) == \
+            ('pending', 'job-0')
+        assert order_idempotency.submit('key:checkout-7', payload, instant({'id': 'order_7'})) == \
+            ('pending', 'job-1')
+        # ... and once created, retries get the order rather than a job to poll
+        assert order_idempotency.submit('key:checkout-7', payload, instant({'id': 'order_x'})) == \
+            ('created', {'id': 'order_7'})
+    assert jobs == ['job-0', 'job-1']
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, '-q']))
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Tests for impact readings and their rollups (impact.py)
+"""
+import calendar
+import random
+from datetime import date
+
+import pytest
+
+ISSUER = {
+    'email': 'impact@example.com',
+    'password': 'testpassword123',
+    'firstName': 'Solar',
+    'lastName': 'Issuer',
+    'userType': 'bond_issuer'
+}
+
+T0 = calendar.timegm((2024, 9, 30, 23, 0, 0))
+
+
+def seed(app, client, email=ISSUER['email']):
+    """An issuer with one bond and project; returns (project_id, headers)"""
+    from app import db
+    from models import create_models
+
+    _, GreenBond, Project, _ = create_models(db)
+    body = client.post('/api/auth/register', json=dict(ISSUER, email=email)).get_json()
+    with app.app_context():
+        bond = GreenBond(issuer_id=body['user']['id'], bond_name='Solar', isin=f'IN{len(email):010d}',
+                         bond_type='corporate', face_value=1000, coupon_rate=5,
+                         maturity_date=date(2030, 1, 1), issue_date=date(2024, 1, 1),
+                         minimum_investment=1000, total_amount=1_000_000, risk_rating='AA',
+                         status='active', description='Green bond')
+        db.session.add(bond)
+        db.session.flush()
+        project = Project(bond_id=bond.id, project_name='Solar park', project_type='renewable_energy',
+                          description='Project', country='India', region='South', project_manager='PM',
+                          start_date=date(2024, 1, 1), expected_completion_date=date(2026, 1, 1),
+                          total_budget=100_000)
+        db.session.add(project)
+        db.session.commit()
+        return project.id, {'Authorization': f"Bearer {body['access_token']}"}
+
+
+def post(client, headers, readings):
+    return client.post('/api/impact/readings', json={'readings': readings}, headers=headers)
+
+
+def test_readings_roll_up_by_hour_day_and_month(app, client):
+    project_id, headers = seed(app, client)
+    readings = [
+        {'projectId': project_id, 'metricType': 'co2_reduction', 'value': 2.0, 'recordedAt': T0 + 60},
+        {'projectId': project_id, 'metricType': 'co2_reduction', 'value': 3.0, 'recordedAt': T0 + 120},
+        # The next hour is the next day and the next month
+        {'projectId': project_id, 'metricType': 'co2_reduction', 'value': 5.0,
+         'recordedAt': '2024-10-01T00:30:00'},
+        {'projectId': project_id, 'metricType': 'hectares_restored', 'value': 10, 'recordedAt': T0},
+        {'projectId': project_id, 'metricType': 'hectares_restored', 'value': 12,
+         'recordedAt': '2024-10-01T05:30:00+05:30'},
+    ]
+    response = post(client, headers, readings)
+    assert response.status_code == 200
+    assert response.get_json() == {'received': 5, 'recorded': 5, 'rollupsUpdated': 12, 'rejected': []}
+
+    def series(metric, period):
+        response = client.get(f'/api/impact/projects/{project_id}/series',
+                              query_string={'metricType': metric, 'period': period})
+        return [(point['bucket'], point['value'], point['readingCount']) for point in response.get_json()['points']]
+
+    assert series('co2_reduction', 'hour') == [('2024-09-30T23:00:00', 5.0, 2), ('2024-10-01T00:00:00', 5.0, 1)]
+    assert series('co2_reduction', 'month') == [('2024-09-01T00:00:00', 5.0, 2), ('2024-10-01T00:00:00', 5.0, 1)]
+    # Levels report the latest reading, here 05:30 IST = 00:00 UTC
+    assert series('hectares_restored', 'day') == [('2024-09-30T00:00:00', 10, 1), ('2024-10-01T00:00:00', 12, 1)]
+
+    metrics = client.get('/api/impact/metrics', query_string={'projectId': project_id}).get_json()
+    by_type = {metric['metricType']: metric for metric in metrics['projects'][0]['metrics']}
+    assert by_type['co2_reduction']['currentValue'] == 10.0 and by_type['co2_reduction']['unit'] == 'tCO2e'
+    assert by_type['hectares_restored']['currentValue'] == 12
+    assert by_type['hectares_restored']['measurementDate'] == '2024-10-01T00:00:00'
+
+
+def test_batches_merge_into_existing_rollups(app, client):
+    project_id, headers = seed(app, client)
+    values = [7.0, 1.0, 4.0, 9.0]
+    for value, offset in zip(values, (300, 100, 200, 50)):
+        post(client, headers, [{'projectId': project_id, 'metricType': 'energy_generated',
+                                'value': value, 'recordedAt': T0 + offset}])
+    point, = client.get(f'/api/impact/projects/{project_id}/series',
+                        query_string={'metricType': 'energy_generated', 'period': 'hour'}).get_json()['points']
+    assert point['total'] == sum(values) and point['readingCount'] == 4
+    assert (point['minimum'], point['maximum']) == (1.0, 9.0)
+    # The latest reading is the one recorded last, not the one posted last
+    assert point['lastValue'] == 7.0
+
+
+def test_rebuild_matches_incremental_rollups(app, client):
+    from app import db
+    from impact import rebuild_rollups
+    from models import get_models
+
+    project_id, headers = seed(app, client)
+    rng = random.Random(21)
+    readings = [{'projectId': project_id, 'metricType': rng.choice(('water_saved', 'jobs_created')),
+                 'value': rng.randrange(100), 'recordedAt': T0 + rng.randrange(-10 ** 7, 10 ** 7)}
+                for _ in range(500)]
+    for start in range(0, 500, 100):
+        post(client, headers, readings[start:start + 100])
+
+    table = get_models(db)['ImpactRollup'].__table__
+    with app.app_context():
+        incremental = db.session.execute(table.select().order_by(*table.primary_key)).all()
+        rebuild_rollups([project_id])
+        assert db.session.execute(table.select().order_by(*table.primary_key)).all() == incremental
+    assert len(incremental) > 100
+
+
+def test_rejects_bad_readings_and_other_issuers_projects(app, client):
+    project_id, headers = seed(app, client)
+    other_project, _ = seed(app, client, email='other@example.com')
+    response = post(client, headers, [
+        {'projectId': project_id, 'metricType': 'co2_reduction', 'value': 1, 'recordedAt': T0},
+        {'projectId': project_id, 'metricType': 'smiles', 'value': 1, 'recordedAt': T0},
+        {'projectId': project_id, 'metricType': 'co2_reduction', 'value': 'lots', 'recordedAt': T0},
+        {'projectId': project_id, 'metricType': 'co2_reduction', 'value': 1, 'recordedAt': 'yesterday'},
+        {'projectId': other_project, 'metricType': 'co2_reduction', 'value': 1, 'recordedAt': T0},
+    ])
+    body = response.get_json()
+    assert body['recorded'] == 1
+    assert [item['index'] for item in body['rejected']] == [1, 2, 3, 4]
+    assert body['rejected'][3]['error'] == 'not a project of yours'
+
+    assert client.post('/api/impact/readings', json={'readings': []}).status_code == 401
+    assert post(client, headers, None).status_code == 400
+    app.config['IMPACT_MAX_READINGS'] = 2
+    try:
+        assert post(client, headers, [{}] * 3).status_code == 413
+    finally:
+        app.config['IMPACT_MAX_READINGS'] = 10000
+
+
+def test_series_parameters(app, client):
+    project_id, headers = seed(app, client)
+    post(client, headers, [{'projectId': project_id, 'metricType': 'co2_reduction', 'value': 1,
+                            'recordedAt': T0 + day * 86400} for day in range(10)])
+    url = f'/api/impact/projects/{project_id}/series'
+    points = client.get(url, query_string={'metricType': 'co2_reduction', 'from': '2024-10-02',
+                                           'to': T0 + 5 * 86400}).get_json()['points']
+    assert [point['bucket'][:10] for point in points] == ['2024-10-02', '2024-10-03', '2024-10-04', '2024-10-05']
+    latest = client.get(url, query_string={'metricType': 'co2_reduction', 'limit': 2}).get_json()['points']
+    assert [point['bucket'][:10] for point in latest] == ['2024-10-08', '2024-10-09']
+    assert client.get(url, query_string={'metricType': 'smiles'}).status_code == 400
+    assert client.get(url, query_string={'metricType': 'co2_reduction', 'period': 'week'}).status_code == 400
+    assert client.get(url, query_string={'metricType': 'co2_reduction', 'from': 'soon'}).status_code == 400
+    assert client.get('/api/impact/metrics').status_code == 400
+
+
+def test_reads_search_the_rollup_key(app, client):
+    from app import db
+    from query_plans import assert_no_scans
+
+    project_id, headers = seed(app, client)
+    post(client, headers, [{'projectId': project_id, 'metricType': 'co2_reduction', 'value': 1, 'recordedAt': T0}])
+    with app.app_context():
+        engine = db.engine
+    with assert_no_scans(engine):
+        client.get(f'/api/impact/projects/{project_id}/series', query_string={'metricType': 'co2_reduction'})
+        client.get('/api/impact/metrics', query_string={'projectId': project_id})
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, '-q']))
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Tests for streaming bulk impact uploads (ingest.py)
+"""
+import io
+import json
+import sqlite3
+from datetime import date
+
+import pytest
+
+T0 = 1727737200  # 2024-09-30T23:00:00Z
+
+ISSUER = {
+    'email': 'meters@example.com',
+    'password': 'testpassword123',
+    'firstName': 'Meter',
+    'lastName': 'Reader',
+    'userType': 'bond_issuer'
+}
+
+
+@pytest.fixture
+def project(app, client):
+    """(project_id, headers) for a project on a bond the caller issued"""
+    from app import db
+    from models import create_models
+
+    _, GreenBond, Project, _ = create_models(db)
+    body = client.post('/api/auth/register', json=ISSUER).get_json()
+    with app.app_context():
+        bond = GreenBond(issuer_id=body['user']['id'], bond_name='Wind', isin='IN0000000001',
+                         bond_type='corporate', face_value=1000, coupon_rate=5,
+                         maturity_date=date(2030, 1, 1), issue_date=date(2024, 1, 1),
+                         minimum_investment=1000, total_amount=1_000_000, risk_rating='AA',
+                         status='active', description='Green bond')
+        db.session.add(bond)
+        db.session.flush()
+        project = Project(bond_id=bond.id, project_name='Wind farm', project_type='renewable_energy',
+                          description='Project', country='India', region='West', project_manager='PM',
+                          start_date=date(2024, 1, 1), expected_completion_date=date(2026, 1, 1),
+                          total_budget=100_000)
+        db.session.add(project)
+        db.session.commit()
+        return project.id, {'Authorization': f"Bearer {body['access_token']}"}
+
+
+@pytest.fixture
+def chunk(app):
+    original = app.config['IMPACT_BULK_CHUNK']
+    app.config['IMPACT_BULK_CHUNK'] = 3
+    yield 3
+    app.config['IMPACT_BULK_CHUNK'] = original
+
+
+def upload(client, project_id, headers, body, content_type='application/x-ndjson'):
+    return client.post(f'/api/projects/{project_id}/metrics:bulk', data=body,
+                       headers=dict(headers, **{'Content-Type': content_type}))
+
+
+def stored(app):
+    from app import db
+
+    with app.app_context():
+        readings = db.session.execute(db.text('SELECT COUNT(*), SUM(value) FROM impact_readings')).one()
+        rollup = db.session.execute(db.text(
+            "SELECT SUM(reading_count), SUM(total) FROM impact_rollups WHERE period = 'month'")).one()
+        return tuple(readings), tuple(rollup)
+
+
+def test_ndjson_upload_in_chunks(app, client, project, chunk):
+    project_id, headers = project
+    lines = [json.dumps({'metricType': 'co2_reduction', 'value': i, 'recordedAt': T0 + i * 60}) for i in range(8)]
+    lines[2] = '{"metricType": "co2_reduction", '                      # line 3: not JSON
+    lines.insert(4, '')                                                                    # line 5: blank
+    lines[6] = json.dumps({'metricType': 'smiles', 'value': 1, 'recordedAt': T0})         # line 7
+    lines.append(json.dumps({'projectId': 'elsewhere', 'metricType': 'water_saved',      # line 10
+                             'value': 1, 'recordedAt': T0}))
+    response = upload(client, project_id, headers, '\n'.join(lines) + '\n')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body == {
+        'received': 9,
+        'recorded': 6,
+        'rejectedCount': 3,
+        'rejected': [{'line': 3, 'error': 'line is not JSON'},
+                     {'line': 7, 'error': 'unknown metricType: smiles'},
+                     {'line': 10, 'error': 'projectId does not match the URL'}],
+        'committedThroughLine': 10
+    }
+    assert stored(app) == ((6, 0 + 1 + 3 + 4 + 6 + 7), (6, 21.0))
+
+
+def test_csv_upload(app, client, project):
+    project_id, headers = project
+    body = ('recordedAt,metricType,value,note\r\n'
+            f'{T0},energy_generated,1.5,"first, of two"\r\n'
+            '2024-10-01T00:30:00,energy_generated,2.5,"multi\r\nline"\r\n'
+            '2024-10-01T00:45:00,energy_generated,lots,\r\n')
+    response = upload(client, project_id, headers, body, 'text/csv')
+    assert response.status_code == 200
+    assert response.get_json()['recorded'] == 2
+    assert response.get_json()['rejected'] == [{'line': 5, 'error': 'value must be a number'}]
+    assert stored(app) == ((2, 4.0), (2, 4.0))
+
+    response = upload(client, project_id, headers, 'when,metricType,value\n1,co2_reduction,1\n', 'text/csv')
+    assert response.status_code == 400 and 'recordedAt' in response.get_json()['error']
+
+
+class MeteredBody(io.RawIOBase):
+    """A request body that records the reads made of it and how many readings were committed by then"""
+
+    def __init__(self, data, database):
+        self.data = io.BytesIO(data)
+        self.database = database
+        self.reads = []
+
+    def readable(self):
+        return True
+
+    # The test client measures the body with these before the request
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.data.seek(offset, whence)
+
+    def tell(self):
+        return self.data.tell()
+
+    def readinto(self, buffer):
+        with sqlite3.connect(self.database) as connection:
+            committed = connection.execute('SELECT COUNT(*) FROM impact_readings').fetchone()[0]
+        count = self.data.readinto(buffer)
+        self.reads.append((len(buffer), committed))
+        return count
+
+
+def test_body_is_streamed_and_committed_as_it_goes(app, client, project):
+    from app import db
+    from ingest import BUFFER_SIZE
+
+    project_id, headers = project
+    line = json.dumps({'metricType': 'co2_reduction', 'value': 1.0, 'recordedAt': T0}) + '\n'
+    data = (line * 60000).encode()
+    with app.app_context():
+        body = MeteredBody(data, db.engine.url.database)
+    response = client.post(f'/api/projects/{project_id}/metrics:bulk', input_stream=body,
+                           headers=dict(headers, **{'Content-Type': 'application/x-ndjson',
+                                                    'Content-Length': str(len(data))}))
+    assert response.get_json()['recorded'] == 60000
+    assert all(size <= BUFFER_SIZE for size, _ in body.reads)
+    # Chunks were committed while the rest of the body was still unread
+    assert 0 < body.reads[-1][1] < 60000
+
+
+def test_failed_chunk_keeps_earlier_ones(app, client, project, chunk, monkeypatch):
+    import ingest
+
+    project_id, headers = project
+    calls = []
+
+    def record_readings(readings):
+        calls.append(len(readings))
+        if len(calls) == 2:
+            raise RuntimeError('disk full')
+        return original(readings)
+
+    original = ingest.record_readings
+    monkeypatch.setattr(ingest, 'record_readings', record_readings)
+    lines = [json.dumps({'metricType': 'co2_reduction', 'value': 1, 'recordedAt': T0 + i}) for i in range(7)]
+    response = upload(client, project_id, headers, '\n'.join(lines))
+    assert response.status_code == 500
+    assert response.get_json()['recorded'] == 3 and response.get_json()['committedThroughLine'] == 3
+    assert stored(app) == ((3, 3.0), (3, 3.0))
+
+
+def test_rejects_other_projects_and_formats(app, client, project):
+    project_id, headers = project
+    assert upload(client, project_id, headers, '{}', 'application/json').status_code == 415
+    assert upload(client, 'no-such-project', headers, '{}').status_code == 404
+    assert client.post(f'/api/projects/{project_id}/metrics:bulk', data='{}',
+                       content_type='application/x-ndjson').status_code == 401
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, '-q']))
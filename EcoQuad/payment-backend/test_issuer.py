@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Tests for the incrementally maintained issuer summary (issuer.py)
+"""
+from datetime import date
+
+import pytest
+
+ISSUER = {
+    'email': 'summary@example.com',
+    'password': 'testpassword123',
+    'firstName': 'Green',
+    'lastName': 'Issuer',
+    'userType': 'bond_issuer'
+}
+
+
+def register(client, email=ISSUER['email']):
+    body = client.post('/api/auth/register', json=dict(ISSUER, email=email)).get_json()
+    return body['user']['id'], {'Authorization': f"Bearer {body['access_token']}"}
+
+
+def bond(issuer_id, isin, total, raised=0, status='active'):
+    from app import db
+    from models import create_models
+
+    GreenBond = create_models(db)[1]
+    return GreenBond(issuer_id=issuer_id, bond_name='Bond', isin=isin, bond_type='corporate',
+                     face_value=1000, coupon_rate=5, maturity_date=date(2030, 1, 1),
+                     issue_date=date(2024, 1, 1), minimum_investment=1000, total_amount=total,
+                     amount_raised=raised, risk_rating='AA', status=status, description='Green bond')
+
+
+def project(bond_id, budget, spent=0):
+    from app import db
+    from models import create_models
+
+    Project = create_models(db)[2]
+    return Project(bond_id=bond_id, project_name='Project', project_type='renewable_energy',
+                   description='Project', country='India', region='East', project_manager='PM',
+                   start_date=date(2024, 1, 1), expected_completion_date=date(2026, 1, 1),
+                   total_budget=budget, allocated_funds=budget / 2, spent_funds=spent)
+
+
+def summary_rows(app, issuer_id):
+    """The issuer's summary row without updated_at, and their non-empty status rows"""
+    from app import db
+    from models import get_models
+
+    models = get_models(db)
+    summary, statuses = models['IssuerSummary'].__table__, models['IssuerBondStatus'].__table__
+    with app.app_context():
+        row = db.session.execute(summary.select().where(summary.c.issuer_id == issuer_id)).one()
+        return tuple(row)[:-1], sorted(tuple(row) for row in db.session.execute(
+            statuses.select().where(statuses.c.issuer_id == issuer_id, statuses.c.bond_count > 0)))
+
+
+@pytest.fixture
+def issuer(app, client):
+    """An issuer with two active bonds and a draft, and three projects"""
+    from app import db
+
+    issuer_id, headers = register(client)
+    with app.app_context():
+        bonds = [bond(issuer_id, 'IN0000000001', 100_000, 25_000), bond(issuer_id, 'IN0000000002', 50_000),
+                 bond(issuer_id, 'IN0000000003', 20_000, status='draft')]
+        db.session.add_all(bonds)
+        db.session.flush()
+        db.session.add_all([project(bonds[0].id, 40_000, 10_000), project(bonds[0].id, 20_000),
+                            project(bonds[1].id, 30_000, 3_000)])
+        db.session.commit()
+        return issuer_id, headers, [b.id for b in bonds]
+
+
+def test_summary_endpoint(app, client, issuer):
+    issuer_id, headers, _ = issuer
+    body = client.get('/api/issuer/summary', headers=headers).get_json()
+    summary = body['summary']
+    del summary['updatedAt']
+    assert summary == {
+        'bondCount': 3, 'totalAmount': 170_000, 'amountRaised': 25_000, 'fundingProgress': 14.71,
+        'projectCount': 3, 'totalBudget': 90_000, 'allocatedFunds': 45_000, 'spentFunds': 13_000,
+        'budgetSpent': 14.44
+    }
+    assert body['bondsByStatus'] == [
+        {'status': 'active', 'bondCount': 2, 'totalAmount': 150_000, 'amountRaised': 25_000,
+         'fundingProgress': 16.67},
+        {'status': 'draft', 'bondCount': 1, 'totalAmount': 20_000, 'amountRaised': 0, 'fundingProgress': 0},
+    ]
+    assert client.get('/api/issuer/summary').status_code == 401
+
+    # Someone who never issued a bond gets zeros, and the read writes nothing
+    from app import db
+    from query_counter import count_queries
+
+    _, other = register(client, 'nobonds@example.com')
+    with app.app_context():
+        engine = db.engine
+    with count_queries(engine) as statements:
+        assert client.get('/api/issuer/summary', headers=other).get_json()['summary']['bondCount'] == 0
+    assert all(statement.lstrip().startswith('SELECT') for statement in statements)
+
+
+def test_hooks_match_a_rebuild(app, client, issuer):
+    from app import db
+    from issuer import rebuild_issuers
+    from models import create_models
+
+    issuer_id, _, (first, second, draft) = issuer
+    _, GreenBond, Project, _ = create_models(db)
+    with app.app_context():
+        assert GreenBond.add_raised(second, 5_000)
+        db.session.get(GreenBond, draft).status = 'active'
+        spent = Project.query.filter_by(bond_id=first, total_budget=20_000).one()
+        spent.spent_funds = 7_500
+        db.session.delete(Project.query.filter_by(bond_id=second).one())
+        db.session.commit()
+    incremental = summary_rows(app, issuer_id)
+    summary, statuses = incremental
+    assert summary[1:] == (3, 170_000, 30_000, 2, 60_000, 30_000, 17_500)
+    assert [row[1:] for row in statuses] == [('active', 3, 170_000, 30_000)]
+
+    with app.app_context():
+        rebuild_issuers()
+    assert summary_rows(app, issuer_id) == incremental
+
+
+def test_summary_is_a_key_lookup(app, client, issuer):
+    from app import db
+    from query_plans import assert_no_scans
+
+    _, headers, _ = issuer
+    client.get('/api/issuer/summary', headers=headers)
+    with app.app_context():
+        engine = db.engine
+    with assert_no_scans(engine):
+        assert client.get('/api/issuer/summary', headers=headers).status_code == 200
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, '-q']))
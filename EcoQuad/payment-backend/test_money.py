@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Tests for integer-paise money columns and their migration from FLOAT rupees
+"""
+from datetime import date
+
+import pytest
+from sqlalchemy import MetaData, func, inspect, select, text
+from sqlalchemy.types import Float, Integer
+
+from money import Money, to_paise, to_rupees
+
+
+def seed_bond(app, **columns):
+    from app import db
+    from models import create_models
+
+    User, GreenBond, _, _ = create_models(db)
+    with app.app_context():
+        issuer = User(email='issuer@example.com', first_name='Eco', last_name='Issuer',
+                      user_type='bond_issuer', password_hash='x')
+        db.session.add(issuer)
+        db.session.flush()
+        bond = GreenBond(**dict(dict(
+            issuer_id=issuer.id, bond_name='Solar', isin='IN0000000003', bond_type='corporate',
+            face_value=1000, coupon_rate=7, maturity_date=date(2030, 3, 31), issue_date=date(2024, 1, 1),
+            minimum_investment=500.25, total_amount=1_000_000, amount_raised=0, risk_rating='AA',
+            status='active', description='Green bond'), **columns))
+        db.session.add(bond)
+        db.session.commit()
+        return issuer.id, bond.id
+
+
+def test_to_paise():
+    assert [to_paise(amount) for amount in (12, 1500.5, 0.29, '1500.50', ' -0.07 ', '.5', '3.100')] == \
+        [1200, 150050, 29, 150050, -7, 50, 310]
+    assert to_rupees(150050) == 1500.5
+    for bad in ('', 'abc', '1e3', '1.005', float('nan'), float('inf'), None, True, [1]):
+        with pytest.raises(ValueError):
+            to_paise(bad)
+
+
+def test_amounts_are_stored_as_paise_and_read_as_rupees(app):
+    from app import db
+    from models import get_models
+
+    _, bond_id = seed_bond(app)
+    GreenBond = get_models(db)['GreenBond']
+    with app.app_context():
+        assert db.session.execute(text('SELECT minimum_investment FROM green_bonds')).scalar() == 50025
+        bond = db.session.get(GreenBond, bond_id)
+        assert bond.minimum_investment == 500.25
+        assert bond.to_dict()['minimumInvestment'] == 500.25
+        # Literals in SQL expressions are amounts too
+        assert GreenBond.query.filter(GreenBond.minimum_investment + 0 >= 500.25).count() == 1
+        assert GreenBond.query.filter(GreenBond.minimum_investment > 500.25).count() == 0
+
+
+def test_sums_are_exact(app):
+    from app import db
+    from models import get_models
+
+    investor_id, bond_id = seed_bond(app)
+    models = get_models(db)
+    Investment, PortfolioSummary = models['Investment'], models['PortfolioSummary']
+    with app.app_context():
+        for _ in range(1000):
+            db.session.add(Investment(investor_id=investor_id, bond_id=bond_id, investment_amount=0.1,
+                                      purchase_price=1000, purchase_date=date(2024, 2, 1),
+                                      status='confirmed', fees=0.01))
+        db.session.commit()
+        assert sum([0.1] * 1000) != 100
+        assert db.session.query(func.sum(Investment.investment_amount)).scalar() == 100
+        summary = db.session.get(PortfolioSummary, investor_id)
+        # 13 coupons of 35 plus 1000 principal on 0.0001 bonds is 0.1455, stored as 0.15
+        assert (summary.total_invested, summary.total_fees, summary.expected_return) == (100, 10, 150)
+        assert db.session.execute(select(func.sum(Investment.fees))).scalar() == 10
+
+
+def test_create_order_converts_amounts_exactly(app, client):
+    from app import payment_gateway
+
+    _, bond_id = seed_bond(app, total_amount=1000, amount_raised=999.71)
+    sent = []
+    original = payment_gateway.create_order
+    payment_gateway.create_order = lambda payload: sent.append(payload) or dict(payload, id='order_1')
+    try:
+        # int(float('0.29') * 100) used to send 28
+        assert client.post('/create-order', json={'amount': '0.29', 'bondId': bond_id}).status_code == 200
+        response = client.post('/create-order', json={'amount': 0.3, 'bondId': bond_id})
+        assert response.status_code == 409 and response.get_json()['remainingAmount'] == 0.29
+        assert client.post('/create-order', json={'amount': 'ten'}).status_code == 400
+    finally:
+        payment_gateway.create_order = original
+    assert [payload['amount'] for payload in sent] == [29]
+
+
+def legacy_money_tables(app):
+    """Replace green_bonds and investments with their rupee FLOAT versions; returns (investor_id, bond_id)"""
+    from app import db
+
+    investor_id, bond_id = seed_bond(app, face_value=999.99, total_amount=2_500_000.5)
+    metadata = MetaData()
+    for table in db.metadata.sorted_tables:
+        table.to_metadata(metadata)
+    legacy = {name: metadata.tables[name] for name in ('green_bonds', 'investments')}
+    for table in legacy.values():
+        for column in table.columns:
+            if isinstance(column.type, Money):
+                column.type = Float()
+    with app.app_context():
+        with db.engine.begin() as connection:
+            bonds = [dict(row) for row in connection.execute(select(legacy['green_bonds'])).mappings()]
+            for name in ('investments', 'green_bonds'):
+                db.metadata.tables[name].drop(connection)
+            for name in ('green_bonds', 'investments'):
+                legacy[name].create(connection)
+            connection.execute(legacy['green_bonds'].insert(), [
+                dict(bond, **{name: bond[name] / 100 for name in
+                              ('face_value', 'minimum_investment', 'total_amount', 'amount_raised')})
+                for bond in bonds])
+            connection.execute(legacy['investments'].insert(), [{
+                'id': f'inv-{i}', 'investor_id': investor_id, 'bond_id': bond_id,
+                'investment_amount': 1500.5 + i, 'purchase_price': 1000.0, 'purchase_date': date(2024, 2, 1),
+                'status': 'confirmed', 'fees': 0.29, 'expected_return': 1650.55, 'maturity_value': 1500.5,
+            } for i in range(3)])
+    return investor_id, bond_id
+
+
+def test_float_columns_are_migrated_to_paise(app):
+    from app import db
+    from migrations import migrate_money_columns
+    from models import get_models
+
+    models = get_models(db)
+    GreenBond, Investment = models['GreenBond'], models['Investment']
+    investor_id, bond_id = legacy_money_tables(app)
+    with app.app_context():
+        assert migrate_money_columns(db) == ['green_bonds', 'investments']
+        assert migrate_money_columns(db) == []
+
+        columns = {column['name']: column['type'] for column in inspect(db.engine).get_columns('investments')}
+        assert isinstance(columns['investment_amount'], Integer) and isinstance(columns['fees'], Integer)
+        assert db.session.execute(text('SELECT SUM(investment_amount), SUM(fees) FROM investments')).one() == \
+            (450450, 87)
+        investment = db.session.get(Investment, 'inv-1')
+        assert (investment.investment_amount, investment.fees, investment.expected_return) == (1501.5, 0.29, 1650.55)
+        bond = db.session.get(GreenBond, bond_id)
+        assert (bond.face_value, bond.total_amount, bond.minimum_investment) == (999.99, 2_500_000.5, 500.25)
+        indexes = {index['name'] for index in inspect(db.engine).get_indexes('green_bonds')}
+        assert {index.name for index in GreenBond.__table__.indexes} <= indexes
+
+
+def test_unsupported_dialect_is_refused_before_migrating(app, monkeypatch):
+    import migrations
+    from app import db
+
+    legacy_money_tables(app)
+    monkeypatch.delitem(migrations.MONEY_MIGRATIONS, 'sqlite')
+    with app.app_context():
+        with pytest.raises(RuntimeError, match='unsupported dialect sqlite .* green_bonds, investments'):
+            migrations.migrate_money_columns(db)
+        columns = {column['name']: column['type'] for column in inspect(db.engine).get_columns('investments')}
+        assert isinstance(columns['investment_amount'], Float)
+
+    monkeypatch.undo()
+    with app.app_context():
+        assert migrations.migrate_money_columns(db) == ['green_bonds', 'investments']
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, '-q']))
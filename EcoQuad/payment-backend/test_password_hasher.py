@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Tests for the bounded password hashing pool
+"""
+import threading
+
+import pytest
+from flask import Flask
+
+from hashing import HashingUnavailable, PasswordHasher, hash_rounds
+
+
+def make_hasher(**config):
+    app = Flask(__name__)
+    app.config.update({
+        'PASSWORD_HASH_EXECUTOR': 'thread',
+        'PASSWORD_HASH_WORKERS': 1,
+        'PASSWORD_HASH_QUEUE_DEPTH': 0,
+        'BCRYPT_LOG_ROUNDS': 4,
+    })
+    app.config.update(config)
+    return PasswordHasher(app)
+
+
+def occupy(hasher):
+    """Hold every slot of hasher until the returned event is set"""
+    release = threading.Event()
+    threads = []
+    for _ in range(hasher.workers + hasher.queue_depth):
+        started = threading.Event()
+
+        def block(started=started):
+            started.set()
+            release.wait(5)
+
+        thread = threading.Thread(target=hasher._submit, args=(block,))
+        thread.start()
+        threads.append(thread)
+        # queued jobs never start, so only wait for the ones a worker picks up
+        started.wait(0.05)
+    return release, threads
+
+
+def test_hash_and_check_roundtrip():
+    hasher = make_hasher()
+    pw_hash = hasher.hash('testpassword123')
+    assert pw_hash.startswith('$2b$04$')
+    assert hasher.check(pw_hash, 'testpassword123')
+    assert not hasher.check(pw_hash, 'wrong-password')
+
+    metrics = hasher.metrics()
+    assert metrics['completed'] == 3
+    assert metrics['hashTimeMs']['p50'] is not None
+
+
+def test_process_pool_matches_inline_hash():
+    hasher = make_hasher(PASSWORD_HASH_EXECUTOR='process')
+    try:
+        pw_hash = hasher.hash('testpassword123')
+    finally:
+        hasher.shutdown()
+    assert make_hasher(PASSWORD_HASH_EXECUTOR='inline').check(pw_hash, 'testpassword123')
+
+
+def test_saturated_pool_rejects_immediately():
+    hasher = make_hasher()
+    release, threads = occupy(hasher)
+    try:
+        with pytest.raises(HashingUnavailable):
+            hasher.hash('testpassword123')
+    finally:
+        release.set()
+        for thread in threads:
+            thread.join()
+    assert hasher.metrics()['rejected'] == 1
+    assert hasher.hash('testpassword123')
+
+
+def test_login_returns_503_when_saturated(app, client):
+    user = {
+        'email': 'burst@example.com',
+        'password': 'testpassword123',
+        'firstName': 'Burst',
+        'lastName': 'Test',
+        'userType': 'retail_investor'
+    }
+    assert client.post('/api/auth/register', json=user).status_code == 201
+
+    hasher = app.extensions['password_hasher']
+    release, threads = occupy(hasher)
+    try:
+        response = client.post('/api/auth/login', json={'email': user['email'], 'password': user['password']})
+    finally:
+        release.set()
+        for thread in threads:
+            thread.join()
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+    response = client.post('/api/auth/login', json={'email': user['email'], 'password': user['password']})
+    assert response.status_code == 200
+
+
+def test_login_rehashes_to_configured_cost(app, client):
+    from app import db
+    from models import create_models
+
+    User, _, _, _ = create_models(db)
+    user = {
+        'email': 'rehash@example.com',
+        'password': 'testpassword123',
+        'firstName': 'Re',
+        'lastName': 'Hash',
+        'userType': 'retail_investor'
+    }
+    assert client.post('/api/auth/register', json=user).status_code == 201
+
+    hasher = app.extensions['password_hasher']
+    original_rounds = hasher.rounds
+    hasher.rounds = original_rounds + 1
+    try:
+        response = client.post('/api/auth/login', json={'email': user['email'], 'password': user['password']})
+        assert response.status_code == 200
+        with app.app_context():
+            stored = User.query.filter_by(email=user['email']).first().password_hash
+        assert hash_rounds(stored) == original_rounds + 1
+    finally:
+        hasher.rounds = original_rounds
+
+    response = client.post('/api/auth/login', json={'email': user['email'], 'password': user['password']})
+    assert response.status_code == 200
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, '-q']))
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Tests for the incrementally maintained portfolio summary
+"""
+from datetime import date
+
+import pytest
+
+
+def register(client, email='investor@example.com'):
+    response = client.post('/api/auth/register', json={
+        'email': email,
+        'password': 'testpassword123',
+        'firstName': 'Port',
+        'lastName': 'Folio',
+        'userType': 'institutional_investor'
+    })
+    body = response.get_json()
+    return body['user']['id'], {'Authorization': f"Bearer {body['access_token']}"}
+
+
+def seed_bonds(app):
+    from app import db
+    from models import create_models
+
+    User, GreenBond, _, _ = create_models(db)
+    with app.app_context():
+        issuer = User(email='issuer@example.com', first_name='Eco', last_name='Issuer',
+                      user_type='bond_issuer', password_hash='x')
+        db.session.add(issuer)
+        db.session.flush()
+        bonds = []
+        for i, (bond_type, rating, year) in enumerate((('corporate', 'AA', 2029),
+                                                       ('municipal', 'AAA', 2031),
+                                                       ('corporate', 'BBB+', 2031))):
+            bond = GreenBond(issuer_id=issuer.id, bond_name=f'Bond {i}', isin=f'IN{i:010d}',
+                             bond_type=bond_type, face_value=1000, coupon_rate=5,
+                             maturity_date=date(year, 6, 30), issue_date=date(2024, 1, 1),
+                             minimum_investment=1000, total_amount=1_000_000, risk_rating=rating,
+                             status='active', description='Green bond')
+            db.session.add(bond)
+            bonds.append(bond)
+        db.session.commit()
+        return [bond.id for bond in bonds]
+
+
+def invest(app, investor_id, bond_id, amount, status='settled'):
+    from app import db
+    from models import create_models
+
+    _, _, _, Investment = create_models(db)
+    with app.app_context():
+        investment = Investment(investor_id=investor_id, bond_id=bond_id, investment_amount=amount,
+                                purchase_price=1000, purchase_date=date(2024, 2, 1), status=status,
+                                fees=10)
+        db.session.add(investment)
+        db.session.commit()
+        return investment.id
+
+
+def test_summary_tracks_inserts_and_status_changes(app, client):
+    from app import db
+    from models import create_models
+
+    _, _, _, Investment = create_models(db)
+    investor_id, headers = register(client)
+    bonds = seed_bonds(app)
+    invest(app, investor_id, bonds[0], 10000)
+    invest(app, investor_id, bonds[1], 20000)
+    cancel_me = invest(app, investor_id, bonds[2], 30000, status='pending')
+
+    body = client.get('/api/portfolio/summary', headers=headers).get_json()
+    assert body['summary']['portfolioValue'] == pytest.approx(60000)
+    # Coupons of 25 per 1000 bond still due after purchase, plus principal:
+    # 11 to mid-2029, 15 to mid-2031
+    assert body['summary']['expectedReturns'] == pytest.approx(10 * 1275 + 20 * 1375 + 30 * 1375)
+    assert body['summary']['positionCount'] == 3
+    assert {row['bucket']: row['amount'] for row in body['allocation']['bondType']} == \
+        pytest.approx({'corporate': 40000, 'municipal': 20000})
+    assert [(row['year'], row['amount']) for row in body['maturityLadder']] == [(2029, 10000), (2031, 50000)]
+
+    with app.app_context():
+        # expire first so the old status isn't in the attribute history
+        investment = Investment.query.get(cancel_me)
+        db.session.expire(investment)
+        investment.status = 'cancelled'
+        db.session.commit()
+
+    body = client.get('/api/portfolio/summary', headers=headers).get_json()
+    assert body['summary']['portfolioValue'] == pytest.approx(30000)
+    assert body['summary']['positionCount'] == 2
+    assert [row['bucket'] for row in body['allocation']['riskRating']] == ['AAA', 'AA']
+
+
+def test_rebuild_matches_incremental_summary(app, client):
+    from app import db
+    from portfolio import rebuild_portfolios
+
+    investor_id, headers = register(client)
+    bonds = seed_bonds(app)
+    for i, bond_id in enumerate(bonds * 3):
+        invest(app, investor_id, bond_id, 1000 * (i + 1))
+
+    incremental = client.get('/api/portfolio/summary', headers=headers).get_json()
+    with app.app_context():
+        rebuild_portfolios()
+    rebuilt = client.get('/api/portfolio/summary', headers=headers).get_json()
+    incremental['summary'].pop('updatedAt')
+    rebuilt['summary'].pop('updatedAt')
+    assert rebuilt == incremental
+
+
+def test_changing_a_bond_moves_its_positions_between_buckets(app, client):
+    from app import db
+    from models import create_models
+    from portfolio import rebuild_portfolios
+
+    _, GreenBond, _, Investment = create_models(db)
+    investor_id, headers = register(client)
+    other_id, _ = register(client, 'other@example.com')
+    bonds = seed_bonds(app)
+    first = invest(app, investor_id, bonds[0], 10000)
+    invest(app, investor_id, bonds[1], 20000)
+    invest(app, other_id, bonds[0], 5000)
+
+    with app.app_context():
+        bond = db.session.get(GreenBond, bonds[0])
+        bond.risk_rating = 'A'
+        bond.maturity_date = date(2031, 12, 31)
+        db.session.commit()
+    body = client.get('/api/portfolio/summary', headers=headers).get_json()
+    assert {row['bucket']: row['amount'] for row in body['allocation']['riskRating']} == \
+        pytest.approx({'A': 10000, 'AAA': 20000})
+    assert [(row['year'], row['amount']) for row in body['maturityLadder']] == [(2031, 30000)]
+
+    # Removing the position after the change takes it out of the new buckets
+    with app.app_context():
+        db.session.delete(db.session.get(Investment, first))
+        db.session.commit()
+    incremental = client.get('/api/portfolio/summary', headers=headers).get_json()
+    assert {row['bucket'] for row in incremental['allocation']['riskRating']} == {'AAA'}
+    with app.app_context():
+        stored = db.session.execute(db.text(
+            'SELECT investor_id, dimension, bucket, position_count, amount FROM portfolio_allocations '
+            'WHERE position_count != 0 OR amount != 0 ORDER BY 1, 2, 3')).all()
+        rebuild_portfolios()
+        assert db.session.execute(db.text(
+            'SELECT investor_id, dimension, bucket, position_count, amount FROM portfolio_allocations '
+            'ORDER BY 1, 2, 3')).all() == stored
+
+
+def test_new_investor_gets_an_empty_summary(app, client):
+    from app import db
+    from query_counter import count_queries
+
+    _, headers = register(client)
+    with app.app_context():
+        engine = db.engine
+    # The read may be on a replica, so a missing summary is never written
+    with count_queries(engine) as statements:
+        body = client.get('/api/portfolio/summary', headers=headers).get_json()
+    assert all(statement.lstrip().startswith('SELECT') for statement in statements)
+    assert body['summary']['portfolioValue'] == 0
+    assert body['allocation'] == {'bondType': [], 'riskRating': []}
+    assert client.get('/api/portfolio/summary').status_code == 401
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, '-q']))
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Query plan regression tests: the queries behind the dashboards must search
+an index, never scan a table
+"""
+from datetime import date
+
+import pytest
+
+from query_plans import assert_no_scans, explain, scans
+
+INVESTOR = {
+    'email': 'plans@example.com',
+    'password': 'testpassword123',
+    'firstName': 'Query',
+    'lastName': 'Plan',
+    'userType': 'retail_investor'
+}
+
+
+def seed(app, client):
+    """An issuer with bonds and projects, and an investor holding some of them"""
+    from app import db
+    from models import get_models
+
+    models = get_models(db)
+    User, GreenBond, Project, Investment = (models[name] for name in ('User', 'GreenBond', 'Project', 'Investment'))
+    body = client.post('/api/auth/register', json=INVESTOR).get_json()
+    headers = {'Authorization': f"Bearer {body['access_token']}"}
+    with app.app_context():
+        issuer = User(email='issuer@example.com', first_name='Eco', last_name='Issuer',
+                      user_type='bond_issuer', password_hash='x')
+        db.session.add(issuer)
+        db.session.flush()
+        bond_ids = []
+        for i in range(4):
+            bond = GreenBond(issuer_id=issuer.id, bond_name=f'Bond {i}', isin=f'IN{i:010d}',
+                             bond_type='corporate', face_value=1000, coupon_rate=5,
+                             maturity_date=date(2030, 1, 1), issue_date=date(2024, 1, 1),
+                             minimum_investment=1000, total_amount=1_000_000, risk_rating='AA',
+                             status='active', description='Green bond')
+            db.session.add(bond)
+            db.session.flush()
+            db.session.add(Project(bond_id=bond.id, project_name=f'Solar {i}', project_type='renewable_energy',
+                                   description='Project', country='India', region='South', project_manager='PM',
+                                   start_date=date(2024, 1, 1), expected_completion_date=date(2026, 1, 1),
+                                   total_budget=100_000))
+            db.session.add(Investment(investor_id=body['user']['id'], bond_id=bond.id, investment_amount=5000,
+                                      purchase_price=1000, purchase_date=date(2024, 2, 1), status='settled',
+                                      expected_return=5250, maturity_value=6250))
+            bond_ids.append(bond.id)
+        db.session.commit()
+        return issuer.id, body['user']['id'], bond_ids, headers
+
+
+def test_dashboard_endpoints_search_indexes(app, client):
+    from app import db
+
+    _, _, bond_ids, headers = seed(app, client)
+    with app.app_context():
+        engine = db.engine
+    with assert_no_scans(engine) as queries:
+        assert client.get('/api/bonds').status_code == 200
+        assert client.get(f'/api/bonds/{bond_ids[0]}').status_code == 200
+        assert client.get('/api/portfolio/summary', headers=headers).status_code == 200
+        assert client.get('/api/portfolio/analytics', headers=headers).status_code == 200
+    assert any('FROM investments' in statement for statement, _ in queries)
+
+
+def test_issuer_bonds_and_portfolio_rebuild_search_indexes(app, client):
+    from app import db
+    from models import get_models
+    from portfolio import rebuild_portfolios
+
+    issuer_id, investor_id, _, _ = seed(app, client)
+    with app.app_context():
+        with assert_no_scans(db.engine):
+            issuer = db.session.get(get_models(db)['User'], issuer_id)
+            assert len(issuer.issued_bonds) == 4
+            rebuild_portfolios([investor_id])
+
+
+def test_a_lost_index_fails_the_check(app, client):
+    from app import db
+
+    _, _, _, headers = seed(app, client)
+    with app.app_context():
+        engine = db.engine
+        db.session.execute(db.text('DROP INDEX ix_investments_investor_id_status'))
+        db.session.commit()
+    with pytest.raises(AssertionError, match='SCAN investments'):
+        with assert_no_scans(engine):
+            client.get('/api/portfolio/analytics', headers=headers)
+
+
+def test_scans_reads_sqlite_plans(app):
+    from app import db
+
+    with app.app_context(), db.engine.connect() as connection:
+        plan = explain(connection, 'SELECT * FROM investments WHERE status = ?', ('settled',))
+        assert scans(plan) == ['SCAN investments']
+        assert scans(plan, allow=('investments',)) == []
+        plan = explain(connection, 'SELECT count(*) FROM investments WHERE bond_id = ? AND status != ?',
+                       ('x', 'cancelled'))
+        assert scans(plan) == [] and 'COVERING INDEX ix_investments_bond_id_status_investor_id' in plan[0]
+
+
+def test_create_missing_indexes(app):
+    from app import db
+    from migrations import create_missing_indexes
+
+    with app.app_context():
+        db.session.execute(db.text('DROP INDEX ix_projects_bond_id_project_type'))
+        db.session.commit()
+        assert create_missing_indexes(db) == ['ix_projects_bond_id_project_type']
+        assert create_missing_indexes(db) == []
+        # ANALYZE ran (it records nothing for an empty table)
+        assert db.inspect(db.engine).has_table('sqlite_stat1')
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, '-q']))
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Tests for read-replica routing (replicas.py), with a second SQLite file
+standing in for the replica
+"""
+import os
+import tempfile
+
+import pytest
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.exc import OperationalError
+
+USER = {
+    'email': 'replica@example.com',
+    'password': 'testpassword123',
+    'firstName': 'Replica',
+    'lastName': 'Reader',
+    'userType': 'retail_investor'
+}
+
+
+@pytest.fixture
+def replica(app):
+    """A replica of the app's schema, and a writable engine for seeding it"""
+    from app import db, read_replicas
+
+    url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'replica.db')
+    engine = create_engine(url)
+    db.metadata.create_all(engine)
+    original = dict(app.config)
+    app.config.update({'DATABASE_REPLICA_URLS': url, 'REPLICA_STICKY_SECONDS': 30})
+    read_replicas.init_app(app, db)
+    app.extensions['user_cache'].clear()
+    yield engine
+    read_replicas.dispose()
+    engine.dispose()
+    app.config.clear()
+    app.config.update(original)
+    read_replicas.init_app(app, db)
+
+
+def copy_users(app, replica):
+    """Replicate the primary's users table"""
+    from app import db
+    from models import get_models
+
+    table = get_models(db)['User'].__table__
+    with app.app_context():
+        rows = db.session.execute(select(table)).mappings().all()
+    with replica.begin() as connection:
+        connection.execute(table.delete())
+        connection.execute(insert(table), [dict(row) for row in rows])
+
+
+def test_reads_go_to_the_replica(app, replica):
+    setup = app.test_client()
+    token = setup.post('/api/auth/register', json=USER).get_json()['access_token']
+    headers = {'Authorization': f'Bearer {token}'}
+
+    # A client that hasn't written reads the replica, which hasn't caught up yet
+    reader = app.test_client()
+    assert reader.get('/api/auth/profile', headers=headers).status_code == 404
+    copy_users(app, replica)
+    app.extensions['user_cache'].clear()
+    response = reader.get('/api/auth/profile', headers=headers)
+    assert response.status_code == 200 and response.get_json()['user']['email'] == USER['email']
+    assert reader.get('/metrics/database').get_json()['readReplicas']['replicaReads'] == 2
+
+
+def test_writer_reads_its_own_writes(app, replica):
+    client = app.test_client()
+    response = client.post('/api/auth/register', json=USER)
+    assert 'db_primary_until' in response.headers['Set-Cookie']
+    headers = {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+
+    # The registering client carries the cookie and reads the primary
+    assert client.get('/api/auth/profile', headers=headers).status_code == 200
+
+    # A write made with the token sticks the identity too, for clients without cookies
+    copy_users(app, replica)
+    assert client.put('/api/auth/profile', json={'firstName': 'Renamed'}, headers=headers).status_code == 200
+    app.extensions['user_cache'].clear()
+    response = app.test_client().get('/api/auth/profile', headers=headers)
+    assert response.get_json()['user']['firstName'] == 'Renamed'
+
+
+def test_session_returns_to_the_primary_once_it_writes(app, replica):
+    from app import db
+    from models import get_models
+    from flask import g
+
+    User = get_models(db)['User']
+    with app.test_request_context():
+        g.read_replica = app.extensions['read_replicas'].engines[0]
+        assert db.session.get_bind(clause=select(User.__table__)) is g.read_replica
+        db.session.add(User(email='new@example.com', first_name='N', last_name='U',
+                            user_type='retail_investor', password_hash='x'))
+        db.session.flush()
+        assert db.session.get_bind(clause=select(User.__table__)) is db.engine
+        db.session.rollback()
+        db.session.remove()
+
+
+def test_replica_connections_are_read_only(app, replica):
+    from app import db
+    from models import get_models
+
+    table = get_models(db)['User'].__table__
+    with pytest.raises(OperationalError, match='readonly'):
+        with app.extensions['read_replicas'].engines[0].begin() as connection:
+            connection.execute(table.delete())
+
+
+def test_without_replicas_everything_reads_the_primary(app, client):
+    assert client.get('/api/bonds').status_code == 200
+    assert client.get('/metrics/database').get_json()['readReplicas']['replicas'] == 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, '-q']))
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Tests for full-text search over bonds and projects (search.py)
+"""
+from datetime import date
+
+import pytest
+
+
+@pytest.fixture
+def catalog(app):
+    """Two bonds, one with a project in Kerala; returns (bond ids, project id)"""
+    from app import db
+    from models import create_models
+
+    User, GreenBond, Project, _ = create_models(db)
+    with app.app_context():
+        issuer = User(email='search@example.com', password_hash='x', first_name='Search',
+                      last_name='Issuer', user_type='bond_issuer')
+        db.session.add(issuer)
+        db.session.flush()
+        bonds = [GreenBond(issuer_id=issuer.id, bond_name=name, isin=f'IN000000000{i}', bond_type='corporate',
+                           face_value=1000, coupon_rate=5, maturity_date=date(2030, 1, 1),
+                           issue_date=date(2024, 1, 1), minimum_investment=1000, total_amount=1_000_000,
+                           risk_rating='AA', status='active', description=description)
+                 for i, (name, description) in enumerate((
+                     ('Solar <Rooftop> Bond', 'Rooftop solar for schools in Maharashtra'),
+                     ('Coastal Resilience Bond', 'Seawalls and wetlands, partly solar powered')))]
+        db.session.add_all(bonds)
+        db.session.flush()
+        project = Project(bond_id=bonds[1].id, project_name='Mangrove restoration',
+                          project_type='forest_conservation', description='Replanting mangroves on the coast',
+                          country='India', region='Kerala', project_manager='PM', start_date=date(2024, 1, 1),
+                          expected_completion_date=date(2026, 1, 1), total_budget=100_000)
+        db.session.add(project)
+        db.session.commit()
+        return [bond.id for bond in bonds], project.id
+
+
+def search(client, **params):
+    response = client.get('/api/search', query_string=params)
+    assert response.status_code == 200
+    return response.get_json()['results']
+
+
+def test_ranked_prefix_search_with_highlights(client, catalog):
+    (rooftop, coastal), project_id = catalog
+    results = search(client, q='sol')
+    # A title match outranks a description match
+    assert [result['id'] for result in results] == [rooftop, coastal]
+    assert results[0]['titleHighlight'] == '<mark>Solar</mark> &lt;Rooftop&gt; Bond'
+    assert results[1]['snippet'] == 'Seawalls and wetlands, partly <mark>solar</mark> powered'
+    assert results[0]['score'] > results[1]['score']
+
+    # Every word must match, each as a prefix; regions are searched too
+    assert [result['id'] for result in search(client, q='solar maha')] == [rooftop]
+    project, = search(client, q='mangro kera')
+    assert (project['type'], project['id'], project['bondId'], project['region']) == (
+        'project', project_id, coastal, 'Kerala')
+    assert [result['type'] for result in search(client, q='coast')] == ['bond', 'project']
+    assert [result['type'] for result in search(client, q='coast', type='project')] == ['project']
+    # Query syntax is taken as words
+    assert search(client, q='"solar" OR NEAR(') == search(client, q='solar or near')
+
+
+def test_index_follows_writes(app, client, catalog):
+    from app import db
+    from models import create_models
+
+    (rooftop, _), project_id = catalog
+    _, GreenBond, Project, _ = create_models(db)
+    with app.app_context():
+        db.session.get(GreenBond, rooftop).bond_name = 'Sunshine Schools Bond'
+        db.session.delete(db.session.get(Project, project_id))
+        # Core inserts bypass the ORM; the triggers still index them
+        db.session.execute(Project.__table__.insert(), [{
+            'id': 'bulk-project', 'bond_id': rooftop, 'project_name': 'Biogas digesters',
+            'project_type': 'renewable_energy', 'description': 'Farm waste to cooking gas', 'country': 'India',
+            'region': 'Punjab', 'project_manager': 'PM', 'start_date': date(2024, 1, 1),
+            'expected_completion_date': date(2026, 1, 1), 'total_budget': 1000}])
+        db.session.commit()
+    assert [result['id'] for result in search(client, q='sunshine')] == [rooftop]
+    assert search(client, q='mangrove') == []
+    assert [result['id'] for result in search(client, q='biogas punjab')] == ['bulk-project']
+
+
+def test_best_match_ranks_first_among_many(app, client, catalog):
+    from app import db
+    from models import create_models
+
+    (rooftop, coastal), _ = catalog
+    _, _, Project, _ = create_models(db)
+    with app.app_context():
+        # Indexed after the bonds, and each a weaker match than either
+        db.session.execute(Project.__table__.insert(), [{
+            'id': f'solar-{i}', 'bond_id': coastal, 'project_name': f'Site {i}', 'project_type': 'renewable_energy',
+            'description': 'Panels and a solar inverter for the village grid', 'country': 'India',
+            'region': 'Punjab', 'project_manager': 'PM', 'start_date': date(2024, 1, 1),
+            'expected_completion_date': date(2026, 1, 1), 'total_budget': 1000} for i in range(400)])
+        db.session.commit()
+    assert search(client, q='solar', limit=1)[0]['id'] == rooftop
+
+
+def test_only_active_bonds_and_their_projects_are_found(app, client, catalog):
+    from app import db
+    from models import create_models
+
+    (rooftop, coastal), project_id = catalog
+    _, GreenBond, _, _ = create_models(db)
+    with app.app_context():
+        db.session.get(GreenBond, rooftop).status = 'draft'
+        db.session.get(GreenBond, coastal).status = 'cancelled'
+        db.session.commit()
+    assert search(client, q='solar') == []
+    assert search(client, q='mangrove') == []
+
+    with app.app_context():
+        db.session.get(GreenBond, coastal).status = 'active'
+        db.session.commit()
+    assert [result['id'] for result in search(client, q='coast')] == [coastal, project_id]
+    assert [result['id'] for result in search(client, q='solar')] == [coastal]
+
+
+def test_index_survives_the_money_migration(app, client, catalog):
+    from sqlalchemy import Float, MetaData, select
+
+    from app import create_tables, db
+    from money import Money
+
+    (rooftop, _), _ = catalog
+    # green_bonds as it was before amounts were stored in paise
+    metadata = MetaData()
+    for table in db.metadata.sorted_tables:
+        table.to_metadata(metadata)
+    legacy = metadata.tables['green_bonds']
+    for column in legacy.columns:
+        if isinstance(column.type, Money):
+            column.type = Float()
+    with app.app_context():
+        with db.engine.begin() as connection:
+            bonds = [dict(row) for row in connection.execute(select(legacy)).mappings()]
+            connection.exec_driver_sql('DROP TABLE green_bonds')
+            legacy.create(connection)
+            connection.execute(legacy.insert(), bonds)
+    create_tables(app)
+
+    with app.app_context():
+        db.session.execute(db.text("UPDATE green_bonds SET bond_name = 'Sunshine Schools Bond' WHERE id = :id"),
+                           {'id': rooftop})
+        db.session.commit()
+    assert [result['id'] for result in search(client, q='sunshine')] == [rooftop]
+
+
+def test_rebuild_and_bad_queries(app, client, catalog):
+    from app import db
+    from search import rebuild_search_index
+
+    before = search(client, q='solar')
+    with app.app_context():
+        db.session.execute(db.text('DELETE FROM search_index'))
+        db.session.commit()
+        assert search(client, q='solar') == []
+        rebuild_search_index()
+    assert search(client, q='solar') == before
+
+    assert client.get('/api/search').status_code == 400
+    assert client.get('/api/search', query_string={'q': '!!'}).status_code == 400
+    assert client.get('/api/search', query_string={'q': 'solar', 'type': 'issuer'}).status_code == 400
+    assert client.get('/api/search', query_string={'q': 'solar', 'limit': 'all'}).status_code == 400
+    assert len(search(client, q='solar', limit=1)) == 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, '-q']))
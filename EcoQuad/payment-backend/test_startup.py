@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Tests for the application factory and deferred imports (app.py)
+
+Extensions are shared by the process, so anything that builds a second app
+runs in a fresh interpreter.
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def run(script):
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(tempfile.mkdtemp(), 'startup.db'),
+               JOB_QUEUE_MODE='off')
+    result = subprocess.run([sys.executable, '-c', script], cwd=HERE, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    return result.stdout.split()
+
+
+def test_import_defers_heavy_modules():
+    loaded = run(
+        'import sys, app\n'
+        "for name in ('numpy', 'razorpay', 'requests', 'sqlalchemy.dialects.postgresql'):\n"
+        '    print(name in sys.modules)\n'
+    )
+    assert loaded == ['False'] * 4
+
+
+def test_create_app_applies_overrides():
+    output = run(
+        'from app import create_app\n'
+        "app = create_app({'RAZORPAY_ORDER_MODE': 'async', 'USER_CACHE_SIZE': 7})\n"
+        "print(app.config['RAZORPAY_ORDER_MODE'], app.extensions['user_cache'].maxsize)\n"
+        "print(*sorted(rule.rule for rule in app.url_map.iter_rules() if rule.rule.startswith('/create-order')))\n"
+    )
+    assert output[:2] == ['async', '7']
+    assert output[2:] == ['/create-order', '/create-order/<job_id>']
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, '-q']))
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Tests for the user snapshot cache behind /profile and /verify-token
+"""
+import time
+
+import pytest
+
+import query_counter
+from cache import TTLCache
+
+USER = {
+    'email': 'cached@example.com',
+    'password': 'testpassword123',
+    'firstName': 'Cached',
+    'lastName': 'User',
+    'userType': 'retail_investor'
+}
+
+
+def register(client):
+    response = client.post('/api/auth/register', json=USER)
+    assert response.status_code == 201
+    return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+
+
+def count_queries(app, fn):
+    """Run fn and return how many SQL statements it executed"""
+    from app import db
+
+    with app.app_context():
+        engine = db.engine
+    with query_counter.count_queries(engine) as statements:
+        fn()
+    return len(statements)
+
+
+def test_ttl_cache_expires_and_evicts():
+    cache = TTLCache(maxsize=2, ttl=0.05)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)  # evicts 'b', the least recently used
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    time.sleep(0.06)
+    assert cache.get('a') is None
+    assert len(cache) == 1  # 'c' has expired but not been looked up yet
+
+
+def test_warm_verify_token_runs_no_queries(app, client):
+    app.extensions['user_cache'].clear()
+    headers = register(client)
+
+    assert client.post('/api/auth/verify-token', headers=headers).status_code == 200
+
+    def verify():
+        response = client.post('/api/auth/verify-token', headers=headers)
+        assert response.status_code == 200
+        assert response.get_json()['user']['email'] == USER['email']
+
+    assert count_queries(app, verify) == 0
+
+
+def test_update_profile_invalidates_snapshot(app, client):
+    app.extensions['user_cache'].clear()
+    headers = register(client)
+    assert client.get('/api/auth/profile', headers=headers).get_json()['user']['firstName'] == 'Cached'
+
+    response = client.put('/api/auth/profile', headers=headers, json={'firstName': 'Renamed'})
+    assert response.status_code == 200
+    assert 'access_token' not in response.get_json()
+
+    assert client.get('/api/auth/profile', headers=headers).get_json()['user']['firstName'] == 'Renamed'
+
+
+def test_embedded_claims_skip_the_lookup(app, client):
+    app.config['JWT_EMBED_USER_CLAIMS'] = True
+    try:
+        headers = register(client)
+        app.extensions['user_cache'].clear()
+
+        def verify():
+            response = client.post('/api/auth/verify-token', headers=headers)
+            assert response.get_json()['user']['email'] == USER['email']
+
+        assert count_queries(app, verify) == 0
+        assert len(app.extensions['user_cache']) == 0
+
+        response = client.put('/api/auth/profile', headers=headers, json={'firstName': 'Renamed'})
+        fresh = {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+        response = client.post('/api/auth/verify-token', headers=fresh)
+        assert response.get_json()['user']['firstName'] == 'Renamed'
+    finally:
+        app.config['JWT_EMBED_USER_CLAIMS'] = False
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, '-q']))
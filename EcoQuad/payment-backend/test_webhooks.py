@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Tests for the Razorpay webhook receiver
+"""
+import json
+from datetime import date
+
+import pytest
+import razorpay
+
+from gateway import SignatureVerifier
+from query_counter import assert_max_queries
+
+SECRET = 'whsec_test'
+
+
+@pytest.fixture
+def queue(app):
+    """Webhooks enabled, jobs left queued for the test to run"""
+    from app import db, job_queue, payment_gateway
+
+    original = dict(app.config)
+    app.config.update({'RAZORPAY_WEBHOOK_SECRET': SECRET, 'JOB_QUEUE_MODE': 'off'})
+    payment_gateway.init_app(app)
+    job_queue.init_app(app, db)
+    app.extensions['webhook_seen'].clear()
+    yield job_queue
+    app.config.clear()
+    app.config.update(original)
+    payment_gateway.init_app(app)
+    job_queue.init_app(app, db)
+
+
+def captured(payment_id, amount=100000, notes=None, event='payment.captured'):
+    return json.dumps({
+        'entity': 'event',
+        'event': event,
+        'payload': {'payment': {'entity': {
+            'id': payment_id, 'entity': 'payment', 'amount': amount, 'currency': 'INR',
+            'order_id': f'order_{payment_id}', 'status': 'captured', 'notes': notes or [],
+        }}},
+    })
+
+
+def deliver(client, body, event_id, secret=SECRET):
+    return client.post('/webhooks/razorpay', data=body, content_type='application/json', headers={
+        'X-Razorpay-Signature': SignatureVerifier(secret).sign(body),
+        'X-Razorpay-Event-Id': event_id,
+    })
+
+
+def item(body, event_id, secret=SECRET):
+    return {'eventId': event_id, 'body': body, 'signature': SignatureVerifier(secret).sign(body)}
+
+
+def seed_bond(app):
+    from app import db
+    from models import create_models
+
+    User, GreenBond, _, _ = create_models(db)
+    with app.app_context():
+        investor = User(email='investor@example.com', first_name='In', last_name='Vestor',
+                        user_type='retail_investor', password_hash='x')
+        db.session.add(investor)
+        db.session.flush()
+        bond = GreenBond(issuer_id=investor.id, bond_name='Wind', isin='IN0000000002',
+                         bond_type='corporate', face_value=1000, coupon_rate=6,
+                         maturity_date=date(2031, 6, 30), issue_date=date(2024, 1, 1),
+                         minimum_investment=1000, total_amount=10_000_000, amount_raised=0,
+                         risk_rating='AA', status='active', description='Green bond')
+        db.session.add(bond)
+        db.session.commit()
+        return investor.id, bond.id
+
+
+def models():
+    from app import db
+    from models import get_models
+
+    return db, get_models(db)
+
+
+def store_orders(app, payment_ids, notes):
+    """The orders behind payment_ids, as /create-order stores them, with notes"""
+    db, m = models()
+    with app.app_context():
+        db.session.execute(m['PaymentOrder'].__table__.insert(), [{
+            'id': f'po_{payment_id}', 'idempotency_key': f'key:{payment_id}', 'fingerprint': 'x',
+            'receipt': f'rcpt_{payment_id}', 'amount': 100000, 'currency': 'INR', 'status': 'created',
+            'razorpay_order_id': f'order_{payment_id}',
+            'order_data': json.dumps({'id': f'order_{payment_id}', 'amount': 100000, 'currency': 'INR',
+                                      'notes': notes}),
+        } for payment_id in payment_ids])
+        db.session.commit()
+
+
+def test_verifier_matches_razorpay():
+    verifier = SignatureVerifier('secret')
+    utility = razorpay.Client(auth=('key', 'secret')).utility
+    body = captured('pay_x')
+    assert utility.verify_webhook_signature(body, verifier.sign(body), 'secret')
+    assert verifier.verify_many([(body, verifier.sign(body)), (body, '0' * 64), (body, None)]) == \
+        [True, False, False]
+    assert not SignatureVerifier(None).verify(body, SignatureVerifier('').sign(body))
+
+
+def test_captured_payment_is_fulfilled_from_the_event(app, client, queue):
+    investor_id, bond_id = seed_bond(app)
+    store_orders(app, ['pay_w1'], {'bondId': bond_id, 'investorId': investor_id})
+    # The payer's own notes are never trusted
+    body = captured('pay_w1', amount=250000, notes={'bondId': 'another-bond', 'investorId': 'another-investor'})
+    response = deliver(client, body, 'evt_1')
+    assert response.status_code == 200
+    assert response.get_json() == {'received': 1, 'processed': 1, 'duplicates': 0,
+                                   'paymentsRecorded': 1, 'rejected': []}
+
+    db, m = models()
+    with app.app_context():
+        payment = m['Payment'].query.filter_by(razorpay_payment_id='pay_w1').one()
+        assert (payment.bond_id, payment.investor_id) == (None, None)
+        # The bond and investor come from the stored order, the amount from the event
+        assert queue.run_pending() == 1
+        db.session.refresh(payment)
+        assert payment.status == 'fulfilled' and payment.amount == 250000
+        assert (payment.bond_id, payment.investor_id) == (bond_id, investor_id)
+        assert db.session.get(m['GreenBond'], bond_id).amount_raised == 2500
+
+
+def test_bad_or_missing_signatures_are_refused(app, client, queue):
+    body = captured('pay_w2')
+    assert deliver(client, body, 'evt_2', secret='wrong').status_code == 400
+    assert client.post('/webhooks/razorpay', data=body, content_type='application/json').status_code == 400
+    _, m = models()
+    with app.app_context():
+        assert m['WebhookEvent'].query.count() == 0 and m['Payment'].query.count() == 0
+
+
+def test_webhooks_need_a_secret(app, client, queue):
+    from app import payment_gateway
+
+    app.config['RAZORPAY_WEBHOOK_SECRET'] = None
+    payment_gateway.init_app(app)
+    assert deliver(client, captured('pay_w3'), 'evt_3').status_code == 503
+
+
+def test_batch_is_stored_in_one_transaction(app, client, queue):
+    from app import db
+
+    investor_id, bond_id = seed_bond(app)
+    store_orders(app, [f'pay_b{i}' for i in range(300)], {'bondId': bond_id, 'investorId': investor_id})
+    items = [item(captured(f'pay_b{i}'), f'evt_b{i}') for i in range(300)]
+    # Both events Razorpay sends for one payment
+    items.append(item(captured('pay_b0', event='order.paid'), 'evt_b0_paid'))
+    items += [item(captured('pay_b1'), 'evt_b1')] * 20
+    items += [item(captured(f'pay_bad{i}'), f'evt_bad{i}', secret='wrong') for i in range(10)]
+
+    with app.app_context(), assert_max_queries(db.engine, 6):
+        response = client.post('/webhooks/razorpay', json={'events': items})
+    body = response.get_json()
+    assert response.status_code == 200
+    assert (body['received'], body['processed'], body['duplicates'], body['paymentsRecorded']) == \
+        (331, 301, 20, 300)
+    assert body['rejected'] == [f'evt_bad{i}' for i in range(10)]
+
+    db, m = models()
+    with app.app_context():
+        assert queue.run_pending() == 300
+        assert db.session.get(m['GreenBond'], bond_id).amount_raised == 300 * 1000
+
+
+def test_redelivery_is_dropped_after_a_restart(app, client, queue):
+    body = captured('pay_w4')
+    assert deliver(client, body, 'evt_4').get_json()['processed'] == 1
+    assert deliver(client, body, 'evt_4').get_json()['duplicates'] == 1
+    # A fresh process has an empty seen-set and falls back to webhook_events
+    app.extensions['webhook_seen'].clear()
+    response = deliver(client, body, 'evt_4').get_json()
+    assert (response['processed'], response['duplicates']) == (0, 1)
+    _, m = models()
+    with app.app_context():
+        assert m['Job'].query.count() == 1
+
+
+def test_payment_already_verified_is_not_queued_again(app, client, queue):
+    from app import payment_gateway
+
+    verified = {'razorpay_order_id': 'order_pay_w5', 'razorpay_payment_id': 'pay_w5'}
+    verified['razorpay_signature'] = payment_gateway.payment_signatures.sign('order_pay_w5|pay_w5')
+    assert client.post('/verify-payment', json=verified).status_code == 200
+    assert deliver(client, captured('pay_w5'), 'evt_5').get_json()['paymentsRecorded'] == 0
+    _, m = models()
+    with app.app_context():
+        assert m['Job'].query.count() == 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, '-q']))
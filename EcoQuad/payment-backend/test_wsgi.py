@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Tests for the production entry point (wsgi.py, gunicorn.conf.py)
+"""
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+import requests
+
+from stub_gateway import StubGateway
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_worker_hooks_start_and_stop_background_work(app):
+    from app import job_queue, payment_gateway
+    from wsgi import init_worker, shutdown_worker
+
+    original = app.config['JOB_QUEUE_MODE']
+    app.config['JOB_QUEUE_MODE'] = job_queue.mode = 'thread'
+    try:
+        init_worker()
+        assert payment_gateway._pid == os.getpid()
+        assert job_queue._threads and all(thread.is_alive() for thread in job_queue._threads)
+        threads = job_queue._threads
+        shutdown_worker()
+        assert not any(thread.is_alive() for thread in threads)
+        assert payment_gateway._pid is None
+    finally:
+        app.config['JOB_QUEUE_MODE'] = job_queue.mode = original
+
+
+def test_sigterm_lets_in_flight_requests_finish():
+    pytest.importorskip('gunicorn')
+    port = free_port()
+    with StubGateway(key_id='rzp_test_key', key_secret='rzp_test_secret', latency=1.0) as stub:
+        env = dict(os.environ, PORT=str(port), HOST='127.0.0.1', WEB_CONCURRENCY='2',
+                   DATABASE_URL='sqlite:///' + os.path.join(tempfile.mkdtemp(), 'wsgi.db'),
+                   RAZORPAY_KEY_ID='rzp_test_key', RAZORPAY_KEY_SECRET='rzp_test_secret',
+                   RAZORPAY_BASE_URL=stub.url, JOB_QUEUE_MODE='thread')
+        server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+                                   'wsgi:application'], cwd=HERE, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        url = f'http://127.0.0.1:{port}'
+        try:
+            for _ in range(100):
+                try:
+                    requests.get(f'{url}/health', timeout=1)
+                    break
+                except requests.ConnectionError:
+                    time.sleep(0.1)
+
+            results = []
+            checkout = threading.Thread(target=lambda: results.append(
+                requests.post(f'{url}/create-order', json={'amount': 1500.5}, timeout=10)))
+            checkout.start()
+            time.sleep(0.3)
+            server.send_signal(signal.SIGTERM)
+            checkout.join()
+            assert server.wait(timeout=15) == 0
+        finally:
+            if server.poll() is None:
+                server.kill()
+
+    # The checkout that was waiting on the gateway completed before exit
+    assert results[0].status_code == 200 and results[0].json()['order']['amount'] == 150050
+    with pytest.raises(requests.ConnectionError):
+        requests.get(f'{url}/health', timeout=1)
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, '-q']))
@@ -0,0 +1,209 @@
+"""
+Razorpay webhook receiver.
+
+POST /webhooks/razorpay takes either a single delivery straight from
+Razorpay (the event as the body, signed in ``X-Razorpay-Signature``, its id
+in ``X-Razorpay-Event-Id``) or a batch forwarded by a relay:
+
+    {"events": [{"eventId": "evt_...", "body": "<raw event JSON>",
+                 "signature": "<X-Razorpay-Signature of body>"}, ...]}
+
+Every event is checked against RAZORPAY_WEBHOOK_SECRET with the gateway's
+pre-keyed verifier; batch items that fail are reported and skipped. Event ids
+seen recently in this process are dropped from memory and the rest against
+``webhook_events``, so redeliveries are ignored. Everything new in a batch is
+written in one transaction: the events, a Payment per captured payment not
+already recorded, and its fulfillment job (see fulfillment.py). Only the
+payment and order ids and the amount are taken from an event; the job finds
+the bond and the investor on the order this server created.
+"""
+from flask import Blueprint, request, jsonify, current_app
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from datetime import datetime
+import hashlib
+import json
+
+from cache import TTLCache
+from fulfillment import FULFILL_PAYMENT
+from gateway import get_gateway
+from guid import new_id
+from jobs import get_job_queue
+from models import get_models
+
+webhooks_bp = Blueprint('webhooks', __name__)
+
+# Bound once when the blueprint is registered (see auth.py)
+db = None
+Payment = None
+WebhookEvent = None
+seen = None
+
+# Events that mean a payment has been captured and should be fulfilled
+PAYMENT_EVENTS = ('payment.captured', 'order.paid')
+
+# Values per IN (...) lookup, well under SQLite's bound parameter limit
+IN_CHUNK = 500
+
+class InvalidDelivery(ValueError):
+    """Raised for a request that carries no verifiable events"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+@webhooks_bp.record_once
+def bind_models(state):
+    """Resolve models and the seen-event cache for the app's db instance"""
+    global db, Payment, WebhookEvent, seen
+    db = state.app.extensions['sqlalchemy']
+    models = get_models(db)
+    Payment = models['Payment']
+    WebhookEvent = models['WebhookEvent']
+    seen = state.app.extensions['webhook_seen'] = TTLCache(
+        maxsize=int(state.app.config.get('WEBHOOK_SEEN_SIZE', 100000)),
+        ttl=float(state.app.config.get('WEBHOOK_SEEN_TTL', 86400))
+    )
+
+def body_event_id(body):
+    """Stand-in id for deliveries without one: identical redeliveries share it"""
+    return 'sha256:' + hashlib.sha256(body).hexdigest()
+
+def read_deliveries(verifier):
+    """Verified (event_id, event) pairs in the request, and the rejected batch items"""
+    raw = request.get_data()
+    signature = request.headers.get('X-Razorpay-Signature')
+    if signature is not None:
+        if not verifier.verify(raw, signature):
+            raise InvalidDelivery('invalid signature')
+        try:
+            event = json.loads(raw)
+        except ValueError:
+            raise InvalidDelivery('body is not JSON')
+        return [(request.headers.get('X-Razorpay-Event-Id') or body_event_id(raw), event)], []
+
+    try:
+        items = json.loads(raw).get('events')
+    except (ValueError, AttributeError):
+        items = None
+    if not isinstance(items, list):
+        raise InvalidDelivery('expected a signed event or {"events": [...]}')
+    limit = current_app.config.get('WEBHOOK_MAX_EVENTS', 5000)
+    if len(items) > limit:
+        raise InvalidDelivery(f'at most {limit} events per batch', status=413)
+
+    bodies = [item.get('body') if isinstance(item, dict) else None for item in items]
+    valid = verifier.verify_many(
+        (body.encode('utf-8') if isinstance(body, str) else b'', item.get('signature') if body else None)
+        for item, body in zip(items, bodies)
+    )
+    deliveries, rejected = [], []
+    for position, (item, body, ok) in enumerate(zip(items, bodies, valid)):
+        event_id = item.get('eventId') if isinstance(item, dict) else None
+        if ok:
+            try:
+                deliveries.append((event_id or body_event_id(body.encode('utf-8')), json.loads(body)))
+                continue
+            except ValueError:
+                pass
+        rejected.append(event_id or position)
+    return deliveries, rejected
+
+def payment_row(event):
+    """Payment columns for a captured-payment event, or None for other events"""
+    if not isinstance(event, dict) or event.get('event') not in PAYMENT_EVENTS:
+        return None
+    payment = ((event.get('payload') or {}).get('payment') or {}).get('entity') or {}
+    if not payment.get('id') or not payment.get('order_id'):
+        return None
+    # The payer sets the payment's notes at checkout, so the bond and the
+    # investor are left to the fulfillment job, which reads the order
+    return {
+        'razorpay_payment_id': payment['id'],
+        'razorpay_order_id': payment['order_id'],
+        'amount': int(payment['amount']) if payment.get('amount') is not None else None,
+        'currency': payment.get('currency'),
+    }
+
+def existing(column, values):
+    """The subset of values already present in column"""
+    values = list(values)
+    found = set()
+    for start in range(0, len(values), IN_CHUNK):
+        chunk = values[start:start + IN_CHUNK]
+        found.update(value for (value,) in db.session.query(column).filter(column.in_(chunk)))
+    return found
+
+def insert_ignoring_conflicts(table, rows, index_elements):
+    """Insert many rows in one statement, skipping any that already exist"""
+    if not rows:
+        return
+    if db.session.get_bind().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        insert = sqlite_insert
+    db.session.execute(insert(table).on_conflict_do_nothing(index_elements=index_elements), rows)
+
+def store_events(deliveries, job_queue):
+    """Record new events and their payments in one transaction; returns counts and job ids"""
+    fresh, duplicates = {}, 0
+    for event_id, event in deliveries:
+        if event_id in fresh or seen.get(event_id) is not None:
+            duplicates += 1
+            continue
+        fresh[event_id] = event
+    for event_id in existing(WebhookEvent.id, fresh):
+        del fresh[event_id]
+        seen.set(event_id, True)
+        duplicates += 1
+
+    now = datetime.utcnow()
+    event_rows, payments = [], {}
+    for event_id, event in fresh.items():
+        row = payment_row(event)
+        event_rows.append({
+            'id': event_id,
+            'event': str(event.get('event') if isinstance(event, dict) else None)[:50],
+            'razorpay_payment_id': row['razorpay_payment_id'] if row else None,
+            'received_at': now,
+        })
+        if row is not None:
+            # payment.captured and order.paid both arrive for one payment
+            payments.setdefault(row['razorpay_payment_id'], row)
+    recorded = existing(Payment.razorpay_payment_id, payments)
+    new_payments = [dict(row, id=new_id(), status='verified', created_at=now, updated_at=now)
+                    for payment_id, row in payments.items() if payment_id not in recorded]
+
+    insert_ignoring_conflicts(WebhookEvent.__table__, event_rows, ['id'])
+    # A payment recorded concurrently by /verify-payment keeps its row; the
+    # job queued here for the skipped one then finds nothing to do
+    insert_ignoring_conflicts(Payment.__table__, new_payments, ['razorpay_payment_id'])
+    job_ids = job_queue.enqueue_many(FULFILL_PAYMENT, [{'paymentId': row['id']} for row in new_payments])
+    db.session.commit()
+    for event_id in fresh:
+        seen.set(event_id, True)
+    return {
+        'processed': len(fresh),
+        'duplicates': duplicates,
+        'paymentsRecorded': len(new_payments),
+    }, job_ids
+
+@webhooks_bp.route('/razorpay', methods=['POST'])
+def razorpay_webhook():
+    """Receive one Razorpay event or a relayed batch"""
+    verifier = get_gateway(current_app).webhook_signatures
+    if not verifier.configured:
+        return jsonify({'error': 'Webhooks are not configured'}), 503
+    try:
+        deliveries, rejected = read_deliveries(verifier)
+    except InvalidDelivery as e:
+        return jsonify({'error': str(e)}), e.status
+
+    try:
+        job_queue = get_job_queue(current_app)
+        result, job_ids = store_events(deliveries, job_queue)
+        job_queue.dispatch_many(job_ids)
+        return jsonify(dict(result, received=len(deliveries) + len(rejected), rejected=rejected)), 200
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f'Webhook error: {str(e)}')
+        return jsonify({'error': 'Failed to process events'}), 500
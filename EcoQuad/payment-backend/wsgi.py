@@ -0,0 +1,62 @@
+"""
+WSGI entry point for production servers.
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+Importing this module loads the app, its models and blueprints and creates
+or migrates the tables. With ``preload_app`` (the default in
+gunicorn.conf.py) that happens once in the master before it forks, so
+workers start with everything imported and share those pages copy-on-write.
+
+Anything holding sockets, threads or child processes must not cross the
+fork, so gunicorn.conf.py calls init_worker() in each worker after fork and
+shutdown_worker() when it exits:
+
+- init_worker drops database connections inherited from the master, opens
+  the worker's Razorpay session so the first checkout doesn't pay for it,
+  and starts the job queue's threads in ``JOB_QUEUE_MODE=thread``;
+- shutdown_worker lets the job threads finish the job in hand and the
+  offloaded orders and password hashes in flight complete, then closes
+  the pools. Gunicorn only calls it once the worker's in-flight requests
+  have finished (or ``graceful_timeout`` has passed).
+
+The app defers its heaviest imports (Razorpay, requests, NumPy) to first
+use so a bare import stays fast. When the master preloads the app,
+gunicorn.conf.py calls import_deferred() before the first fork, so workers
+inherit those modules too instead of importing them on their first checkout
+or analytics request.
+"""
+from app import app, create_tables, db, job_queue, password_hasher, payment_gateway, read_replicas
+
+application = app
+
+create_tables()
+
+
+def import_deferred():
+    """Import the modules the app loads on first use (NumPy, requests, Razorpay)"""
+    import analytics
+    import http_session
+    import razorpay
+
+
+def init_worker():
+    """Per-process setup, run in each worker right after fork"""
+    with app.app_context():
+        # Connections opened by the master (create_tables) belong to it;
+        # close=False leaves their sockets alone for the master to close
+        db.engine.dispose(close=False)
+    read_replicas.dispose(close=False)
+    payment_gateway.client
+    if app.config['JOB_QUEUE_MODE'] == 'thread':
+        job_queue.start()
+
+
+def shutdown_worker():
+    """Finish in-flight background work and close this process's pools"""
+    job_queue.shutdown()
+    payment_gateway.shutdown()
+    password_hasher.shutdown()
+    read_replicas.dispose()
+    with app.app_context():
+        db.engine.dispose()
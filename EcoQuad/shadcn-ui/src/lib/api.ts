@@ -121,10 +121,20 @@ class ApiClient {
     lastName?: string;
     companyName?: string;
   }) {
-    return this.request<{ user: any }>('/auth/profile', {
+    const response = await this.request<{
+      user: any;
+      access_token?: string;
+    }>('/auth/profile', {
       method: 'PUT',
       body: JSON.stringify(userData),
     });
+
+    // Tokens that embed the profile are reissued after an update
+    if (response.data?.access_token) {
+      this.setToken(response.data.access_token);
+    }
+
+    return response;
   }
 
   async changePassword(currentPassword: string, newPassword: string) {
@@ -143,18 +153,97 @@ class ApiClient {
     });
   }
 
+  // Bond marketplace
+  async getBonds(params: {
+    status?: string[];
+    bondType?: string[];
+    riskRating?: string[];
+    currency?: string[];
+    couponMin?: number;
+    couponMax?: number;
+    minimumInvestmentMin?: number;
+    minimumInvestmentMax?: number;
+    sort?: string;
+    limit?: number;
+    cursor?: string;
+  } = {}) {
+    const query = new URLSearchParams();
+    Object.entries(params).forEach(([key, value]) => {
+      if (value === undefined || value === null) return;
+      (Array.isArray(value) ? value : [value]).forEach((item) =>
+        query.append(key, String(item))
+      );
+    });
+
+    return this.request<{
+      bonds: any[];
+      nextCursor: string | null;
+      limit: number;
+    }>(`/bonds?${query.toString()}`);
+  }
+
+  async getBondAnalytics(bonds: { bondId: string; price?: number }[], settlementDate?: string) {
+    return this.request<{
+      settlementDate: string;
+      analytics: any[];
+    }>('/bonds/analytics', {
+      method: 'POST',
+      body: JSON.stringify({ bonds, settlementDate }),
+    });
+  }
+
+  // Portfolio
+  async getPortfolioSummary() {
+    return this.request<{
+      summary: {
+        portfolioValue: number;
+        expectedReturns: number;
+        totalGains: number;
+        returnPercentage: number;
+        maturityValue: number;
+        fees: number;
+        positionCount: number;
+        updatedAt: string | null;
+      };
+      allocation: {
+        bondType: any[];
+        riskRating: any[];
+      };
+      maturityLadder: any[];
+    }>('/portfolio/summary');
+  }
+
+  async getPortfolioAnalytics(limit?: number) {
+    const query = limit === undefined ? '' : `?limit=${limit}`;
+    return this.request<{
+      portfolio: {
+        marketValue: number;
+        yieldToMaturity: number | null;
+        macaulayDuration: number | null;
+        modifiedDuration: number | null;
+        convexity: number | null;
+      } | null;
+      positionCount: number;
+      positions: any[];
+    }>(`/portfolio/analytics${query}`);
+  }
+
   // Payment methods
   async createOrder(orderData: {
     amount: number;
     currency?: string;
     receipt?: string;
-  }) {
+    bondId?: string;
+  }, idempotencyKey?: string) {
     return this.request<{
       order: any;
       key: string;
     }>('/create-order', {
       method: 'POST',
       body: JSON.stringify(orderData),
+      ...(idempotencyKey && {
+        headers: { 'Content-Type': 'application/json', 'Idempotency-Key': idempotencyKey },
+      }),
     });
   }
 
@@ -162,6 +251,7 @@ class ApiClient {
     razorpay_payment_id: string;
     razorpay_order_id: string;
     razorpay_signature: string;
+    bondId?: string;
   }) {
     return this.request('/verify-payment', {
       method: 'POST',
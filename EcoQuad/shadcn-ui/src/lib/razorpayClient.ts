@@ -9,12 +9,18 @@ export async function loadRazorpayScript(): Promise<boolean> {
   });
 }
 
-export async function createOrder(amount: number) {
+export async function createOrder(amount: number, bondId: string) {
   const backendUrl = (import.meta as any).env?.VITE_PAYMENT_BACKEND_URL || 'http://localhost:5000';
+  // The order records the bond and the signed-in investor; the server
+  // credits the payment from the order, not from what verify-payment is sent
+  const token = localStorage.getItem('auth_token');
   const resp = await fetch(`${backendUrl}/create-order`, {
     method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify({ amount, currency: 'INR' })
+    headers: {
+      'Content-Type': 'application/json',
+      ...(token && { Authorization: `Bearer ${token}` }),
+    },
+    body: JSON.stringify({ amount, currency: 'INR', bondId })
   });
   const body = await resp.text();
   let json;
@@ -172,7 +172,7 @@ export default function BondDetails() {
 
     try {
       // Create server side order
-      const resp = await createOrder(amount);
+      const resp = await createOrder(amount, bond.id);
       const order = resp.order;
       const key = resp.key;
 
@@ -181,10 +181,15 @@ export default function BondDetails() {
         try {
           // Verify payment on server
           const backendUrl = (import.meta as any).env?.VITE_PAYMENT_BACKEND_URL || 'http://localhost:5000';
+          // The server creates the investment for the signed-in investor
+          const token = localStorage.getItem('auth_token');
           const verifyResp = await fetch(`${backendUrl}/verify-payment`, {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify(paymentResp)
+            headers: {
+              'Content-Type': 'application/json',
+              ...(token && { Authorization: `Bearer ${token}` }),
+            },
+            body: JSON.stringify({ ...paymentResp, bondId: bond.id })
           });
           if (!verifyResp.ok) throw new Error('Payment verification failed');
 